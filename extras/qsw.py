@@ -6,6 +6,9 @@ option"""
 import sys
 import os
 import re
+import json
+import fcntl
+import getpass
 import subprocess
 import time
 import logging
@@ -18,7 +21,7 @@ __version__ = 1.0
 # max number of times QSTAT will be polled
 MAX_QSTAT_FAILURES = 3
 # time between calls to qstat (in sec)
-POLLING_INTERVAL = 5
+POLLING_INTERVAL = int(os.environ.get("QSW_POLLING_INTERVAL", 5))
 # Max polling time to for wait for exitcode file (sec) default is 5 minutes
 MAX_POLLING_TIME = 60 * 1.5 
 
@@ -28,6 +31,18 @@ PBS_JOB_ID_DECODER = "(\d+)\..+"
 PBS_NO_JOB_FOUND_CODE = 153
 PBS_SUCCESS_CODE = 0
 
+# Snapshot of the job states from a single qstat call that is shared by all
+# the qsw processes of the user. Only one process calls qstat per polling
+# interval. Set QSW_QSTAT_SNAPSHOT to share the snapshot across hosts (e.g., NFS)
+QSTAT_SNAPSHOT = os.environ.get("QSW_QSTAT_SNAPSHOT",
+                                os.path.join(tempfile.gettempdir(), "qsw-qstat-{u}.json".format(u=getpass.getuser())))
+
+# Job id and state from a line of the (default) PBS qstat output
+# 38976.localhost   job-name   user   00:00:00 R batch
+PBS_QSTAT_JOB_DECODER = "^(\d+)\.\S*\s.*\s([A-Z])\s+\S+\s*$"
+# Completed (C, Torque) or Finished (F, PBS Pro) jobs
+PBS_COMPLETED_STATES = ("C", "F")
+
 # Unique str (built from a palindrome) to extract exitcode from wrapper script
 EXIT_CODE_ENCODER = "PB_EXIT_CODE_${?}_EDOC_TIXE_BP"
 EXIT_CODE_DECODER = "PB_EXIT_CODE_(\d+)_EDOC_TIXE_BP"
@@ -56,6 +71,114 @@ class QSubError(Exception):
     pass
 
 
+def parseQstatOutput(output, jobStateDecoder=PBS_QSTAT_JOB_DECODER):
+    """Returns {jobId: state} from the qstat output of all jobs"""
+    rx = re.compile(jobStateDecoder)
+    states = {}
+    for line in output.splitlines():
+        match = rx.match(line)
+        if match:
+            states[int(match.group(1))] = match.group(2)
+    return states
+
+
+class QstatSnapshot(object):
+
+    def __init__(self, createdAt, returnCode, jobStates, errorMessage=""):
+        self.createdAt = createdAt
+        self.returnCode = returnCode
+        # {jobId: state}
+        self.jobStates = jobStates
+        self.errorMessage = errorMessage
+
+    def __repr__(self):
+        return "<QstatSnapshot created_at:{c} returncode:{r} jobs:{n} >".format(c=self.createdAt, r=self.returnCode, n=len(self.jobStates))
+
+    def isJobCompleted(self, jobId):
+        """A job is completed once qstat no longer lists it, or lists it
+        as completed"""
+        return self.jobStates.get(jobId, PBS_COMPLETED_STATES[0]) in PBS_COMPLETED_STATES
+
+    def toDict(self):
+        return dict(created_at=self.createdAt, returncode=self.returnCode,
+                    error_message=self.errorMessage,
+                    job_states={str(k): v for k, v in self.jobStates.iteritems()})
+
+    @staticmethod
+    def fromDict(d):
+        return QstatSnapshot(d['created_at'], d['returncode'],
+                             {int(k): v for k, v in d['job_states'].iteritems()},
+                             d.get('error_message', ""))
+
+
+class QstatSnapshotCache(object):
+    """
+    Job states shared by all the qsw processes through a JSON file.
+
+    The snapshot is refreshed (using a single qstat call for all jobs) by
+    at most one process per polling interval. Refreshing is serialized with
+    an exclusive lock on the {path}.lock file, other processes read the
+    snapshot that was just written.
+    """
+
+    def __init__(self, qstatCmd, path=QSTAT_SNAPSHOT, maxAge=POLLING_INTERVAL):
+        self.qstatCmd = qstatCmd
+        self.path = os.path.abspath(path)
+        self.lockPath = self.path + ".lock"
+        self.maxAge = maxAge
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return QstatSnapshot.fromDict(json.load(f))
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def _write(self, snapshot):
+        # write atomically, readers don't take the lock
+        fd, tmpPath = tempfile.mkstemp(prefix=os.path.basename(self.path), dir=os.path.dirname(self.path))
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps(snapshot.toDict()))
+        os.rename(tmpPath, self.path)
+
+    def _isValid(self, snapshot, minCreatedAt):
+        return (snapshot is not None and
+                snapshot.createdAt >= minCreatedAt and
+                time.time() - snapshot.createdAt < self.maxAge)
+
+    def _callQstat(self):
+        createdAt = time.time()
+        log.debug("calling cmd {c}".format(c=self.qstatCmd))
+        p = subprocess.Popen(self.qstatCmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate()
+        if DEBUG:
+            log.debug(out)
+        return QstatSnapshot(createdAt, p.returncode, parseQstatOutput(out), err)
+
+    def get(self, minCreatedAt):
+        """
+        Returns a snapshot created after minCreatedAt (e.g., the time the
+        job was submitted) and that is no older than the polling interval.
+        """
+        snapshot = self._read()
+        if self._isValid(snapshot, minCreatedAt):
+            return snapshot
+
+        with open(self.lockPath, 'a') as lockFile:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+            try:
+                # Another process might have refreshed the snapshot while
+                # this process was waiting for the lock
+                snapshot = self._read()
+                if not self._isValid(snapshot, minCreatedAt):
+                    snapshot = self._callQstat()
+                    self._write(snapshot)
+            finally:
+                fcntl.flock(lockFile, fcntl.LOCK_UN)
+
+        return snapshot
+
+
 class QSubWrapper(object):
 
     def __init__(self):
@@ -134,45 +257,32 @@ class QSubWrapper(object):
         log.debug("Completed writing wrapper script to {x}".format(x=exitCodePath))
         return exitCodePath
 
-    def _waitForJobTermination(self, jobId):
+    def _waitForJobTermination(self, jobId, submittedAt):
         """
-        Loop until we no longer see the job in qstat or we hit a bunch of
-        qstat failures.
+        Loop until we no longer see the job in the shared qstat snapshot or
+        we hit a bunch of qstat failures.
         """
         log.info("waiting for jobId {i} to complete".format(i=jobId))
 
         consecutiveFailures = 0
+        cache = QstatSnapshotCache(self.qstatCmd)
+        lastCreatedAt = None
 
         while True:
-            # Push this error up to smrtpipe level and useful for
-            # debugging/testing
-            e_out = tempfile.NamedTemporaryFile(suffix='.err')
-            o_out = tempfile.NamedTemporaryFile(suffix='.out')
-
-            # Check job status via qstat/qstat -j 1234
-            cmd = "%s %s" % (self.qstatCmd, jobId)
-
-            log.debug("calling cmd {c}".format(c=cmd))
-            retCode = subprocess.call(cmd, shell=True,
-                                      stderr=e_out,
-                                      stdout=o_out)
-
-            e_out.seek(0)
-            error_str = e_out.read()
-            if error_str:
+            time.sleep(POLLING_INTERVAL)
+
+            snapshot = cache.get(submittedAt)
+            if snapshot.createdAt == lastCreatedAt:
+                continue
+            lastCreatedAt = snapshot.createdAt
+
+            if snapshot.errorMessage:
                 # this should just be qstat related errors
                 # (e.g., unable to get server, timeout)
-                # Most of the time this will catch Errors like:
-                # PBS: 'qstat: Unknown Job Id 38976.localhost.localdomain'
-                log.warn(error_str)
-                sys.stderr.write(error_str + "\n")
-
-            if DEBUG:
-                o_out.seek(0)
-                out_str = o_out.read()
-                log.debug(out_str)
+                log.warn(snapshot.errorMessage)
+                sys.stderr.write(snapshot.errorMessage + "\n")
 
-            failed = retCode not in [self.noJobFoundCode, self.successCode]
+            failed = snapshot.returnCode != self.successCode
             consecutiveFailures = consecutiveFailures + 1 if failed else 0
 
             if consecutiveFailures >= MAX_QSTAT_FAILURES:
@@ -180,15 +290,10 @@ class QSubWrapper(object):
                 log.error(msg)
                 raise QSubError(msg)
 
-            if retCode == self.noJobFoundCode:
-                # Job is not indentified by qstat (qstat returns non-zero exit
-                # code). Hence the job is done.
-                log.info("Breaking. Found returncode {r}".format(r=retCode))
-                e_out.close()
-                o_out.close()
+            if not failed and snapshot.isJobCompleted(jobId):
+                log.info("Breaking. Job {i} is no longer running in {s}".format(i=jobId, s=snapshot))
                 break
 
-            time.sleep(POLLING_INTERVAL)
         log.info("Completed waiting for termination of jobId {i}".format(i=jobId))
 
     def _extractExitCode(self, fileName):
@@ -244,6 +349,8 @@ class QSubWrapper(object):
             cmd = "qsub %s %s" % (self.qsubArgs, self.tmpScriptPath)
             log.info("calling cmd : {c}".format(c=cmd))
             output = subprocess.check_output(cmd, shell=True)
+            # qsub has returned, so the job will be listed by qstat
+            submittedAt = time.time()
 
             match = re.search(self.jobIdDecoder, output)
 
@@ -254,7 +361,7 @@ class QSubWrapper(object):
                 raise QSubError(msg)
 
             # This will block
-            self._waitForJobTermination(jobId)
+            self._waitForJobTermination(jobId, submittedAt)
 
             exitCode = self._extractExitCode(exitCodePath)
             # propogate the exitCode to sys.exit()
@@ -0,0 +1,194 @@
+"""CPU affinity of local tasks
+
+The driver allocates a set of CPUs to each local task (nproc CPUs, from a
+single NUMA node if possible) when pbsmrtpipe.options.cpu_affinity is
+enabled. The CPU set is written to the runnable-task.json and the runner
+pins itself (and the task commands it starts) to the CPUs. The CPUs are
+released when the task is completed.
+"""
+import os
+import re
+import glob
+import ctypes
+import ctypes.util
+import logging
+import subprocess
+import threading
+import multiprocessing
+
+log = logging.getLogger(__name__)
+
+__all__ = ['CpuAllocator',
+           'parse_cpu_list',
+           'to_cpu_list',
+           'get_numa_nodes',
+           'set_cpu_affinity']
+
+
+class Constants(object):
+    SYS_NODE_CPULIST = "/sys/devices/system/node/node*/cpulist"
+    PROC_STATUS = "/proc/self/status"
+
+
+_RX_NODE_ID = re.compile(r'node(\d+)')
+
+
+def parse_cpu_list(s):
+    """Parse a linux CPU list (e.g., '0-3,8,10-11') into a sorted list of ints"""
+    cpus = set()
+    for x in s.strip().split(','):
+        x = x.strip()
+        if not x:
+            continue
+        if '-' in x:
+            start, end = x.split('-')
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(x))
+    return sorted(cpus)
+
+
+def to_cpu_list(cpus):
+    """Convert the CPUs into a linux CPU list (e.g., [0, 1, 2, 3, 8] -> '0-3,8')"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else "{a}-{b}".format(a=a, b=b) for a, b in ranges)
+
+
+def _get_allowed_cpus():
+    """CPUs the process is allowed to run on (e.g., restricted by a cpuset), or None"""
+    try:
+        with open(Constants.PROC_STATUS, 'r') as f:
+            for line in f:
+                if line.startswith("Cpus_allowed_list:"):
+                    return set(parse_cpu_list(line.split(":", 1)[1]))
+    except IOError:
+        pass
+    return None
+
+
+def get_numa_nodes():
+    """
+    Returns a list of (node id, [cpu, ...]) of the CPUs the process is allowed
+    to run on. If the NUMA topology isn't available, all the CPUs are on node 0.
+    """
+    allowed_cpus = _get_allowed_cpus()
+    nodes = []
+    for path in glob.glob(Constants.SYS_NODE_CPULIST):
+        m = _RX_NODE_ID.search(path)
+        with open(path, 'r') as f:
+            cpus = parse_cpu_list(f.read())
+        if allowed_cpus is not None:
+            cpus = [c for c in cpus if c in allowed_cpus]
+        if cpus:
+            nodes.append((int(m.group(1)), cpus))
+
+    if not nodes:
+        cpus = range(multiprocessing.cpu_count()) if allowed_cpus is None else sorted(allowed_cpus)
+        nodes.append((0, list(cpus)))
+
+    return sorted(nodes)
+
+
+class CpuAllocator(object):
+
+    """Thread-safe allocation of CPU sets to tasks
+
+    A task is allocated the CPUs of the NUMA node with the fewest free CPUs
+    that can run it (to keep the larger nodes free for the larger tasks).
+    Otherwise, the task is spread across the nodes with the most free CPUs.
+    """
+
+    def __init__(self, numa_nodes):
+        """:param numa_nodes: list of (node id, [cpu, ...])"""
+        self.numa_nodes = numa_nodes
+        self.ncpus = sum(len(cpus) for _, cpus in numa_nodes)
+        # task id -> [cpu, ...]
+        self._allocations = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=len(self.numa_nodes), c=self.ncpus, a=len(self._allocations))
+        return "<{k} numa nodes:{n} cpus:{c} allocations:{a} >".format(**_d)
+
+    @staticmethod
+    def from_host():
+        return CpuAllocator(get_numa_nodes())
+
+    def _get_free_cpus(self):
+        used = set(c for cpus in self._allocations.values() for c in cpus)
+        return [(node_id, [c for c in cpus if c not in used]) for node_id, cpus in self.numa_nodes]
+
+    def allocate(self, task_id, nproc):
+        """
+        Returns the sorted list of CPUs allocated to the task, or None if
+        there aren't nproc free CPUs (the task is not pinned)
+        """
+        with self._lock:
+            if task_id in self._allocations:
+                return self._allocations[task_id]
+
+            free_cpus = self._get_free_cpus()
+            if sum(len(cpus) for _, cpus in free_cpus) < nproc:
+                return None
+
+            fits = [cpus for _, cpus in free_cpus if len(cpus) >= nproc]
+            if fits:
+                cpus = min(fits, key=len)[:nproc]
+            else:
+                cpus = []
+                for _, node_cpus in sorted(free_cpus, key=lambda x: len(x[1]), reverse=True):
+                    cpus.extend(node_cpus[:nproc - len(cpus)])
+
+            self._allocations[task_id] = sorted(cpus)
+            return self._allocations[task_id]
+
+    def release(self, task_id):
+        with self._lock:
+            return self._allocations.pop(task_id, None)
+
+    def get_allocations(self):
+        """Returns a dict of task id -> [cpu, ...]"""
+        with self._lock:
+            return dict(self._allocations)
+
+
+def _sched_setaffinity(cpus):
+    """Set the affinity of the calling process with sched_setaffinity (linux)"""
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    nbits = 8 * ctypes.sizeof(ctypes.c_ulong)
+    mask = (ctypes.c_ulong * (max(cpus) // nbits + 1))()
+    for cpu in cpus:
+        mask[cpu // nbits] |= 1 << (cpu % nbits)
+    if libc.sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+        e = ctypes.get_errno()
+        raise OSError(e, os.strerror(e))
+
+
+def set_cpu_affinity(cpus):
+    """
+    Pin the current process (and the processes it starts) to the CPUs. Uses
+    sched_setaffinity and falls back to taskset.
+
+    :returns: True if the affinity was set
+    """
+    try:
+        _sched_setaffinity(cpus)
+        return True
+    except (OSError, AttributeError, TypeError) as e:
+        log.debug("sched_setaffinity failed. {e}. Trying taskset".format(e=e))
+
+    cmd = ["taskset", "-p", "-c", to_cpu_list(cpus), str(os.getpid())]
+    try:
+        with open(os.devnull, 'w') as devnull:
+            if subprocess.call(cmd, stdout=devnull, stderr=devnull) == 0:
+                return True
+    except OSError as e:
+        log.debug("taskset failed. {e}".format(e=e))
+
+    log.warn("Unable to set the CPU affinity to {c}".format(c=to_cpu_list(cpus)))
+    return False
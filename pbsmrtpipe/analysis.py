@@ -0,0 +1,300 @@
+"""Static analysis of the parallelism of a pipeline
+
+The task dependency graph is derived from the BindingsGraph of a pipeline
+(no tasks are run). The analysis reports the depth and the width of each
+level, the max number of tasks that can run concurrently (the largest set of
+tasks without a dependency between them) with and without the chunk
+operators applied, and the critical path given the run times of a
+DurationModel.
+"""
+import logging
+from collections import namedtuple, defaultdict
+
+import networkx as nx
+from networkx.algorithms import bipartite
+
+from pbsmrtpipe.graph.models import TaskBindingNode, EntryPointNode, _TaskLike
+from pbsmrtpipe.models import MetaScatterTask
+
+log = logging.getLogger(__name__)
+
+__all__ = ['TemplateAnalysis', 'analyze_bindings_graph', 'to_task_graph',
+           'to_chunked_task_graph', 'to_level_widths', 'to_max_concurrency',
+           'to_critical_path']
+
+
+# Task of a pipeline that could be chunked, but isn't
+UnchunkedTask = namedtuple("UnchunkedTask", "task_id reason")
+
+
+def _to_task_successors(bg, tnode):
+    """Task nodes that consume (via the file nodes) an output of the task"""
+    successors = set()
+    todo = list(bg.successors(tnode))
+    seen = set(todo)
+    while todo:
+        n = todo.pop()
+        if isinstance(n, _TaskLike):
+            successors.add(n)
+        else:
+            for x in bg.successors(n):
+                if x not in seen:
+                    seen.add(x)
+                    todo.append(x)
+    return successors
+
+
+def to_task_graph(bg):
+    """
+    Convert the BindingsGraph to a task dependency graph. The nodes are
+    'task_id-instance_id' with the task_id as a node attribute.
+
+    :type bg: pbsmrtpipe.graph.bgraph.BindingsGraph
+    :rtype: nx.DiGraph
+    """
+    def _to_id(tnode_):
+        return "-".join([tnode_.meta_task.task_id, str(tnode_.instance_id)])
+
+    g = nx.DiGraph()
+    tnodes = [n for n in bg.all_task_type_nodes() if not isinstance(n, EntryPointNode)]
+    for tnode in tnodes:
+        g.add_node(_to_id(tnode), task_id=tnode.meta_task.task_id)
+    for tnode in tnodes:
+        for s in _to_task_successors(bg, tnode):
+            if not isinstance(s, EntryPointNode):
+                g.add_edge(_to_id(tnode), _to_id(s))
+    return g
+
+
+def _to_nchunks(scatter_meta_task, max_nchunks):
+    if isinstance(scatter_meta_task, MetaScatterTask) and isinstance(scatter_meta_task.chunk_di, int):
+        return min(scatter_meta_task.chunk_di, max_nchunks)
+    return max_nchunks
+
+
+def to_chunked_task_graph(g, chunk_operators_d, registered_tasks_d, max_nchunks):
+    """
+    Apply the chunk operators to a task graph. A chunked task is replaced by
+    the scatter task, the chunks of the task and the gather tasks
+
+    a -> T -> b
+
+    To
+
+    a -> TS -> {T_0 ... T_n} -> {TG_0 ... TG_m} -> b
+
+    :rtype: nx.DiGraph
+    """
+    cg = g.copy()
+    for operator_id, chunk_operator in sorted(chunk_operators_d.iteritems()):
+        nodes = [n for n, d in cg.nodes(data=True) if d['task_id'] == chunk_operator.scatter.task_id and not d.get('chunked')]
+        for n in nodes:
+            scatter_task_id = chunk_operator.scatter.scatter_task_id
+            nchunks = _to_nchunks(registered_tasks_d.get(scatter_task_id), max_nchunks)
+            predecessors, successors = cg.predecessors(n), cg.successors(n)
+            cg.remove_node(n)
+
+            sid = "-".join([n, "scatter"])
+            cg.add_node(sid, task_id=scatter_task_id, chunked=True)
+            for p in predecessors:
+                cg.add_edge(p, sid)
+
+            chunk_ids = []
+            for i in xrange(nchunks):
+                cid = "-".join([n, "chunk", str(i)])
+                cg.add_node(cid, task_id=chunk_operator.scatter.task_id, chunked=True, nchunks=nchunks)
+                cg.add_edge(sid, cid)
+                chunk_ids.append(cid)
+
+            for gather_chunk in chunk_operator.gather.chunks:
+                gid = "-".join([n, "gather", gather_chunk.chunk_key])
+                cg.add_node(gid, task_id=gather_chunk.gather_task_id, chunked=True)
+                for cid in chunk_ids:
+                    cg.add_edge(cid, gid)
+                for s in successors:
+                    cg.add_edge(gid, s)
+    return cg
+
+
+def to_levels(g):
+    """Level of each task. Tasks without dependencies are level 0
+
+    :rtype: dict
+    """
+    levels = {}
+    for n in nx.topological_sort(g):
+        levels[n] = max([levels[p] + 1 for p in g.predecessors(n)] + [0])
+    return levels
+
+
+def to_level_widths(g):
+    """Number of tasks at each level"""
+    widths = defaultdict(int)
+    for level in to_levels(g).values():
+        widths[level] += 1
+    return [widths[i] for i in xrange(len(widths))]
+
+
+def to_max_concurrency(g):
+    """
+    Max number of tasks that can run concurrently. This is the largest set
+    of tasks without a (transitive) dependency between them, which (Dilworth)
+    is the number of tasks minus the max matching in the bipartite graph of
+    the transitive closure.
+    """
+    closure = nx.Graph()
+    for n in g.nodes_iter():
+        for d in nx.descendants(g, n):
+            closure.add_edge(('u', n), ('v', d))
+    nmatched = len(bipartite.maximum_matching(closure)) // 2 if closure else 0
+    return g.number_of_nodes() - nmatched
+
+
+def to_critical_path(g, weights):
+    """
+    Longest path of the task graph weighted by the run time of the tasks
+
+    :param weights: {node: run time}
+    :returns: (run time, [nodes])
+    """
+    # node -> (run time of the longest path ending at the node, predecessor)
+    paths = {}
+    for n in nx.topological_sort(g):
+        run_times = [(paths[p][0], p) for p in g.predecessors(n)]
+        run_time, p = max(run_times) if run_times else (0.0, None)
+        paths[n] = (run_time + weights[n], p)
+
+    if not paths:
+        return 0.0, []
+
+    n = max(paths, key=lambda x: paths[x][0])
+    run_time = paths[n][0]
+    nodes = []
+    while n is not None:
+        nodes.append(n)
+        n = paths[n][1]
+    return run_time, list(reversed(nodes))
+
+
+def to_task_weights(g, duration_model):
+    """Run time of each task in the graph. Chunks are the run time of the
+    task split across the chunks
+
+    :type duration_model: pbsmrtpipe.simulator.DurationModel
+    """
+    weights = {}
+    for n, d in g.nodes_iter(data=True):
+        weights[n] = duration_model.to_run_time(d['task_id'], d.get('nchunks'))
+    return weights
+
+
+def to_unchunked_tasks(bg, chunk_operators_d, valid_chunk_operators_d, registered_tasks_d):
+    """
+    Tasks of the pipeline that are scatterable, but are not chunked
+
+    - a chunk operator is registered for the task, but is invalid
+    - no chunk operator is registered for the task, but a registered scatter
+      task accepts the inputs of the task
+
+    :rtype: list[UnchunkedTask]
+    """
+    chunked_task_ids = {op.scatter.task_id for op in valid_chunk_operators_d.values()}
+    operator_task_ids = {op.scatter.task_id for op in chunk_operators_d.values()}
+    scatter_tasks = [t for t in registered_tasks_d.values() if isinstance(t, MetaScatterTask)]
+
+    task_ids = sorted({n.meta_task.task_id for n in bg.task_nodes() if isinstance(n, TaskBindingNode)})
+    unchunked = []
+    for task_id in task_ids:
+        if task_id in chunked_task_ids:
+            continue
+        if task_id in operator_task_ids:
+            unchunked.append(UnchunkedTask(task_id, "chunk operator is invalid"))
+            continue
+        input_types = [x.file_type_id for x in registered_tasks_d[task_id].input_types]
+        for s in scatter_tasks:
+            if [x.file_type_id for x in s.input_types] == input_types:
+                unchunked.append(UnchunkedTask(task_id, "no chunk operator. Scatter task {s} accepts the inputs".format(s=s.task_id)))
+                break
+    return unchunked
+
+
+class TemplateAnalysis(object):
+
+    def __init__(self, level_widths, max_concurrency, max_chunked_concurrency, max_nchunks,
+                 critical_path, chunked_critical_path, unchunked_tasks):
+        """
+        :param critical_path: (run time, [(task id, run time)])
+        :type unchunked_tasks: list[UnchunkedTask]
+        """
+        self.level_widths = level_widths
+        self.max_concurrency = max_concurrency
+        self.max_chunked_concurrency = max_chunked_concurrency
+        self.max_nchunks = max_nchunks
+        self.critical_path = critical_path
+        self.chunked_critical_path = chunked_critical_path
+        self.unchunked_tasks = unchunked_tasks
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, d=self.depth, c=self.max_concurrency,
+                  x=self.max_chunked_concurrency)
+        return "<{k} depth:{d} max concurrency:{c} chunked:{x} >".format(**_d)
+
+    @property
+    def depth(self):
+        return len(self.level_widths)
+
+    def to_dict(self):
+        def _to_d(path):
+            run_time, tasks = path
+            return dict(run_time=run_time, tasks=[dict(task_id=i, run_time=t) for i, t in tasks])
+
+        return dict(depth=self.depth,
+                    level_widths=self.level_widths,
+                    max_concurrency=self.max_concurrency,
+                    max_chunked_concurrency=self.max_chunked_concurrency,
+                    max_nchunks=self.max_nchunks,
+                    critical_path=_to_d(self.critical_path),
+                    chunked_critical_path=_to_d(self.chunked_critical_path),
+                    unchunked_tasks=[t._asdict() for t in self.unchunked_tasks])
+
+    def to_summary(self):
+        _d = dict(d=self.depth, w=" ".join(str(x) for x in self.level_widths),
+                  c=self.max_concurrency, x=self.max_chunked_concurrency, n=self.max_nchunks,
+                  p=self.critical_path[0], q=self.chunked_critical_path[0])
+        outs = ["Depth                     : {d}".format(**_d),
+                "Width per level           : {w}".format(**_d),
+                "Max concurrency           : {c}".format(**_d),
+                "Max concurrency (chunked) : {x} (max_nchunks {n})".format(**_d),
+                "Critical path             : {p:.1f} sec".format(**_d),
+                "Critical path (chunked)   : {q:.1f} sec".format(**_d)]
+        for task_id, run_time in self.chunked_critical_path[1]:
+            outs.append("  {t:.1f} sec {i}".format(t=run_time, i=task_id))
+        if self.unchunked_tasks:
+            outs.append("Scatterable tasks that are not chunked")
+            for t in self.unchunked_tasks:
+                outs.append("  {i} ({r})".format(i=t.task_id, r=t.reason))
+        return "\n".join(outs)
+
+
+def analyze_bindings_graph(bg, chunk_operators_d, valid_chunk_operators_d, registered_tasks_d,
+                           max_nchunks, duration_model):
+    """
+    :type bg: pbsmrtpipe.graph.bgraph.BindingsGraph
+    :param chunk_operators_d: All the registered chunk operators
+    :param valid_chunk_operators_d: The chunk operators applied to the pipeline
+    :type duration_model: pbsmrtpipe.simulator.DurationModel
+
+    :rtype: TemplateAnalysis
+    """
+    g = to_task_graph(bg)
+    cg = to_chunked_task_graph(g, valid_chunk_operators_d, registered_tasks_d, max_nchunks)
+
+    def _to_path(g_):
+        weights = to_task_weights(g_, duration_model)
+        run_time, nodes = to_critical_path(g_, weights)
+        return run_time, [(g_.node[n]['task_id'], weights[n]) for n in nodes]
+
+    unchunked = to_unchunked_tasks(bg, chunk_operators_d, valid_chunk_operators_d, registered_tasks_d)
+
+    return TemplateAnalysis(to_level_widths(g), to_max_concurrency(g), to_max_concurrency(cg),
+                            max_nchunks, _to_path(g), _to_path(cg), unchunked)
@@ -157,15 +157,20 @@ def run_show_templates(avro_output_dir=None, json_output_dir=None):
     from pbsmrtpipe.pb_io import (write_pipeline_templates_to_avro,
                                   write_pipeline_templates_to_json)
 
-    rtasks_d, _, _, pts = L.load_all()
+    # Listing the templates only requires the pipeline definitions. The
+    # pipelines and tool contracts are only loaded to write the templates.
+    pts = L.load_all_installed_pipelines()
 
-    print pretty_registered_pipelines(pts)
+    print pretty_registered_pipelines(pts.definitions())
 
-    if avro_output_dir is not None:
-        write_pipeline_templates_to_avro(pts.values(), rtasks_d, avro_output_dir)
+    if avro_output_dir is not None or json_output_dir is not None:
+        rtasks_d = L.load_all_tool_contracts()
 
-    if json_output_dir is not None:
-        write_pipeline_templates_to_json(pts.values(), rtasks_d, json_output_dir)
+        if avro_output_dir is not None:
+            write_pipeline_templates_to_avro(pts.values(), rtasks_d, avro_output_dir)
+
+        if json_output_dir is not None:
+            write_pipeline_templates_to_json(pts.values(), rtasks_d, json_output_dir)
 
     return 0
 
@@ -610,6 +615,246 @@ def add_args_run_diagnstic(p):
     return p
 
 
+def run_simulate(pipeline_id_or_template_xml, preset_xmls, force_chunk_mode, max_nworkers, max_nproc,
+                 max_total_nproc, max_nchunks, nchunks, durations, default_run_time, output_json):
+    import pbsmrtpipe.graph.bgraph as B
+    import pbsmrtpipe.simulator as S
+    from pbsmrtpipe.run_time_model import DurationModel, load_duration_model
+
+    rtasks, _, chunk_operators, pipelines = __dynamically_load_all()
+
+    if pipeline_id_or_template_xml in pipelines:
+        bindings = pipelines[pipeline_id_or_template_xml].all_bindings
+        wopts = {}
+    elif os.path.isfile(pipeline_id_or_template_xml):
+        builder_record = IO.parse_pipeline_template_xml(os.path.abspath(pipeline_id_or_template_xml), pipelines)
+        bindings = builder_record.bindings
+        wopts = dict(builder_record.workflow_options)
+    else:
+        raise ValueError("Unable to find pipeline id or template XML '{i}'".format(i=pipeline_id_or_template_xml))
+
+    if preset_xmls:
+        wopts.update(dict(IO.parse_pipeline_preset_xmls(preset_xmls).workflow_options))
+
+    workflow_opts = IO.WorkflowLevelOptions.from_id_dict(wopts)
+
+    # Explicit overrides of the preset values
+    overrides = dict(chunk_mode=force_chunk_mode, max_nworkers=max_nworkers, max_nproc=max_nproc,
+                     total_max_nproc=max_total_nproc, max_nchunks=max_nchunks)
+    for attr_name, value in overrides.iteritems():
+        if value is not None:
+            setattr(workflow_opts, attr_name, value)
+    # same bounds as a run of the pipeline
+    workflow_opts = D._resolve_nproc_and_nchunks(workflow_opts)
+
+    if durations is None:
+        duration_model = DurationModel(default_run_time=default_run_time)
+    else:
+        duration_model = load_duration_model(durations, default_run_time=default_run_time)
+
+    bg = B.binding_strs_to_binding_graph(rtasks, bindings)
+    chunk_operators_d = D._get_valid_chunk_operators(bg, workflow_opts.chunk_mode, chunk_operators, rtasks)
+
+    result = S.simulate_workflow(bg, S.to_simulated_entry_points(bg), chunk_operators_d, rtasks,
+                                 workflow_opts, duration_model, nchunks=nchunks)
+
+    print "Simulated {w} with {m}".format(w=pipeline_id_or_template_xml, m=duration_model)
+    print "max_nworkers:{w} max_nproc:{p} max_total_nproc:{t} max_nchunks:{c} chunk_mode:{x}".format(
+        w=workflow_opts.max_nworkers, p=workflow_opts.max_nproc, t=workflow_opts.total_max_nproc,
+        c=workflow_opts.max_nchunks, x=workflow_opts.chunk_mode)
+    print result.to_summary()
+
+    if output_json is not None:
+        with open(output_json, 'w') as f:
+            f.write(json.dumps(result.to_dict(), indent=4))
+        print "Wrote simulated task schedule to {p}".format(p=output_json)
+
+    return 0
+
+
+def add_simulate_options(p):
+    p.add_argument('pipeline_id_or_template_xml', type=str,
+                   help="Registered pipeline id (run show-templates) or path to pipeline template XML.")
+    _add_preset_xml_option(p)
+    TU.add_override_chunked_mode(p)
+
+    def _to_h(name):
+        return "Override the {n} workflow option".format(n=name)
+
+    p.add_argument('--max-nworkers', type=int, default=None, help=_to_h("max_nworkers"))
+    p.add_argument('--max-nproc', type=int, default=None, help=_to_h("max_nproc"))
+    p.add_argument('--max-total-nproc', type=int, default=None, help=_to_h("max_total_nproc"))
+    p.add_argument('--max-nchunks', type=int, default=None, help=_to_h("max_nchunks"))
+    p.add_argument('--nchunks', type=int, default=None,
+                   help="Number of chunks each scatter task emits (defaults to max_nchunks)")
+    p.add_argument('--durations', type=str, default=None,
+                   help="Task run times. Path to a completed job dir, its workflow/workflow-graph.json or "
+                        "a JSON model file ({\"run_times\": {task_id: sec}, \"chunked_run_times\": {task_id: sec}})")
+    p.add_argument('--default-run-time', type=float, default=60.0,
+                   help="Run time (sec) of tasks that are not in the durations model")
+    p.add_argument('--output-json', type=str, default=None, help="Write the simulated task schedule to JSON")
+    add_log_level_option(p)
+    return p
+
+
+def _args_run_simulate(args):
+    force_chunk = None
+    if args.force_chunk_mode is True:
+        force_chunk = True
+    if args.disable_chunk_mode is True:
+        force_chunk = False
+
+    preset_xmls = [os.path.abspath(os.path.expandvars(p)) for p in args.preset_xml]
+    return run_simulate(args.pipeline_id_or_template_xml, preset_xmls, force_chunk,
+                        args.max_nworkers, args.max_nproc, args.max_total_nproc,
+                        args.max_nchunks, args.nchunks, args.durations,
+                        args.default_run_time, args.output_json)
+
+
+def run_show_template_analysis(pipeline_id_or_template_xml, preset_xmls, max_nchunks, durations,
+                               default_run_time, output_json):
+    import pbsmrtpipe.graph.bgraph as B
+    import pbsmrtpipe.simulator as S
+    from pbsmrtpipe.run_time_model import DurationModel, load_duration_model
+    import pbsmrtpipe.analysis as A
+
+    rtasks, _, chunk_operators, pipelines = __dynamically_load_all()
+
+    if pipeline_id_or_template_xml in pipelines:
+        bindings = pipelines[pipeline_id_or_template_xml].all_bindings
+        wopts = {}
+    elif os.path.isfile(pipeline_id_or_template_xml):
+        builder_record = IO.parse_pipeline_template_xml(os.path.abspath(pipeline_id_or_template_xml), pipelines)
+        bindings = builder_record.bindings
+        wopts = dict(builder_record.workflow_options)
+    else:
+        raise ValueError("Unable to find pipeline id or template XML '{i}'".format(i=pipeline_id_or_template_xml))
+
+    if preset_xmls:
+        wopts.update(dict(IO.parse_pipeline_preset_xmls(preset_xmls).workflow_options))
+
+    workflow_opts = IO.WorkflowLevelOptions.from_id_dict(wopts)
+    if max_nchunks is not None:
+        workflow_opts.max_nchunks = max_nchunks
+
+    if durations is None:
+        duration_model = DurationModel(default_run_time=default_run_time)
+    else:
+        duration_model = load_duration_model(durations, default_run_time=default_run_time)
+
+    bg = B.binding_strs_to_binding_graph(rtasks, bindings)
+    # the chunked analysis is independent of the chunk_mode of the preset
+    valid_chunk_operators = D._get_valid_chunk_operators(bg, True, chunk_operators, rtasks)
+
+    analysis = A.analyze_bindings_graph(bg, chunk_operators, valid_chunk_operators, rtasks,
+                                        workflow_opts.max_nchunks, duration_model)
+
+    print "Analysis of {w} with {m}".format(w=pipeline_id_or_template_xml, m=duration_model)
+    print analysis.to_summary()
+
+    if output_json is not None:
+        with open(output_json, 'w') as f:
+            f.write(json.dumps(analysis.to_dict(), indent=4))
+        print "Wrote analysis to {p}".format(p=output_json)
+
+    return 0
+
+
+def add_show_template_analysis_options(p):
+    p.add_argument('pipeline_id_or_template_xml', type=str,
+                   help="Registered pipeline id (run show-templates) or path to pipeline template XML.")
+    _add_preset_xml_option(p)
+    p.add_argument('--max-nchunks', type=int, default=None, help="Override the max_nchunks workflow option")
+    p.add_argument('--durations', type=str, default=None,
+                   help="Task run times used to weight the critical path. Path to a completed job dir, its "
+                        "workflow/workflow-graph.json or a JSON model file ({\"run_times\": {task_id: sec}, "
+                        "\"chunked_run_times\": {task_id: sec}})")
+    p.add_argument('--default-run-time', type=float, default=60.0,
+                   help="Run time (sec) of tasks that are not in the durations model")
+    p.add_argument('--output-json', type=str, default=None, help="Write the analysis to JSON")
+    add_log_level_option(p)
+    return p
+
+
+def _args_run_show_template_analysis(args):
+    preset_xmls = [os.path.abspath(os.path.expandvars(p)) for p in args.preset_xml]
+    return run_show_template_analysis(args.pipeline_id_or_template_xml, preset_xmls, args.max_nchunks,
+                                      args.durations, args.default_run_time, args.output_json)
+
+
+def _add_serve_socket_option(p):
+    from pbsmrtpipe.serve import Constants as ServeConstants
+    p.add_argument('--socket', type=str, default=ServeConstants.SOCKET_PATH,
+                   help="Path to the Unix socket of 'pbsmrtpipe serve'")
+    return p
+
+
+def add_serve_options(p):
+    from pbsmrtpipe.serve import Constants as ServeConstants
+    _add_serve_socket_option(p)
+    p.add_argument('--total-max-nproc', type=int, default=None,
+                   help="Max number of nproc used by the local tasks of all the jobs (Default is the number of CPUs)")
+    p.add_argument('--max-jobs', type=int, default=ServeConstants.MAX_JOBS,
+                   help="Max number of jobs to run concurrently")
+    add_log_level_option(p)
+    return p
+
+
+def _args_run_serve(args):
+    import multiprocessing
+    from pbsmrtpipe.serve import run_serve
+    total_max_nproc = multiprocessing.cpu_count() if args.total_max_nproc is None else args.total_max_nproc
+    return run_serve(args.socket, total_max_nproc=total_max_nproc, max_jobs=args.max_jobs)
+
+
+def add_submit_options(p):
+    p.add_argument('pipeline_id', type=str,
+                   help="Registered pipeline id (run show-templates) to show a list of the registered pipelines.")
+    funcs = [_add_serve_socket_option,
+             _add_webservice_config,
+             _add_rc_preset_xml_option,
+             _add_preset_xml_option,
+             _add_output_dir_option,
+             _add_entry_point_option,
+             add_log_debug_option]
+    f = compose(*funcs)
+    return f(p)
+
+
+def _print_serve_response(response_d):
+    print json.dumps(response_d, sort_keys=True, indent=4)
+    return 0 if response_d['status'] == "ok" else 1
+
+
+def _args_run_submit(args):
+    from pbsmrtpipe.serve import submit_job
+    ep_d = _cli_entry_point_args_to_dict(args.entry_points)
+    preset_xmls = [os.path.abspath(os.path.expandvars(p)) for p in args.preset_xml]
+    response_d = submit_job(args.socket, args.pipeline_id, ep_d, args.output_dir, preset_xmls=preset_xmls,
+                            preset_rc_xml=args.preset_rc_xml, service_uri=args.service_uri,
+                            debug_mode=args.debug)
+    return _print_serve_response(response_d)
+
+
+def add_serve_status_options(p):
+    _add_serve_socket_option(p)
+    p.add_argument('--job-id', type=int, default=None, help="Only show the job (Default is all jobs)")
+    p.add_argument('--shutdown', action='store_true', default=False,
+                   help="Shut down the daemon after the running and queued jobs are completed")
+    return p
+
+
+def _args_run_serve_status(args):
+    from pbsmrtpipe.serve import send_request
+    if args.shutdown:
+        request_d = dict(command="shutdown")
+    elif args.job_id is not None:
+        request_d = dict(command="status", job_id=args.job_id)
+    else:
+        request_d = dict(command="jobs")
+    return _print_serve_response(send_request(args.socket, request_d))
+
+
 def get_parser():
     desc = "Pbsmrtpipe workflow engine"
     p = get_default_argparser(pbsmrtpipe.get_version(), desc)
@@ -638,6 +883,11 @@ def get_parser():
     # Show Template Details
     builder('show-template-details', "Show details about a specific Pipeline template.", add_show_template_details_parser_options, _args_run_show_template_details)
 
+    # Static analysis of the parallelism of a Template
+    analysis_desc = "Show the depth, width per level, max concurrency (with and without chunking) and " \
+                    "critical path of a Pipeline template. No tasks are run."
+    builder('show-template-analysis', analysis_desc, add_show_template_analysis_options, _args_run_show_template_analysis)
+
     # Show Tasks
     show_tasks_desc = "Show completed list of Tasks by id. Use ENV {x} to define a " \
                       "custom directory of tool contracts. These TCs will override " \
@@ -654,6 +904,18 @@ def get_parser():
     diag_desc = "Diagnostic tests of preset.xml and cluster configuration"
     builder('run-diagnostic', diag_desc, add_args_run_diagnstic, _args_run_diagnostics)
 
+    sim_desc = "Predict the makespan, peak concurrency and slot utilization of a pipeline by " \
+               "simulating the scheduler against a virtual clock. No tasks are run."
+    builder('simulate', sim_desc, add_simulate_options, _args_run_simulate)
+
+    serve_desc = "Run a daemon that keeps the registry loaded and runs the jobs submitted over " \
+                 "a Unix socket concurrently, with a shared pool of nproc slots."
+    builder('serve', serve_desc, add_serve_options, _args_run_serve)
+
+    builder('submit', "Submit a job to 'pbsmrtpipe serve' by registered pipeline id.", add_submit_options, _args_run_submit)
+
+    builder('serve-status', "Show the jobs of (or shut down) 'pbsmrtpipe serve'.", add_serve_status_options, _args_run_serve_status)
+
     return p
 
 
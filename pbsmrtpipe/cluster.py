@@ -20,6 +20,8 @@ _PACKAGE_DIR = os.path.dirname(os.path.dirname(pbsmrtpipe.__file__))
 
 __all__ = ['load_installed_cluster_templates',
            'load_installed_cluster_templates_by_name',
+           'load_named_cluster_templates',
+           'parse_named_cluster_templates',
            'ClusterTemplate',
            'ClusterTemplateRender',
            'CLUSTER_TEMPLATE_DIR']
@@ -29,6 +31,9 @@ class Constants(object):
     # Each template must be implemented.
     START = "start"
     STOP = "stop"
+    # Name of the cluster_manager templates when several named
+    # cluster templates are used
+    DEFAULT_NAME = "default"
 
     @classmethod
     def all(cls):
@@ -117,6 +122,42 @@ def load_cluster_templates(path_or_module_name):
         raise ValueError("Unable to load cluster manager from '{p}'".format(p=path_or_module_name))
 
 
+def parse_named_cluster_templates(s):
+    """
+    Parse named cluster templates from a str
+
+    "short=pbsmrtpipe.cluster_templates.sge,highmem=/path/to/sge_highmem"
+
+    :rtype: dict[str, str]
+    """
+    names = {}
+    if not s:
+        return names
+    for item in s.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            name, path = [x.strip() for x in item.split("=")]
+        except ValueError:
+            raise ValueError("Invalid named cluster template '{i}'. Expected format 'name=path_or_module'".format(i=item))
+        if name == Constants.DEFAULT_NAME:
+            raise ValueError("Cluster template name '{n}' is reserved for the cluster manager".format(n=name))
+        if name in names:
+            raise ValueError("Duplicate cluster template name '{n}'".format(n=name))
+        names[name] = path
+    return names
+
+
+def load_named_cluster_templates(s):
+    """
+    Load the named cluster templates from a str (see parse_named_cluster_templates)
+
+    :rtype: dict[str, ClusterTemplateRender]
+    """
+    return {name: load_cluster_templates(path) for name, path in parse_named_cluster_templates(s).iteritems()}
+
+
 def load_installed_cluster_templates():
     """
 
@@ -62,12 +62,23 @@ RX_CHUNK_ID = re.compile(r'(^[A-z0-9_]*)')
 
 TASK_MANIFEST_JSON = 'task-manifest.json'
 RUNNABLE_TASK_JSON = "runnable-task.json"
+# Task of a completed task, written when the task is spilled from the master
+TASK_JSON = "task.json"
 TASK_MANIFEST_VERSION = '0.3.0'
 
 RESOLVED_TOOL_CONTRACT_JSON = "resolved-tool-contract.json"
 RESOLVED_TOOL_CONTRACT_AVRO = 'resolved-tool-contract.avro'
 TOOL_CONTRACT_JSON = "tool-contract.json"
 
+# Chrome trace-event timeline of the master and workers (in workflow/)
+WORKFLOW_TRACE_JSON = "trace.json"
+# gzip'd JSON lines snapshot of the bindings graph (in workflow/)
+WORKFLOW_GRAPH_SNAPSHOT = "workflow-graph.jsonl.gz"
+# Prometheus text format metrics of the master (in workflow/)
+WORKFLOW_METRICS_PROM = "metrics.prom"
+# JSON lines of the local vs cluster routing decisions (in workflow/)
+WORKFLOW_ROUTING_JSONL = "routing.jsonl"
+
 # ***** DEFAULT PIPELINE LEVEL OPTIONS ******
 # Global hard limit on the maximum number of chunks per task are created
 MAX_NCHUNKS = 128
@@ -81,6 +92,52 @@ CLUSTER_MANAGER_DIR = None
 TMP_DIR = os.getenv('TMP_DIR', '/tmp')
 EXIT_ON_FAILIURE = False
 DEBUG_MODE = False
+# Port of the localhost metrics endpoint of the master (None disables the endpoint)
+METRICS_PORT = None
+# Run distributed tasks predicted to run less than this (in sec) locally (None disables)
+LOCAL_RUN_TIME_THRESHOLD = None
+# Job dir, workflow-graph.json or duration model JSON used to predict task run times
+RUN_TIME_HISTORY = None
+# Per-task run time hints "task_id=sec,task_id=sec"
+RUN_TIME_HINTS = None
+# Named cluster templates "name=path_or_module,name=path_or_module"
+CLUSTER_TEMPLATES = None
+# Rules to select the cluster template of a distributed task "name: cond, cond; name: cond"
+CLUSTER_ROUTING_RULES = None
+# Per-task memory hints (in MB) "task_id=mb,task_id=mb"
+MEMORY_HINTS = None
+# Speculatively re-run chunks running longer than this multiple of the median
+# run time of their completed sibling chunks (None disables)
+SPECULATIVE_MULTIPLE = None
+# Chunks running less than this (in sec) are never speculatively re-run
+SPECULATIVE_MIN_RUN_TIME = 60.0
+# Per-task walltimes (in sec) "task_id=sec,task_id=sec"
+TASK_WALLTIMES = None
+# Walltime of a task as a multiple of its run time in the run time history (None disables)
+WALLTIME_MULTIPLIER = None
+# Cluster EXTRAS of tasks with a walltime, e.g., "-l h_rt=${WALLTIME}"
+WALLTIME_EXTRAS = None
+# State file of the host-wide nproc/memory slots shared by all the pbsmrtpipe
+# instances on the host (None disables)
+HOST_SLOT_BROKER = None
+# Max nproc of the local tasks of all instances (None is the number of CPUs)
+HOST_MAX_NPROC = None
+# Max memory (in MB) of the local tasks of all instances (None is unbounded)
+HOST_MAX_MEMORY = None
+# Pin each local task to nproc CPUs (NUMA node local if possible)
+CPU_AFFINITY = False
+# Write the Task of completed tasks to the task dir and drop it from the master
+SPILL_COMPLETED_TASKS = False
+# Node-local scratch dir the task inputs and outputs are staged in, e.g.,
+# "$TMPDIR" (env vars are expanded on the node). None disables the staging
+STAGE_DIR = None
+# Task ids (glob patterns) "task_id,task_id" of the staged tasks (None is all the tasks)
+STAGE_TASK_IDS = None
+# Inputs larger than this (in MB) are read in place
+STAGE_MAX_INPUT_SIZE = 10240
+# File type ids (glob patterns) that are never staged. The DataSet XMLs
+# reference their external resources (e.g., BAMs) by path
+STAGE_SKIP_FILE_TYPES = "PacBio.DataSet.*"
 
 
 class PacBioNamespaces(object):
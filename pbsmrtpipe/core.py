@@ -18,7 +18,7 @@ from pbsmrtpipe.constants import (ENTRY_PREFIX,
                                   RX_TASK_ID, RX_BINDING_PIPELINE_ENTRY,
                                   RX_BINDING_PIPELINE_TASK)
 
-from pbsmrtpipe.models import Pipeline, REGISTERED_PIPELINES
+from pbsmrtpipe.models import Pipeline, LazyPipelineRegistry, REGISTERED_PIPELINES
 
 from pbsmrtpipe.utils import validate_type_or_raise
 
@@ -117,25 +117,36 @@ def _load_existing_pipeline(p, p_existing):
 
 
 def _load_existing_pipeline_or_raise(pipelines_d, p, p_existing_id):
-    if p_existing_id not in pipelines_d.keys():
+    if p_existing_id not in pipelines_d:
         raise KeyError("Pipeline '{i}' required pipeline '{o}' to be defined.".format(i=p.pipeline_id, o=p_existing_id))
 
     p_existing = pipelines_d[p_existing_id]
     _load_existing_pipeline(p, p_existing)
 
 
-def load_pipeline_bindings(registered_pipeline_d, pipeline_id, display_name, version, description, bs, tags, task_options):
+def _to_unique(xs):
+    """Remove duplicates and preserve the order"""
+    seen = set()
+    items = []
+    for x in xs:
+        if x not in seen:
+            seen.add(x)
+            items.append(x)
+    return items
+
+
+def to_pipeline(registered_pipeline_d, pipeline_id, display_name, version, description, bs, tags, task_options):
     """
-    Mutate the registered pipelines registry
+    Create a Pipeline from binding strings. The pipelines referenced by the
+    bindings are loaded from the registry.
 
-    :param registered_pipeline_d:
-    :param pipeline_id:
+    :param registered_pipeline_d: {id: Pipeline}
     :param bs: list of binding strings [(a, b), ]
 
-    :return: mutated pipeline registry
+    :rtype: Pipeline
     """
     # only use unique pairs
-    bs = list({x for x in bs})
+    bs = _to_unique(bs)
 
     log.debug("Processing pipeline {i}".format(i=pipeline_id))
     # str, [(in, out)] [(in, out)]
@@ -197,14 +208,67 @@ def load_pipeline_bindings(registered_pipeline_d, pipeline_id, display_name, ver
         else:
             raise MalformedPipelineError("Unhandled binding case '{o}' -> '{i}'".format(o=b_out, i=b_in))
 
-        if pipeline.pipeline_id not in registered_pipeline_d:
-            log.debug("registering pipeline {i}".format(i=pipeline.pipeline_id))
+    # Parent pipelines that share a pipeline (or bindings) yield duplicates
+    pipeline.bindings = _to_unique(pipeline.bindings)
+    pipeline.entry_bindings = _to_unique(pipeline.entry_bindings)
+    pipeline.parent_pipeline_ids = _to_unique(pipeline.parent_pipeline_ids)
+
+    return pipeline
 
-        registered_pipeline_d[pipeline.pipeline_id] = pipeline
+
+def load_pipeline_bindings(registered_pipeline_d, pipeline_id, display_name, version, description, bs, tags, task_options):
+    """
+    Mutate the registered pipelines registry
+
+    :param registered_pipeline_d:
+    :param pipeline_id:
+    :param bs: list of binding strings [(a, b), ]
+
+    :return: mutated pipeline registry
+    """
+    pipeline = to_pipeline(registered_pipeline_d, pipeline_id, display_name, version, description, bs, tags, task_options)
+
+    if pipeline.pipeline_id not in registered_pipeline_d:
+        log.debug("registering pipeline {i}".format(i=pipeline.pipeline_id))
+
+    registered_pipeline_d[pipeline.pipeline_id] = pipeline
 
     return registered_pipeline_d
 
 
+class PipelineDefinition(object):
+
+    """Definition of a registered Pipeline
+
+    The bindings func is only called when the Pipeline is resolved by the
+    registry (see LazyPipelineRegistry)
+    """
+
+    def __init__(self, idx, display_name, version, description, bindings_func, tags=(), task_options=None):
+        self.idx = idx
+        self.display_name = display_name
+        self.version = version
+        self.description = description
+        # func() -> [(a, b), ]
+        self.bindings_func = bindings_func
+        self.tags = tags
+        self.task_options = {} if task_options is None else task_options
+
+    @property
+    def pipeline_id(self):
+        return self.idx
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, i=self.idx, d=self.display_name)
+        return "<{k} id={i} name={d} >".format(**_d)
+
+    def to_pipeline(self, registered_pipeline_d):
+        """:rtype: Pipeline"""
+        bs = self.bindings_func()
+        return to_pipeline(registered_pipeline_d, self.idx, self.display_name, self.version,
+                           self.description, bs, self.tags, self.task_options)
+
+
 def register_pipeline(pipeline_id, display_name, version, tags=(), task_options=None):
 
     def deco_wrapper(func):
@@ -212,8 +276,8 @@ def register_pipeline(pipeline_id, display_name, version, tags=(), task_options=
         if pipeline_id in REGISTERED_PIPELINES:
             log.warn("'{i}' has already been registered.".format(i=pipeline_id))
 
-        bs = func()
-        load_pipeline_bindings(REGISTERED_PIPELINES, pipeline_id, display_name, version, func.__doc__, bs, tags, task_options=task_options)
+        REGISTERED_PIPELINES.register(PipelineDefinition(pipeline_id, display_name, version, func.__doc__, func,
+                                                         tags=tags, task_options=task_options))
 
         def wrapper(*args, **kwargs):
             return func(*args, **kwargs)
@@ -231,7 +295,7 @@ class PipelineRegistry(object):
     def __init__(self, namespace):
         self.namespace = namespace
         # {id:Pipeline}
-        self.pipelines = {}
+        self.pipelines = LazyPipelineRegistry()
 
     def __repr__(self):
         _d = dict(k=self.__class__.__name__, n=self.namespace, p=len(self.pipelines))
@@ -242,9 +306,9 @@ class PipelineRegistry(object):
         def _w(func):
             desc = func.__doc__
             t_options = {} if task_options is None else copy.deepcopy(task_options)
-            bs = func()
             pipeline_id = ".".join([self.namespace, 'pipelines', relative_pipeline_id])
-            load_pipeline_bindings(self.pipelines, pipeline_id, name, version, desc, bs, tags=tags, task_options=t_options)
-            return bs
+            self.pipelines.register(PipelineDefinition(pipeline_id, name, version, desc, func,
+                                                       tags=tags, task_options=t_options))
+            return func
 
         return _w
\ No newline at end of file
@@ -1,4 +1,4 @@
-from collections import deque
+from collections import defaultdict
 import logging
 import os
 import socket
@@ -12,19 +12,15 @@ import pprint
 import traceback
 import types
 import functools
-import uuid
 import platform
 
 from pbcommand.pb_io import (write_resolved_tool_contract,
-                             write_tool_contract,
-                             load_report_from_json)
+                             write_tool_contract)
 from pbcommand.pb_io.tool_contract_io import write_resolved_tool_contract_avro
 from pbcommand.utils import log_traceback
 from pbcommand.models import (FileTypes, DataStoreFile)
 from pbsmrtpipe.utils import nfs_exists_check
 
-from pbcore.io import getDataSetUuid
-
 import pbsmrtpipe
 import pbsmrtpipe.constants as GlobalConstants
 from pbsmrtpipe.exceptions import (PipelineRuntimeError,
@@ -50,10 +46,23 @@ from pbsmrtpipe.graph.models import (TaskStates,
 
 from pbsmrtpipe.models import (Pipeline, ToolContractMetaTask, MetaTask,
                                GlobalRegistry, TaskResult, validate_operator,
-                               AnalysisLink, RunnableTask,
+                               AnalysisLink, RunnableTask, spill_task,
                                ScatterToolContractMetaTask,
                                GatherToolContractMetaTask)
-from pbsmrtpipe.engine import TaskManifestWorker
+from pbsmrtpipe.engine import TaskManifestWorker, tail_file
+from pbsmrtpipe.trace_events import TraceRecorder, WorkerSlots
+from pbsmrtpipe.trace_events import Constants as TraceConstants
+from pbsmrtpipe.metrics import MasterMetrics, MetricsServer
+from pbsmrtpipe.routing import (LocalRoutingPolicy, ClusterTemplateRouter,
+                                 write_routing_decision, parse_memory_hints)
+from pbsmrtpipe.speculation import SpeculationPolicy, SpeculativeTasks, to_speculative_task_id
+from pbsmrtpipe.walltime import WalltimePolicy, to_walltime_extras
+from pbsmrtpipe.walltime import Constants as WalltimeConstants
+from pbsmrtpipe.registrar import BackgroundRegistrar, get_or_create_uuid_from_file
+from pbsmrtpipe.slots import to_slot_pool
+from pbsmrtpipe.affinity import CpuAllocator, to_cpu_list
+from pbsmrtpipe.graph.bgraph_snapshot import BindingsGraphSnapshotWriter
+from pbsmrtpipe.staging import StagingPolicy
 from pbsmrtpipe.pb_io import WorkflowLevelOptions
 
 
@@ -65,6 +74,12 @@ slog = logging.getLogger('status.' + __name__)
 
 class Constants(object):
     SHUTDOWN = "SHUTDOWN"
+    # Min time (in sec) between the checks of the pending background cleanups
+    # of the task dirs (one stat per task dir on NFS)
+    CLEANUP_CHECK_INTERVAL = 30.0
+    # Min time (in sec) between the writes of the live metrics (one pass
+    # over the graph per write)
+    METRICS_WRITE_INTERVAL = 5.0
 
 
 def _init_bg(bg, ep_d):
@@ -116,33 +131,6 @@ def _status(bg):
     return "Workflow status {n}/{t} completed/total tasks".format(t=ntasks, n=ncompleted_tasks)
 
 
-def _get_report_uuid(path):
-    """Get UUID from the file resource or return None"""
-    return load_report_from_json(path).uuid
-
-
-def _get_or_create_uuid_from_file(path):
-    """
-    Extract the uuid from the DataSet or assign a new UUID
-
-    :param path: Path to file
-
-    :rtype: str
-    :return: uuid string
-    """
-
-    loader_funcs = (getDataSetUuid, _get_report_uuid)
-    for get_uuid_func in loader_funcs:
-        try:
-            ds_uuid = get_uuid_func(path)
-        except Exception:
-            ds_uuid = None
-        if ds_uuid is not None:
-            return ds_uuid
-
-    return uuid.uuid4()
-
-
 def _get_last_lines_of_stderr(n, stderr_path):
     """Read in the last N-lines of the stderr from a task
 
@@ -151,9 +139,7 @@ def _get_last_lines_of_stderr(n, stderr_path):
     lines = []
     try:
         nfs_exists_check(stderr_path)
-        with open(stderr_path, 'r') as f:
-            lines = deque(f, n)
-            lines = [l.rstrip() for l in lines]
+        lines = [l.rstrip() for l in tail_file(stderr_path, n)]
     except Exception as e:
         log.exception("Unable to extract stderr from {p} Error {e}".format(p=stderr_path, e=e.message))
 
@@ -197,7 +183,7 @@ def _is_chunked_task_node_type(tnode):
 
 
 def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_dir,
-                   workers, shutdown_event, service_uri_or_none):
+                   workers, shutdown_event, service_uri_or_none, slot_pool=None, setup_logs=True):
     """
     Core runner of a workflow.
 
@@ -205,6 +191,10 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
     :type workflow_opts: WorkflowLevelOptions
     :type output_dir: str
     :type service_uri_or_none: str | None
+    :param slot_pool: nproc slots shared with other workflows
+    :type slot_pool: pbsmrtpipe.slots.SlotPool | None
+    :param setup_logs: Setup the log handlers of the job. Disabled if the
+    handlers are managed by the caller (e.g., pbsmrtpipe serve)
 
     :param workers: {taskid:Worker}
     :return:
@@ -217,11 +207,18 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
     job_id = random.randint(100000, 999999)
     started_at = time.time()
 
+    # Timing spans of the master and each worker slot. Written to
+    # workflow/trace.json (chrome://tracing or Perfetto)
+    tracer = TraceRecorder(min_duration=0.001)
+    worker_slots = WorkerSlots()
+    # task id -> (worker slot lane, submitted at)
+    tid_to_trace = {}
+
     m_ = "Distributed" if workflow_opts.distributed_mode is not None else "Local"
 
     # Setup logger, job directory and initialize DS
     slog.info("creating job resources in {o}".format(o=output_dir))
-    job_resources, ds, master_log_ds_file = DU.job_resource_create_and_setup_logs(output_dir, bg, task_opts, workflow_opts, ep_d)
+    job_resources, ds, master_log_ds_file = DU.job_resource_create_and_setup_logs(output_dir, bg, task_opts, workflow_opts, ep_d, setup_logs=setup_logs)
     slog.info("successfully created job resources.")
 
     slog.info("starting to execute {m} workflow with assigned job_id {i}".format(i=job_id, m=m_))
@@ -254,7 +251,8 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
 
     # Add scattered
     # This will add new nodes to the graph if necessary
-    B.apply_chunk_operator(bg, global_registry.chunk_operators, global_registry.tasks, workflow_opts.max_nchunks)
+    with tracer.span("apply_chunk_operator"):
+        B.apply_chunk_operator(bg, global_registry.chunk_operators, global_registry.tasks, workflow_opts.max_nchunks)
 
     log.debug(BU.to_binding_graph_summary(bg))
 
@@ -287,6 +285,18 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
     sleep_time = 1
     # Running total of current number of slots/cpu's used
     total_nproc = 0
+    # Slots shared with the other workflows run in the same process and
+    # (if enabled) with the other pbsmrtpipe instances on the host
+    slot_pool = to_slot_pool(workflow_opts, multiprocessing.cpu_count(), slot_pool=slot_pool)
+    slot_owner_id = os.path.abspath(output_dir)
+    memory_hints = parse_memory_hints(workflow_opts.memory_hints)
+    slog.info("Slot pool {p}".format(p=slot_pool))
+    # CPU sets of the local tasks
+    cpu_allocator = CpuAllocator.from_host() if workflow_opts.cpu_affinity else None
+    if cpu_allocator is not None:
+        slog.info("CPU affinity enabled {a}".format(a=cpu_allocator))
+    # full snapshot of the graph, with the state changes appended
+    graph_snapshot = BindingsGraphSnapshotWriter(os.path.join(job_resources.workflow, GlobalConstants.WORKFLOW_GRAPH_SNAPSHOT))
 
     # Define a bunch of util funcs to try to make the main driver while loop
     # more understandable. Not the greatest model.
@@ -294,23 +304,280 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
     def _to_run_time():
         return time.time() - started_at
 
-    def write_analysis_report(analysis_file_links_):
+    def write_analysis_report(analysis_file_links_, lane_=TraceConstants.MASTER):
         analysis_report_html = os.path.join(job_resources.html, 'analysis.html')
-        R.write_analysis_link_report(analysis_file_links_, analysis_report_html)
+        with tracer.span("write_analysis_report", lane=lane_):
+            R.write_analysis_link_report(analysis_file_links_, analysis_report_html)
 
     def update_analysis_file_links(task_id_, report_path_):
         analysis_link = AnalysisLink(task_id_, report_path_)
         log.info("updating report analysis file links {a}".format(a=analysis_link))
         analysis_file_links.append(analysis_link)
-        write_analysis_report(analysis_file_links)
+        write_analysis_report(analysis_file_links, lane_=registrar.name)
+
+    def route_task(tnode_, task_id_, nproc_):
+        """Returns True if the distributed task should be run locally"""
+        nchunks_ = None
+        if isinstance(tnode_, TaskChunkedBindingNode) and routing_policy.is_enabled:
+            nchunks_ = B.to_nchunks(bg, tnode_)
+        local_nproc_ = sum(tid_to_local_nproc.values())
+        decision_ = routing_policy.route(task_id_, tnode_.meta_task.task_id, nproc_, local_nproc_, nchunks=nchunks_)
+        slog.info("Routing distributed task {i} to {r} ({m})".format(i=task_id_, r="local" if decision_.run_local else "cluster", m=decision_.reason))
+        if routing_policy.is_enabled:
+            write_routing_decision(decision_, routing_jsonl)
+        return decision_.run_local
+
+    def to_cluster_template(tnode_, task_id_, nproc_):
+        """Returns a tuple of (name, ClusterTemplateRender) of the task"""
+        if cluster_router is None or not tnode_.meta_task.is_distributed:
+            return None, global_registry.cluster_renderer
+        predicted_ = None
+        if cluster_router.uses_run_time:
+            nchunks_ = B.to_nchunks(bg, tnode_) if isinstance(tnode_, TaskChunkedBindingNode) else None
+            predicted_ = routing_policy.to_predicted_run_time(tnode_.meta_task.task_id, nchunks=nchunks_)
+        decision_ = cluster_router.route(task_id_, tnode_.meta_task.task_id, nproc_, run_time=predicted_)
+        slog.info("Selected cluster templates '{n}' for task {i} ({m})".format(n=decision_.name, i=task_id_, m=decision_.reason))
+        return decision_.name, cluster_router.to_cluster_renderer(decision_.name)
+
+    def to_task(tnode_, tid_, task_dir_):
+        """Convert the meta task of the node to a Task (writing to task_dir_)"""
+        to_resources_func_ = B.to_resolve_di_resources(task_dir_, root_tmp_dir=workflow_opts.tmp_dir)
+        input_files_ = B.get_task_input_files(bg, tnode_)
+
+        # convert metatask -> task
+        try:
+            with tracer.span("meta_task_to_task", args=dict(task_id=tid_)):
+                return GX.meta_task_to_task(tnode_.meta_task, input_files_, task_opts, task_dir_, max_nproc, max_nchunks,
+                                            to_resources_func_, to_resolve_files_func)
+        except Exception as e:
+            slog.error("Failed to convert metatask {i} to task. {m}".format(i=tnode_.meta_task.task_id, m=e.message))
+            raise
+
+    def write_runnable_task(tnode_, task_, tid_, task_dir_, run_local_):
+        """Write the (resolved) tool contract and the runnable-task.json of the task
+
+        The cluster template (and the cluster extras) are only selected for
+        tasks that are submitted to the cluster (see to_run_local)
+
+        Returns the path to the runnable-task.json
+        """
+        if isinstance(tnode_.meta_task, (ToolContractMetaTask, ScatterToolContractMetaTask, GatherToolContractMetaTask)):
+            # the task.options have actually already been resolved here, but using this other
+            # code path for clarity
+            if isinstance(tnode_.meta_task, ToolContractMetaTask):
+                rtc = IO.static_meta_task_to_rtc(tnode_.meta_task, task_, task_opts, task_dir_, tmp_dir, max_nproc, is_distributed=is_workflow_distributable)
+            elif isinstance(tnode_.meta_task, ScatterToolContractMetaTask):
+                rtc = IO.static_scatter_meta_task_to_rtc(tnode_.meta_task, task_, task_opts, task_dir_, tmp_dir, max_nproc, max_nchunks, tnode_.meta_task.chunk_keys, is_distributed=is_workflow_distributable)
+            elif isinstance(tnode_.meta_task, GatherToolContractMetaTask):
+                # this should always be a TaskGatherBindingNode which will have a .chunk_key
+                rtc = IO.static_gather_meta_task_to_rtc(tnode_.meta_task, task_, task_opts, task_dir_, tmp_dir, max_nproc, tnode_.chunk_key, is_distributed=is_workflow_distributable)
+            else:
+                raise TypeError("Unsupported task type {t}".format(t=tnode_.meta_task))
+
+            # write driver manifest, which calls the resolved-tool-contract.json
+            # there's too many layers of indirection here. Partly due to the pre-tool-contract era
+            # python defined tasks.
+            # Always write the RTC json for debugging purposes
+            tc_path = os.path.join(task_dir_, GlobalConstants.TOOL_CONTRACT_JSON)
+            write_tool_contract(tnode_.meta_task.tool_contract, tc_path)
+
+            rtc_json_path = os.path.join(task_dir_, GlobalConstants.RESOLVED_TOOL_CONTRACT_JSON)
+            rtc_avro_path = os.path.join(task_dir_, GlobalConstants.RESOLVED_TOOL_CONTRACT_AVRO)
+            if rtc.driver.serialization == 'avro':
+                # hack to fix command
+                task_.cmds[0] = task_.cmds[0].replace('.json', '.avro')
+                write_resolved_tool_contract_avro(rtc, rtc_avro_path)
+            # for debugging
+            write_resolved_tool_contract(rtc, rtc_json_path)
+
+        runnable_task_path_ = os.path.join(task_dir_, GlobalConstants.RUNNABLE_TASK_JSON)
+        cluster_name_, cluster_render_ = (None, None) if run_local_ else to_cluster_template(tnode_, tid_, task_.nproc)
+        walltime_ = to_walltime(tnode_)
+        extras_ = None
+        if cluster_render_ is not None:
+            extras_ = to_walltime_extras(workflow_opts.walltime_extras, walltime_)
+        if walltime_ is not None:
+            tid_to_walltime[tid_] = (walltime_, task_dir_)
+        runnable_task_ = RunnableTask(task_, cluster_render_, cluster_template=cluster_name_,
+                                      walltime=walltime_, extras=extras_,
+                                      staging=staging_policy.to_staging(tnode_.meta_task, task_),
+                                      cleanup_resources=not workflow_opts.debug_mode)
+        runnable_task_.write_json(runnable_task_path_)
+        return runnable_task_path_
+
+    def to_walltime(tnode_):
+        nchunks_ = None
+        if isinstance(tnode_, TaskChunkedBindingNode) and walltime_policy.multiplier is not None:
+            nchunks_ = B.to_nchunks(bg, tnode_)
+        return walltime_policy.to_walltime(tnode_.meta_task.task_id, nchunks=nchunks_)
+
+    def to_timed_out_result():
+        """Watchdog of the running tasks (and copies)
+
+        Kill the first task that is still running after its walltime (and a
+        grace period for the runner to report the time out) to reclaim the
+        slots. The cluster job of a distributed task is stopped. Returns a
+        TaskResult or None.
+        """
+        now_ = time.time()
+        for tid_, (walltime_, task_dir_) in tid_to_walltime.items():
+            if tid_ not in workers:
+                continue
+            # distributed tasks waiting in the queue haven't started
+            started_at_ = T.get_task_started_at(task_dir_)
+            if started_at_ is None:
+                continue
+            run_time_ = now_ - started_at_
+            if run_time_ > walltime_ + WalltimeConstants.GRACE_PERIOD:
+                w_ = workers[tid_]
+                try:
+                    w_.terminate_process_tree()
+                except Exception as e:
+                    log.error("Failed to terminate worker {n} task-id:{i}. {e}".format(n=w_.name, i=tid_, e=e))
+                # reclaim the cluster slots, even if the cluster walltime extras aren't used
+                stop_cluster_job(tid_, task_dir_)
+                msg_ = "Task {i} exceeded walltime of {w:.1f} sec (running for {r:.1f} sec). Killed by the watchdog".format(i=tid_, w=walltime_, r=run_time_)
+                return TaskResult(tid_, TaskStates.TIMED_OUT, msg_, round(run_time_, 2))
+        return None
+
+    def to_started_run_time(tid_):
+        """Returns the time (in sec) since the task (or copy) started running
+        in its task dir, or None if it hasn't started. The time waiting in
+        the cluster queue is not included"""
+        started_at_ = T.get_task_started_at(os.path.join(job_resources.tasks, tid_))
+        return None if started_at_ is None else time.time() - started_at_
+
+    def to_stragglers():
+        """Returns the task ids of the running chunks that are running much
+        longer than their completed sibling chunks"""
+        tids_ = []
+        for tid_ in workers.keys():
+            # speculative copies are not in tid_to_tnode
+            tnode_ = tid_to_tnode.get(tid_)
+            if not isinstance(tnode_, TaskChunkedBindingNode) or speculative_tasks.has_copy(tid_):
+                continue
+            run_time_ = to_started_run_time(tid_)
+            # chunks waiting in the cluster queue haven't started
+            if run_time_ is None:
+                continue
+            if speculation_policy.is_straggler(run_time_, chunk_group_run_times[tnode_.chunk_group_id]):
+                tids_.append(tid_)
+        return tids_
+
+    def start_speculative_copy(tid_):
+        """Run a copy of the task in a separate task dir. Returns the nproc of the copy"""
+        tnode_ = tid_to_tnode[tid_]
+        copy_id_ = speculative_tasks.add(tid_)
+        task_dir_ = os.path.join(job_resources.tasks, copy_id_)
+        if not os.path.exists(task_dir_):
+            os.mkdir(task_dir_)
+
+        task_ = to_task(tnode_, copy_id_, task_dir_)
+        copy_tid_to_task[tid_] = tnode_to_task[tnode_]
+        copy_tid_to_task[copy_id_] = task_
+        run_local_ = to_run_local(tnode_, copy_id_, task_.nproc)
+        runnable_task_path_ = write_runnable_task(tnode_, task_, copy_id_, task_dir_, run_local_)
+
+        w_ = _to_worker(run_local_, "worker-task-{i}".format(i=copy_id_), copy_id_, runnable_task_path_, tnode_, task_.nproc)
+        workers[copy_id_] = w_
+        trace_worker_submitted(copy_id_, w_)
+
+        msg_ = "Task {i} is a straggler of chunk group {g}. Starting speculative copy {c}".format(i=tid_, g=tnode_.chunk_group_id, c=copy_id_)
+        slog.warn(msg_)
+        services_log_update_progress("pbsmrtpipe::{i}".format(i=tid_), WS.LogLevels.INFO, msg_)
+        return task_.nproc
+
+    def stop_cluster_job(tid_, task_dir_):
+        """Kill the cluster job of a distributed task. Terminating the worker
+        only kills the local submit process"""
+        try:
+            T.stop_cluster_job(task_dir_)
+        except Exception as e:
+            log.error("Failed to stop the cluster job of task-id:{i}. {e}".format(i=tid_, e=e))
+
+    def discard_task_copy(copy_id_):
+        """Kill a copy of a speculatively executed task and remove its
+        outputs. Returns the nproc of the copy"""
+        task_ = copy_tid_to_task.pop(copy_id_)
+        w_ = workers.pop(copy_id_)
+        try:
+            w_.terminate_process_tree()
+        except Exception as e:
+            log.error("Failed to terminate worker {n} task-id:{i}. {e}".format(n=w_.name, i=copy_id_, e=e))
+        stop_cluster_job(copy_id_, task_.output_dir)
+        trace_worker_completed(copy_id_, TaskStates.KILLED, 0.0)
+        tid_to_local_nproc.pop(copy_id_, None)
+        slot_pool.release(slot_owner_id, copy_id_)
+        release_cpus(copy_id_)
+        tid_to_walltime.pop(copy_id_, None)
+        for path_ in task_.output_files:
+            if os.path.isfile(path_):
+                os.remove(path_)
+        slog.info("Discarded task copy {i}".format(i=copy_id_))
+        return task_.nproc
+
+    def use_task_copy(tid_, copy_id_):
+        """Use the completed copy (original or speculative) as the Task of the node"""
+        tnode_ = tid_to_tnode[tid_]
+        task_ = copy_tid_to_task.pop(copy_id_)
+        copy_tid_to_task.pop(tid_, None)
+        bg.node[tnode_]['task'] = task_
+        tnode_to_task[tnode_] = task_
+
+    def spill_completed_task(tnode_):
+        """Replace the Task of the completed node by a compact SpilledTask. The
+        registrar keeps its own reference until the outputs are registered"""
+        try:
+            task_ = spill_task(tnode_to_task[tnode_])
+        except (IOError, OSError) as e:
+            log.warn("Unable to spill task {t}. {e}".format(t=tnode_, e=e))
+            return
+        bg.node[tnode_]['task'] = task_
+        tnode_to_task[tnode_] = task_
+
+    def allocate_cpus(tnode_, task_id_, nproc_, manifest_path_):
+        """Pin the local task to a CPU set. The CPUs are written to the runnable-task.json"""
+        cpus_ = cpu_allocator.allocate(task_id_, nproc_)
+        if cpus_ is None:
+            slog.info("Not enough free CPUs to pin task {i} (nproc {n})".format(i=task_id_, n=nproc_))
+            return
+        with open(manifest_path_, 'r') as f_:
+            d_ = json.load(f_)
+        d_['cpus'] = cpus_
+        with open(manifest_path_, 'w') as f_:
+            f_.write(json.dumps(d_, sort_keys=True, indent=4))
+        # speculative copies are not shown in the task summary
+        if not speculative_tasks.is_running_copy(task_id_):
+            bg.node[tnode_]['cpus'] = to_cpu_list(cpus_)
+        slog.info("Pinned task {i} to CPUs {c}".format(i=task_id_, c=to_cpu_list(cpus_)))
+
+    def release_cpus(tid_):
+        if cpu_allocator is not None:
+            cpu_allocator.release(tid_)
 
     # factories for getting a Worker instance
     # utils for getting the running func and worker type
-    def _to_worker(w_is_distributed, wid, task_id, manifest_path_):
+    def to_run_local(tnode_, task_id, nproc_):
+        """Returns True if the task is run locally. Decided before the
+        runnable-task.json is written"""
         # the IO loading will forceful set this to None
         # if the cluster manager not defined or cluster_mode is False
-        if global_registry.cluster_renderer is None or not w_is_distributed:
+        if global_registry.cluster_renderer is None or not tnode_.meta_task.is_distributed:
+            return True
+        # short distributed tasks can be run locally
+        run_local_ = route_task(tnode_, task_id, nproc_)
+        memory_ = int(memory_hints.get(tnode_.meta_task.task_id, 0))
+        if run_local_ and not slot_pool.try_acquire(slot_owner_id, task_id, nproc_, memory=memory_):
+            slog.info("Shared slots are not available. Submitting task {i} to the cluster".format(i=task_id))
+            run_local_ = False
+        return run_local_
+
+    def _to_worker(run_local_, wid, task_id, manifest_path_, tnode_, nproc_):
+        if run_local_:
             r_func = T.run_task_manifest
+            tid_to_local_nproc[task_id] = nproc_
+            if cpu_allocator is not None:
+                allocate_cpus(tnode_, task_id, nproc_, manifest_path_)
         else:
             r_func = T.run_task_manifest_on_cluster
         return TaskManifestWorker(q_out, shutdown_event, worker_sleep_time,
@@ -319,12 +586,55 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
     # Define a bunch of util funcs to try to make the main driver while loop
     # more understandable. Not the greatest model.
     def write_report_(bg_, current_state_, was_successful_):
-        return DU.write_update_main_workflow_report(job_id, job_resources, bg_, current_state_, was_successful_, _to_run_time())
+        with tracer.span("write_main_workflow_report"):
+            return DU.write_update_main_workflow_report(job_id, job_resources, bg_, current_state_, was_successful_, _to_run_time())
 
     def write_task_summary_report(bg_):
-        task_summary_report = DU.to_task_summary_report(bg_)
-        p = os.path.join(job_resources.html, 'task_summary.html')
-        R.write_report_to_html(task_summary_report, p)
+        with tracer.span("write_task_summary_report"):
+            task_summary_report = DU.to_task_summary_report(bg_)
+            p = os.path.join(job_resources.html, 'task_summary.html')
+            R.write_report_to_html(task_summary_report, p)
+
+    def write_binding_graph_images(bg_):
+        with tracer.span("write_binding_graph_images"):
+            BU.write_binding_graph_images(bg_, job_resources.workflow)
+        append_graph_snapshot(bg_)
+
+    def append_graph_snapshot(bg_, tnode_=None):
+        """Append the state changes of the task node, its output files and
+        their successors to the graph snapshot. If the task node is None, the
+        nodes and edges (after the graph was changed) and all the nodes are
+        compared"""
+        nodes_ = None
+        if tnode_ is not None:
+            fnodes_ = bg_.successors(tnode_)
+            nodes_ = set([tnode_] + fnodes_ + [n_ for f_ in fnodes_ for n_ in bg_.successors(f_)])
+        with tracer.span("append_graph_snapshot"):
+            try:
+                graph_snapshot.append(bg_, nodes=nodes_, update_graph=tnode_ is None)
+            except (IOError, OSError, KeyError, TypeError, ValueError) as e_:
+                log.warn("Unable to write graph snapshot {p}. {e}".format(p=graph_snapshot.path, e=e_))
+
+    def write_trace():
+        tracer.add_span("exe_workflow", started_at, time.time(), args=dict(job_id=job_id))
+        trace_json = os.path.join(job_resources.workflow, GlobalConstants.WORKFLOW_TRACE_JSON)
+        tracer.write_json(trace_json)
+
+    def trace_worker_submitted(tid_, worker_):
+        lane_ = worker_slots.acquire(tid_)
+        with tracer.span("spawn", lane=lane_, args=dict(task_id=tid_)):
+            worker_.start()
+        tid_to_trace[tid_] = (lane_, time.time())
+
+    def trace_worker_completed(tid_, state_, run_time_):
+        lane_, submitted_at_ = tid_to_trace.pop(tid_)
+        worker_slots.release(tid_)
+        now_ = time.time()
+        tracer.add_span(tid_, submitted_at_, now_, lane=lane_, args=dict(state=state_, run_time=run_time_))
+        # The runner's run time is the tail of the worker life cycle. The
+        # remainder is the process startup, the cluster queue wait (if
+        # distributed) and the latency of the master polling q_out.
+        tracer.add_span("run", max(submitted_at_, now_ - run_time_), now_, lane=lane_, args=dict(task_id=tid_))
 
     def services_log_update_progress(source_id_, level_, message_):
         if service_uri_or_none is not None:
@@ -338,32 +648,40 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
             WS.add_datastore_file(total_ds_uri, datastore_file_, ignore_errors=True)
 
     def _update_analysis_reports_and_datastore(tnode_, task_):
-        assert (len(tnode_.meta_task.output_file_display_names) ==
-                len(tnode_.meta_task.output_file_descriptions) ==
-                len(tnode_.meta_task.output_types) == len(task_.output_files))
-        for file_type_, path_, name, description in zip(tnode_.meta_task.output_types, task_.output_files, tnode_.meta_task.output_file_display_names, tnode_.meta_task.output_file_descriptions):
-            source_id = "{t}-{f}".format(t=task_.task_id, f=file_type_.file_type_id)
-            ds_uuid = _get_or_create_uuid_from_file(path_)
-            is_chunked_ = _is_chunked_task_node_type(tnode_)
-            ds_file_ = DataStoreFile(ds_uuid, source_id, file_type_.file_type_id, path_, is_chunked=is_chunked_, name=name, description=description)
-            ds.add(ds_file_)
-            ds.write_update_json(job_resources.datastore_json)
-
-            # Update Services
-            services_add_datastore_file(ds_file_)
+        """Register the outputs of the task. This is run in the registrar
+        thread, the datastore and the analysis file links are only accessed
+        from the registrar after the workflow has started."""
+        with tracer.span("update_analysis_reports_and_datastore", lane=registrar.name, args=dict(task_id=task_.task_id)):
+            assert (len(tnode_.meta_task.output_file_display_names) ==
+                    len(tnode_.meta_task.output_file_descriptions) ==
+                    len(tnode_.meta_task.output_types) == len(task_.output_files))
+            for file_type_, path_, name, description in zip(tnode_.meta_task.output_types, task_.output_files, tnode_.meta_task.output_file_display_names, tnode_.meta_task.output_file_descriptions):
+                source_id = "{t}-{f}".format(t=task_.task_id, f=file_type_.file_type_id)
+                ds_uuid = get_or_create_uuid_from_file(file_type_, path_)
+                is_chunked_ = _is_chunked_task_node_type(tnode_)
+                ds_file_ = DataStoreFile(ds_uuid, source_id, file_type_.file_type_id, path_, is_chunked=is_chunked_, name=name, description=description)
+                ds.add(ds_file_)
+
+                # Update Services
+                services_add_datastore_file(ds_file_)
+
+                if file_type_ == FileTypes.REPORT:
+                    T.write_task_report(job_resources, task_.task_id, path_, DU._get_images_in_dir(task_.output_dir))
+                    update_analysis_file_links(tnode_.idx, path_)
 
+            ds.write_update_json(job_resources.datastore_json)
             dsr = DU.datastore_to_report(ds)
             R.write_report_to_html(dsr, os.path.join(job_resources.html, 'datastore.html'))
-            if file_type_ == FileTypes.REPORT:
-                T.write_task_report(job_resources, task_.task_id, path_, DU._get_images_in_dir(task_.output_dir))
-                update_analysis_file_links(tnode_.idx, path_)
 
     def _log_task_failure_and_call_services(task_result, task_id_):
         """
         log the error messages extracted from TaskResult
         :type task_result: TaskResult
         """
-        mx = "Task {i} {m}".format(i=task_id_, m=task_result.error_message)
+        if task_result.state == TaskStates.TIMED_OUT:
+            mx = "Task {i} timed out. {m}".format(i=task_id_, m=task_result.error_message)
+        else:
+            mx = "Task {i} {m}".format(i=task_id_, m=task_result.error_message)
         slog.error(mx)
         log.error(mx)
         services_log_update_progress("pbsmrtpipe::{i}".format(i=task_id_), WS.LogLevels.ERROR, mx)
@@ -373,6 +691,58 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
             return True
         return total_nproc + n <= max_total_nproc
 
+    def acquire_slots(tnode_, tid_, nproc_):
+        """Returns True if the slots are available in the job. The slots of
+        the local tasks are also acquired from the shared slot pool"""
+        if not has_available_slots(nproc_):
+            return False
+        if is_workflow_distributable and tnode_.meta_task.is_distributed:
+            # acquired in to_run_local if the task is routed to run locally
+            return True
+        memory_ = int(memory_hints.get(tnode_.meta_task.task_id, 0))
+        return slot_pool.try_acquire(slot_owner_id, tid_, nproc_, memory=memory_)
+
+    def _get_q_out_depth():
+        try:
+            return q_out.qsize()
+        except NotImplementedError:
+            # qsize isn't supported on OSX
+            return None
+
+    def to_ncleanups_pending(force=False):
+        now_ = time.time()
+        if force or now_ - cleanups_checked_at['t'] >= Constants.CLEANUP_CHECK_INTERVAL:
+            cleanups_checked_at['t'] = now_
+            for task_dir_ in list(cleanup_task_dirs):
+                if not T.is_cleanup_pending(task_dir_):
+                    cleanup_task_dirs.discard(task_dir_)
+        return len(cleanup_task_dirs)
+
+    def write_metrics(loop_dt_, last_completed_at_, force=False):
+        now_ = time.time()
+        if not force and now_ - metrics_written_at['t'] < Constants.METRICS_WRITE_INTERVAL:
+            return
+        metrics_written_at['t'] = now_
+        states_ = [bg.node[t_]['state'] for t_ in bg.all_task_type_nodes()]
+        running_states_ = (TaskStates.SUBMITTED, TaskStates.RUNNING)
+        metrics.update(tasks_runnable=len(B.get_runnable_tasks(bg)),
+                       tasks_running=sum(1 for x in states_ if x in running_states_),
+                       tasks_completed=states_.count(TaskStates.SUCCESSFUL),
+                       tasks_failed=sum(1 for x in states_ if x in TaskStates.FAILURE_STATES()),
+                       tasks_timed_out=states_.count(TaskStates.TIMED_OUT),
+                       tasks_total=len(states_),
+                       workers_running=len(workers),
+                       cleanups_pending=to_ncleanups_pending(),
+                       registrations_pending=registrar.npending,
+                       nproc_used=total_nproc,
+                       nproc_max=max_total_nproc,
+                       result_queue_depth=_get_q_out_depth(),
+                       loop_iteration_seconds=round(loop_dt_, 4),
+                       loop_iterations_total=nloop_iterations,
+                       seconds_since_last_task_completion=round(now_ - last_completed_at_, 2),
+                       run_time_seconds=round(_to_run_time(), 2))
+        metrics.write(metrics_path)
+
     # Misc setup
     write_report_(bg, TaskStates.CREATED, False)
     # write empty analysis reports
@@ -381,7 +751,7 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
     # Add Master log to the datastore file
     services_add_datastore_file(master_log_ds_file)
 
-    BU.write_binding_graph_images(bg, job_resources.workflow)
+    write_binding_graph_images(bg)
 
     # write initial report.
     DU.write_main_workflow_report(job_id, job_resources, workflow_opts, task_opts, bg, TaskStates.RUNNING, False, 0.0)
@@ -393,6 +763,67 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
     tnode_to_task = {}
 
     is_workflow_distributable = global_registry.cluster_renderer is not None
+
+    # Local vs cluster routing of distributed tasks. The local slots are
+    # shared by the local (non-distributed) tasks and the routed tasks.
+    routing_policy = LocalRoutingPolicy.from_workflow_options(workflow_opts, multiprocessing.cpu_count())
+    routing_jsonl = os.path.join(job_resources.workflow, GlobalConstants.WORKFLOW_ROUTING_JSONL)
+    # task id -> nproc of the tasks running locally
+    tid_to_local_nproc = {}
+    # Selection of the named cluster templates (e.g., queues) of the
+    # distributed tasks that are submitted to the cluster
+    cluster_router = None
+    if is_workflow_distributable:
+        slog.info("Local routing policy {p}".format(p=routing_policy))
+        cluster_router = ClusterTemplateRouter.from_workflow_options(workflow_opts, global_registry.cluster_renderer)
+        slog.info("Cluster template router {r}".format(r=cluster_router))
+
+    # Speculative execution of straggling chunks
+    speculation_policy = SpeculationPolicy.from_workflow_options(workflow_opts)
+    speculative_tasks = SpeculativeTasks()
+    # chunk group id -> elapsed times of the successful chunks
+    chunk_group_run_times = defaultdict(list)
+    # task id (or speculative copy id) -> Task of the running copies
+    copy_tid_to_task = {}
+    if speculation_policy.is_enabled:
+        slog.info("Speculation policy {p}".format(p=speculation_policy))
+
+    # Walltime of tasks, enforced by the runner and the watchdog
+    walltime_policy = WalltimePolicy.from_workflow_options(workflow_opts)
+    # task id (or speculative copy id) -> (walltime, task dir)
+    tid_to_walltime = {}
+    if walltime_policy.is_enabled:
+        slog.info("Walltime policy {p}".format(p=walltime_policy))
+
+    # Node-local scratch staging of the task files, done by the runner
+    staging_policy = StagingPolicy.from_workflow_options(workflow_opts)
+    if staging_policy.is_enabled:
+        slog.info("Staging policy {p}".format(p=staging_policy))
+
+    # dirs of the completed tasks whose tmp resources might still be
+    # removed by the background cleanup
+    cleanup_task_dirs = set()
+    cleanups_checked_at = dict(t=0.0)
+
+    # Registration of the outputs of the successful tasks (datastore,
+    # reports and services) in a background thread
+    registrar = BackgroundRegistrar("datastore-registrar")
+    tracer.lane(registrar.name)
+
+    # Live metrics of the master (workflow/metrics.prom)
+    metrics = MasterMetrics(job_id)
+    metrics_path = os.path.join(job_resources.workflow, GlobalConstants.WORKFLOW_METRICS_PROM)
+    metrics_written_at = dict(t=0.0)
+    metrics_server = None
+    if workflow_opts.metrics_port is not None:
+        try:
+            metrics_server = MetricsServer(metrics, workflow_opts.metrics_port).start()
+            slog.info("Serving metrics on http://localhost:{p}/metrics".format(p=metrics_server.port))
+        except socket.error as e:
+            slog.warn("Unable to start metrics server on port {p}. {e}".format(p=workflow_opts.metrics_port, e=e))
+    nloop_iterations = 0
+    loop_started_at = None
+    last_completed_at = started_at
     # local loop for adjusting sleep time, this will get reset after each new
     # task is created
     niterations = 0
@@ -403,8 +834,15 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
     dt_stead_state = 4
     try:
         log.debug("Starting execution loop... in process {p}".format(p=os.getpid()))
+        registrar.start()
 
         while True:
+            # the latency of the previous iteration, without the sleep
+            if loop_started_at is not None:
+                write_metrics(time.time() - loop_started_at - sleep_time, last_completed_at)
+            loop_started_at = time.time()
+            nloop_iterations += 1
+
             # After the initial startup, bump up the time to reduce resource usage
             # (since multiple instances will be launched from the services)
             niterations += 1
@@ -413,17 +851,29 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
             else:
                 sleep_time = dt_stead_state
 
+            registrar.raise_if_failed()
+
+            # each of the graph changes below adds nodes (the gather adds
+            # more nodes than it removes)
+            nnodes = bg.number_of_nodes()
+
             # Convert Task -> ScatterAble task (emits a Chunk.json file)
-            B.apply_scatterable(bg, global_registry.chunk_operators, global_registry.tasks)
+            with tracer.span("apply_scatterable"):
+                B.apply_scatterable(bg, global_registry.chunk_operators, global_registry.tasks)
 
             # This will add new TaskBinding nodes to the graph if necessary
-            B.apply_chunk_operator(bg, global_registry.chunk_operators, global_registry.tasks, max_nchunks)
+            with tracer.span("apply_chunk_operator"):
+                B.apply_chunk_operator(bg, global_registry.chunk_operators, global_registry.tasks, max_nchunks)
             # B.write_binding_graph_images(bg, job_resources.workflow)
             # If a TaskScatteredBindingNode is completed successfully and
             # output chunk.json is resolved, read in the file and
             # generate the new chunked tasks. This mutates the graph
             # significantly.
-            B.add_gather_to_completed_task_chunks(bg, global_registry.chunk_operators, global_registry.tasks, job_resources.tasks)
+            with tracer.span("add_gather_to_completed_task_chunks"):
+                B.add_gather_to_completed_task_chunks(bg, global_registry.chunk_operators, global_registry.tasks, job_resources.tasks)
+
+            if bg.number_of_nodes() != nnodes:
+                append_graph_snapshot(bg)
 
             if not _are_workers_alive(workers):
                 for tix_, w_ in workers.iteritems():
@@ -467,14 +917,43 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
             except Queue.Empty:
                 result = None
 
+            if result is None and tid_to_walltime:
+                result = to_timed_out_result()
+
             # log.info("Results {r}".format(r=result))
             if isinstance(result, TaskResult):
                 niterations = 0
+                last_completed_at = time.time()
                 log.debug("Task result {r}".format(r=result))
 
                 tid_, state_, msg_, run_time_ = result
+                if tid_ not in workers:
+                    # killed speculative copies, or tasks killed by the watchdog
+                    log.info("Ignoring result of discarded worker {r}".format(r=result))
+                    continue
+
+                # id of the worker. This is the id of the speculative copy if
+                # the copy completed first
+                worker_tid_ = tid_
+                if speculative_tasks.is_running_copy(worker_tid_):
+                    r_ = speculative_tasks.complete(worker_tid_, state_ == TaskStates.SUCCESSFUL)
+                    for copy_id_ in r_.discarded:
+                        total_nproc -= discard_task_copy(copy_id_)
+                    if not r_.is_final:
+                        # the other copy is still running
+                        continue
+                    tid_ = r_.task_id
+                    use_task_copy(tid_, worker_tid_)
+
                 tnode_ = tid_to_tnode[tid_]
                 task_ = tnode_to_task[tnode_]
+                trace_worker_completed(worker_tid_, state_, run_time_)
+                tid_to_local_nproc.pop(worker_tid_, None)
+                tid_to_walltime.pop(worker_tid_, None)
+                slot_pool.release(slot_owner_id, worker_tid_)
+                release_cpus(worker_tid_)
+                if task_.resources and not workflow_opts.debug_mode:
+                    cleanup_task_dirs.add(task_.output_dir)
 
                 # Process Successful Task Result
                 if state_ == TaskStates.SUCCESSFUL:
@@ -490,20 +969,30 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
                     B.resolve_successor_binding_file_path(bg)
 
                     total_nproc -= task_.nproc
-                    w_ = workers.pop(tid_)
+                    w_ = workers.pop(worker_tid_)
                     _terminate_worker(w_)
 
-                    # Update Analysis Reports and Register output files to Datastore
-                    _update_analysis_reports_and_datastore(tnode_, task_)
+                    if isinstance(tnode_, TaskChunkedBindingNode):
+                        started_run_time_ = to_started_run_time(worker_tid_)
+                        chunk_group_run_times[tnode_.chunk_group_id].append(run_time_ if started_run_time_ is None else started_run_time_)
+
+                    # Update Analysis Reports and Register output files to
+                    # Datastore. This doesn't block scheduling of the
+                    # downstream tasks
+                    registrar.submit(_update_analysis_reports_and_datastore, tnode_, task_)
+                    if workflow_opts.spill_completed_tasks:
+                        spill_completed_task(tnode_)
 
                     # BU.write_binding_graph_images(bg, job_resources.workflow)
                 else:
                     # Process Non-Successful Task Result
                     B.update_task_state(bg, tnode_, state_)
                     _log_task_failure_and_call_services(result, tid_)
+                    if workflow_opts.spill_completed_tasks:
+                        spill_completed_task(tnode_)
 
                     # let the remaining running jobs continue
-                    w_ = workers.pop(tid_)
+                    w_ = workers.pop(worker_tid_)
                     _terminate_worker(w_)
 
                     total_nproc -= task_.nproc
@@ -519,6 +1008,7 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
 
                 write_report_(bg, s_, False)
                 write_task_summary_report(bg)
+                append_graph_snapshot(bg, tnode_)
 
             elif isinstance(result, types.NoneType):
                 pass
@@ -530,6 +1020,14 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
                 # Just kill everything
                 break
 
+            # Speculatively re-run straggling chunks
+            if speculation_policy.is_enabled:
+                for straggler_tid_ in to_stragglers():
+                    nproc_ = tnode_to_task[tid_to_tnode[straggler_tid_]].nproc
+                    if len(workers) >= max_nworkers or not acquire_slots(tid_to_tnode[straggler_tid_], to_speculative_task_id(straggler_tid_), nproc_):
+                        break
+                    total_nproc += start_speculative_copy(straggler_tid_)
+
             # Computational resources are tapped
             if len(workers) >= max_nworkers:
                 # don't do anything
@@ -550,66 +1048,24 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
                 if not os.path.exists(task_dir):
                     os.mkdir(task_dir)
 
-                to_resources_func = B.to_resolve_di_resources(task_dir, root_tmp_dir=workflow_opts.tmp_dir)
-                input_files = B.get_task_input_files(bg, tnode)
-
-                # convert metatask -> task
-                try:
-                    task = GX.meta_task_to_task(tnode.meta_task, input_files, task_opts, task_dir, max_nproc, max_nchunks,
-                                                to_resources_func, to_resolve_files_func)
-                except Exception as e:
-                    slog.error("Failed to convert metatask {i} to task. {m}".format(i=tnode.meta_task.task_id, m=e.message))
-                    raise
-
-                # log.debug(task)
-
+                task = to_task(tnode, tid, task_dir)
                 bg.node[tnode]['nproc'] = task.nproc
 
-                if not has_available_slots(task.nproc):
+                if not acquire_slots(tnode, tid, task.nproc):
                     # not enough slots to run in
                     continue
 
                 bg.node[tnode]['task'] = task
                 tnode_to_task[tnode] = task
 
-                if isinstance(tnode.meta_task, (ToolContractMetaTask, ScatterToolContractMetaTask, GatherToolContractMetaTask)):
-                    # the task.options have actually already been resolved here, but using this other
-                    # code path for clarity
-                    if isinstance(tnode.meta_task, ToolContractMetaTask):
-                        rtc = IO.static_meta_task_to_rtc(tnode.meta_task, task, task_opts, task_dir, tmp_dir, max_nproc, is_distributed=is_workflow_distributable)
-                    elif isinstance(tnode.meta_task, ScatterToolContractMetaTask):
-                        rtc = IO.static_scatter_meta_task_to_rtc(tnode.meta_task, task, task_opts, task_dir, tmp_dir, max_nproc, max_nchunks, tnode.meta_task.chunk_keys, is_distributed=is_workflow_distributable)
-                    elif isinstance(tnode.meta_task, GatherToolContractMetaTask):
-                        # this should always be a TaskGatherBindingNode which will have a .chunk_key
-                        rtc = IO.static_gather_meta_task_to_rtc(tnode.meta_task, task, task_opts, task_dir, tmp_dir, max_nproc, tnode.chunk_key, is_distributed=is_workflow_distributable)
-                    else:
-                        raise TypeError("Unsupported task type {t}".format(t=tnode.meta_task))
-
-                    # write driver manifest, which calls the resolved-tool-contract.json
-                    # there's too many layers of indirection here. Partly due to the pre-tool-contract era
-                    # python defined tasks.
-                    # Always write the RTC json for debugging purposes
-                    tc_path = os.path.join(task_dir, GlobalConstants.TOOL_CONTRACT_JSON)
-                    write_tool_contract(tnode.meta_task.tool_contract, tc_path)
-
-                    rtc_json_path = os.path.join(task_dir, GlobalConstants.RESOLVED_TOOL_CONTRACT_JSON)
-                    rtc_avro_path = os.path.join(task_dir, GlobalConstants.RESOLVED_TOOL_CONTRACT_AVRO)
-                    if rtc.driver.serialization == 'avro':
-                        # hack to fix command
-                        task.cmds[0] = task.cmds[0].replace('.json', '.avro')
-                        write_resolved_tool_contract_avro(rtc, rtc_avro_path)
-                    # for debugging
-                    write_resolved_tool_contract(rtc, rtc_json_path)
-
-                runnable_task_path = os.path.join(task_dir, GlobalConstants.RUNNABLE_TASK_JSON)
-                runnable_task = RunnableTask(task, global_registry.cluster_renderer)
-                runnable_task.write_json(runnable_task_path)
+                run_local = to_run_local(tnode, tid, task.nproc)
+                runnable_task_path = write_runnable_task(tnode, task, tid, task_dir, run_local)
 
                 # Create an instance of Worker
-                w = _to_worker(tnode.meta_task.is_distributed, "worker-task-{i}".format(i=tid), tid, runnable_task_path)
+                w = _to_worker(run_local, "worker-task-{i}".format(i=tid), tid, runnable_task_path, tnode, task.nproc)
 
                 workers[tid] = w
-                w.start()
+                trace_worker_submitted(tid, w)
                 total_nproc += task.nproc
                 slog.info("Starting worker {i} ({n} workers running, {m} total proc in use)".format(i=tid, n=len(workers), m=total_nproc))
 
@@ -619,7 +1075,7 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
                 log.debug(msg_)
                 tid_to_tnode[tid] = tnode
                 services_log_update_progress("pbsmrtpipe::{i}".format(i=tnode.idx), WS.LogLevels.INFO, msg_)
-                # BU.write_binding_graph_images(bg, job_resources.workflow)
+                append_graph_snapshot(bg, tnode)
 
             elif isinstance(tnode, EntryOutBindingFileNode):
                 # Handle EntryPoint types. This is not a particularly elegant design :(
@@ -637,12 +1093,14 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
 
             # Update state of any files
             B.resolve_successor_binding_file_path(bg)
-            # Final call to write empty analysis reports
-            write_analysis_report(analysis_file_links)
 
         # end of while loop
         _terminate_all_workers(workers.values(), shutdown_event)
 
+        # the datastore must be complete before the final reports
+        registrar.shutdown()
+        registrar.raise_if_failed()
+
         if has_failed:
             log.debug("\n" + BU.to_binding_graph_summary(bg))
 
@@ -653,7 +1111,7 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
     except PipelineRuntimeKeyboardInterrupt:
         write_report_(bg, TaskStates.KILLED, False)
         write_task_summary_report(bg)
-        BU.write_binding_graph_images(bg, job_resources.workflow)
+        write_binding_graph_images(bg)
         was_successful = False
 
     except Exception as e:
@@ -662,12 +1120,23 @@ def __exe_workflow(global_registry, ep_d, bg, task_opts, workflow_opts, output_d
         write_report_(bg, TaskStates.FAILED, False)
         write_task_summary_report(bg)
         services_log_update_progress("pbsmrtpipe", WS.LogLevels.ERROR, "Error {e}".format(e=e))
-        BU.write_binding_graph_images(bg, job_resources.workflow)
+        write_binding_graph_images(bg)
         raise
 
     finally:
+        registrar.shutdown()
+        slot_pool.release_all(slot_owner_id)
         write_task_summary_report(bg)
-        BU.write_binding_graph_images(bg, job_resources.workflow)
+        write_binding_graph_images(bg)
+        write_metrics(0.0, last_completed_at, force=True)
+        if to_ncleanups_pending(force=True):
+            slog.info("{n} tasks have tmp resources pending background cleanup".format(n=len(cleanup_task_dirs)))
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        # close out the spans of workers that were terminated
+        for tid_, (lane_, submitted_at_) in tid_to_trace.items():
+            tracer.add_span(tid_, submitted_at_, time.time(), lane=lane_, args=dict(state=TaskStates.KILLED))
+        write_trace()
 
     return True if was_successful else False
 
@@ -688,6 +1157,23 @@ def _validate_entry_points_or_raise(entry_points_d):
     return True
 
 
+def _resolve_nproc_and_nchunks(workflow_level_opts):
+    """Bound max nchunks and (in local-only mode) the nproc to the cpus of the host
+
+    :type workflow_level_opts: WorkflowLevelOptions
+    """
+    workflow_level_opts.max_nchunks = min(workflow_level_opts.max_nchunks, GlobalConstants.MAX_NCHUNKS)
+
+    if workflow_level_opts.distributed_mode is False:
+        total_max_nproc = multiprocessing.cpu_count() if workflow_level_opts.total_max_nproc is None else workflow_level_opts.total_max_nproc
+        workflow_level_opts.total_max_nproc = min(total_max_nproc, multiprocessing.cpu_count())
+        workflow_level_opts.max_nproc = min(workflow_level_opts.max_nproc, workflow_level_opts.total_max_nproc)
+        slog.info("local-only mode updating       MAX NPROC to {x}".format(x=workflow_level_opts.max_nproc))
+        slog.info("local-only mode updating TOTAL MAX NPROC to {x}".format(x=workflow_level_opts.total_max_nproc))
+
+    return workflow_level_opts
+
+
 def _load_io_for_workflow(registered_tasks, registered_pipelines, workflow_template_xml_or_pipeline,
                           entry_points_d, preset_xmls, rc_preset_or_none, force_distribute=None, force_chunk_mode=None, debug_mode=None):
     """
@@ -775,14 +1261,7 @@ def _load_io_for_workflow(registered_tasks, registered_pipelines, workflow_templ
     if isinstance(force_chunk_mode, bool):
         workflow_level_opts.chunk_mode = force_chunk_mode
 
-    workflow_level_opts.max_nchunks = min(workflow_level_opts.max_nchunks, GlobalConstants.MAX_NCHUNKS)
-
-    if workflow_level_opts.distributed_mode is False:
-        total_max_nproc = multiprocessing.cpu_count() if workflow_level_opts.total_max_nproc is None else workflow_level_opts.total_max_nproc
-        workflow_level_opts.total_max_nproc = min(total_max_nproc, multiprocessing.cpu_count())
-        workflow_level_opts.max_nproc = min(workflow_level_opts.max_nproc, workflow_level_opts.total_max_nproc)
-        slog.info("local-only mode updating       MAX NPROC to {x}".format(x=workflow_level_opts.max_nproc))
-        slog.info("local-only mode updating TOTAL MAX NPROC to {x}".format(x=workflow_level_opts.total_max_nproc))
+    workflow_level_opts = _resolve_nproc_and_nchunks(workflow_level_opts)
 
     if debug_mode is True:
         slog.info("overriding debug-mode to True")
@@ -856,7 +1335,8 @@ def _load_io_for_task(registered_tasks, entry_points_d, preset_xmls, rc_preset_o
     return workflow_level_opts, topts, cluster_render
 
 
-def exe_workflow(global_registry, entry_points_d, bg, task_opts, workflow_level_opts, output_dir, service_uri):
+def exe_workflow(global_registry, entry_points_d, bg, task_opts, workflow_level_opts, output_dir, service_uri,
+                 slot_pool=None, setup_logs=True):
     """This is the fundamental entry point to running a pbsmrtpipe workflow."""
 
     slog.info("Initializing Workflow")
@@ -871,7 +1351,8 @@ def exe_workflow(global_registry, entry_points_d, bg, task_opts, workflow_level_
     try:
         state = __exe_workflow(global_registry, entry_points_d, bg, task_opts,
                                workflow_level_opts, output_dir,
-                               workers, shutdown_event, service_uri)
+                               workers, shutdown_event, service_uri,
+                               slot_pool=slot_pool, setup_logs=setup_logs)
     except Exception as e:
         if isinstance(e, KeyboardInterrupt):
             emsg = "received SIGINT. Attempting to abort gracefully."
@@ -936,7 +1417,8 @@ def workflow_exception_exitcode_handler(func):
 def run_pipeline(registered_pipelines_d, registered_file_types_d, registered_tasks_d,
                  chunk_operators, workflow_template_xml_or_pipeline, entry_points_d,
                  output_dir, preset_xmls, rc_preset_or_none, service_uri,
-                 force_distribute=None, force_chunk_mode=None, debug_mode=None):
+                 force_distribute=None, force_chunk_mode=None, debug_mode=None,
+                 slot_pool=None, setup_logs=True):
     """
     Entry point for running a pipeline
 
@@ -953,6 +1435,7 @@ def run_pipeline(registered_pipelines_d, registered_file_types_d, registered_tas
     :type preset_xmls: list[str]
     :type service_uri: str | None
     :type force_distribute: None | bool
+    :type slot_pool: pbsmrtpipe.slots.SlotPool | None
 
     :rtype: int
     """
@@ -971,9 +1454,25 @@ def run_pipeline(registered_pipelines_d, registered_file_types_d, registered_tas
     bg = B.binding_strs_to_binding_graph(registered_tasks_d, workflow_bindings)
     slog.info("successfully loaded graph from bindings.")
 
+    filtered_chunk_operators_d = _get_valid_chunk_operators(bg, workflow_level_opts.chunk_mode, chunk_operators, registered_tasks_d)
+    # Container to hold all the resources
+    global_registry = GlobalRegistry(registered_tasks_d,
+                                     registered_file_types_d,
+                                     filtered_chunk_operators_d,
+                                     cluster_render)
+
+    return exe_workflow(global_registry, entry_points_d, bg, task_opts,
+                        workflow_level_opts, output_dir, service_uri,
+                        slot_pool=slot_pool, setup_logs=setup_logs)
+
+
+def _get_valid_chunk_operators(bg, chunk_mode, chunk_operators, registered_tasks_d):
+    """Validate the chunk operators and filter the operators that don't have
+    tasks in the BindingsGraph. Returns an empty dict if chunk mode is disabled.
+    """
     valid_chunk_operators = {}
     # Disabled chunk operators if necessary
-    if workflow_level_opts.chunk_mode is False:
+    if chunk_mode is False:
         slog.info("Chunk mode is False. Disabling {n} chunk operators.".format(n=len(chunk_operators)))
     else:
         # Validate chunk operators, or skip if malformed.
@@ -984,15 +1483,7 @@ def run_pipeline(registered_pipelines_d, registered_file_types_d, registered_tas
             except MalformedChunkOperatorError as e:
                 log.warn("Invalid chunk operator {i}. {m}".format(i=chunk_operator_id, m=e.message))
 
-    filtered_chunk_operators_d = _filter_chunk_operators(bg, valid_chunk_operators)
-    # Container to hold all the resources
-    global_registry = GlobalRegistry(registered_tasks_d,
-                                     registered_file_types_d,
-                                     filtered_chunk_operators_d,
-                                     cluster_render)
-
-    return exe_workflow(global_registry, entry_points_d, bg, task_opts,
-                        workflow_level_opts, output_dir, service_uri)
+    return _filter_chunk_operators(bg, valid_chunk_operators)
 
 
 def _filter_chunk_operators(bg, chunk_operators_d):
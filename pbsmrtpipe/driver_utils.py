@@ -144,6 +144,7 @@ def to_task_summary_report(bg):
           Column("workflow_task_status", header="Status"),
           Column("workflow_task_run_time", header="Task Runtime"),
           Column('workflow_task_nproc', header="Number of Procs"),
+          Column('workflow_task_cpus', header="CPUs"),
           Column("workflow_task_emsg", header="Error Message")]
 
     t = Table("workflow_task_summary", title="Task Summary", columns=cs)
@@ -153,6 +154,8 @@ def to_task_summary_report(bg):
             t.add_data_by_column_id("workflow_task_status", bg.node[tnode]['state'])
             t.add_data_by_column_id("workflow_task_run_time", bg.node[tnode]['run_time'])
             t.add_data_by_column_id("workflow_task_nproc", bg.node[tnode]['nproc'])
+            # CPU set of the task (if pinned with the cpu_affinity option)
+            t.add_data_by_column_id("workflow_task_cpus", bg.node[tnode].get('cpus', ""))
             t.add_data_by_column_id("workflow_task_emsg", bg.node[tnode]['error_message'])
 
     return Report("workflow_task_summary", tables=[t])
@@ -315,7 +318,7 @@ def _log_pbsmrptipe_header():
     return s
 
 
-def job_resource_create_and_setup_logs(job_root_dir, bg, task_opts, workflow_level_opts, ep_d):
+def job_resource_create_and_setup_logs(job_root_dir, bg, task_opts, workflow_level_opts, ep_d, setup_logs=True):
     """
     Create job resource dirs and setup log handlers
 
@@ -324,6 +327,8 @@ def job_resource_create_and_setup_logs(job_root_dir, bg, task_opts, workflow_lev
     :type task_opts: dict
     :type workflow_level_opts: WorkflowLevelOptions
     :type ep_d: dict
+    :param setup_logs: If False, the log handlers of the master.log and
+    pbsmrtpipe.log are setup by the caller
     """
 
     job_resources = to_job_resources_and_create_dirs(job_root_dir)
@@ -336,7 +341,8 @@ def job_resource_create_and_setup_logs(job_root_dir, bg, task_opts, workflow_lev
         master_log_level = logging.DEBUG
         stdout_level = logging.DEBUG
 
-    setup_internal_logs(master_log_path, master_log_level, pb_log_path, stdout_level)
+    if setup_logs:
+        setup_internal_logs(master_log_path, master_log_level, pb_log_path, stdout_level)
 
     log.info("Starting pbsmrtpipe v{v}".format(v=pbsmrtpipe.get_version()))
     log.info("\n" + _log_pbsmrptipe_header())
@@ -12,7 +12,9 @@ import platform
 import tempfile
 import shlex
 import signal
+import functools
 import Queue
+from collections import defaultdict, deque
 
 from pbsmrtpipe.cluster import ClusterTemplateRender
 from pbsmrtpipe.cluster import Constants as ClusterConstants
@@ -22,14 +24,96 @@ log = logging.getLogger(__name__)
 slog = logging.getLogger('status.' + __name__)
 
 
-def backticks(cmd, merge_stderr=True):
+class Constants(object):
+    # Max number of lines of stdout/stderr kept in memory. Only the tail of
+    # the output is kept.
+    MAX_CAPTURED_LINES = 10000
+    # Lines longer than this are split
+    MAX_LINE_LENGTH = 64 * 1024
+    # Block size when reading files (backwards when extracting the tail)
+    BLOCK_SIZE = 64 * 1024
+    # Max number of bytes read to extract the tail of a file
+    MAX_TAIL_BYTES = 1024 * 1024
+
+
+def tail_file(path, nlines, block_size=Constants.BLOCK_SIZE, max_bytes=Constants.MAX_TAIL_BYTES):
+    """
+    Returns the last nlines lines of a file (without the newlines)
+
+    The file is read in blocks backwards from the end, so the memory (and
+    IO) is bounded by the size of the tail, not the size of the file.
+    """
+    if nlines <= 0:
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        blocks = []
+        nnewlines = 0
+        nbytes = 0
+        # a complete last line requires nlines + 1 newlines (the file
+        # usually ends with a newline)
+        while pos > 0 and nnewlines <= nlines and nbytes < max_bytes:
+            n = min(block_size, pos)
+            pos -= n
+            f.seek(pos)
+            block = f.read(n)
+            blocks.append(block)
+            nnewlines += block.count("\n")
+            nbytes += n
+    lines = "".join(reversed(blocks)).splitlines()
+    return lines[-nlines:]
+
+
+class _LineBuffer(object):
+
+    """Split chunks of output into lines, keeping a bounded tail of the lines"""
+
+    def __init__(self, write_func=None, max_lines=Constants.MAX_CAPTURED_LINES,
+                 max_line_length=Constants.MAX_LINE_LENGTH):
+        self.write_func = write_func
+        self.lines = deque(maxlen=max_lines)
+        self.max_line_length = max_line_length
+        self._partial = ""
+
+    def _add_line(self, line):
+        line = line.rstrip()
+        self.lines.append(line)
+        if self.write_func is not None:
+            self.write_func(line)
+
+    def add(self, chunk):
+        xs = (self._partial + chunk).split("\n")
+        self._partial = xs.pop()
+        for x in xs:
+            self._add_line(x)
+        if len(self._partial) > self.max_line_length:
+            self._add_line(self._partial)
+            self._partial = ""
+
+    def flush(self):
+        if self._partial:
+            self._add_line(self._partial)
+            self._partial = ""
+
+    def to_list(self):
+        return list(self.lines)
+
+
+def backticks(cmd, merge_stderr=True, max_lines=Constants.MAX_CAPTURED_LINES):
     """
     Returns rcode, stdout, stderr
+
+    Only the last max_lines lines of the output are kept
     """
+    # The stderr is written to a tmp file (not a PIPE), otherwise the
+    # process can block on a full stderr pipe while stdout is being read
+    stderr_fh = None
     if merge_stderr:
         _stderr = subprocess.STDOUT
     else:
-        _stderr = subprocess.PIPE
+        stderr_fh = tempfile.TemporaryFile()
+        _stderr = stderr_fh
 
     # Setting shell = True is really badform, however, many of the tasks
     # generate general shell code (which needs to be removed).
@@ -44,13 +128,20 @@ def backticks(cmd, merge_stderr=True):
 
     log.debug("Running on {s} with cmd '{c}'".format(s=node_id, c=cmd))
 
-    out = [l[:-1] for l in p.stdout.readlines()]
+    buf = _LineBuffer(max_lines=max_lines)
+    for chunk in iter(functools.partial(p.stdout.read, Constants.BLOCK_SIZE), ''):
+        buf.add(chunk)
+    buf.flush()
+    out = buf.to_list()
 
     p.stdout.close()
 
     # need to allow process to terminate
     p.wait()
 
+    if stderr_fh is not None:
+        stderr_fh.close()
+
     run_time = time.time() - started_at
 
     errCode = p.returncode and p.returncode or 0
@@ -215,31 +306,42 @@ def run_command_async(command, file_stdout=None, file_stderr=None):
     stderr_reader.start()
     """
 
-    # store the stdout and stderr
-    stdouts = []
-    stderrs = []
+    def _to_fh(fh_or_file):
+        if fh_or_file is None or hasattr(fh_or_file, 'write'):
+            return fh_or_file, False
+        return open(fh_or_file, 'w'), True
+
+    # The lines are written to the stdout/stderr files as they are read. Only
+    # the tail of the stdout and stderr is kept in memory.
+    stdout_fh, close_stdout_fh = _to_fh(file_stdout)
+    stderr_fh, close_stderr_fh = _to_fh(file_stderr)
+
+    def _to_write_func(log_func, fh):
+        def _write(line):
+            log_func(line)
+            if fh is not None:
+                fh.write(line + "\n")
+        return _write
+
+    stdouts = _LineBuffer(_to_write_func(slog.info, stdout_fh))
+    stderrs = _LineBuffer(_to_write_func(slog.error, stderr_fh))
 
     started_at = time.time()
 
-    def readlines(q, write):
-        for line in q.read(-1).splitlines():
-                write(line.rstrip())
-    def stdout_write(line):
-        slog.info(line)
-        stdouts.append(line)
-    def stderr_write(line):
-        slog.error(line)
-        stderrs.append(line)
+    def readlines(q, buf):
+        # read in bounded chunks of the output appended since the last read
+        for chunk in iter(functools.partial(q.read, Constants.BLOCK_SIZE), ''):
+            buf.add(chunk)
 
     # Check the queues if we received some output (until there is nothing
     # more to get).
     try:
       while process.returncode is None:
         # Show what we received from standard output.
-        readlines(stdout_queue, stdout_write)
+        readlines(stdout_queue, stdouts)
 
         # Show what we received from standard error.
-        readlines(stderr_queue, stderr_write)
+        readlines(stderr_queue, stderrs)
 
         # Sleep a bit before asking the readers again.
         time.sleep(1)
@@ -264,8 +366,10 @@ def run_command_async(command, file_stdout=None, file_stderr=None):
         # big deal. It's merely informative, and it's always available to
         # the curious in the stdout/err files.
 
-        readlines(stdout_queue, stdout_write)
-        readlines(stderr_queue, stderr_write)
+        readlines(stdout_queue, stdouts)
+        readlines(stderr_queue, stderrs)
+        stdouts.flush()
+        stderrs.flush()
 
         # Close subprocess' file descriptors.
         ofho.close()
@@ -273,18 +377,14 @@ def run_command_async(command, file_stdout=None, file_stderr=None):
         #process.stdout.close()
         #process.stderr.close()
 
-    def _write_to_fh_or_file(fh_or_file, contents):
-        if hasattr(fh_or_file, 'write'):
-            fh_or_file.write(contents)
-        else:
-            with open(fh_or_file, 'w') as w:
-                w.write(contents)
-
-    _write_to_fh_or_file(file_stderr, "\n".join(stderrs))
-    _write_to_fh_or_file(file_stdout, "\n".join(stdouts))
+        for fh, close_fh in ((stdout_fh, close_stdout_fh), (stderr_fh, close_stderr_fh)):
+            if close_fh:
+                fh.close()
+            elif fh is not None:
+                fh.flush()
 
     run_time = time.time() - started_at
-    return process.returncode, "\n".join(stdouts), "\n".join(stderrs), run_time
+    return process.returncode, "\n".join(stdouts.to_list()), "\n".join(stderrs.to_list()), run_time
 
 
 def run_command(cmd, stdout_fh, stderr_fh, shell=True, time_out=None):
@@ -345,6 +445,29 @@ def run_command(cmd, stdout_fh, stderr_fh, shell=True, time_out=None):
     return returncode, stdout, stderr, run_time
 
 
+def get_descendant_pids(pid):
+    """Returns the pids of the children (and their children) of a process"""
+    try:
+        output = subprocess.check_output(["ps", "-eo", "pid=,ppid="])
+    except (OSError, subprocess.CalledProcessError) as e:
+        log.warn("Unable to list the processes. {e}".format(e=e))
+        return []
+
+    children = defaultdict(list)
+    for line in output.splitlines():
+        xs = line.split()
+        if len(xs) == 2:
+            children[int(xs[1])].append(int(xs[0]))
+
+    pids = []
+    todo = [pid]
+    while todo:
+        for child in children[todo.pop()]:
+            pids.append(child)
+            todo.append(child)
+    return pids
+
+
 def get_results_from_queue(queue):
     """
     Pull all the results from the Output queue used by the Workers
@@ -598,9 +721,25 @@ class ProcessPoolManager(multiprocessing.Process):
         slog.info(msg)
 
 
+def _reinit_logging_locks():
+    """Re-create the locks of the logging module and of every handler (in a
+    forked process). A lock held by another thread at fork would never be
+    released in the child"""
+    logging._lock = threading.RLock()
+    loggers = [logging.root] + [x for x in logging.Logger.manager.loggerDict.values() if isinstance(x, logging.Logger)]
+    handlers = {id(h): h for x in loggers for h in x.handlers}
+    for h in handlers.values():
+        h.createLock()
+
+
 class TaskManifestWorker(multiprocessing.Process):
 
-    """This fundamental unit that runs a "Manifest" or Tool Contract (ToDo)"""
+    """This fundamental unit that runs a "Manifest" or Tool Contract (ToDo)
+
+    The worker is forked from a multithreaded process (e.g., the jobs of
+    pbsmrtpipe serve). Python 2 doesn't reinit the logging locks after fork,
+    so the worker re-creates them before logging.
+    """
 
     def __init__(self, q_out, event, sleep_time, run_manifest_func, task_id, manifest_path, group=None, name=None, target=None):
         self.q_out = q_out
@@ -617,7 +756,20 @@ class TaskManifestWorker(multiprocessing.Process):
     def shutdown(self):
         self.event.set()
 
+    def terminate_process_tree(self):
+        """Terminate the worker and the processes it started (e.g., the task
+        commands or the cluster submission)"""
+        if self.pid is not None:
+            # the children are re-parented once the worker is terminated
+            for pid in get_descendant_pids(self.pid):
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+        self.terminate()
+
     def run(self):
+        _reinit_logging_locks()
         log.info("Starting process:{p} {k} worker {i} task id {t}".format(k=self.__class__.__name__, i=self.name, t=self.task_id, p=self.pid))
 
         try:
@@ -51,10 +51,52 @@ slog = logging.getLogger(GlobalConstants.SLOG_PREFIX + "__name__")
 #logging.basicConfig(level=logging.DEBUG)
 
 
+# Concrete task node classes that share the instance-id of a task id
+_TASK_NODE_KLASSES = (TaskBindingNode, TaskChunkedBindingNode, TaskScatterBindingNode, TaskGatherBindingNode)
+
+
 class BindingsGraph(nx.DiGraph):
 
     # This is the new model. This will replace the Abstract Graph
 
+    def __init__(self, data=None, **attr):
+        # Index of the max instance-id of the nodes to avoid scanning the
+        # graph every time a node is added.
+        # {(node class, task id or file type id): max instance id}
+        self._instance_ids = {}
+        # {node class: max instance id}
+        self._klass_instance_ids = {}
+        # Number of nodes in the index
+        self._nindexed_nodes = 0
+        super(BindingsGraph, self).__init__(data=data, **attr)
+
+    @staticmethod
+    def _to_type_id(n):
+        if isinstance(n, TaskBindingNode):
+            return n.meta_task.task_id
+        return n.file_klass.file_type_id
+
+    def _index_node(self, n):
+        for d, k in ((self._instance_ids, (n.__class__, self._to_type_id(n))),
+                     (self._klass_instance_ids, n.__class__)):
+            d[k] = max(d.get(k, 0), n.instance_id)
+        self._nindexed_nodes += 1
+
+    def _get_instance_ids(self):
+        """Returns the instance-id indexes
+
+        Nodes added (or removed) without add_node, or add_edge (e.g., via
+        remove_node or add_nodes_from) invalidate the index, which is
+        then rebuilt.
+        """
+        if self._nindexed_nodes != len(self.node):
+            self._instance_ids = {}
+            self._klass_instance_ids = {}
+            self._nindexed_nodes = 0
+            for n in self.nodes_iter():
+                self._index_node(n)
+        return self._instance_ids, self._klass_instance_ids
+
     def _validate_type(self, n):
         _allowed_types = tuple(itertools.chain(VALID_TASK_NODE_CLASSES, VALID_FILE_NODE_CLASSES))
 
@@ -72,11 +114,17 @@ class BindingsGraph(nx.DiGraph):
     def add_edge(self, u, v, attr_dict=None, **attr):
         for n in (u, v):
             self._validate_type(n)
+        new_nodes = {n for n in (u, v) if n not in self}
         super(BindingsGraph, self).add_edge(u, v, attr_dict=attr_dict, **attr)
+        for n in new_nodes:
+            self._index_node(n)
 
     def add_node(self, n, attr_dict=None, **attr):
         self._validate_type(n)
+        is_new = n not in self
         super(BindingsGraph, self).add_node(n, attr_dict=attr_dict, **attr)
+        if is_new:
+            self._index_node(n)
 
     def _get_nodes_by_klasses(self, klasses, data=False):
         return [n for n in list(self.nodes_iter(data=data)) if isinstance(n, klasses)]
@@ -86,12 +134,8 @@ class BindingsGraph(nx.DiGraph):
         return [n for n in nodes if isinstance(n, klasses)]
 
     def _get_next_instance_id(self, meta_task):
-        xd = defaultdict(lambda : 0)
-        for tnode in self.all_task_type_nodes():
-            if not isinstance(tnode, EntryPointNode):
-                i = max(tnode.instance_id, xd[tnode.meta_task.task_id])
-                xd[tnode.meta_task.task_id] = i
-        return xd[meta_task.task_id] + 1
+        instance_ids, _ = self._get_instance_ids()
+        return max(instance_ids.get((k, meta_task.task_id), 0) for k in _TASK_NODE_KLASSES) + 1
 
     def add_meta_task(self, meta_task):
         """Generate a TaskBindingNode and assign an instance-id
@@ -124,12 +168,12 @@ class BindingsGraph(nx.DiGraph):
         return t
 
     def _get_next_file_instance_id(self, file_node_class, file_type):
-        xd = defaultdict(lambda : 0)
-        for fnode in self.file_nodes():
-            if not isinstance(fnode, file_node_class):
-                i = max(fnode.instance_id, xd[file_type.file_type_id])
-                xd[file_type.file_type_id] = i
-        return xd[file_type.file_type_id] + 1
+        # The instance-id is the max of the file nodes that are NOT
+        # of file_node_class (of any file type)
+        _, klass_instance_ids = self._get_instance_ids()
+        ids = [i for k, i in klass_instance_ids.iteritems()
+               if issubclass(k, VALID_FILE_NODE_CLASSES) and not issubclass(k, file_node_class)]
+        return max(ids + [0]) + 1
 
     def add_binding_in(self, meta_task, index, file_type):
         i = self._get_next_file_instance_id((BindingInFileNode, BindingChunkInFileNode), file_type)
@@ -208,18 +252,21 @@ class BindingsGraph(nx.DiGraph):
         return "<{k} Tasks:{t} Files:{f} EntryPoints:{p} node:{n} edges:{e} >".format(**d)
 
 
-def validate_binding_graph_integrity(bg):
+def validate_binding_graph_integrity(bg, task_nodes=None):
     """
     Check for malformed graphs with dangling input file nodes.
 
 
     :raises: MalformedBindingGraphError
     :param bg: Binding Graph
+    :param task_nodes: Only validate the inputs of these task nodes (e.g.,
+    the nodes that were just added to the graph). Defaults to all task nodes.
 
     :type bg: BindingsGraph
     :return:
     """
-    for n in bg.all_task_type_nodes():
+    tnodes = bg.all_task_type_nodes() if task_nodes is None else task_nodes
+    for n in tnodes:
         for i in bg.predecessors(n):
             # the in degree should be 1,
             # or 0 if the node is an Entry Point
@@ -503,24 +550,19 @@ def binding_strs_to_xml(bindings):
     return b
 
 
+def _get_next_instance_id_by_type_id(g, node_klasses, type_id):
+    """:type g: BindingsGraph"""
+    instance_ids, _ = g._get_instance_ids()
+    ids = [i for (k, x), i in instance_ids.iteritems() if x == type_id and issubclass(k, node_klasses)]
+    return max(ids + [0]) + 1
+
+
 def get_next_task_instance_id(g, task_node_klasses, meta_task_id):
-    i = 0
-    for node in g.nodes():
-        if isinstance(g, task_node_klasses):
-            if node.meta_task.task_id == meta_task_id:
-                if node.instance_id > i:
-                    i = node.instance_id
-    return i + 1
+    return _get_next_instance_id_by_type_id(g, task_node_klasses, meta_task_id)
 
 
 def _get_next_in_out_file_instance_id(g, file_node_klass, file_type_id):
-    i = 0
-    for node in g.nodes():
-        if isinstance(node, file_node_klass):
-            if node.file_klass.file_type_id == file_type_id:
-                if node.instance_id > i:
-                    i = node.instance_id
-    return i + 1
+    return _get_next_instance_id_by_type_id(g, file_node_klass, file_type_id)
 
 
 def get_next_in_file_instance_id(g, file_type_id):
@@ -627,6 +669,22 @@ def _are_all_inputs_resolved(bg, tnode):
     return False
 
 
+def _is_task_runnable(g, tnode):
+    if isinstance(tnode, TaskBindingNode):
+        state = g.node[tnode][ConstantsNodes.TASK_ATTR_STATE]
+        is_chunkable = g.node[tnode][ConstantsNodes.TASK_ATTR_IS_CHUNKABLE]
+        if state == TaskStates.SCATTERED:
+            # these tasks are labeled as on-hold and will be deleted
+            # once the gather step is successful
+            return False
+        elif is_chunkable is True:
+            # Skip original 'unchunked' tasks.
+            return False
+        elif state in TaskStates.RUNNABLE_STATES():
+            return _are_all_inputs_resolved(g, tnode)
+    return False
+
+
 def get_next_runnable_task(g):
 
     if g.is_workflow_complete():
@@ -634,27 +692,18 @@ def get_next_runnable_task(g):
 
     # this should probably do a top sort, then return
     for tnode in g.all_task_type_nodes():
-        if isinstance(tnode, TaskBindingNode):
-            state = g.node[tnode][ConstantsNodes.TASK_ATTR_STATE]
-            is_chunkable = g.node[tnode][ConstantsNodes.TASK_ATTR_IS_CHUNKABLE]
-            if state == TaskStates.SCATTERED:
-                # these tasks are labeled as on-hold and will be deleted
-                # once the gather step is successful
-                continue
-            elif is_chunkable is True:
-                # Skip original 'unchunked' tasks.
-                continue
-            elif state in TaskStates.RUNNABLE_STATES():
-                if _are_all_inputs_resolved(g, tnode):
-                    return tnode
-            else:
-                # log.debug("Skipping chunkable tasks {n}".format(n=tnode))
-                pass
+        if _is_task_runnable(g, tnode):
+            return tnode
 
     # log.debug("Unable to find runnable task")
     return None
 
 
+def get_runnable_tasks(g):
+    """Get all Tasks that are ready to be submitted"""
+    return [tnode for tnode in g.all_task_type_nodes() if _is_task_runnable(g, tnode)]
+
+
 def has_task_in_states(g, task_states):
     # All tasks are running or completed
     return any((g.node[t][ConstantsNodes.TASK_ATTR_STATE] not in task_states for t in g.all_task_type_nodes()))
@@ -837,14 +886,16 @@ def update_task_output_file_nodes(bg, tnode, task):
     return True
 
 
-def resolve_successor_binding_file_path(g):
+def resolve_successor_binding_file_path(g, file_nodes=None):
     """update linked bound files
 
+    :param file_nodes: Only update the successors of these file nodes.
+    Defaults to all file nodes.
 
     :type g: BindingsGraph
     """
-
-    for fnode in g.file_nodes():
+    fnodes = g.file_nodes() if file_nodes is None else file_nodes
+    for fnode in fnodes:
         attrs = g.node[fnode]
         is_resolved = attrs.get(ConstantsNodes.FILE_ATTR_IS_RESOLVED, False)
         path = attrs.get(ConstantsNodes.FILE_ATTR_PATH, None)
@@ -1085,6 +1136,8 @@ def add_chunkable_task_nodes_to_bgraph(bg, scatter_task_node, pipeline_chunks, c
     chunk_group_id = scatter_task_node.chunk_group_id
 
     total_chunked_nodes = []
+    # file nodes added to the graph
+    total_file_nodes = []
     for chunk_operator in chunk_operators:
         slog.debug("Starting to chunk task type {i} with chunk-group {g} for operator {o}".format(i=task_type_to_scatter.task_id, g=chunk_group_id, o=chunk_operator.idx))
 
@@ -1117,6 +1170,7 @@ def add_chunkable_task_nodes_to_bgraph(bg, scatter_task_node, pipeline_chunks, c
 
                 bg.add_edge(chunk_file_node, in_node)
                 bg.add_edge(in_node, chunked_task_node)
+                total_file_nodes.append(in_node)
 
             # Create new outputs of the chunked tasks
             out_nodes = []
@@ -1124,6 +1178,7 @@ def add_chunkable_task_nodes_to_bgraph(bg, scatter_task_node, pipeline_chunks, c
                 out_node = bg.add_binding_file_chunk_out(task_type_to_scatter, out_index, out_file_type, pipeline_chunk.chunk_id, chunk_group_id)
                 bg.add_edge(chunked_task_node, out_node)
                 out_nodes.append(out_node)
+                total_file_nodes.append(out_node)
 
         # If NO chunked tasks were added, there was a serious problem
         if not chunked_task_nodes:
@@ -1135,8 +1190,9 @@ def add_chunkable_task_nodes_to_bgraph(bg, scatter_task_node, pipeline_chunks, c
 
     # log.debug(to_binding_graph_summary(bg))
     slog.info("Chunked Tasks added {n} from task-id {i}".format(n=len(total_chunked_nodes), i=task_type_to_scatter.task_id))
-    resolve_successor_binding_file_path(bg)
-    validate_binding_graph_integrity(bg)
+    # Only the added subgraph needs to be resolved and validated
+    resolve_successor_binding_file_path(bg, file_nodes=total_file_nodes)
+    validate_binding_graph_integrity(bg, task_nodes=total_chunked_nodes)
     return total_chunked_nodes
 
 
@@ -1240,11 +1296,16 @@ def apply_chunk_operator(bg, chunk_operators_d, registered_tasks_d, max_nchunks)
             else:
                 log.debug("Skipping {t}. Node was already chunked".format(t=tnode_))
 
-    resolve_successor_binding_file_path(bg)
-    validate_binding_graph_integrity(bg)
+    # The chunked subgraphs were resolved and validated when they were added
     return bg
 
 
+def to_nchunks(bg, tnode):
+    """Number of chunks in the chunk group of a chunked task node"""
+    return len([n for n in bg.chunked_task_nodes()
+                if n.chunk_group_id == tnode.chunk_group_id and n.operator_id == tnode.operator_id])
+
+
 def get_companion_unscattered_task_node(bg, chunk_group_id):
     for tnode in bg.task_nodes():
         if tnode.__class__ == TaskBindingNode:
@@ -0,0 +1,322 @@
+"""Compact, incremental snapshots of a BindingsGraph
+
+The snapshot is a gzip'd file of JSON lines. Each line is a record (list)
+
+- ["h", {version, created_at}] header of a full snapshot
+- ["i", ref, "string"] interned string. Referenced by ref (int) in the later records
+- ["n", nid, klass ref, [args], [attr ref, value, ...]] node (nid is an int)
+- ["e", nid, nid, edge type ref] edge
+- ["s", nid, timestamp, [attr ref, value, ...]] changed node attributes
+- ["x", nid] removed node (and its edges)
+- ["d", nid, nid] removed edge
+
+A full snapshot is written with write, then the new nodes and edges, the
+removed nodes and edges (e.g., the unchunked task removed by the gather) and
+the changed node attributes are appended with append (as a new gzip member).
+The nodes and edges are only compared when the graph was changed. The
+datetime attributes are stored as epoch seconds. The Task of the node is not
+stored (see the task dirs).
+
+load_bindings_graph_snapshot replays the records and reconstructs the
+BindingsGraph from the registered meta tasks and file types.
+"""
+import gzip
+import json
+import time
+import logging
+import datetime
+
+from pbsmrtpipe.graph.bgraph import BindingsGraph
+from pbsmrtpipe.graph.models import (ConstantsNodes,
+                                     TaskBindingNode,
+                                     TaskScatterBindingNode,
+                                     TaskChunkedBindingNode,
+                                     TaskGatherBindingNode,
+                                     EntryOutBindingFileNode,
+                                     BindingChunkInFileNode, BindingInFileNode,
+                                     BindingOutFileNode, EntryPointNode,
+                                     BindingChunkOutFileNode,
+                                     VALID_FILE_NODE_CLASSES)
+
+log = logging.getLogger(__name__)
+
+__all__ = ['BindingsGraphSnapshotWriter',
+           'load_bindings_graph_snapshot',
+           'to_edge_type']
+
+
+class Constants(object):
+    VERSION = "0.1.0"
+
+    R_HEADER = "h"
+    R_INTERN = "i"
+    R_NODE = "n"
+    R_EDGE = "e"
+    R_STATE = "s"
+    R_REMOVE_NODE = "x"
+    R_REMOVE_EDGE = "d"
+
+    # file -> task
+    EDGE_INPUT = "input"
+    # task -> file
+    EDGE_OUTPUT = "output"
+    # output file -> input file
+    EDGE_BINDING = "binding"
+    # entry point -> entry file
+    EDGE_ENTRY = "entry"
+
+    # Not serialized
+    SKIP_ATTRS = ('task', )
+    DATETIME_ATTRS = (ConstantsNodes.TASK_ATTR_CREATED_AT,
+                      ConstantsNodes.TASK_ATTR_UPDATED_AT,
+                      ConstantsNodes.FILE_ATTR_RESOLVED_AT)
+
+
+def _task_id(n):
+    return n.meta_task.task_id
+
+
+def _file_type_id(n):
+    return n.file_klass.file_type_id
+
+
+# klass -> [(func(node) -> value, is_interned), ...] in the order of the
+# constructor args. The meta task and file type are converted to ids.
+_NODE_ARGS = {
+    EntryPointNode: [(lambda n: n.idx, True), (_file_type_id, True)],
+    TaskBindingNode: [(_task_id, True), (lambda n: n.instance_id, False)],
+    TaskChunkedBindingNode: [(_task_id, True), (lambda n: n.instance_id, False), (lambda n: n.chunk_id, True),
+                             (lambda n: n.chunk_group_id, True), (lambda n: n.operator_id, True)],
+    TaskScatterBindingNode: [(_task_id, True), (lambda n: n.original_nid, True), (lambda n: n.original_task_id, True),
+                             (lambda n: n.instance_id, False), (lambda n: n.chunk_group_id, True)],
+    TaskGatherBindingNode: [(_task_id, True), (lambda n: n.instance_id, False), (lambda n: n.chunk_key, True)],
+    BindingInFileNode: [(_task_id, True), (lambda n: n.instance_id, False), (lambda n: n.index, False), (_file_type_id, True)],
+    BindingOutFileNode: [(_task_id, True), (lambda n: n.instance_id, False), (lambda n: n.index, False), (_file_type_id, True)],
+    BindingChunkInFileNode: [(_task_id, True), (lambda n: n.instance_id, False), (lambda n: n.index, False), (_file_type_id, True),
+                             (lambda n: n.chunk_id, True), (lambda n: n.chunk_group_id, True)],
+    BindingChunkOutFileNode: [(_task_id, True), (lambda n: n.instance_id, False), (lambda n: n.index, False), (_file_type_id, True),
+                              (lambda n: n.chunk_id, True), (lambda n: n.chunk_group_id, True)],
+    EntryOutBindingFileNode: [(lambda n: n.entry_id, True), (_file_type_id, True)]}
+
+_KLASSES = {k.__name__: k for k in _NODE_ARGS}
+
+
+def to_edge_type(u, v):
+    if isinstance(u, EntryPointNode):
+        return Constants.EDGE_ENTRY
+    u_is_file = isinstance(u, VALID_FILE_NODE_CLASSES)
+    v_is_file = isinstance(v, VALID_FILE_NODE_CLASSES)
+    if u_is_file and v_is_file:
+        return Constants.EDGE_BINDING
+    elif u_is_file:
+        return Constants.EDGE_INPUT
+    return Constants.EDGE_OUTPUT
+
+
+def _to_epoch(dt):
+    return time.mktime(dt.timetuple()) + dt.microsecond / 1e6
+
+
+def _to_value(value):
+    if isinstance(value, datetime.datetime):
+        return _to_epoch(value)
+    return value
+
+
+class BindingsGraphSnapshotWriter(object):
+
+    """Write a full snapshot of the graph, then append the changes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._reset()
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, p=self.path, n=len(self._nids), e=len(self._edges))
+        return "<{k} {p} nodes:{n} edges:{e} >".format(**_d)
+
+    def _reset(self):
+        # string -> ref
+        self._refs = {}
+        # node -> nid (of the nodes in the graph). nids are never reused
+        self._nids = {}
+        self._next_nid = 0
+        self._edges = set()
+        # node -> {attr name: value} last written
+        self._attrs = {}
+
+    def _intern(self, s, records):
+        if s is None:
+            return None
+        if s not in self._refs:
+            ref = len(self._refs)
+            self._refs[s] = ref
+            records.append([Constants.R_INTERN, ref, s])
+        return self._refs[s]
+
+    def _to_attrs(self, bg, n):
+        return {k: _to_value(v) for k, v in bg.node[n].iteritems() if k not in Constants.SKIP_ATTRS}
+
+    def _to_attr_list(self, attrs, records):
+        xs = []
+        for k in sorted(attrs.keys()):
+            xs.extend([self._intern(k, records), attrs[k]])
+        return xs
+
+    def _add_node(self, bg, n, records):
+        nid = self._next_nid
+        self._next_nid += 1
+        self._nids[n] = nid
+        args = [self._intern(f(n), records) if is_interned else f(n) for f, is_interned in _NODE_ARGS[n.__class__]]
+        attrs = self._to_attrs(bg, n)
+        self._attrs[n] = attrs
+        records.append([Constants.R_NODE, nid, self._intern(n.__class__.__name__, records), args,
+                        self._to_attr_list(attrs, records)])
+
+    def _add_edge(self, u, v, records):
+        self._edges.add((u, v))
+        records.append([Constants.R_EDGE, self._nids[u], self._nids[v], self._intern(to_edge_type(u, v), records)])
+
+    def _update_nodes_and_edges(self, bg, records):
+        """Diff the nodes and edges of the graph against the snapshot"""
+        nodes = set(bg.nodes())
+        edges = set(bg.edges())
+
+        for n in set(self._nids) - nodes:
+            records.append([Constants.R_REMOVE_NODE, self._nids.pop(n)])
+            del self._attrs[n]
+        for u, v in self._edges - edges:
+            # the edges of a removed node are removed with the node
+            if u in self._nids and v in self._nids:
+                records.append([Constants.R_REMOVE_EDGE, self._nids[u], self._nids[v]])
+        self._edges &= edges
+
+        for n in nodes - set(self._nids):
+            self._add_node(bg, n, records)
+        for u, v in edges - self._edges:
+            self._add_edge(u, v, records)
+
+    def _write_records(self, records, mode):
+        f = gzip.open(self.path, mode)
+        try:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':'), default=str))
+                f.write("\n")
+        finally:
+            f.close()
+
+    def write(self, bg):
+        """Write a full snapshot of the graph (overwriting the file)"""
+        self._reset()
+        records = [[Constants.R_HEADER, dict(version=Constants.VERSION, created_at=time.time())]]
+        self._update_nodes_and_edges(bg, records)
+        self._write_records(records, 'wb')
+        return len(records)
+
+    def append(self, bg, nodes=None, update_graph=True):
+        """
+        Append the new and removed nodes and edges, and the changed
+        attributes of the nodes. If nodes is None, all the nodes of the graph
+        are compared.
+
+        :param update_graph: Diff the nodes and edges of the graph. Only
+         required after the graph was changed (e.g., by the chunking or the
+         gather). Otherwise only the attributes of the nodes are compared
+
+        :returns: Number of records written
+        """
+        if self._next_nid == 0:
+            return self.write(bg)
+
+        records = []
+        if update_graph:
+            self._update_nodes_and_edges(bg, records)
+        now = time.time()
+        for n in (bg.nodes() if nodes is None else nodes):
+            if n not in self._nids:
+                continue
+            attrs = self._to_attrs(bg, n)
+            last_attrs = self._attrs[n]
+            changed = {k: v for k, v in attrs.iteritems() if k not in last_attrs or last_attrs[k] != v}
+            if changed:
+                self._attrs[n] = attrs
+                records.append([Constants.R_STATE, self._nids[n], now, self._to_attr_list(changed, records)])
+
+        if records:
+            self._write_records(records, 'ab')
+        return len(records)
+
+
+def _to_node(klass_name, args, registered_tasks, registered_file_types):
+    klass = _KLASSES[klass_name]
+
+    def _meta_task(task_id):
+        if task_id not in registered_tasks:
+            raise KeyError("Unable to find meta task '{i}' of {k} in the registered tasks".format(i=task_id, k=klass_name))
+        return registered_tasks[task_id]
+
+    def _file_type(file_type_id):
+        return registered_file_types[file_type_id]
+
+    if klass in (EntryPointNode, EntryOutBindingFileNode):
+        return klass(args[0], _file_type(args[1]))
+    elif issubclass(klass, (BindingInFileNode, BindingOutFileNode)):
+        xs = [_meta_task(args[0]), args[1], args[2], _file_type(args[3])] + args[4:]
+        return klass(*xs)
+    return klass(_meta_task(args[0]), *args[1:])
+
+
+def _to_attrs_d(xs, refs):
+    d = {}
+    for i in xrange(0, len(xs), 2):
+        k = refs[xs[i]]
+        v = xs[i + 1]
+        if k in Constants.DATETIME_ATTRS and v is not None:
+            v = datetime.datetime.fromtimestamp(v)
+        d[k] = v
+    return d
+
+
+def load_bindings_graph_snapshot(path, registered_tasks, registered_file_types):
+    """
+    Reconstruct the BindingsGraph from a snapshot (with all the appended changes)
+
+    :param registered_tasks: {meta task id: MetaTask}
+    :param registered_file_types: {file type id: FileType}
+
+    :rtype: BindingsGraph
+    """
+    bg = BindingsGraph()
+    # ref -> string
+    refs = {}
+    # nid -> node
+    nodes = {}
+
+    f = gzip.open(path, 'rb')
+    try:
+        for line in f:
+            record = json.loads(line)
+            kind = record[0]
+            if kind == Constants.R_INTERN:
+                refs[record[1]] = record[2]
+            elif kind == Constants.R_NODE:
+                _, nid, klass_ref, args, attrs = record
+                args = [refs[a] if is_interned and a is not None else a
+                        for a, (_, is_interned) in zip(args, _NODE_ARGS[_KLASSES[refs[klass_ref]]])]
+                n = _to_node(refs[klass_ref], args, registered_tasks, registered_file_types)
+                nodes[nid] = n
+                bg.add_node(n, **_to_attrs_d(attrs, refs))
+            elif kind == Constants.R_EDGE:
+                bg.add_edge(nodes[record[1]], nodes[record[2]])
+            elif kind == Constants.R_STATE:
+                bg.node[nodes[record[1]]].update(_to_attrs_d(record[3], refs))
+            elif kind == Constants.R_REMOVE_NODE:
+                bg.remove_node(nodes.pop(record[1]))
+            elif kind == Constants.R_REMOVE_EDGE:
+                bg.remove_edge(nodes[record[1]], nodes[record[2]])
+            elif kind == Constants.R_HEADER:
+                log.debug("Loading snapshot {p} version {v}".format(p=path, v=record[1]['version']))
+    finally:
+        f.close()
+
+    return bg
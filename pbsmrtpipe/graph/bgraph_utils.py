@@ -22,6 +22,8 @@ from pbsmrtpipe.graph.models import (ConstantsNodes,
                                      BindingChunkOutFileNode,
                                      VALID_FILE_NODE_CLASSES,
                                      VALID_TASK_NODE_CLASSES)
+from pbsmrtpipe.graph.bgraph_snapshot import to_edge_type
+
 log = logging.getLogger(__name__)
 
 
@@ -35,14 +37,12 @@ def bindings_graph_to_dict(bg):
     def _to_d(n_):
         _x = {a: _to_a(n_, a) for a in n_.NODE_ATTRS.keys()}
         _x['klass'] = n_.__class__.__name__
-        _x['node_id'] = n.idx
+        _x['node_id'] = n_.idx
         return _x
 
-    nodes = []
-    edges = set([])
-
-    for n in bg.nodes():
-        nodes.append(_to_d(n))
+    nodes = [_to_d(n) for n in bg.nodes()]
+    # [source node id, target node id, edge type]
+    edges = [[str(u), str(v), to_edge_type(u, v)] for u, v in bg.edges()]
 
     _d['nodes'] = nodes
     _d['nnodes'] = len(nodes)
@@ -64,7 +64,7 @@ def write_bindings_graph_to_json(bg, path):
     d = bindings_graph_to_dict(bg)
 
     with open(path, 'w+') as w:
-        w.write(json.dumps(d, indent=4, sort_keys=True, cls=DateTimeEncoder))
+        w.write(json.dumps(d, sort_keys=True, separators=(',', ':'), cls=DateTimeEncoder))
 
 
 def write_binding_graph_images(g, root_dir):
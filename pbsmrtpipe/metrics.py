@@ -0,0 +1,150 @@
+"""Live metrics of the workflow master process
+
+The metrics are written in the Prometheus text exposition format to
+workflow/metrics.prom (e.g., for the node_exporter textfile collector) and
+can optionally be served over HTTP on localhost.
+"""
+import os
+import logging
+import threading
+import BaseHTTPServer
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+__all__ = ['MasterMetrics', 'MetricsServer']
+
+
+class Constants(object):
+    PREFIX = "pbsmrtpipe_"
+    GAUGE = "gauge"
+    COUNTER = "counter"
+    CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+# name -> (type, help)
+METRICS = OrderedDict([
+    ("tasks_runnable", (Constants.GAUGE, "Number of tasks that are ready to be submitted")),
+    ("tasks_running", (Constants.GAUGE, "Number of tasks submitted or running")),
+    ("tasks_completed", (Constants.GAUGE, "Number of successfully completed tasks")),
+    ("tasks_failed", (Constants.GAUGE, "Number of failed, killed or timed out tasks")),
+    ("tasks_timed_out", (Constants.GAUGE, "Number of tasks killed after exceeding their walltime")),
+    ("tasks_total", (Constants.GAUGE, "Total number of tasks in the workflow")),
+    ("workers_running", (Constants.GAUGE, "Number of running workers")),
+    ("cleanups_pending", (Constants.GAUGE, "Number of completed tasks with tmp resources waiting to be removed by the background cleanup")),
+    ("registrations_pending", (Constants.GAUGE, "Number of successful tasks waiting for their outputs to be registered in the datastore")),
+    ("nproc_used", (Constants.GAUGE, "Number of slots (nproc) used by running tasks")),
+    ("nproc_max", (Constants.GAUGE, "Max total number of slots (max_total_nproc). NaN if unlimited")),
+    ("result_queue_depth", (Constants.GAUGE, "Number of task results waiting to be processed by the master")),
+    ("loop_iteration_seconds", (Constants.GAUGE, "Run time of the last iteration of the execution loop (excluding sleep)")),
+    ("loop_iterations_total", (Constants.COUNTER, "Total number of iterations of the execution loop")),
+    ("seconds_since_last_task_completion", (Constants.GAUGE, "Time since the last task completed (or the job started)")),
+    ("run_time_seconds", (Constants.GAUGE, "Run time of the workflow")),
+])
+
+
+def _to_value_str(v):
+    if v is None:
+        return "NaN"
+    if isinstance(v, bool):
+        return str(int(v))
+    if isinstance(v, float):
+        return repr(v)
+    return str(v)
+
+
+class MasterMetrics(object):
+
+    """Current values of the master metrics"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.values = {name: 0 for name in METRICS.keys()}
+        # the http server thread will read the rendered text
+        self._lock = threading.Lock()
+        self._text = self.to_text()
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, i=self.job_id)
+        return "<{k} job_id:{i} >".format(**_d)
+
+    def update(self, **values):
+        for name, value in values.iteritems():
+            if name not in METRICS:
+                raise KeyError("Unsupported metric '{n}'. Supported metrics {m}".format(n=name, m=METRICS.keys()))
+            self.values[name] = value
+
+        text = self.to_text()
+        with self._lock:
+            self._text = text
+
+    def to_text(self):
+        labels = '{{job_id="{i}"}}'.format(i=self.job_id)
+        lines = []
+        for name, (metric_type, help_) in METRICS.iteritems():
+            metric_name = Constants.PREFIX + name
+            lines.append("# HELP {n} {h}".format(n=metric_name, h=help_))
+            lines.append("# TYPE {n} {t}".format(n=metric_name, t=metric_type))
+            lines.append("{n}{l} {v}".format(n=metric_name, l=labels, v=_to_value_str(self.values[name])))
+        return "\n".join(lines) + "\n"
+
+    @property
+    def text(self):
+        with self._lock:
+            return self._text
+
+    def write(self, path):
+        """Atomically write the metrics so scrapers never read a partial file"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.text)
+        os.rename(tmp_path, path)
+        return path
+
+
+def _to_handler(metrics):
+
+    class _MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.text
+            self.send_response(200)
+            self.send_header("Content-Type", Constants.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            log.debug("metrics server " + format % args)
+
+    return _MetricsHandler
+
+
+class MetricsServer(object):
+
+    """Serve the metrics on http://localhost:{port}/metrics from a daemon thread"""
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        self.server = BaseHTTPServer.HTTPServer((host, port), _to_handler(metrics))
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server")
+        self.thread.daemon = True
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, h=self.server.server_address[0], p=self.port)
+        return "<{k} {h}:{p} >".format(**_d)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        log.info("Started metrics server on port {p}".format(p=self.port))
+        return self
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
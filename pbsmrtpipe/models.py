@@ -3,6 +3,7 @@ import logging
 import json
 import os
 import collections
+import threading
 
 # legacy. imports into this module.
 import uuid
@@ -11,13 +12,105 @@ from pbcommand.models.common import REGISTERED_FILE_TYPES
 
 import pbsmrtpipe
 from pbsmrtpipe.constants import (to_workflow_option_ns,
-                                  RESOLVED_TOOL_CONTRACT_JSON)
-from pbsmrtpipe.exceptions import (MalformedChunkOperatorError)
+                                  RESOLVED_TOOL_CONTRACT_JSON,
+                                  SPECULATIVE_MIN_RUN_TIME,
+                                  STAGE_MAX_INPUT_SIZE,
+                                  STAGE_SKIP_FILE_TYPES,
+                                  TASK_JSON)
+from pbsmrtpipe.exceptions import (MalformedChunkOperatorError,
+                                   MalformedPipelineError)
 
 log = logging.getLogger(__name__)
 
 
-REGISTERED_PIPELINES = {}
+class LazyPipelineRegistry(collections.MutableMapping):
+
+    """Registry of Pipelines {id: Pipeline}
+
+    Only the pipeline definition is stored when a pipeline is registered. The
+    Pipeline (and the bindings of the parent pipelines it references) is
+    resolved on first access and memoized. The pipeline ids (e.g., keys, in)
+    and the definitions never resolve a Pipeline.
+    """
+
+    def __init__(self):
+        # {id: PipelineDefinition}
+        self._definitions = collections.OrderedDict()
+        # {id: Pipeline}
+        self._pipelines = {}
+        # ids of the pipelines that are currently being resolved
+        self._resolving = set()
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=len(self), r=len(self._pipelines))
+        return "<{k} pipelines:{n} resolved:{r} >".format(**_d)
+
+    def register(self, definition):
+        """
+        Register a pipeline definition. The definition must have a
+        to_pipeline(registry) method (see pbsmrtpipe.core.PipelineDefinition)
+        """
+        with self._lock:
+            self._definitions[definition.pipeline_id] = definition
+            self._pipelines.pop(definition.pipeline_id, None)
+
+    def definitions(self):
+        """Pipeline definition (or the Pipeline if registered without a
+        definition) of each registered pipeline. Nothing is resolved."""
+        d = collections.OrderedDict(self._definitions)
+        for pipeline_id, pipeline in self._pipelines.iteritems():
+            d.setdefault(pipeline_id, pipeline)
+        return d
+
+    def is_resolved(self, pipeline_id):
+        return pipeline_id in self._pipelines
+
+    def __getitem__(self, pipeline_id):
+        pipeline = self._pipelines.get(pipeline_id)
+        if pipeline is not None:
+            return pipeline
+
+        with self._lock:
+            if pipeline_id in self._pipelines:
+                return self._pipelines[pipeline_id]
+            definition = self._definitions[pipeline_id]
+            if pipeline_id in self._resolving:
+                raise MalformedPipelineError("Pipeline '{i}' has a cyclic reference to itself".format(i=pipeline_id))
+            self._resolving.add(pipeline_id)
+            try:
+                pipeline = definition.to_pipeline(self)
+            finally:
+                self._resolving.discard(pipeline_id)
+            self._pipelines[pipeline_id] = pipeline
+            return pipeline
+
+    def __setitem__(self, pipeline_id, pipeline):
+        with self._lock:
+            self._pipelines[pipeline_id] = pipeline
+
+    def __delitem__(self, pipeline_id):
+        with self._lock:
+            if pipeline_id not in self:
+                raise KeyError(pipeline_id)
+            self._definitions.pop(pipeline_id, None)
+            self._pipelines.pop(pipeline_id, None)
+
+    def __contains__(self, pipeline_id):
+        return pipeline_id in self._definitions or pipeline_id in self._pipelines
+
+    def __iter__(self):
+        for pipeline_id in self._definitions:
+            yield pipeline_id
+        for pipeline_id in self._pipelines.keys():
+            if pipeline_id not in self._definitions:
+                yield pipeline_id
+
+    def __len__(self):
+        return len(self._definitions) + len([i for i in self._pipelines if i not in self._definitions])
+
+
+REGISTERED_PIPELINES = LazyPipelineRegistry()
 
 REGISTERED_CHUNK_OPERATORS = {}
 
@@ -167,6 +260,8 @@ class TaskStates(object):
     FAILED = 'failed'
     # Killed by sigint from the user
     KILLED = 'killed'
+    # Killed after exceeding the walltime of the task
+    TIMED_OUT = 'timed_out'
     # Not sure this is the best way to handle this
     # Scattered means the chunking has been applied and the new
     # chunked tasks were created.
@@ -175,11 +270,12 @@ class TaskStates(object):
     @classmethod
     def ALL_STATES(cls):
         return (cls.CREATED, cls.READY, cls.SUBMITTED, cls.RUNNING,
-                cls.SUCCESSFUL, cls.FAILED, cls.SCATTERED, cls.KILLED)
+                cls.SUCCESSFUL, cls.FAILED, cls.SCATTERED, cls.KILLED,
+                cls.TIMED_OUT)
 
     @classmethod
     def COMPLETED_STATES(cls):
-        return cls.SUCCESSFUL, cls.FAILED, cls.KILLED, cls.SCATTERED
+        return cls.SUCCESSFUL, cls.FAILED, cls.KILLED, cls.SCATTERED, cls.TIMED_OUT
 
     @classmethod
     def RUNNABLE_STATES(cls):
@@ -187,7 +283,7 @@ class TaskStates(object):
 
     @classmethod
     def FAILURE_STATES(cls):
-        return cls.FAILED, cls.KILLED
+        return cls.FAILED, cls.KILLED, cls.TIMED_OUT
 
 
 class MetaTask(object):
@@ -225,6 +321,19 @@ class MetaTask(object):
             output_file_display_names is not None else ["" for x in output_file_names]
         self.output_file_descriptions = output_file_descriptions if \
             output_file_descriptions is not None else ["" for x in output_file_names]
+        # option id -> OptionValidator (compiled on first use)
+        self._option_validators = {}
+
+    def get_option_validator(self, option_id):
+        """
+        Returns the compiled validator of the option schema
+
+        :rtype: pbsmrtpipe.schema_opt_utils.OptionValidator
+        """
+        import pbsmrtpipe.schema_opt_utils as OP
+        if option_id not in self._option_validators:
+            self._option_validators[option_id] = OP.OptionValidator(self.option_schemas[option_id])
+        return self._option_validators[option_id]
 
     def __eq__(self, other):
         # need to rethink this.
@@ -471,20 +580,114 @@ class GatherTask(Task):
     pass
 
 
+class SpilledTask(object):
+
+    """Compact stand-in of a completed Task whose details were written to
+    the task dir (see spill_task). Only the ids, the output dir, the nproc
+    and the output files are kept in memory. Other attributes (e.g., cmds)
+    are loaded from the task dir on access. The last loaded Task is cached,
+    so consecutive accesses of the same task only load it once."""
+
+    __slots__ = ('task_id', 'uuid', 'output_dir', 'nproc', 'output_files')
+
+    # (path, uuid, Task) of the last loaded task
+    _last_loaded = (None, None, None)
+
+    def __init__(self, task_id, uuid, output_dir, nproc, output_files):
+        self.task_id = task_id
+        self.uuid = uuid
+        self.output_dir = output_dir
+        self.nproc = nproc
+        self.output_files = output_files
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, i=self.task_id, n=self.nproc, d=self.output_dir)
+        return "<{k} id:{i} nproc:{n} dir:{d} >".format(**_d)
+
+    @property
+    def path(self):
+        return os.path.join(self.output_dir, TASK_JSON)
+
+    def load(self):
+        """:rtype: Task"""
+        path, uuid_, task = SpilledTask._last_loaded
+        if path == self.path and uuid_ == self.uuid:
+            return task
+
+        with open(self.path, 'r') as f:
+            d = json.load(f)
+
+        klass = d.get('klass', Task.__name__)
+        args = (d['task_id'], d['is_distributed'], d['input_files'], d['output_files'],
+                d['options'], d['nproc'], d['resources'], d['cmds'])
+        if klass == ScatterTask.__name__:
+            task = ScatterTask(*(args + (d['nchunks'], d['output_dir'], d['chunk_keys'])))
+        elif klass == GatherTask.__name__:
+            task = GatherTask(*(args + (d['output_dir'], )))
+        else:
+            task = Task(*(args + (d['output_dir'], )))
+        task.uuid = d['uuid']
+        task.task_type_id = d['task_type_id']
+
+        SpilledTask._last_loaded = (self.path, self.uuid, task)
+        return task
+
+    def __getattr__(self, name):
+        # only called for the attributes that are not in memory
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+
+def spill_task(task):
+    """
+    Write the Task (or ScatterTask, GatherTask) to the task dir and return a
+    SpilledTask
+
+    :type task: Task
+    :rtype: SpilledTask
+    """
+    if isinstance(task, SpilledTask):
+        return task
+    d = task.to_dict()
+    d['klass'] = task.__class__.__name__
+    if isinstance(task, ScatterTask):
+        d['nchunks'] = task.nchunks
+        d['chunk_keys'] = task.chunk_keys
+    path = os.path.join(task.output_dir, TASK_JSON)
+    with open(path, 'w') as f:
+        f.write(json.dumps(d, sort_keys=True, indent=2))
+    return SpilledTask(task.task_id, task.uuid, task.output_dir, task.nproc, task.output_files)
+
+
 class RunnableTask(object):
 
     """Container for task-manifest.json"""
 
-    def __init__(self, task, cluster, envs=None):
+    def __init__(self, task, cluster, envs=None, cluster_template=None, walltime=None, extras=None, cpus=None,
+                 staging=None, cleanup_resources=True):
         """
 
         :type cluster: ClusterTemplateRender | None
         :type task: Task
+        :param cluster_template: Name of the selected cluster templates (e.g., 'default')
+        :param walltime: Walltime (in sec) of the task. None is unlimited
+        :param extras: Cluster template EXTRAS (e.g., '-l h_rt=01:00:00')
+        :param cpus: (list, None) CPUs the (local) task is pinned to. None is not pinned
+        :param staging: (dict, None) Files staged on the node-local scratch
+         dir (see pbsmrtpipe.staging). None is not staged
+        :param cleanup_resources: Remove the tmp resources of the task (in the background) when the task is completed
         """
 
         self.task = task
         self.cluster = cluster
         self.envs = {} if envs is None else envs
+        self.cluster_template = cluster_template
+        self.walltime = walltime
+        self.extras = extras
+        self.cpus = cpus
+        self.staging = staging
+        self.cleanup_resources = cleanup_resources
 
     def __repr__(self):
         _d = dict(k=self.__class__.__name__,
@@ -518,7 +721,10 @@ class RunnableTask(object):
             c = None
 
         task = Task.from_d(d['task'])
-        return RunnableTask(task, c, d['env'])
+        return RunnableTask(task, c, d['env'], cluster_template=d.get('cluster_template'),
+                            walltime=d.get('walltime'), extras=d.get('extras'),
+                            cpus=d.get('cpus'), staging=d.get('staging'),
+                            cleanup_resources=d.get('cleanup_resources', True))
 
     def to_dict(self):
         t = self.task.to_dict()
@@ -530,6 +736,12 @@ class RunnableTask(object):
         return dict(id=self.task.task_id,
                     task=t, env={},
                     cluster=cr,
+                    cluster_template=self.cluster_template,
+                    walltime=self.walltime,
+                    extras=self.extras,
+                    cpus=self.cpus,
+                    staging=self.staging,
+                    cleanup_resources=self.cleanup_resources,
                     version=pbsmrtpipe.get_version(),
                     resource_types=self.task.resources)
 
@@ -753,12 +965,40 @@ class WorkflowLevelOptions(collections.Sized):
                   "tmp_dir": to_workflow_option_ns("tmp_dir"),
                   "progress_status_url": to_workflow_option_ns("progress_status_url"),
                   "exit_on_failure": to_workflow_option_ns("exit_on_failure"),
-                  "debug_mode": to_workflow_option_ns("debug_mode")}
+                  "debug_mode": to_workflow_option_ns("debug_mode"),
+                  "metrics_port": to_workflow_option_ns("metrics_port"),
+                  "local_run_time_threshold": to_workflow_option_ns("local_run_time_threshold"),
+                  "run_time_history": to_workflow_option_ns("run_time_history"),
+                  "run_time_hints": to_workflow_option_ns("run_time_hints"),
+                  "cluster_templates": to_workflow_option_ns("cluster_templates"),
+                  "cluster_routing_rules": to_workflow_option_ns("cluster_routing_rules"),
+                  "memory_hints": to_workflow_option_ns("memory_hints"),
+                  "speculative_multiple": to_workflow_option_ns("speculative_multiple"),
+                  "speculative_min_run_time": to_workflow_option_ns("speculative_min_run_time"),
+                  "task_walltimes": to_workflow_option_ns("task_walltimes"),
+                  "walltime_multiplier": to_workflow_option_ns("walltime_multiplier"),
+                  "walltime_extras": to_workflow_option_ns("walltime_extras"),
+                  "host_slot_broker": to_workflow_option_ns("host_slot_broker"),
+                  "host_max_nproc": to_workflow_option_ns("host_max_nproc"),
+                  "host_max_memory": to_workflow_option_ns("host_max_memory"),
+                  "cpu_affinity": to_workflow_option_ns("cpu_affinity"),
+                  "spill_completed_tasks": to_workflow_option_ns("spill_completed_tasks"),
+                  "stage_dir": to_workflow_option_ns("stage_dir"),
+                  "stage_task_ids": to_workflow_option_ns("stage_task_ids"),
+                  "stage_max_input_size": to_workflow_option_ns("stage_max_input_size"),
+                  "stage_skip_file_types": to_workflow_option_ns("stage_skip_file_types")}
 
     def __init__(self, chunk_mode, max_nchunks, max_nproc, total_max_nproc, max_nworkers,
                  distributed_mode, cluster_manager_path, tmp_dir,
                  progress_status_url, exit_on_failure, debug_mode,
-                 system_message=None):
+                 system_message=None, metrics_port=None, local_run_time_threshold=None,
+                 run_time_history=None, run_time_hints=None, cluster_templates=None,
+                 cluster_routing_rules=None, memory_hints=None, speculative_multiple=None,
+                 speculative_min_run_time=SPECULATIVE_MIN_RUN_TIME, task_walltimes=None,
+                 walltime_multiplier=None, walltime_extras=None, host_slot_broker=None,
+                 host_max_nproc=None, host_max_memory=None, cpu_affinity=False,
+                 spill_completed_tasks=False, stage_dir=None, stage_task_ids=None,
+                 stage_max_input_size=STAGE_MAX_INPUT_SIZE, stage_skip_file_types=STAGE_SKIP_FILE_TYPES):
         """ Container for the known workflow options"""
         self.chunk_mode = chunk_mode
         self.max_nchunks = max_nchunks
@@ -773,6 +1013,29 @@ class WorkflowLevelOptions(collections.Sized):
         self.progress_status_url = progress_status_url
         self.exit_on_failure = exit_on_failure
         self.debug_mode = debug_mode
+        self.metrics_port = metrics_port
+        self.local_run_time_threshold = local_run_time_threshold
+        self.run_time_history = run_time_history
+        self.run_time_hints = run_time_hints
+        # Named cluster templates in addition to the cluster_manager
+        self.cluster_templates = cluster_templates
+        self.cluster_routing_rules = cluster_routing_rules
+        self.memory_hints = memory_hints
+        self.speculative_multiple = speculative_multiple
+        self.speculative_min_run_time = speculative_min_run_time
+        self.task_walltimes = task_walltimes
+        self.walltime_multiplier = walltime_multiplier
+        self.walltime_extras = walltime_extras
+        self.host_slot_broker = host_slot_broker
+        self.host_max_nproc = host_max_nproc
+        self.host_max_memory = host_max_memory
+        self.cpu_affinity = cpu_affinity
+        self.spill_completed_tasks = spill_completed_tasks
+        # node-local scratch staging of the task files
+        self.stage_dir = stage_dir
+        self.stage_task_ids = stage_task_ids
+        self.stage_max_input_size = stage_max_input_size
+        self.stage_skip_file_types = stage_skip_file_types
         # XXX hack to facilitate displaying runtime information such as
         # sys.argv in pbsmrtpipe.log
         self.system_message = system_message
@@ -795,7 +1058,7 @@ class WorkflowLevelOptions(collections.Sized):
         """
         Create an instance from a id dict of options (pbsmrtpipe.options.x:value}
         """
-        from pbsmrtpipe.pb_io import REGISTERED_WORKFLOW_OPTIONS
+        from pbsmrtpipe.pb_io import REGISTERED_WORKFLOW_OPTIONS, REGISTERED_WORKFLOW_OPTION_VALIDATORS
         import pbsmrtpipe.schema_opt_utils as OP
 
         adict = {}
@@ -803,7 +1066,7 @@ class WorkflowLevelOptions(collections.Sized):
         for opt_id, schema in REGISTERED_WORKFLOW_OPTIONS.iteritems():
             if opt_id in d:
                 v = d[opt_id]
-                OP.validate_value(schema, {opt_id: v})
+                REGISTERED_WORKFLOW_OPTION_VALIDATORS[opt_id].validate({opt_id: v})
                 adict[opt_id] = v
             else:
                 value = OP.get_default_from_schema(schema)
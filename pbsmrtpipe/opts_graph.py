@@ -7,7 +7,7 @@ import functools
 import re
 import types
 import pprint
-import jsonschema
+from collections import namedtuple
 
 from pbcommand.models import FileTypes, TaskTypes, SymbolTypes
 from pbsmrtpipe.exceptions import (InvalidDependencyInjectError,
@@ -19,6 +19,7 @@ from pbsmrtpipe.models import (MetaScatterTask,
                                GatherToolContractMetaTask,
                                ToolContractMetaTask)
 
+import pbsmrtpipe.schema_opt_utils as OP
 from pbsmrtpipe.dataset_io import (dispatch_metadata_resolver,
                                    has_metadata_resolver,
                                    DatasetMetadata)
@@ -29,6 +30,10 @@ import networkx as nx
 log = logging.getLogger(__name__)
 # logging.basicConfig(level=logging.DEBUG)
 
+# Resolution step of a DI plan. func is None if the value is resolved by the
+# default resolution func. args is a list of (is_dollar_value, value)
+DIStep = namedtuple("DIStep", "method_id symbol func args")
+
 
 def get_report_json_attribute(report_file, attribute_id):
 
@@ -303,25 +308,24 @@ def is_dollar_value(x_):
 
 def is_valid(schema, v):
     """Returns a bool if the schema is valid"""
-    try:
-        jsonschema.validate(v, schema)
-        return True
-    except jsonschema.ValidationError:
-        pass
-    return False
+    return OP.is_valid(schema, v)
 
 
-def default_to_ropts(user_opts, opts_schemas):
+def default_to_ropts(user_opts, opts_schemas, get_validator=None):
     """
     'Resolves' the options and returns a {id:value}
 
     or raises jsonschema.ValidationError
+
+    :param get_validator: func(option id) -> compiled OptionValidator (e.g.,
+     MetaTask.get_option_validator). If None, the schemas are compiled
     """
     ropts = {}
     for opt_id, schema in opts_schemas.iteritems():
         if opt_id in user_opts:
             v = user_opts[opt_id]
-            jsonschema.validate({opt_id: v}, schema)
+            validator = OP.OptionValidator(schema) if get_validator is None else get_validator(opt_id)
+            validator.validate({opt_id: v})
             ropts[opt_id] = v
         else:
             # must have a default value or null?
@@ -331,6 +335,109 @@ def default_to_ropts(user_opts, opts_schemas):
     return ropts
 
 
+class DIPlan(object):
+
+    """Compiled DI resolution plan of a MetaTask
+
+    The DI graph of a MetaTask is the same for every task instance, so the
+    graph is built and (topologically) sorted once per MetaTask. Resolving a
+    task instance is then an evaluation of the ordered steps.
+    """
+
+    def __init__(self, task_id, steps, report_dis):
+        """
+        :type steps: list[DIStep]
+        :param report_dis: [(input file index, report/metadata attribute id)]
+        """
+        self.task_id = task_id
+        self.steps = steps
+        self.report_dis = report_dis
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, i=self.task_id,
+                  s=[x.method_id for x in self.steps], r=len(self.report_dis))
+        return "<{k} {i} steps:{s} report DIs:{r} >".format(**_d)
+
+
+# Symbol resolved by each of the resolution funcs
+_METHOD_ID_TO_SYMBOL = {'to_ropts': SymbolTypes.RESOLVED_OPTS,
+                        'to_nproc': SymbolTypes.NPROC,
+                        'to_nchunks': SymbolTypes.NCHUNKS,
+                        'to_task_type': SymbolTypes.TASK_TYPE}
+
+
+def _get_method_id_prefix(s):
+    if isinstance(s, str):
+        for to_x in _METHOD_ID_TO_SYMBOL.keys():
+            if s.startswith(to_x):
+                return to_x
+    return None
+
+
+def compile_di_plan(meta_task):
+    """
+    Compile the DI resolution plan of a MetaTask
+
+    :type meta_task: MetaTask
+    :rtype: DIPlan
+    """
+    method_id_to_di = {'to_ropts': meta_task.option_schemas,
+                       'to_nproc': meta_task.nproc,
+                       'to_task_type': meta_task.is_distributed,
+                       'to_nchunks': meta_task.chunk_di if isinstance(meta_task, MetaScatterTask) else None}
+
+    g = to_di_graph(meta_task)
+    nodes = nx.topological_sort(g)
+    log.debug(pprint.pformat(nodes))
+
+    steps = []
+    for node in nodes:
+        method_id = _get_method_id_prefix(node)
+        if method_id is None:
+            # already resolved values, or (potentially unsupported) values
+            continue
+        di_values = method_id_to_di[method_id]
+        if is_di_list(di_values):
+            f = get_tail_func_or_raise(di_values)
+            args = [(is_dollar_value(x), x) for x in di_values[:-1]]
+            steps.append(DIStep(method_id, _METHOD_ID_TO_SYMBOL[method_id], f, args))
+        else:
+            steps.append(DIStep(method_id, _METHOD_ID_TO_SYMBOL[method_id], None, []))
+
+    return DIPlan(meta_task.task_id, steps, get_report_di(meta_task))
+
+
+# id(meta_task) -> (meta_task, DIPlan)
+_DI_PLANS = {}
+
+
+def get_di_plan(meta_task):
+    """
+    Returns the cached DI resolution plan of a MetaTask (compiled on first use)
+
+    :rtype: DIPlan
+    """
+    key = id(meta_task)
+    if key in _DI_PLANS:
+        cached_meta_task, plan = _DI_PLANS[key]
+        if cached_meta_task is meta_task:
+            return plan
+    plan = compile_di_plan(meta_task)
+    _DI_PLANS[key] = (meta_task, plan)
+    log.debug("Compiled {p}".format(p=plan))
+    return plan
+
+
+# func -> number of args
+_FUNC_NARGS = {}
+
+
+def _get_nargs(func):
+    if func not in _FUNC_NARGS:
+        _FUNC_NARGS[func] = len(inspect.getargspec(func).args)
+    return _FUNC_NARGS[func]
+
+
 def meta_task_to_task(meta_task,
                       input_files,
                       all_task_options,
@@ -357,14 +464,13 @@ def meta_task_to_task(meta_task,
     # Type checking
 
     if isinstance(to_resolve_files_func, functools.partial):
-        f1 = to_resolve_files_func.func
-        args_obj = inspect.getargspec(f1)
-        if (len(args_obj.args) - len(to_resolve_files_func.args)) != 5:
-            TypeError("Incorrect Function {f} args {a}".format(f=str(to_resolve_files_func), a=args_obj.args))
+        nargs = _get_nargs(to_resolve_files_func.func)
+        if (nargs - len(to_resolve_files_func.args)) != 5:
+            TypeError("Incorrect Function {f} nargs {a}".format(f=str(to_resolve_files_func), a=nargs))
     elif isinstance(to_resolve_files_func, types.FunctionType):
-        args_obj = inspect.getargspec(to_resolve_files_func)
-        if len(args_obj.args) != 5:
-            raise TypeError("Incorrect Function {f} args {a}".format(f=str(to_resolve_files_func), a=args_obj.args))
+        nargs = _get_nargs(to_resolve_files_func)
+        if nargs != 5:
+            raise TypeError("Incorrect Function {f} nargs {a}".format(f=str(to_resolve_files_func), a=nargs))
     else:
         raise TypeError("Expected function type. Got {f}".format(f=type(to_resolve_files_func)))
 
@@ -384,8 +490,10 @@ def meta_task_to_task(meta_task,
     log.debug("Initial resolved DI values")
     log.debug(pprint.pformat(resolved_values.keys()))
 
+    plan = get_di_plan(meta_task)
+
     # [(input file index, report attribute id), ]
-    report_dis = get_report_di(meta_task)
+    report_dis = plan.report_dis
 
     if report_dis:
         log.debug("Report Input DIs")
@@ -421,7 +529,8 @@ def meta_task_to_task(meta_task,
         log.info("Default nchunks {x}".format(x=max_nchunks))
         return max_nchunks
 
-    default_resolve_ropts = functools.partial(default_to_ropts, resolved_values[SymbolTypes.OPTS], resolved_values[SymbolTypes.SCHEMA_OPTS])
+    default_resolve_ropts = functools.partial(default_to_ropts, resolved_values[SymbolTypes.OPTS], resolved_values[SymbolTypes.SCHEMA_OPTS],
+                                              meta_task.get_option_validator)
 
     # Default Resolution Functions. They have no args
     default_funcs = {'to_ropts': default_resolve_ropts,
@@ -431,84 +540,31 @@ def meta_task_to_task(meta_task,
 
     nchunks_ = _default_nchunks()
 
-    # the resolved func with update the resolved values with the value of dict
-    # {str:(Symbol, func() -> value)}
-    method_id_to_dollar_t = {'to_ropts': (SymbolTypes.RESOLVED_OPTS, meta_task.option_schemas),
-                             'to_nproc': (SymbolTypes.NPROC, meta_task.nproc),
-                             'to_nchunks': (SymbolTypes.NCHUNKS, nchunks_),
-                             'to_task_type': (SymbolTypes.TASK_TYPE, meta_task.is_distributed)}
-
-    if isinstance(meta_task, MetaScatterTask):
-        method_id_to_dollar_t['to_nchunks'] = (SymbolTypes.NCHUNKS, meta_task.chunk_di)
-
-    def get_method_id_prefix(s):
-        if isinstance(s, str):
-            for to_x in method_id_to_dollar_t.keys():
-                if s.startswith(to_x):
-                    return to_x
-        return False
-
-    def begins_with_method_prefix(s):
-        return get_method_id_prefix(s) is not False
-
-    g = to_di_graph(meta_task)
-
-    nodes = nx.topological_sort(g)
-    log.debug(pprint.pformat(nodes))
+    for step in plan.steps:
+        if step.func is not None:
+            # this will be resolved args to func
+            # For example, [$a, $b, func(a, b)]
+            # then, the resolved value will computed via
+            # value = func(a, b)
+            injectable = []
+            for is_dollar, x in step.args:
+                if is_dollar:
+                    if x in resolved_values:
+                        injectable.append(resolved_values[x])
+                    else:
+                        raise ValueError("$ value '{x}' not resolved.".format(x=x))
+                else:
+                    injectable.append(x)
 
-    for node in nodes:
-        # log.debug("Trying to resolve '{r}'".format(r=node))
-        if node in resolved_values:
-            # nothing to do here
-            # log.debug("Value {n} has been resolved. '{v}'".format(n=node, v=resolved_values[node]))
-            pass
+            value = step.func(*injectable)
+            log.debug("resolved '{k}' -> '{v}'".format(k=step.symbol, v=value))
         else:
-            # Are we using default funcs to resolve values
-            if begins_with_method_prefix(node):
-
-                method_prefix = get_method_id_prefix(node)
-
-                dollar_key, di_values = method_id_to_dollar_t[method_prefix]
-
-                if is_di_list(di_values):
-                    f = get_tail_func_or_raise(di_values)
-
-                    # this will be resolved args to func
-                    # For example, [$a, $b, func(a, b)]
-                    # then, the resolved value will computed via
-                    # value = func(a, b)
-                    injectable = []
-                    for x in di_values[:-1]:
-                        if is_dollar_value(x):
-                            if x in resolved_values:
-                                v = resolved_values[x]
-                                injectable.append(v)
-                            else:
-                                raise ValueError("$ value '{x}' not resolved.".format(x=x))
-                        else:
-                            injectable.append(x)
-                    # log.debug(f.__name__)
-                    # log.debug(injectable)
-
-                    # this should do an argsinpsect. Putting a TypeError try/catch
-                    # could be misleading
-                    value = f(*injectable)
-
-                    log.debug("resolved '{k}' -> '{v}'".format(k=dollar_key, v=value))
-                    resolved_values[dollar_key] = value
-                else:
-                    # use default value, it was supplied as a primitive.
-                    # this still needs to validate the final value.
-                    # nchunks can still be computed to be > $MAX_NCHUNKS
-
-                    f = default_funcs[method_prefix]
-                    value = f()
-                    log.debug("resolved '{k}' -> '{v}' (default resolution)".format(k=dollar_key, v=value))
-                    resolved_values[dollar_key] = value
-            else:
-                msg = "potentially unsupported value '{n}'".format(n=node)
-                #log.warn(msg)
-                #raise ValueError(msg)
+            # use default value, it was supplied as a primitive.
+            # this still needs to validate the final value.
+            # nchunks can still be computed to be > $MAX_NCHUNKS
+            value = default_funcs[step.method_id]()
+            log.debug("resolved '{k}' -> '{v}' (default resolution)".format(k=step.symbol, v=value))
+        resolved_values[step.symbol] = value
 
     # Sanity Check to make sure required values are resolved
     for x in v_to_resolve:
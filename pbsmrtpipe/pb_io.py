@@ -11,7 +11,6 @@ import itertools
 
 from avro.datafile import DataFileWriter, DataFileReader
 from avro.io import DatumWriter, DatumReader, validate
-import jsonschema
 from pbcommand.models.parser import JsonSchemaTypes
 from pbcommand.resolver import (resolve_tool_contract,
                                 resolve_scatter_tool_contract,
@@ -93,6 +92,8 @@ class Constants(object):
 
 
 REGISTERED_WORKFLOW_OPTIONS = {}
+# option id -> compiled OptionValidator of the schema
+REGISTERED_WORKFLOW_OPTION_VALIDATORS = {}
 # {option_id: [validate_func, ..]}
 OPTION_VALIDATORS = collections.defaultdict(list)
 
@@ -163,8 +164,9 @@ def register_workflow_option(func):
     """Register workflow option to global registry"""
 
     s = func()
-    _ = jsonschema.Draft4Validator(s)
     oid = s['properties'].keys()[0]
+    # validate the schema and compile the validator
+    REGISTERED_WORKFLOW_OPTION_VALIDATORS[oid] = OP.OptionValidator(s)
     REGISTERED_WORKFLOW_OPTIONS[oid] = s
 
     return func
@@ -257,6 +259,167 @@ def _get_exit_on_failure():
                                "Debug will emit debug messages to Stdout and set the level in the master log to DEBUG.", GlobalConstants.DEBUG_MODE)
 
 
+@register_workflow_option
+def _get_metrics_port():
+    return OP.to_option_schema(_to_wopt_id("metrics_port"), ("integer", "null"), "Metrics HTTP Port",
+                               "Serve the live metrics of the master (workflow/metrics.prom) in the Prometheus text format on "
+                               "http://localhost:{port}/metrics (null disables the endpoint)", GlobalConstants.METRICS_PORT)
+
+
+@register_workflow_option
+def _get_local_run_time_threshold():
+    return OP.to_option_schema(_to_wopt_id("local_run_time_threshold"), ("number", "null"), "Local Run Time Threshold",
+                               "In distributed mode, run distributed tasks locally if their predicted run time (in sec) "
+                               "is less than the threshold and local slots are free (null disables local routing)",
+                               GlobalConstants.LOCAL_RUN_TIME_THRESHOLD)
+
+
+@register_workflow_option
+def _get_run_time_history():
+    return OP.to_option_schema(_to_wopt_id("run_time_history"), ("string", "null"), "Run Time History",
+                               "Path to a job dir, workflow-graph.json or duration model JSON used to predict the run time of tasks",
+                               GlobalConstants.RUN_TIME_HISTORY)
+
+
+@register_workflow_option
+def _get_run_time_hints():
+    return OP.to_option_schema(_to_wopt_id("run_time_hints"), ("string", "null"), "Run Time Hints",
+                               "Predicted run time (in sec) of tasks. Overrides the run time history. "
+                               "Format 'task_id=seconds,task_id=seconds'",
+                               GlobalConstants.RUN_TIME_HINTS)
+
+
+@register_workflow_option
+def _get_cluster_templates():
+    return OP.to_option_schema(_to_wopt_id("cluster_templates"), ("string", "null"), "Named Cluster Templates",
+                               "Additional named cluster templates (e.g., queues) used by the cluster routing rules. "
+                               "Format 'name=path_or_module,name=path_or_module'. The 'cluster_manager' templates are named 'default'",
+                               GlobalConstants.CLUSTER_TEMPLATES)
+
+
+@register_workflow_option
+def _get_cluster_routing_rules():
+    return OP.to_option_schema(_to_wopt_id("cluster_routing_rules"), ("string", "null"), "Cluster Routing Rules",
+                               "Ordered rules to select the named cluster template of a distributed task. The first matching "
+                               "rule wins, otherwise the 'default' template is used. "
+                               "Format 'name: cond, cond; name: cond' with conditions on task (glob), nproc, memory (MB) and run_time (sec), "
+                               "e.g., 'short: run_time<600; highmem: memory>=64000; long: task=pbsmrtpipe.tasks.*'",
+                               GlobalConstants.CLUSTER_ROUTING_RULES)
+
+
+@register_workflow_option
+def _get_memory_hints():
+    return OP.to_option_schema(_to_wopt_id("memory_hints"), ("string", "null"), "Memory Hints",
+                               "Memory (in MB) required by tasks. Used by the cluster routing rules. "
+                               "Format 'task_id=mb,task_id=mb'",
+                               GlobalConstants.MEMORY_HINTS)
+
+
+@register_workflow_option
+def _get_speculative_multiple():
+    return OP.to_option_schema(_to_wopt_id("speculative_multiple"), ("number", "null"), "Speculative Execution Multiple",
+                               "Run a speculative copy of a chunked task running longer than this multiple of the median run time "
+                               "of the completed chunks of the same chunk group. The first copy to complete wins "
+                               "(null disables speculative execution)", GlobalConstants.SPECULATIVE_MULTIPLE)
+
+
+@register_workflow_option
+def _get_speculative_min_run_time():
+    return OP.to_option_schema(_to_wopt_id("speculative_min_run_time"), "number", "Speculative Execution Min Run Time",
+                               "Chunked tasks running less than this (in sec) are never speculatively executed",
+                               GlobalConstants.SPECULATIVE_MIN_RUN_TIME)
+
+
+@register_workflow_option
+def _get_task_walltimes():
+    return OP.to_option_schema(_to_wopt_id("task_walltimes"), ("string", "null"), "Task Walltimes",
+                               "Walltime (in sec) of tasks. Tasks exceeding their walltime are killed and marked as timed out. "
+                               "Format 'task_id=seconds,task_id=seconds'", GlobalConstants.TASK_WALLTIMES)
+
+
+@register_workflow_option
+def _get_walltime_multiplier():
+    return OP.to_option_schema(_to_wopt_id("walltime_multiplier"), ("number", "null"), "Walltime Multiplier",
+                               "Default walltime of a task as a multiple of its run time in the run time history "
+                               "(null disables the default walltime)", GlobalConstants.WALLTIME_MULTIPLIER)
+
+
+@register_workflow_option
+def _get_walltime_extras():
+    return OP.to_option_schema(_to_wopt_id("walltime_extras"), ("string", "null"), "Walltime Cluster Extras",
+                               "Cluster template EXTRAS of distributed tasks with a walltime. ${WALLTIME} (HH:MM:SS) and "
+                               "${WALLTIME_SECONDS} are substituted, e.g., '-l h_rt=${WALLTIME}'", GlobalConstants.WALLTIME_EXTRAS)
+
+
+@register_workflow_option
+def _get_host_slot_broker():
+    return OP.to_option_schema(_to_wopt_id("host_slot_broker"), ("string", "null"), "Host Slot Broker",
+                               "Path to the state file of the nproc and memory slots shared by all the pbsmrtpipe "
+                               "instances on the host. Local tasks acquire their slots before they are launched "
+                               "(null disables the broker)", GlobalConstants.HOST_SLOT_BROKER)
+
+
+@register_workflow_option
+def _get_host_max_nproc():
+    return OP.to_option_schema(_to_wopt_id("host_max_nproc"), ("integer", "null"), "Host Max nproc",
+                               "Max number of nproc used by the local tasks of all the pbsmrtpipe instances on the host "
+                               "(null is the number of CPUs). Only used by the host slot broker", GlobalConstants.HOST_MAX_NPROC)
+
+
+@register_workflow_option
+def _get_host_max_memory():
+    return OP.to_option_schema(_to_wopt_id("host_max_memory"), ("integer", "null"), "Host Max Memory",
+                               "Max memory (in MB, from the memory hints) used by the local tasks of all the pbsmrtpipe "
+                               "instances on the host (null is unbounded). Only used by the host slot broker",
+                               GlobalConstants.HOST_MAX_MEMORY)
+
+
+@register_workflow_option
+def _get_cpu_affinity():
+    return OP.to_option_schema(_to_wopt_id("cpu_affinity"), "boolean", "CPU Affinity",
+                               "Pin each local task to a set of nproc CPUs (from a single NUMA node if possible). "
+                               "The CPUs are released when the task is completed", GlobalConstants.CPU_AFFINITY)
+
+
+@register_workflow_option
+def _get_spill_completed_tasks():
+    return OP.to_option_schema(_to_wopt_id("spill_completed_tasks"), "boolean", "Spill Completed Tasks",
+                               "Write the details of completed tasks (commands, options, resources, files) to the task dir "
+                               "and drop them from the memory of the master. The details are loaded on demand. "
+                               "Reduces the memory of jobs with many (chunked) tasks", GlobalConstants.SPILL_COMPLETED_TASKS)
+
+
+@register_workflow_option
+def _get_stage_dir():
+    return OP.to_option_schema(_to_wopt_id("stage_dir"), ("string", "null"), "Stage Dir",
+                               "Node-local scratch dir (e.g., '$TMPDIR', env vars are expanded on the node). The runner "
+                               "copies the task inputs to the scratch dir, runs the task commands with the rewritten "
+                               "paths and copies the outputs back to the task dir (null disables the staging)",
+                               GlobalConstants.STAGE_DIR)
+
+
+@register_workflow_option
+def _get_stage_task_ids():
+    return OP.to_option_schema(_to_wopt_id("stage_task_ids"), ("string", "null"), "Stage Task Ids",
+                               "Tasks staged in the stage dir. Format 'task_id,task_id' (glob patterns, "
+                               "e.g., 'pbalign.tasks.*'). null stages all the tasks", GlobalConstants.STAGE_TASK_IDS)
+
+
+@register_workflow_option
+def _get_stage_max_input_size():
+    return OP.to_option_schema(_to_wopt_id("stage_max_input_size"), ("integer", "null"), "Stage Max Input Size",
+                               "Task inputs larger than this (in MB) are read in place (null is unbounded)",
+                               GlobalConstants.STAGE_MAX_INPUT_SIZE)
+
+
+@register_workflow_option
+def _get_stage_skip_file_types():
+    return OP.to_option_schema(_to_wopt_id("stage_skip_file_types"), ("string", "null"), "Stage Skip File Types",
+                               "Files of these types are never staged. Format 'file_type_id,file_type_id' (glob patterns). "
+                               "By default, the DataSet XMLs, which reference external resources by path",
+                               GlobalConstants.STAGE_SKIP_FILE_TYPES)
+
+
 def validate_or_modify_workflow_level_options(wopts):
     """
     This will adjust or modify intra-option dependencies.
@@ -280,12 +443,20 @@ def validate_or_modify_workflow_level_options(wopts):
             except Exception:
                 slog.error("Failed to load cluster templates from '{x}'".format(x=wopts.cluster_manager_path))
                 raise
+            if wopts.cluster_templates is not None:
+                try:
+                    _ = C.load_named_cluster_templates(wopts.cluster_templates)
+                    slog.info("Successfully loaded named cluster templates {t}".format(t=wopts.cluster_templates))
+                except Exception:
+                    slog.error("Failed to load named cluster templates from '{x}'".format(x=wopts.cluster_templates))
+                    raise
         else:
             slog.warn("cluster_manager not provided. Settings distribute mode to False")
             wopts.distributed_mode = False
     else:
         slog.warn("distribute_mode is False, Disabling cluster manager, running in LOCAL ONLY mode.")
         wopts.cluster_manager_path = None
+        wopts.cluster_templates = None
 
     if wopts.total_max_nproc is not None:
         if wopts.max_nproc > wopts.total_max_nproc:
@@ -371,7 +542,10 @@ parse_task_options = functools.partial(__parse_options, Constants.TASK_OPTIONS)
 parse_workflow_options = functools.partial(__parse_options, Constants.WORKFLOW_OPTIONS)
 
 
-def _raw_option_with_schema(option_id, raw_value, schema):
+def _raw_option_with_schema(option_id, raw_value, schema, validator=None):
+    """
+    :param validator: Compiled OptionValidator of the schema. If None, the schema is compiled
+    """
 
     option_id = option_id.strip()
 
@@ -380,7 +554,9 @@ def _raw_option_with_schema(option_id, raw_value, schema):
     if option_id == schema_option_id:
         types_ = schema['properties'][option_id]['type']
         coerced_value = crude_coerce_type_from_str(raw_value, types_)
-        _ = jsonschema.validate(schema, {option_id: coerced_value})
+        if validator is None:
+            validator = OP.OptionValidator(schema)
+        validator.validate({option_id: coerced_value})
         value = coerced_value
     else:
         raise KeyError("Incompatible option id '{o}' and schema id '{i}'".format(o=option_id, i=schema_option_id))
@@ -389,13 +565,14 @@ def _raw_option_with_schema(option_id, raw_value, schema):
 
 
 def validate_raw_task_option(registered_tasks, option_id, raw_value):
-    opts = {}
+    meta_task = None
     for m in registered_tasks.values():
-        if m.option_schemas:
-            opts.update(m.option_schemas)
+        if m.option_schemas and option_id in m.option_schemas:
+            meta_task = m
 
-    if option_id in opts:
-        value = _raw_option_with_schema(option_id, raw_value, opts[option_id])
+    if meta_task is not None:
+        value = _raw_option_with_schema(option_id, raw_value, meta_task.option_schemas[option_id],
+                                        meta_task.get_option_validator(option_id))
     else:
         log.warn("Unknown option '{i}'. Ignoring".format(i=option_id))
         value = None
@@ -435,7 +612,7 @@ def validate_workflow_options(d):
             raw_value = d[option_id]
             types_ = schema['properties'][option_id]['type']
             coerced_value = crude_coerce_type_from_str(raw_value, types_)
-            _ = jsonschema.validate(schema, {option_id: coerced_value})
+            REGISTERED_WORKFLOW_OPTION_VALIDATORS[option_id].validate({option_id: coerced_value})
             wopts.append((option_id, coerced_value))
         else:
             # grab default
@@ -0,0 +1,155 @@
+"""Register the outputs of completed tasks off the critical path of the driver
+
+Registering the outputs of a task (extracting the UUIDs, updating the
+datastore, rendering the datastore.html and the task reports, and calling
+the services) is run in a background thread. The driver only enqueues the
+completed task, so scheduling the downstream tasks never waits on it.
+
+The registrations are run serially in the order they were submitted.
+"""
+import re
+import json
+import uuid
+import Queue
+import logging
+import threading
+import xml.etree.cElementTree as ET
+
+from pbcommand.models import FileTypes
+
+from pbsmrtpipe.constants import PacBioNamespaces
+from pbsmrtpipe.exceptions import PipelineRuntimeError
+
+log = logging.getLogger(__name__)
+
+__all__ = ['BackgroundRegistrar', 'get_or_create_uuid_from_file']
+
+
+class Constants(object):
+    # Number of bytes read from the head of a report to find the uuid
+    REPORT_HEADER_SIZE = 4096
+    # Sentinel to stop the thread
+    SHUTDOWN = "SHUTDOWN"
+
+
+_RX_REPORT_UUID = re.compile(r'"uuid"\s*:\s*"([0-9a-fA-F\-]{36})"')
+
+
+def _is_dataset_type(file_type):
+    return file_type.file_type_id.startswith(PacBioNamespaces.DATASET_FILE_PREFIX)
+
+
+def get_dataset_uuid(path):
+    """Get the UniqueId of a DataSet XML. Only the root element is parsed."""
+    for _, element in ET.iterparse(path, events=("start", )):
+        return element.attrib.get("UniqueId")
+    return None
+
+
+def get_report_uuid(path):
+    """Get the uuid of a Report JSON from the head of the file. The entire
+    JSON is only loaded if the uuid isn't in the head."""
+    with open(path, 'r') as f:
+        s = f.read(Constants.REPORT_HEADER_SIZE)
+        m = _RX_REPORT_UUID.search(s)
+        if m is not None:
+            return m.group(1)
+        f.seek(0)
+        return json.load(f).get('uuid')
+
+
+# file type -> func(path) -> uuid or None
+_UUID_FUNCS = ((_is_dataset_type, get_dataset_uuid),
+               (lambda file_type: file_type == FileTypes.REPORT, get_report_uuid))
+
+
+def get_or_create_uuid_from_file(file_type, path):
+    """
+    Extract the uuid from the DataSet or Report, or assign a new UUID. The
+    UUID extraction is dispatched by the file type. Other files (e.g., BAM,
+    FASTA) are never read.
+
+    :type file_type: pbcommand.models.FileType
+    :param path: Path to file
+
+    :rtype: str
+    :return: uuid string
+    """
+    for is_type_func, get_uuid_func in _UUID_FUNCS:
+        if is_type_func(file_type):
+            try:
+                ds_uuid = get_uuid_func(path)
+            except Exception as e:
+                log.warn("Unable to extract uuid from {p}. {e}".format(p=path, e=e))
+                ds_uuid = None
+            if ds_uuid is not None:
+                return ds_uuid
+            break
+
+    return uuid.uuid4()
+
+
+class BackgroundRegistrar(object):
+
+    """Run the registration funcs in a background thread
+
+    Errors are stored and raised in the driver thread via raise_if_failed.
+    """
+
+    def __init__(self, name="registrar"):
+        self.name = name
+        self._queue = Queue.Queue()
+        # The thread is named after the thread that created it, so the log
+        # records can be attributed to the job (see pbsmrtpipe.serve)
+        thread_name = "/".join([threading.current_thread().name, name])
+        self._thread = threading.Thread(target=self._run, name=thread_name)
+        self._thread.daemon = True
+        self._lock = threading.Lock()
+        self._npending = 0
+        self.errors = []
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=self.name, p=self.npending, e=len(self.errors))
+        return "<{k} {n} pending:{p} errors:{e} >".format(**_d)
+
+    @property
+    def npending(self):
+        with self._lock:
+            return self._npending
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, func, *args):
+        with self._lock:
+            self._npending += 1
+        self._queue.put((func, args))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item == Constants.SHUTDOWN:
+                break
+            func, args = item
+            try:
+                func(*args)
+            except Exception as e:
+                log.exception("Failed to run {f}. {e}".format(f=func.__name__, e=e))
+                self.errors.append(e)
+            finally:
+                with self._lock:
+                    self._npending -= 1
+
+    def raise_if_failed(self):
+        if self.errors:
+            raise PipelineRuntimeError("Failed to register task outputs. {e}".format(e=self.errors[0]))
+
+    def shutdown(self, timeout=None):
+        """Wait for the pending registrations to complete and stop the thread"""
+        if self._thread.is_alive():
+            n = self.npending
+            if n:
+                log.info("Waiting for {n} pending registrations".format(n=n))
+            self._queue.put(Constants.SHUTDOWN)
+            self._thread.join(timeout)
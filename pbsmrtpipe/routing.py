@@ -0,0 +1,325 @@
+"""Routing of distributed tasks
+
+In distributed mode, short tasks (e.g., gather, report and validation tasks)
+can spend more time waiting in the cluster queue than running. Distributed
+tasks that are predicted to run for less than a threshold are run locally on
+the head node when local slots are free.
+
+The predicted run time of a task is taken from the per-task hints in the
+preset (pbsmrtpipe.options.run_time_hints), or from the run time history
+(pbsmrtpipe.options.run_time_history) of a previous job (see DurationModel).
+
+Distributed tasks that are submitted to the cluster can be routed to one of
+several named cluster templates (e.g., a short, long and high memory queue)
+by ordered rules (pbsmrtpipe.options.cluster_routing_rules).
+"""
+import re
+import json
+import fnmatch
+import logging
+import operator
+from collections import namedtuple
+
+from pbsmrtpipe.cluster import Constants as ClusterConstants
+from pbsmrtpipe.cluster import load_named_cluster_templates
+
+from pbsmrtpipe.run_time_model import DurationModel, load_duration_model
+
+log = logging.getLogger(__name__)
+
+__all__ = ['RoutingDecision', 'LocalRoutingPolicy', 'parse_run_time_hints',
+           'write_routing_decision', 'ClusterTemplateDecision',
+           'ClusterRoutingRule', 'ClusterTemplateRouter',
+           'parse_cluster_routing_rules', 'parse_memory_hints']
+
+
+class Constants(object):
+    LOCAL = "local"
+    CLUSTER = "cluster"
+
+
+# run_local is False if the task is submitted to the cluster
+RoutingDecision = namedtuple("RoutingDecision", "task_id meta_task_id nproc run_local predicted_run_time reason")
+
+# name of the selected cluster template
+ClusterTemplateDecision = namedtuple("ClusterTemplateDecision", "task_id name reason")
+
+
+def _decision_to_dict(decision):
+    d = decision._asdict()
+    d['route'] = Constants.LOCAL if decision.run_local else Constants.CLUSTER
+    return d
+
+
+def _parse_task_hints(s, units):
+    hints = {}
+    if not s:
+        return hints
+    for item in s.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            task_id, value = item.split("=")
+            hints[task_id.strip()] = float(value)
+        except ValueError:
+            raise ValueError("Invalid hint '{i}'. Expected format 'task_id={u}'".format(i=item, u=units))
+    return hints
+
+
+def parse_run_time_hints(s):
+    """
+    Parse per-task run time hints (in sec) from a str
+
+    "pbsmrtpipe.tasks.dev_hello_world=3,pbsmrtpipe.tasks.gather_fasta=10"
+
+    :rtype: dict[str, float]
+    """
+    return _parse_task_hints(s, "seconds")
+
+
+def parse_memory_hints(s):
+    """
+    Parse per-task memory hints (in MB) from a str
+
+    "pbsmrtpipe.tasks.dev_hello_world=100,pbsmrtpipe.tasks.gather_fasta=2000"
+
+    :rtype: dict[str, float]
+    """
+    return _parse_task_hints(s, "mb")
+
+
+class LocalRoutingPolicy(object):
+
+    """Run distributed tasks locally when they are predicted to be short
+    and local slots are free
+
+    Disabled when max_run_time is None.
+    """
+
+    def __init__(self, max_run_time, max_local_nproc, duration_model=None, run_time_hints=None):
+        """
+        :param max_run_time: Distributed tasks predicted to run (strictly) less
+        than this (in sec) are run locally.
+        :param max_local_nproc: Total number of slots of the locally running tasks
+        :type duration_model: DurationModel | None
+        :param run_time_hints: {task_id: run time in sec}. Overrides the model.
+        """
+        self.max_run_time = max_run_time
+        self.max_local_nproc = max_local_nproc
+        self.duration_model = DurationModel() if duration_model is None else duration_model
+        self.run_time_hints = {} if run_time_hints is None else run_time_hints
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, t=self.max_run_time,
+                  n=self.max_local_nproc, h=len(self.run_time_hints),
+                  m=self.duration_model)
+        return "<{k} max_run_time:{t} max_local_nproc:{n} hints:{h} model:{m} >".format(**_d)
+
+    @property
+    def is_enabled(self):
+        return self.max_run_time is not None
+
+    @staticmethod
+    def from_workflow_options(workflow_opts, max_local_nproc):
+        """:type workflow_opts: pbsmrtpipe.models.WorkflowLevelOptions"""
+        duration_model = None
+        if workflow_opts.run_time_history is not None:
+            duration_model = load_duration_model(workflow_opts.run_time_history)
+        hints = parse_run_time_hints(workflow_opts.run_time_hints)
+        return LocalRoutingPolicy(workflow_opts.local_run_time_threshold, max_local_nproc,
+                                  duration_model=duration_model, run_time_hints=hints)
+
+    def to_predicted_run_time(self, meta_task_id, nchunks=None):
+        """Returns the predicted run time (in sec), or None if the run time of
+        the task is unknown
+
+        :param nchunks: Number of chunks if the task is a chunked instance
+        """
+        if meta_task_id in self.run_time_hints:
+            return self.run_time_hints[meta_task_id]
+        if nchunks is not None and meta_task_id in self.duration_model.chunked_run_times:
+            return self.duration_model.to_run_time(meta_task_id, nchunks=nchunks)
+        return self.duration_model.run_times.get(meta_task_id)
+
+    def route(self, task_id, meta_task_id, nproc, local_nproc, nchunks=None):
+        """
+        Route a distributed task
+
+        :param task_id: task instance id (e.g., pbsmrtpipe.tasks.dev_hello_world-0)
+        :param local_nproc: Number of slots used by the locally running tasks
+
+        :rtype: RoutingDecision
+        """
+        def _to_d(run_local_, predicted_, reason_):
+            return RoutingDecision(task_id, meta_task_id, nproc, run_local_, predicted_, reason_)
+
+        if not self.is_enabled:
+            return _to_d(False, None, "local routing is disabled")
+
+        predicted = self.to_predicted_run_time(meta_task_id, nchunks=nchunks)
+        if predicted is None:
+            return _to_d(False, None, "no run time prediction")
+
+        _d = dict(p=predicted, t=self.max_run_time, u=local_nproc, n=nproc, m=self.max_local_nproc)
+        if predicted >= self.max_run_time:
+            return _to_d(False, predicted, "predicted run time {p:.1f} sec >= {t:.1f} sec".format(**_d))
+        if local_nproc + nproc > self.max_local_nproc:
+            return _to_d(False, predicted, "no free local slots ({u} + {n} > {m})".format(**_d))
+
+        return _to_d(True, predicted, "predicted run time {p:.1f} sec < {t:.1f} sec".format(**_d))
+
+
+def write_routing_decision(decision, path):
+    """Append the decision as a JSON line (for tuning the threshold)"""
+    with open(path, 'a') as f:
+        f.write(json.dumps(_decision_to_dict(decision)) + "\n")
+    return decision
+
+
+class ClusterRoutingRule(object):
+
+    """Select the named cluster template if all the conditions match
+
+    Conditions are (field, op, value) with the fields
+
+    - task: glob of the task id (only '=')
+    - nproc: number of processors of the task
+    - memory: memory hint (in MB) of the task
+    - run_time: predicted run time (in sec) of the task
+
+    Conditions on an unknown memory or run time never match.
+    """
+
+    FIELDS = ("task", "nproc", "memory", "run_time")
+    OPS = {"<": operator.lt, "<=": operator.le, ">": operator.gt,
+           ">=": operator.ge, "=": operator.eq}
+
+    def __init__(self, name, conditions):
+        self.name = name
+        self.conditions = conditions
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=self.name,
+                  c=", ".join("".join(str(x) for x in c) for c in self.conditions))
+        return "<{k} {n}: {c} >".format(**_d)
+
+    @property
+    def uses_run_time(self):
+        return any(field == "run_time" for field, _, _ in self.conditions)
+
+    def matches(self, task_id, meta_task_id, nproc, memory=None, run_time=None):
+        values = dict(nproc=nproc, memory=memory, run_time=run_time)
+        for field, op, value in self.conditions:
+            if field == "task":
+                if not (fnmatch.fnmatch(meta_task_id, value) or fnmatch.fnmatch(task_id, value)):
+                    return False
+            elif values[field] is None or not self.OPS[op](values[field], value):
+                return False
+        return True
+
+
+# Longest operators first. ('<=' must not be parsed as '<')
+_CONDITION_RX = re.compile(r"^\s*([a-z_]+)\s*(<=|>=|<|>|=)\s*(\S+)\s*$")
+
+
+def _parse_condition(s):
+    s = s.strip()
+    m = _CONDITION_RX.match(s)
+    if m is None:
+        raise ValueError("Invalid cluster routing condition '{s}'. Expected format 'field<op>value'".format(s=s))
+    field, op, value = m.groups()
+    if field not in ClusterRoutingRule.FIELDS:
+        raise ValueError("Invalid cluster routing field '{f}'. Supported fields {x}".format(f=field, x=ClusterRoutingRule.FIELDS))
+    if field == "task":
+        if op != "=":
+            raise ValueError("Invalid cluster routing condition '{s}'. Only 'task=glob' is supported".format(s=s))
+        return field, op, value
+    try:
+        return field, op, float(value)
+    except ValueError:
+        raise ValueError("Invalid cluster routing condition '{s}'. Expected a number".format(s=s))
+
+
+def parse_cluster_routing_rules(s):
+    """
+    Parse the ordered cluster routing rules from a str
+
+    "short: run_time<600; highmem: memory>=64000; long: task=pbsmrtpipe.tasks.*, nproc>=8"
+
+    :rtype: list[ClusterRoutingRule]
+    """
+    rules = []
+    if not s:
+        return rules
+    for item in s.split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            name, conditions_str = item.split(":", 1)
+        except ValueError:
+            raise ValueError("Invalid cluster routing rule '{i}'. Expected format 'name: cond, cond'".format(i=item))
+        conditions = [_parse_condition(x) for x in conditions_str.split(",") if x.strip()]
+        if not conditions:
+            raise ValueError("Cluster routing rule '{i}' has no conditions".format(i=item))
+        rules.append(ClusterRoutingRule(name.strip(), conditions))
+    return rules
+
+
+class ClusterTemplateRouter(object):
+
+    """Select the named cluster template of a distributed task
+
+    The first matching rule wins. Tasks that do not match any rule use the
+    'default' (i.e., cluster_manager) templates.
+    """
+
+    def __init__(self, cluster_renderers, rules=None, memory_hints=None):
+        """
+        :param cluster_renderers: {name: ClusterTemplateRender}. Must contain the 'default' templates
+        :type rules: list[ClusterRoutingRule] | None
+        :param memory_hints: {task_id: memory in MB}
+        """
+        self.cluster_renderers = cluster_renderers
+        self.rules = [] if rules is None else rules
+        self.memory_hints = {} if memory_hints is None else memory_hints
+
+        if ClusterConstants.DEFAULT_NAME not in cluster_renderers:
+            raise ValueError("Missing '{n}' cluster templates".format(n=ClusterConstants.DEFAULT_NAME))
+        for rule in self.rules:
+            if rule.name not in cluster_renderers:
+                raise ValueError("Cluster routing rule {r} uses unknown cluster templates '{n}'. Known templates {x}".format(r=rule, n=rule.name, x=sorted(cluster_renderers.keys())))
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, t=sorted(self.cluster_renderers.keys()),
+                  r=len(self.rules), h=len(self.memory_hints))
+        return "<{k} templates:{t} rules:{r} memory hints:{h} >".format(**_d)
+
+    @property
+    def uses_run_time(self):
+        return any(rule.uses_run_time for rule in self.rules)
+
+    @staticmethod
+    def from_workflow_options(workflow_opts, default_cluster_renderer):
+        """:type workflow_opts: pbsmrtpipe.models.WorkflowLevelOptions"""
+        renderers = load_named_cluster_templates(workflow_opts.cluster_templates)
+        renderers[ClusterConstants.DEFAULT_NAME] = default_cluster_renderer
+        rules = parse_cluster_routing_rules(workflow_opts.cluster_routing_rules)
+        memory_hints = parse_memory_hints(workflow_opts.memory_hints)
+        return ClusterTemplateRouter(renderers, rules=rules, memory_hints=memory_hints)
+
+    def to_cluster_renderer(self, name):
+        return self.cluster_renderers[name]
+
+    def route(self, task_id, meta_task_id, nproc, run_time=None):
+        """
+        :param run_time: predicted run time (in sec) of the task (if known)
+
+        :rtype: ClusterTemplateDecision
+        """
+        memory = self.memory_hints.get(meta_task_id)
+        for rule in self.rules:
+            if rule.matches(task_id, meta_task_id, nproc, memory=memory, run_time=run_time):
+                return ClusterTemplateDecision(task_id, rule.name, "matched rule {r}".format(r=rule))
+        return ClusterTemplateDecision(task_id, ClusterConstants.DEFAULT_NAME, "no matching rule")
@@ -0,0 +1,99 @@
+"""Predicted run times of the tasks of a pipeline
+
+The run times are loaded from a JSON model file, or from the
+workflow-graph.json of a completed job. Used by the routing of distributed
+tasks, the task walltimes and pbsmrtpipe simulate.
+"""
+import os
+import json
+import logging
+from collections import defaultdict
+
+from pbsmrtpipe.graph.models import TaskStates
+
+log = logging.getLogger(__name__)
+
+__all__ = ['DurationModel', 'load_duration_model']
+
+
+class Constants(object):
+    DEFAULT_RUN_TIME = 60.0
+    WORKFLOW_GRAPH_JSON = "workflow-graph.json"
+    TASK_KLASSES = ("TaskBindingNode", "TaskChunkedBindingNode",
+                    "TaskScatterBindingNode", "TaskGatherBindingNode")
+
+
+class DurationModel(object):
+
+    """Predicted run time (in sec) of a task
+
+    Chunked tasks are modeled as the total run time of the task split
+    evenly across the chunks.
+    """
+
+    def __init__(self, run_times=None, chunked_run_times=None, default_run_time=Constants.DEFAULT_RUN_TIME):
+        # {task_id: run time of an (unchunked) instance}
+        self.run_times = {} if run_times is None else run_times
+        # {task_id: total run time summed over all chunks}
+        self.chunked_run_times = {} if chunked_run_times is None else chunked_run_times
+        self.default_run_time = default_run_time
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=len(self.run_times),
+                  c=len(self.chunked_run_times), d=self.default_run_time)
+        return "<{k} tasks:{n} chunked:{c} default:{d} >".format(**_d)
+
+    def to_run_time(self, task_id, nchunks=None):
+        if nchunks is None:
+            return self.run_times.get(task_id, self.default_run_time)
+
+        total = self.chunked_run_times.get(task_id, self.run_times.get(task_id, self.default_run_time))
+        return total / float(nchunks)
+
+    @staticmethod
+    def from_dict(d):
+        return DurationModel(d.get('run_times', {}), d.get('chunked_run_times', {}),
+                             d.get('default_run_time', Constants.DEFAULT_RUN_TIME))
+
+    def to_dict(self):
+        return dict(run_times=self.run_times,
+                    chunked_run_times=self.chunked_run_times,
+                    default_run_time=self.default_run_time)
+
+    @staticmethod
+    def from_workflow_graph_dict(d, default_run_time=Constants.DEFAULT_RUN_TIME):
+        """Load the observed run times of successful tasks from the
+        workflow-graph.json of a job"""
+        run_times = defaultdict(list)
+        chunked_run_times = defaultdict(float)
+        for node in d['nodes']:
+            if node['klass'] in Constants.TASK_KLASSES:
+                if node.get('state') == TaskStates.SUCCESSFUL and node.get('run_time') is not None:
+                    if node['klass'] == "TaskChunkedBindingNode":
+                        chunked_run_times[node['node_id']] += node['run_time']
+                    else:
+                        run_times[node['node_id']].append(node['run_time'])
+
+        mean_run_times = {k: sum(v) / len(v) for k, v in run_times.iteritems()}
+        return DurationModel(mean_run_times, dict(chunked_run_times), default_run_time)
+
+
+def load_duration_model(path, default_run_time=Constants.DEFAULT_RUN_TIME):
+    """
+    Load a DurationModel from
+
+    - a job dir (the workflow/workflow-graph.json will be used)
+    - a workflow-graph.json file of a job
+    - a model JSON file {"run_times": {task_id: sec}, "chunked_run_times": {}, "default_run_time": sec}
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, "workflow", Constants.WORKFLOW_GRAPH_JSON)
+
+    with open(path, 'r') as f:
+        d = json.load(f)
+
+    if 'nodes' in d:
+        return DurationModel.from_workflow_graph_dict(d, default_run_time=default_run_time)
+
+    d.setdefault('default_run_time', default_run_time)
+    return DurationModel.from_dict(d)
@@ -7,25 +7,92 @@ from pbsmrtpipe.constants import to_task_option_ns
 
 log = logging.getLogger(__name__)
 
-__all__ = ['to_opt_id', 'is_valid', 'to_option_schema']
+__all__ = ['to_opt_id', 'is_valid', 'validate_value', 'to_option_schema',
+           'OptionValidator']
 
 
 def to_opt_id(s):
     return to_task_option_ns(s)
 
 
+# Type checks of the primitive JSON types
+_TYPE_CHECKS = {'integer': lambda x: isinstance(x, (int, long)) and not isinstance(x, bool),
+                'number': lambda x: isinstance(x, (int, long, float)) and not isinstance(x, bool),
+                'boolean': lambda x: isinstance(x, bool),
+                'string': lambda x: isinstance(x, basestring),
+                'null': lambda x: x is None}
+
+# Option schemas with only these keys are validated by checking the type
+_SIMPLE_SCHEMA_KEYS = {'$schema', 'type', 'title', 'properties', 'required'}
+_SIMPLE_PROPERTY_KEYS = {'type', 'title', 'description', 'default'}
+
+
+class OptionValidator(object):
+
+    """Compiled validator of an option schema
+
+    Option schemas (see to_option_schema) of primitive types are validated
+    with a type check. The jsonschema validator is only used for other
+    schemas, or to generate the error of an invalid value.
+    """
+
+    def __init__(self, schema):
+        jsonschema.Draft4Validator.check_schema(schema)
+        self.schema = schema
+        self.validator = jsonschema.Draft4Validator(schema)
+        self.option_id, self.type_checks = self._to_type_checks(schema)
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, i=self.option_id,
+                  f=self.type_checks is not None)
+        return "<{k} {i} fast path:{f} >".format(**_d)
+
+    @staticmethod
+    def _to_type_checks(schema):
+        """Returns (option id, type checks) or (None, None) if the schema
+        isn't a simple option schema"""
+        properties = schema.get('properties')
+        if not set(schema.keys()) <= _SIMPLE_SCHEMA_KEYS or not isinstance(properties, dict) or len(properties) != 1:
+            return None, None
+        option_id, d = properties.items()[0]
+        if schema.get('required', [option_id]) != [option_id]:
+            return None, None
+        if not isinstance(d, dict) or not set(d.keys()) <= _SIMPLE_PROPERTY_KEYS:
+            return None, None
+        types_ = d.get('type')
+        types_ = list(types_) if isinstance(types_, (list, tuple)) else [types_]
+        if not all(t in _TYPE_CHECKS for t in types_):
+            return None, None
+        return option_id, [_TYPE_CHECKS[t] for t in types_]
+
+    def _is_valid_fast(self, v):
+        if self.type_checks is None or not isinstance(v, dict) or len(v) != 1 or self.option_id not in v:
+            return False
+        x = v[self.option_id]
+        return any(f(x) for f in self.type_checks)
+
+    def validate(self, v):
+        """Validate the instance (e.g., {option_id: value})
+
+        :raises: jsonschema.ValidationError
+        """
+        if not self._is_valid_fast(v):
+            self.validator.validate(v)
+
+    def is_valid(self, v):
+        return self._is_valid_fast(v) or self.validator.is_valid(v)
+
+
 def validate_value(schema, v):
-    return jsonschema.validate(v, schema)
+    """Validate against a schema that isn't registered. The validators of the
+    registered option schemas are compiled once (see
+    MetaTask.get_option_validator and REGISTERED_WORKFLOW_OPTION_VALIDATORS)"""
+    return OptionValidator(schema).validate(v)
 
 
 def is_valid(schema, v):
     """Returns a bool if the schema is valid"""
-    try:
-        validate_value(schema, v)
-        return True
-    except jsonschema.ValidationError:
-        pass
-    return False
+    return OptionValidator(schema).is_valid(v)
 
 
 def get_default_from_schema(schema):
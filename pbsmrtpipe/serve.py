@@ -0,0 +1,424 @@
+"""Long-running pbsmrtpipe daemon that runs many jobs in one process
+
+The registry (tool contracts, chunk operators and pipelines) is loaded once.
+Jobs are submitted over a local Unix socket and run concurrently (up to
+max_jobs). The jobs share one pool of nproc slots (see pbsmrtpipe.slots), so
+total_max_nproc of the daemon bounds the local tasks of all the jobs.
+
+Each job writes the same job dir (logs/master.log, logs/pbsmrtpipe.log,
+workflow/datastore.json, ...) as 'pbsmrtpipe pipeline-id'.
+
+The protocol is one JSON request (a single line) per connection and one JSON
+response.
+
+{"command": "submit", "pipeline_id": "pbsmrtpipe.pipelines.dev_local",
+ "entry_points": {"e_01": "/path/to/file.txt"}, "output_dir": "/path/to/job",
+ "preset_xmls": [], "preset_rc_xml": null, "service_uri": null}
+{"command": "status", "job_id": 1}
+{"command": "jobs"}
+{"command": "shutdown"}
+"""
+import os
+import json
+import time
+import Queue
+import socket
+import getpass
+import logging
+import tempfile
+import threading
+import SocketServer
+import logging.handlers
+from collections import OrderedDict
+
+import pbsmrtpipe.loader as L
+import pbsmrtpipe.driver as D
+from pbsmrtpipe.slots import SlotPool
+from pbsmrtpipe.utils import StdOutStatusLogFilter, get_default_logging_config_dict
+
+log = logging.getLogger(__name__)
+slog = logging.getLogger('status.' + __name__)
+
+__all__ = ['JobServer', 'ServeJob', 'run_serve', 'send_request', 'submit_job']
+
+
+class Constants(object):
+    SOCKET_PATH = os.path.join(tempfile.gettempdir(), "pbsmrtpipe-serve-{u}.sock".format(u=getpass.getuser()))
+    MAX_JOBS = 4
+    MAX_REQUEST_SIZE = 1024 * 1024
+    SHUTDOWN = "SHUTDOWN"
+
+
+class JobStates(object):
+    CREATED = "CREATED"
+    RUNNING = "RUNNING"
+    SUCCESSFUL = "SUCCESSFUL"
+    FAILED = "FAILED"
+
+    @classmethod
+    def ACTIVE_STATES(cls):
+        return cls.CREATED, cls.RUNNING
+
+
+class ThreadLogFilter(logging.Filter):
+
+    """Only pass the records of a thread, and the threads it created (named
+    '{thread name}/...')"""
+
+    def __init__(self, thread_name):
+        logging.Filter.__init__(self)
+        self.thread_name = thread_name
+        self._prefix = thread_name + "/"
+
+    def filter(self, record):
+        return record.threadName == self.thread_name or record.threadName.startswith(self._prefix)
+
+
+def add_job_log_handlers(output_dir, thread_name, debug_mode=False):
+    """
+    Add the master.log and pbsmrtpipe.log handlers of a job to the root
+    logger. Only the records of the job thread are written.
+
+    :returns: list of handlers (see remove_job_log_handlers)
+    """
+    logs_dir = os.path.join(output_dir, 'logs')
+    if not os.path.exists(logs_dir):
+        os.makedirs(logs_dir)
+
+    master_log = os.path.join(logs_dir, "master.log")
+    pb_log = os.path.join(logs_dir, "pbsmrtpipe.log")
+    master_level = logging.DEBUG if debug_mode else logging.INFO
+    # same format and rotation as the handlers of a 'pbsmrtpipe pipeline' job
+    formats = get_default_logging_config_dict(master_log, master_level, pb_log, logging.INFO)['formatters']
+
+    def _to_handler(path, level, fmt):
+        h = logging.handlers.RotatingFileHandler(path, maxBytes=10485760, backupCount=20, encoding="utf8")
+        h.setLevel(level)
+        h.setFormatter(logging.Formatter(fmt))
+        h.addFilter(ThreadLogFilter(thread_name))
+        return h
+
+    master_handler = _to_handler(master_log, master_level, formats['full']['format'])
+    pb_handler = _to_handler(pb_log, logging.INFO, formats['standard']['format'])
+    pb_handler.addFilter(StdOutStatusLogFilter())
+
+    handlers = [master_handler, pb_handler]
+    root = logging.getLogger()
+    for h in handlers:
+        root.addHandler(h)
+    return handlers
+
+
+def remove_job_log_handlers(handlers):
+    root = logging.getLogger()
+    for h in handlers:
+        root.removeHandler(h)
+        h.close()
+
+
+class ServeJob(object):
+
+    def __init__(self, job_id, pipeline_id, entry_points, output_dir, preset_xmls=(),
+                 preset_rc_xml=None, service_uri=None, debug_mode=False):
+        self.job_id = job_id
+        self.pipeline_id = pipeline_id
+        # {entry id: path}
+        self.entry_points = entry_points
+        self.output_dir = output_dir
+        self.preset_xmls = list(preset_xmls)
+        self.preset_rc_xml = preset_rc_xml
+        self.service_uri = service_uri
+        self.debug_mode = debug_mode
+        self.state = JobStates.CREATED
+        self.exit_code = None
+        self.error_message = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.completed_at = None
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, i=self.job_id, p=self.pipeline_id, s=self.state)
+        return "<{k} id:{i} {p} state:{s} >".format(**_d)
+
+    @property
+    def thread_name(self):
+        return "job-{i}".format(i=self.job_id)
+
+    @property
+    def is_active(self):
+        return self.state in JobStates.ACTIVE_STATES()
+
+    def to_dict(self):
+        return dict(job_id=self.job_id,
+                    pipeline_id=self.pipeline_id,
+                    entry_points=self.entry_points,
+                    output_dir=self.output_dir,
+                    preset_xmls=self.preset_xmls,
+                    preset_rc_xml=self.preset_rc_xml,
+                    service_uri=self.service_uri,
+                    state=self.state,
+                    exit_code=self.exit_code,
+                    error_message=self.error_message,
+                    created_at=self.created_at,
+                    started_at=self.started_at,
+                    completed_at=self.completed_at)
+
+
+class JobServer(object):
+
+    """Run the submitted jobs concurrently with a shared slot pool
+
+    :param registry: (tasks, file types, chunk operators, pipelines) (see loader.load_all)
+    :param run_job_func: func(job_server, job) -> exit code. Defaults to running the pipeline
+    """
+
+    def __init__(self, registry, total_max_nproc=None, max_jobs=Constants.MAX_JOBS, run_job_func=None):
+        self.registry = registry
+        self.slot_pool = SlotPool(total_max_nproc)
+        self.max_jobs = max_jobs
+        self.run_job_func = run_pipeline_job if run_job_func is None else run_job_func
+        # {job id: ServeJob}
+        self._jobs = OrderedDict()
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.is_shutdown = False
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=len(self._jobs), m=self.max_jobs, s=self.slot_pool)
+        return "<{k} jobs:{n} max_jobs:{m} {s} >".format(**_d)
+
+    @property
+    def pipelines(self):
+        return self.registry[3]
+
+    def start(self):
+        for i in xrange(self.max_jobs):
+            t = threading.Thread(target=self._run, name="job-runner-{i}".format(i=i))
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def submit(self, pipeline_id, entry_points, output_dir, preset_xmls=(), preset_rc_xml=None,
+               service_uri=None, debug_mode=False):
+        """
+        Validate and queue a job
+
+        :rtype: ServeJob
+        """
+        if self.is_shutdown:
+            raise ValueError("Server is shutting down. Unable to submit jobs")
+        if pipeline_id not in self.pipelines:
+            raise KeyError("Unable to find pipeline id '{i}'".format(i=pipeline_id))
+        for entry_id, path in entry_points.iteritems():
+            if not os.path.isfile(path):
+                raise IOError("Unable to find path '{p}' for entry id '{i}'".format(p=path, i=entry_id))
+        for path in preset_xmls:
+            if not os.path.isfile(path):
+                raise IOError("Unable to find preset XML '{p}'".format(p=path))
+
+        output_dir = os.path.abspath(output_dir)
+        with self._lock:
+            for job in self._jobs.values():
+                if job.is_active and job.output_dir == output_dir:
+                    raise ValueError("Job {i} is already running in {o}".format(i=job.job_id, o=output_dir))
+            job = ServeJob(len(self._jobs) + 1, pipeline_id, dict(entry_points), output_dir, preset_xmls=preset_xmls,
+                           preset_rc_xml=preset_rc_xml, service_uri=service_uri, debug_mode=debug_mode)
+            self._jobs[job.job_id] = job
+
+        self._queue.put(job)
+        slog.info("Submitted {j} to {o}".format(j=job, o=output_dir))
+        return job
+
+    def get_job(self, job_id):
+        """:rtype: ServeJob"""
+        with self._lock:
+            if job_id not in self._jobs:
+                raise KeyError("Unable to find job {i}".format(i=job_id))
+            return self._jobs[job_id]
+
+    def get_jobs(self):
+        with self._lock:
+            return self._jobs.values()
+
+    def _run_job(self, job):
+        job.state = JobStates.RUNNING
+        job.started_at = time.time()
+        handlers = add_job_log_handlers(job.output_dir, job.thread_name, debug_mode=job.debug_mode)
+        try:
+            job.exit_code = self.run_job_func(self, job)
+        except Exception as e:
+            log.exception("Job {i} failed. {e}".format(i=job.job_id, e=e))
+            job.exit_code = 1
+            job.error_message = str(e)
+        finally:
+            remove_job_log_handlers(handlers)
+        job.completed_at = time.time()
+        job.state = JobStates.SUCCESSFUL if job.exit_code == 0 else JobStates.FAILED
+        slog.info("Completed {j} with exit code {e} in {t:.2f} sec".format(j=job, e=job.exit_code, t=job.completed_at - job.started_at))
+
+    def _run(self):
+        thread = threading.current_thread()
+        runner_name = thread.name
+        while True:
+            job = self._queue.get()
+            if job == Constants.SHUTDOWN:
+                break
+            # the log records of the job (and the threads and worker
+            # processes created by the driver) are attributed by the name
+            thread.name = job.thread_name
+            try:
+                self._run_job(job)
+            finally:
+                thread.name = runner_name
+
+    def shutdown(self, timeout=None):
+        """Stop accepting jobs and wait for the queued and running jobs to complete"""
+        self.is_shutdown = True
+        for _ in self._threads:
+            self._queue.put(Constants.SHUTDOWN)
+        for t in self._threads:
+            t.join(timeout)
+
+    def handle_request(self, request_d):
+        """Returns the response dict of a request"""
+        try:
+            command = request_d.get('command')
+            if command == 'submit':
+                job = self.submit(request_d['pipeline_id'], request_d.get('entry_points', {}),
+                                  request_d['output_dir'],
+                                  preset_xmls=request_d.get('preset_xmls', ()),
+                                  preset_rc_xml=request_d.get('preset_rc_xml'),
+                                  service_uri=request_d.get('service_uri'),
+                                  debug_mode=request_d.get('debug_mode', False))
+                return dict(status="ok", job=job.to_dict())
+            elif command == 'status':
+                return dict(status="ok", job=self.get_job(request_d['job_id']).to_dict())
+            elif command == 'jobs':
+                return dict(status="ok", jobs=[j.to_dict() for j in self.get_jobs()],
+                            nproc_used=self.slot_pool.nproc_used, nproc_max=self.slot_pool.max_nproc)
+            elif command == 'shutdown':
+                self.is_shutdown = True
+                return dict(status="ok")
+            else:
+                raise ValueError("Unsupported command '{c}'".format(c=command))
+        except Exception as e:
+            log.warn("Failed request {r}. {e}".format(r=request_d, e=e))
+            return dict(status="error", message="{t} {e}".format(t=type(e).__name__, e=e))
+
+
+def run_pipeline_job(job_server, job):
+    """Run the pipeline of the job with the registry and slot pool of the server"""
+    rtasks, rfile_types, chunk_operators, pipelines = job_server.registry
+    return D.run_pipeline(pipelines, rfile_types, rtasks, chunk_operators,
+                          pipelines[job.pipeline_id], job.entry_points, job.output_dir,
+                          job.preset_xmls, job.preset_rc_xml, job.service_uri,
+                          debug_mode=job.debug_mode, slot_pool=job_server.slot_pool,
+                          setup_logs=False)
+
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline(Constants.MAX_REQUEST_SIZE)
+        try:
+            request_d = json.loads(line)
+        except ValueError as e:
+            response_d = dict(status="error", message="Invalid JSON request. {e}".format(e=e))
+        else:
+            response_d = self.server.job_server.handle_request(request_d)
+        self.wfile.write(json.dumps(response_d) + "\n")
+
+        if self.server.job_server.is_shutdown:
+            # shutdown blocks until serve_forever returns
+            threading.Thread(target=self.server.shutdown).start()
+
+
+class UnixJobServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, job_server):
+        SocketServer.UnixStreamServer.__init__(self, socket_path, _RequestHandler)
+        self.job_server = job_server
+
+
+def _is_socket_in_use(socket_path):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(socket_path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        s.close()
+
+
+def to_unix_server(socket_path, job_server):
+    """Bind the socket. A stale socket file of a daemon that is no longer running is removed.
+
+    :rtype: UnixJobServer
+    """
+    if os.path.exists(socket_path):
+        if _is_socket_in_use(socket_path):
+            raise IOError("pbsmrtpipe serve is already running on {p}".format(p=socket_path))
+        os.remove(socket_path)
+    server = UnixJobServer(socket_path, job_server)
+    os.chmod(socket_path, 0o600)
+    return server
+
+
+def run_serve(socket_path=Constants.SOCKET_PATH, total_max_nproc=None, max_jobs=Constants.MAX_JOBS):
+    """Run the daemon until a shutdown request (or SIGINT). The running jobs are completed before exiting."""
+    started_at = time.time()
+    registry = L.load_all()
+    slog.info("Loaded registry in {t:.2f} sec".format(t=time.time() - started_at))
+
+    # the master.log of each job requires the DEBUG records
+    logging.getLogger().setLevel(logging.DEBUG)
+    logging.Formatter.converter = time.gmtime
+
+    job_server = JobServer(registry, total_max_nproc=total_max_nproc, max_jobs=max_jobs).start()
+    server = to_unix_server(socket_path, job_server)
+    slog.info("Serving {j} on {p}".format(j=job_server, p=socket_path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        slog.info("received SIGINT. Waiting for the running jobs to complete")
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        job_server.shutdown()
+
+    slog.info("Shut down {j}".format(j=job_server))
+    return 0
+
+
+def send_request(socket_path, request_d, timeout=None):
+    """Send a request to the daemon and return the response dict"""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect(socket_path)
+        s.sendall(json.dumps(request_d) + "\n")
+        chunks = []
+        while True:
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if chunk.endswith("\n"):
+                break
+    finally:
+        s.close()
+    return json.loads("".join(chunks))
+
+
+def submit_job(socket_path, pipeline_id, entry_points_d, output_dir, preset_xmls=(),
+               preset_rc_xml=None, service_uri=None, debug_mode=False):
+    """Submit a job to the daemon. Returns the response dict"""
+    request_d = dict(command="submit", pipeline_id=pipeline_id, entry_points=entry_points_d,
+                     output_dir=os.path.abspath(output_dir), preset_xmls=list(preset_xmls),
+                     preset_rc_xml=preset_rc_xml, service_uri=service_uri, debug_mode=debug_mode)
+    return send_request(socket_path, request_d)
@@ -0,0 +1,271 @@
+"""Simulate the execution of a pipeline to predict the makespan
+
+The real BindingsGraph is built from the pipeline bindings and the
+scheduling logic of the driver (max_nworkers, max_total_nproc, chunking
+and gathering) is applied against a virtual clock. No tasks (or processes)
+are run. Task run times are taken from a DurationModel (see
+pbsmrtpipe.run_time_model).
+"""
+import os
+import heapq
+import shutil
+import logging
+import tempfile
+
+from pbcommand.models import PipelineChunk
+from pbcommand.pb_io.common import write_pipeline_chunks
+
+import pbsmrtpipe.graph.bgraph as B
+from pbsmrtpipe.exceptions import PipelineRuntimeError
+from pbsmrtpipe.graph.models import (TaskStates, TaskChunkedBindingNode,
+                                     TaskScatterBindingNode)
+from pbsmrtpipe.models import Task
+
+log = logging.getLogger(__name__)
+
+__all__ = ['SimulationResult', 'simulate_workflow', 'to_simulated_entry_points',
+           'initialize_simulated_graph', 'complete_simulated_task']
+
+
+class SimulatedTask(object):
+
+    def __init__(self, task_id, instance_id, nproc, started_at, completed_at):
+        self.task_id = task_id
+        self.instance_id = instance_id
+        self.nproc = nproc
+        self.started_at = started_at
+        self.completed_at = completed_at
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, i=self.task_id, n=self.instance_id,
+                  s=self.started_at, e=self.completed_at, p=self.nproc)
+        return "<{k} {i}-{n} nproc:{p} {s:.1f}-{e:.1f} >".format(**_d)
+
+    @property
+    def run_time(self):
+        return self.completed_at - self.started_at
+
+    def to_dict(self):
+        return dict(task_id=self.task_id, instance_id=self.instance_id, nproc=self.nproc,
+                    started_at=self.started_at, completed_at=self.completed_at)
+
+
+class SimulationResult(object):
+
+    def __init__(self, tasks, max_total_nproc, max_nworkers):
+        """
+        :type tasks: list[SimulatedTask]
+        """
+        self.tasks = tasks
+        self.max_total_nproc = max_total_nproc
+        self.max_nworkers = max_nworkers
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, m=self.makespan, n=len(self.tasks))
+        return "<{k} tasks:{n} makespan:{m:.1f} >".format(**_d)
+
+    @property
+    def makespan(self):
+        return max([t.completed_at for t in self.tasks] + [0.0])
+
+    def _to_events(self):
+        # completions are processed before starts at the same time
+        events = []
+        for t in self.tasks:
+            events.append((t.started_at, 1, 1, t.nproc))
+            events.append((t.completed_at, 0, -1, -t.nproc))
+        return sorted(events)
+
+    @property
+    def peak_nworkers(self):
+        return self._peak(2)
+
+    @property
+    def peak_nproc(self):
+        return self._peak(3)
+
+    def _peak(self, index):
+        n, peak = 0, 0
+        for e in self._to_events():
+            n += e[index]
+            peak = max(peak, n)
+        return peak
+
+    @property
+    def nproc_seconds(self):
+        return sum(t.nproc * t.run_time for t in self.tasks)
+
+    @property
+    def utilization(self):
+        """Fraction of the slots used over the makespan. The slots are the
+        max_total_nproc, or the peak nproc if max_total_nproc is not set"""
+        nslots = self.max_total_nproc if self.max_total_nproc is not None else self.peak_nproc
+        if nslots == 0 or self.makespan == 0:
+            return 0.0
+        return self.nproc_seconds / (nslots * self.makespan)
+
+    def to_dict(self):
+        return dict(makespan=self.makespan,
+                    peak_nworkers=self.peak_nworkers,
+                    peak_nproc=self.peak_nproc,
+                    nproc_seconds=self.nproc_seconds,
+                    utilization=self.utilization,
+                    max_total_nproc=self.max_total_nproc,
+                    max_nworkers=self.max_nworkers,
+                    tasks=[t.to_dict() for t in self.tasks])
+
+    def to_summary(self):
+        _d = dict(n=len(self.tasks), m=self.makespan, h=self.makespan / 3600.0,
+                  w=self.peak_nworkers, p=self.peak_nproc, u=self.utilization * 100,
+                  x=self.max_total_nproc, y=self.max_nworkers)
+        outs = ["Simulated tasks        : {n}",
+                "Predicted makespan     : {m:.1f} sec ({h:.2f} hours)",
+                "Peak concurrent tasks  : {w} (max_nworkers {y})",
+                "Peak nproc in use      : {p} (max_total_nproc {x})",
+                "Slot utilization       : {u:.1f}%"]
+        return "\n".join(outs).format(**_d)
+
+
+def _to_nproc(meta_task, max_nproc):
+    """Resolve the nproc without running the DI funcs. $max_nproc and DI
+    lists are (pessimistically) resolved to max_nproc"""
+    if isinstance(meta_task.nproc, int):
+        return min(meta_task.nproc, max_nproc)
+    return max_nproc
+
+
+def _to_chunk_keys(scatter_meta_task, chunk_operators_d):
+    keys = set(getattr(scatter_meta_task, 'chunk_keys', []))
+    for chunk_operator in chunk_operators_d.values():
+        if chunk_operator.scatter.scatter_task_id == scatter_meta_task.task_id:
+            keys.update(c.chunk_key for c in chunk_operator.scatter.chunks)
+    return keys
+
+
+def _write_synthetic_chunks(path, nchunks, chunk_keys, task_dir):
+    chunks = []
+    for i in xrange(nchunks):
+        chunk_id = "chunk-{i}".format(i=i)
+        datum = {k: os.path.join(task_dir, "{c}{k}".format(c=chunk_id, k=k)) for k in chunk_keys}
+        chunks.append(PipelineChunk(chunk_id, **datum))
+    write_pipeline_chunks(chunks, path, "Synthetic chunks from pbsmrtpipe simulate")
+    return path
+
+
+def to_simulated_entry_points(bg):
+    """Mock paths for every entry point of the graph"""
+    return {n.idx: "/simulated/entry-point/{i}".format(i=n.idx) for n in bg.entry_point_nodes()}
+
+
+def initialize_simulated_graph(bg, ep_d, chunk_operators_d):
+    """Resolve the entry points and label the chunkable tasks"""
+    B.resolve_entry_points(bg, ep_d)
+    B.resolve_entry_binding_points(bg)
+    for eid, path in ep_d.iteritems():
+        B.resolve_entry_point(bg, eid, path)
+        B.resolve_successor_binding_file_path(bg)
+
+    B.label_chunkable_tasks(bg, chunk_operators_d)
+    B.validate_binding_graph_integrity(bg)
+    return bg
+
+
+def complete_simulated_task(bg, tnode, root_dir, run_time, nproc, nchunks, chunk_operators_d):
+    """Mark the task as successful with mock output files written to
+    root_dir. Scatter tasks write a chunk JSON file with nchunks synthetic
+    chunks."""
+    tid = "-".join([tnode.meta_task.task_id, str(tnode.instance_id)])
+    task_dir = os.path.join(root_dir, tid)
+    os.mkdir(task_dir)
+    output_files = [os.path.join(task_dir, "file-{i}.{e}".format(i=i, e=ft.ext))
+                    for i, ft in enumerate(tnode.meta_task.output_types)]
+
+    if isinstance(tnode, TaskScatterBindingNode):
+        chunk_keys = _to_chunk_keys(tnode.meta_task, chunk_operators_d)
+        _write_synthetic_chunks(output_files[0], nchunks, chunk_keys, task_dir)
+
+    task = Task(tnode.meta_task.task_id, tnode.meta_task.is_distributed,
+                B.get_task_input_files(bg, tnode), output_files, {}, nproc, [], [], task_dir)
+    bg.node[tnode]['task'] = task
+    B.update_task_state_to_success(bg, tnode, run_time)
+    B.update_task_output_file_nodes(bg, tnode, task)
+    B.resolve_successor_binding_file_path(bg)
+    return task
+
+
+def simulate_workflow(bg, ep_d, chunk_operators_d, registered_tasks_d, workflow_opts, duration_model, nchunks=None):
+    """
+    Run the driver scheduling logic against a virtual clock
+
+    :type bg: BindingsGraph
+    :type workflow_opts: pbsmrtpipe.models.WorkflowLevelOptions
+    :type duration_model: pbsmrtpipe.run_time_model.DurationModel
+    :param nchunks: Number of chunks emitted by each scatter task (defaults to max_nchunks)
+
+    :rtype: SimulationResult
+    """
+    max_nproc = workflow_opts.max_nproc
+    max_nchunks = workflow_opts.max_nchunks
+    max_total_nproc = workflow_opts.total_max_nproc
+    max_nworkers = workflow_opts.max_nworkers
+    nchunks = max_nchunks if nchunks is None else min(nchunks, max_nchunks)
+
+    # The chunk and gathered chunk JSON files are written here
+    root_dir = tempfile.mkdtemp(suffix="-pbsmrtpipe-simulate")
+
+    initialize_simulated_graph(bg, ep_d, chunk_operators_d)
+
+    clock = 0.0
+    total_nproc = 0
+    # (completed at, seq, tnode, nproc, started_at)
+    running = []
+    nsubmitted = 0
+    tasks = []
+
+    def has_available_slots(n):
+        if max_total_nproc is None:
+            return True
+        return total_nproc + n <= max_total_nproc
+
+    def to_run_time(tnode_):
+        if isinstance(tnode_, TaskChunkedBindingNode):
+            return duration_model.to_run_time(tnode_.meta_task.task_id, B.to_nchunks(bg, tnode_))
+        return duration_model.to_run_time(tnode_.meta_task.task_id)
+
+    try:
+        while True:
+            B.apply_scatterable(bg, chunk_operators_d, registered_tasks_d)
+            B.apply_chunk_operator(bg, chunk_operators_d, registered_tasks_d, max_nchunks)
+            B.add_gather_to_completed_task_chunks(bg, chunk_operators_d, registered_tasks_d, root_dir)
+
+            if bg.is_workflow_complete():
+                break
+
+            # Submit as many tasks as the driver would. If there aren't enough
+            # slots for the next runnable task, the driver waits.
+            while len(running) < max_nworkers:
+                tnode = B.get_next_runnable_task(bg)
+                if tnode is None:
+                    break
+                nproc = _to_nproc(tnode.meta_task, max_nproc)
+                if not has_available_slots(nproc):
+                    break
+
+                bg.node[tnode]['nproc'] = nproc
+                B.update_task_state(bg, tnode, TaskStates.SUBMITTED)
+                total_nproc += nproc
+                nsubmitted += 1
+                heapq.heappush(running, (clock + to_run_time(tnode), nsubmitted, tnode, nproc, clock))
+
+            if not running:
+                raise PipelineRuntimeError("Unable to find runnable task or any tasks running and workflow is NOT completed at t={t}".format(t=clock))
+
+            completed_at, _, tnode, nproc, started_at = heapq.heappop(running)
+            clock = completed_at
+            total_nproc -= nproc
+            complete_simulated_task(bg, tnode, root_dir, completed_at - started_at, nproc, nchunks, chunk_operators_d)
+            tasks.append(SimulatedTask(tnode.meta_task.task_id, tnode.instance_id, nproc, started_at, completed_at))
+    finally:
+        shutil.rmtree(root_dir, ignore_errors=True)
+
+    return SimulationResult(tasks, max_total_nproc, max_nworkers)
@@ -0,0 +1,276 @@
+"""Pools of nproc slots shared by concurrently running workflows
+
+The driver of each workflow enforces its own total_max_nproc. The driver also
+acquires the slots of each local task from the shared pools before the task
+is launched and releases them when the task is completed.
+
+- SlotPool is shared by the workflows run in the same process (see pbsmrtpipe.serve)
+- HostSlotBroker is shared by all the pbsmrtpipe instances on the host
+  (pbsmrtpipe.options.host_slot_broker). The nproc and memory leases are
+  stored in a lock-protected state file.
+"""
+import os
+import json
+import time
+import errno
+import fcntl
+import socket
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+__all__ = ['SlotPool', 'HostSlotBroker', 'SlotPools', 'to_slot_pool']
+
+
+class SlotPool(object):
+
+    """Thread-safe pool of nproc slots. The pool is unbounded if max_nproc is None
+
+    Slots are acquired by (owner id, task id). The owner id is a unique id of
+    the workflow (e.g., the job output dir).
+    """
+
+    def __init__(self, max_nproc=None):
+        self.max_nproc = max_nproc
+        # (owner id, task id) -> nproc
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=self.nproc_used, m=self.max_nproc, x=len(self._leases))
+        return "<{k} nproc:{n}/{m} leases:{x} >".format(**_d)
+
+    @property
+    def nproc_used(self):
+        with self._lock:
+            return sum(self._leases.values())
+
+    def try_acquire(self, owner_id, task_id, nproc, memory=0):
+        """Returns True if the nproc slots were acquired. The memory is not bounded"""
+        with self._lock:
+            key = (owner_id, task_id)
+            if key in self._leases:
+                return True
+            used = sum(self._leases.values())
+            # a task that requires more than max_nproc can only run alone
+            if self.max_nproc is not None and used > 0 and used + nproc > self.max_nproc:
+                return False
+            self._leases[key] = nproc
+            return True
+
+    def release(self, owner_id, task_id):
+        with self._lock:
+            return self._leases.pop((owner_id, task_id), 0)
+
+    def release_all(self, owner_id):
+        """Release the slots of all the tasks of the owner. Returns the number of nproc released"""
+        with self._lock:
+            keys = [k for k in self._leases if k[0] == owner_id]
+            return sum(self._leases.pop(k) for k in keys)
+
+
+def _is_pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _to_pid_started_at(pid):
+    """Start time (in clock ticks since boot) of the process, or None if it
+    is unknown (e.g., no /proc on OSX)"""
+    try:
+        with open("/proc/{p}/stat".format(p=pid), 'r') as f:
+            stat = f.read()
+    except IOError:
+        return None
+    # the command name (2nd field) can contain spaces and ')'
+    return int(stat.rsplit(")", 1)[1].split()[19])
+
+
+def _to_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+class HostSlotBroker(object):
+
+    """Host-wide nproc and memory (in MB) slots shared by the pbsmrtpipe
+    instances running on the host
+
+    Each lease is stored (with the pid and the start time of the master) in a
+    JSON state file. Every read and update is done under an exclusive lock
+    (flock) of the '.lock' file. The leases of processes that are no longer
+    running (e.g., crashed jobs, or a pid that was reused by another process)
+    are reclaimed by the next update.
+
+    The memory is unbounded if max_memory is None.
+    """
+
+    def __init__(self, path, max_nproc, max_memory=None):
+        self.path = os.path.abspath(path)
+        self.lock_path = self.path + ".lock"
+        self.max_nproc = max_nproc
+        self.max_memory = max_memory
+        self.host = socket.gethostname()
+        # the state file is shared with the other users of the host
+        self.mode = 0o666 & ~_to_umask()
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, p=self.path, n=self.max_nproc, m=self.max_memory)
+        return "<{k} {p} max_nproc:{n} max_memory:{m} >".format(**_d)
+
+    @staticmethod
+    def from_workflow_options(workflow_opts, ncpus):
+        """
+        :type workflow_opts: pbsmrtpipe.models.WorkflowLevelOptions
+        :returns: HostSlotBroker or None if the broker is disabled
+        """
+        if workflow_opts.host_slot_broker is None:
+            return None
+        max_nproc = ncpus if workflow_opts.host_max_nproc is None else workflow_opts.host_max_nproc
+        return HostSlotBroker(workflow_opts.host_slot_broker, max_nproc, max_memory=workflow_opts.host_max_memory)
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _load_leases(self):
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)['leases']
+        except (IOError, ValueError, KeyError) as e:
+            log.warn("Ignoring invalid slot broker state {p}. {e}".format(p=self.path, e=e))
+            return []
+
+    def _write_leases(self, leases):
+        # atomic replace, so a reader (or a crash) never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".slots-")
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps(dict(leases=leases), indent=2))
+        # mkstemp creates the file as 0600
+        os.chmod(tmp_path, self.mode)
+        os.rename(tmp_path, self.path)
+
+    def _is_stale(self, lease):
+        if lease['host'] != self.host:
+            return False
+        if not _is_pid_alive(lease['pid']):
+            return True
+        # the pid was reused by another process
+        started_at = lease.get('pid_started_at')
+        return started_at is not None and _to_pid_started_at(lease['pid']) not in (None, started_at)
+
+    def _reclaim_stale(self, leases):
+        alive = []
+        for lease in leases:
+            if self._is_stale(lease):
+                log.warn("Reclaiming stale lease of task {t} (pid {p} is not running)".format(t=lease['task_id'], p=lease['pid']))
+            else:
+                alive.append(lease)
+        return alive
+
+    @contextmanager
+    def _update(self):
+        """Yields the (mutable) list of the current leases of the host, which is written on exit"""
+        with self._locked():
+            leases = self._reclaim_stale(self._load_leases())
+            yield leases
+            self._write_leases(leases)
+
+    def _is_lease(self, lease, owner_id, task_id=None):
+        return (lease['pid'] == os.getpid() and lease['host'] == self.host and
+                lease['owner_id'] == owner_id and (task_id is None or lease['task_id'] == task_id))
+
+    def get_leases(self):
+        """Returns the current leases, without reclaiming the stale leases"""
+        with self._locked():
+            return [x for x in self._load_leases() if not self._is_stale(x)]
+
+    @property
+    def nproc_used(self):
+        return sum(x['nproc'] for x in self.get_leases() if x['host'] == self.host)
+
+    def try_acquire(self, owner_id, task_id, nproc, memory=0):
+        """Returns True if the nproc and memory slots were acquired"""
+        with self._update() as leases:
+            if any(self._is_lease(x, owner_id, task_id) for x in leases):
+                return True
+            host_leases = [x for x in leases if x['host'] == self.host]
+            # a task that requires more than the max can only run alone
+            if host_leases:
+                if sum(x['nproc'] for x in host_leases) + nproc > self.max_nproc:
+                    return False
+                if self.max_memory is not None and sum(x['memory'] for x in host_leases) + memory > self.max_memory:
+                    return False
+            leases.append(dict(host=self.host, pid=os.getpid(), pid_started_at=_to_pid_started_at(os.getpid()),
+                               owner_id=owner_id, task_id=task_id, nproc=nproc, memory=memory, acquired_at=time.time()))
+            return True
+
+    def release(self, owner_id, task_id):
+        with self._update() as leases:
+            nproc = sum(x['nproc'] for x in leases if self._is_lease(x, owner_id, task_id))
+            leases[:] = [x for x in leases if not self._is_lease(x, owner_id, task_id)]
+            return nproc
+
+    def release_all(self, owner_id):
+        """Release the slots of all the tasks of the owner. Returns the number of nproc released"""
+        with self._update() as leases:
+            nproc = sum(x['nproc'] for x in leases if self._is_lease(x, owner_id))
+            leases[:] = [x for x in leases if not self._is_lease(x, owner_id)]
+            return nproc
+
+
+class SlotPools(object):
+
+    """Acquire the slots from all the pools, or none of them"""
+
+    def __init__(self, pools):
+        self.pools = pools
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, p=" ".join(repr(x) for x in self.pools))
+        return "<{k} {p} >".format(**_d)
+
+    def try_acquire(self, owner_id, task_id, nproc, memory=0):
+        acquired = []
+        for pool in self.pools:
+            if not pool.try_acquire(owner_id, task_id, nproc, memory=memory):
+                for x in acquired:
+                    x.release(owner_id, task_id)
+                return False
+            acquired.append(pool)
+        return True
+
+    def release(self, owner_id, task_id):
+        return max([pool.release(owner_id, task_id) for pool in self.pools] + [0])
+
+    def release_all(self, owner_id):
+        return max([pool.release_all(owner_id) for pool in self.pools] + [0])
+
+
+def to_slot_pool(workflow_opts, ncpus, slot_pool=None):
+    """
+    The slot pool of a workflow. The host broker is added if
+    pbsmrtpipe.options.host_slot_broker is set.
+
+    :param slot_pool: SlotPool shared with the other workflows in the process
+    """
+    pool = SlotPool() if slot_pool is None else slot_pool
+    broker = HostSlotBroker.from_workflow_options(workflow_opts, ncpus)
+    if broker is None:
+        return pool
+    return SlotPools([pool, broker])
+
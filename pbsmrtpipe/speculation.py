@@ -0,0 +1,142 @@
+"""Speculative execution of straggling chunked tasks
+
+The gather of a chunk group waits for the slowest chunk. A chunk that is
+running much longer than its completed siblings (e.g., on an overloaded
+node) is run again as a speculative copy in a separate task dir. The first
+copy to complete successfully wins. The other copy is killed and its outputs
+are discarded.
+"""
+import logging
+from collections import namedtuple
+
+import pbsmrtpipe.constants as GlobalConstants
+
+log = logging.getLogger(__name__)
+
+__all__ = ['SpeculationPolicy', 'SpeculativeTasks', 'SpeculativeResult',
+           'to_speculative_task_id']
+
+
+class Constants(object):
+    SUFFIX = "speculative"
+    # Number of completed siblings required to compute the median run time
+    MIN_COMPLETED_SIBLINGS = 2
+
+
+# is_final is False if the (failed) copy was discarded and the other copy
+# is still running. discarded are the copies to kill.
+SpeculativeResult = namedtuple("SpeculativeResult", "task_id is_final discarded")
+
+
+def to_speculative_task_id(task_id):
+    return "-".join([task_id, Constants.SUFFIX])
+
+
+def _median(xs):
+    xs = sorted(xs)
+    n = len(xs)
+    if n % 2 == 1:
+        return xs[n // 2]
+    return (xs[n // 2 - 1] + xs[n // 2]) / 2.0
+
+
+class SpeculationPolicy(object):
+
+    """Detect straggling chunks within a chunk group
+
+    Disabled when multiple is None.
+    """
+
+    def __init__(self, multiple, min_run_time=GlobalConstants.SPECULATIVE_MIN_RUN_TIME,
+                 min_completed_siblings=Constants.MIN_COMPLETED_SIBLINGS):
+        """
+        :param multiple: A chunk running longer than multiple * the median
+        run time of the completed sibling chunks is a straggler
+        :param min_run_time: Chunks running less than this (in sec) are never stragglers
+        """
+        self.multiple = multiple
+        self.min_run_time = min_run_time
+        self.min_completed_siblings = min_completed_siblings
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, m=self.multiple, t=self.min_run_time,
+                  n=self.min_completed_siblings)
+        return "<{k} multiple:{m} min_run_time:{t} min_siblings:{n} >".format(**_d)
+
+    @property
+    def is_enabled(self):
+        return self.multiple is not None
+
+    @staticmethod
+    def from_workflow_options(workflow_opts):
+        """:type workflow_opts: pbsmrtpipe.models.WorkflowLevelOptions"""
+        return SpeculationPolicy(workflow_opts.speculative_multiple,
+                                 min_run_time=workflow_opts.speculative_min_run_time)
+
+    def is_straggler(self, run_time, sibling_run_times):
+        """
+        :param run_time: Elapsed time (in sec) of the running chunk
+        :param sibling_run_times: Run times (in sec) of the completed chunks of the same chunk group
+        """
+        if not self.is_enabled or len(sibling_run_times) < self.min_completed_siblings:
+            return False
+        max_run_time = max(self.multiple * _median(sibling_run_times), self.min_run_time)
+        return run_time > max_run_time
+
+
+class SpeculativeTasks(object):
+
+    """Book-keeping of the running copies of speculatively executed tasks
+
+    Each task has at most one speculative copy.
+    """
+
+    def __init__(self):
+        # task id -> speculative task id
+        self._copies = {}
+        # copy id -> task id of the running copies
+        self._running = {}
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=len(self._copies))
+        return "<{k} tasks:{n} >".format(**_d)
+
+    def __len__(self):
+        return len(self._copies)
+
+    def has_copy(self, task_id):
+        """Returns True if the task was (or is) speculatively executed"""
+        return task_id in self._copies
+
+    def is_running_copy(self, copy_id):
+        return copy_id in self._running
+
+    def add(self, task_id):
+        """Register a speculative copy of a running task
+
+        :returns: The task id of the speculative copy
+        """
+        if task_id in self._copies:
+            raise ValueError("Task {i} already has a speculative copy".format(i=task_id))
+        copy_id = to_speculative_task_id(task_id)
+        self._copies[task_id] = copy_id
+        self._running[task_id] = task_id
+        self._running[copy_id] = task_id
+        return copy_id
+
+    def complete(self, copy_id, was_successful):
+        """
+        Complete a copy of a task
+
+        :rtype: SpeculativeResult
+        """
+        task_id = self._running.pop(copy_id)
+        others = [x for x, t in self._running.iteritems() if t == task_id]
+
+        if not was_successful and others:
+            log.warn("Discarding failed copy {c} of task {i}. {o} still running".format(c=copy_id, i=task_id, o=others))
+            return SpeculativeResult(task_id, False, [copy_id])
+
+        for other in others:
+            self._running.pop(other)
+        return SpeculativeResult(task_id, True, others)
@@ -0,0 +1,274 @@
+"""Node-local scratch staging of the task inputs and outputs
+
+When pbsmrtpipe.options.stage_dir is set, the driver writes the staging
+details of each selected task (pbsmrtpipe.options.stage_task_ids) to the
+runnable-task.json. On the node, the runner
+
+- copies the input files to the scratch dir. Inputs larger than
+  pbsmrtpipe.options.stage_max_input_size (or than the free space of the
+  scratch dir) are read in place
+- runs the commands with the paths rewritten to the scratch dir (including
+  the paths of the resolved tool contract)
+- copies the outputs (and any other file written next to them) back to the
+  task dir before the outputs are validated. Each file is copied to a tmp
+  file and renamed, so a partial output is never seen in the task dir
+- removes the scratch dir
+
+Files of the types in pbsmrtpipe.options.stage_skip_file_types (by default
+the DataSet XMLs, which reference external BAMs by path) are never staged.
+"""
+import os
+import re
+import json
+import shutil
+import fnmatch
+import logging
+
+import pbsmrtpipe.constants as GlobalConstants
+
+log = logging.getLogger(__name__)
+
+__all__ = ['StagingPolicy', 'TaskStager', 'rewrite_paths']
+
+
+class Constants(object):
+    SCRATCH_PREFIX = "pbsmrtpipe-"
+    INPUTS_DIR = "inputs"
+    OUTPUTS_DIR = "outputs"
+    # Prefix of the tmp files of the outputs being copied back
+    COPY_PREFIX = ".staging-"
+    # Free space (in bytes) of the scratch dir that is never used by the inputs
+    MIN_FREE_SPACE = 1024 * 1024 * 1024
+
+
+def _parse_patterns(s):
+    if s is None:
+        return []
+    return [x.strip() for x in s.split(',') if x.strip()]
+
+
+def _matches(value, patterns):
+    return any(fnmatch.fnmatch(value, p) for p in patterns)
+
+
+class StagingPolicy(object):
+
+    """Select the tasks and the files that are staged on node-local scratch"""
+
+    def __init__(self, stage_dir, task_ids=None, max_input_size=None, skip_file_types=None):
+        """
+        :param stage_dir: Scratch dir on the node. Env vars (e.g., $TMPDIR) are expanded on the node
+        :param task_ids: List of task id glob patterns. None stages all the tasks
+        :param max_input_size: Inputs larger than this (in MB) are read in place. None is unbounded
+        :param skip_file_types: List of file type id glob patterns that are never staged
+        """
+        self.stage_dir = stage_dir
+        self.task_ids = task_ids
+        self.max_input_size = max_input_size
+        self.skip_file_types = [] if skip_file_types is None else skip_file_types
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, d=self.stage_dir, t=self.task_ids,
+                  m=self.max_input_size, s=",".join(self.skip_file_types))
+        return "<{k} {d} tasks:{t} max input size:{m} skip:{s} >".format(**_d)
+
+    @property
+    def is_enabled(self):
+        return self.stage_dir is not None
+
+    @staticmethod
+    def from_workflow_options(workflow_opts):
+        """:type workflow_opts: pbsmrtpipe.models.WorkflowLevelOptions"""
+        task_ids = _parse_patterns(workflow_opts.stage_task_ids) or None
+        return StagingPolicy(workflow_opts.stage_dir, task_ids=task_ids,
+                             max_input_size=workflow_opts.stage_max_input_size,
+                             skip_file_types=_parse_patterns(workflow_opts.stage_skip_file_types))
+
+    def _to_files(self, file_types, paths):
+        return [p for file_type, p in zip(file_types, paths) if not _matches(file_type.file_type_id, self.skip_file_types)]
+
+    def to_staging(self, meta_task, task):
+        """
+        Returns the staging details of the task (written to the
+        runnable-task.json), or None if the task is not staged
+
+        :type task: pbsmrtpipe.models.Task
+        """
+        if not self.is_enabled:
+            return None
+        if self.task_ids is not None and not _matches(meta_task.task_id, self.task_ids):
+            return None
+
+        input_files = self._to_files(meta_task.input_types, task.input_files)
+        output_files = self._to_files(meta_task.output_types, task.output_files)
+        if not input_files and not output_files:
+            return None
+        return dict(stage_dir=self.stage_dir,
+                    input_files=input_files,
+                    output_files=output_files,
+                    max_input_size=self.max_input_size)
+
+
+def rewrite_paths(cmd, paths):
+    """Replace the paths (as whole words) in a command str
+
+    :param paths: {path: new path}
+    """
+    # longest first, so a path isn't replaced within a longer path
+    for path in sorted(paths, key=len, reverse=True):
+        rx = re.compile(r'(?<![^\s\'"=:])' + re.escape(path) + r'(?![^\s\'";|&<>)])')
+        cmd = rx.sub(lambda m: paths[path], cmd)
+    return cmd
+
+
+def _rewrite_json_paths(d, paths):
+    if isinstance(d, dict):
+        return {k: _rewrite_json_paths(v, paths) for k, v in d.iteritems()}
+    elif isinstance(d, list):
+        return [_rewrite_json_paths(v, paths) for v in d]
+    elif isinstance(d, basestring):
+        return paths.get(d, d)
+    return d
+
+
+def _get_free_space(path):
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+
+def _copy_atomic(src, dest):
+    """Copy to a tmp file in the dir of the dest, then rename"""
+    tmp_path = os.path.join(os.path.dirname(dest), Constants.COPY_PREFIX + os.path.basename(dest))
+    shutil.copyfile(src, tmp_path)
+    shutil.copymode(src, tmp_path)
+    os.rename(tmp_path, dest)
+
+
+class TaskStager(object):
+
+    """Stage the inputs and outputs of a task in a node-local scratch dir (run on the node)"""
+
+    def __init__(self, scratch_dir, output_dir, input_files, output_files, max_input_size=None):
+        """
+        :param scratch_dir: Scratch dir of the task. Created by stage_inputs
+        :param output_dir: Task dir. Only the outputs in the task dir are staged
+        :param max_input_size: (MB) None is unbounded
+        """
+        self.scratch_dir = scratch_dir
+        self.output_dir = output_dir
+        self.input_files = input_files
+        self.output_files = output_files
+        self.max_input_size = max_input_size
+        # original path -> path in the scratch dir
+        self.staged_inputs = {}
+        self.staged_outputs = {}
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, d=self.scratch_dir,
+                  i=len(self.staged_inputs), o=len(self.staged_outputs))
+        return "<{k} {d} inputs:{i} outputs:{o} >".format(**_d)
+
+    @staticmethod
+    def from_runnable_task(runnable_task):
+        """:type runnable_task: pbsmrtpipe.models.RunnableTask"""
+        s = runnable_task.staging
+        stage_dir = os.path.expandvars(s['stage_dir'])
+        scratch_dir = os.path.join(stage_dir, Constants.SCRATCH_PREFIX + runnable_task.task.uuid)
+        return TaskStager(scratch_dir, runnable_task.task.output_dir, s['input_files'], s['output_files'],
+                          max_input_size=s.get('max_input_size'))
+
+    @property
+    def inputs_dir(self):
+        return os.path.join(self.scratch_dir, Constants.INPUTS_DIR)
+
+    @property
+    def outputs_dir(self):
+        return os.path.join(self.scratch_dir, Constants.OUTPUTS_DIR)
+
+    def _is_staged_input(self, path, size):
+        if self.max_input_size is not None and size > self.max_input_size * 1024 * 1024:
+            log.info("Reading input {p} in place. Size {s} bytes is larger than the max input size".format(p=path, s=size))
+            return False
+        if size > _get_free_space(self.scratch_dir) - Constants.MIN_FREE_SPACE:
+            log.warn("Reading input {p} in place. Not enough free space in {d}".format(p=path, d=self.scratch_dir))
+            return False
+        return True
+
+    def stage_inputs(self):
+        """Copy the inputs to the scratch dir. Returns the number of bytes copied"""
+        os.makedirs(self.inputs_dir)
+        os.makedirs(self.outputs_dir)
+        nbytes = 0
+        for i, path in enumerate(self.input_files):
+            if not os.path.isfile(path):
+                continue
+            size = os.path.getsize(path)
+            if not self._is_staged_input(path, size):
+                continue
+            # the index avoids collisions of inputs with the same name
+            staged_path = os.path.join(self.inputs_dir, str(i), os.path.basename(path))
+            os.mkdir(os.path.dirname(staged_path))
+            try:
+                shutil.copyfile(path, staged_path)
+            except (IOError, OSError) as e:
+                log.warn("Reading input {p} in place. Unable to stage input. {e}".format(p=path, e=e))
+                continue
+            self.staged_inputs[path] = staged_path
+            nbytes += size
+        return nbytes
+
+    def stage_outputs(self):
+        """Map the outputs (in the task dir) to the scratch dir"""
+        output_dir = os.path.abspath(self.output_dir)
+        for path in self.output_files:
+            rpath = os.path.relpath(os.path.abspath(path), output_dir)
+            if rpath.startswith(os.pardir):
+                continue
+            staged_path = os.path.join(self.outputs_dir, rpath)
+            if not os.path.isdir(os.path.dirname(staged_path)):
+                os.makedirs(os.path.dirname(staged_path))
+            self.staged_outputs[path] = staged_path
+
+    def can_stage(self, cmds):
+        """The avro resolved tool contract can't be rewritten"""
+        rtc_avro_path = os.path.join(self.output_dir, GlobalConstants.RESOLVED_TOOL_CONTRACT_AVRO)
+        return not any(rtc_avro_path in cmd for cmd in cmds)
+
+    def _to_paths(self):
+        paths = dict(self.staged_inputs)
+        paths.update(self.staged_outputs)
+        return paths
+
+    def rewrite_cmds(self, cmds):
+        """
+        Returns the commands with the paths rewritten to the scratch dir. The
+        resolved tool contract (JSON) referenced by the commands is rewritten
+        to the scratch dir.
+        """
+        paths = self._to_paths()
+        rtc_path = os.path.join(self.output_dir, GlobalConstants.RESOLVED_TOOL_CONTRACT_JSON)
+        if paths and os.path.exists(rtc_path) and any(rtc_path in cmd for cmd in cmds):
+            with open(rtc_path, 'r') as f:
+                d = json.load(f)
+            staged_rtc_path = os.path.join(self.scratch_dir, GlobalConstants.RESOLVED_TOOL_CONTRACT_JSON)
+            with open(staged_rtc_path, 'w') as f:
+                f.write(json.dumps(_rewrite_json_paths(d, paths), sort_keys=True, indent=4))
+            paths[rtc_path] = staged_rtc_path
+        return [rewrite_paths(cmd, paths) for cmd in cmds]
+
+    def copy_back_outputs(self):
+        """Copy the files written to the outputs dir of the scratch dir back
+        to the task dir. Returns the list of files copied"""
+        copied = []
+        for root, dnames, fnames in os.walk(self.outputs_dir):
+            dest_dir = os.path.join(self.output_dir, os.path.relpath(root, self.outputs_dir))
+            if not os.path.isdir(dest_dir):
+                os.makedirs(dest_dir)
+            for fname in fnames:
+                dest = os.path.normpath(os.path.join(dest_dir, fname))
+                _copy_atomic(os.path.join(root, fname), dest)
+                copied.append(dest)
+        return copied
+
+    def cleanup(self):
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
@@ -1,7 +1,8 @@
 import time
+import json
+import Queue
 import operator
-import multiprocessing
-import functools
+import threading
 import logging
 import sys
 import os
@@ -12,7 +13,10 @@ from pbcommand.validators import validate_file
 from pbcommand.utils import setup_log
 
 from pbsmrtpipe.testkit.runner import add_ignore_test_failures_option
+from pbsmrtpipe.testkit.butler import config_parser_to_butler
+import pbsmrtpipe.testkit.xunit as X
 import pbsmrtpipe.tools.utils as TU
+import pbsmrtpipe.constants as GlobalConstants
 from pbsmrtpipe.utils import compose
 from pbsmrtpipe.engine import backticks
 
@@ -24,6 +28,13 @@ log = logging.getLogger(__name__)
 _EXE = 'pbtestkit-runner'
 
 
+class Constants(object):
+    # Written to the job output dir (next to the testkit xunit output)
+    RUN_TIME_JSON = "testkit_run_time.json"
+    JENKINS_XUNIT_XML = "jenkins_testkit_xunit.xml"
+    XUNIT_SUITE_NAME = "pbtestkit-multirunner"
+
+
 def _testkit_cfg_fofn_to_files(butler_fofn, root_dir):
     """
     Parse the butler FOFN and return a list of butler cfgs with absolute path.
@@ -68,24 +79,188 @@ def _validate_testkit_cfg_fofn(path):
 validate_testkit_cfg_fofn = compose(_validate_testkit_cfg_fofn, validate_file)
 
 
+class TestkitJob(object):
+
+    def __init__(self, testkit_cfg, job_id, output_dir, nproc, run_time=None):
+        """
+        :param nproc: max nproc of the job (from the preset XML)
+        :param run_time: (float, None) Run time (in sec) of the previous run
+        """
+        self.testkit_cfg = testkit_cfg
+        self.job_id = job_id
+        self.output_dir = output_dir
+        self.nproc = nproc
+        self.run_time = run_time
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, i=self.job_id, n=self.nproc, r=self.run_time)
+        return "<{k} {i} nproc:{n} run_time:{r} >".format(**_d)
+
+
+def _load_preset_max_nproc(preset_xml, default_nproc):
+    if preset_xml is None:
+        return default_nproc
+
+    # pb_io is imported here to avoid loading the registered tasks when the
+    # module is imported
+    from pbsmrtpipe.pb_io import parse_pipeline_preset_xml
+    try:
+        wopts = parse_pipeline_preset_xml(preset_xml).to_workflow_level_opt()
+        return default_nproc if wopts.max_nproc is None else wopts.max_nproc
+    except Exception as e:
+        log.warn("Unable to load max_nproc from preset {p}. {e}".format(p=preset_xml, e=e))
+        return default_nproc
+
+
+def load_run_time(output_dir):
+    """Load the run time (in sec) of the previous run of the job, or None"""
+    path = os.path.join(output_dir, Constants.RUN_TIME_JSON)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return float(json.load(f)['run_time'])
+    except (ValueError, KeyError, TypeError) as e:
+        log.warn("Ignoring invalid run time file {p}. {e}".format(p=path, e=e))
+        return None
+
+
+def write_run_time(output_dir, run_time, rcode):
+    if os.path.isdir(output_dir):
+        path = os.path.join(output_dir, Constants.RUN_TIME_JSON)
+        with open(path, 'w') as f:
+            f.write(json.dumps(dict(run_time=run_time, exit_code=rcode), indent=2))
+
+
+def load_testkit_job(testkit_cfg, default_nproc=GlobalConstants.MAX_NPROC):
+    """
+    :param testkit_cfg: Absolute path to the butler cfg
+
+    :rtype: TestkitJob
+    """
+    try:
+        butler = config_parser_to_butler(testkit_cfg)
+    except Exception as e:
+        # the failure will be reported by pbtestkit-runner
+        log.warn("Unable to load butler cfg {c}. {e}".format(c=testkit_cfg, e=e))
+        return TestkitJob(testkit_cfg, testkit_cfg, os.path.dirname(testkit_cfg), default_nproc)
+
+    nproc = _load_preset_max_nproc(butler.preset_xml, default_nproc)
+    return TestkitJob(testkit_cfg, butler.job_id, butler.output_dir, nproc, load_run_time(butler.output_dir))
+
+
+def to_longest_first(jobs):
+    """Sort the jobs by the run time of the previous run (longest first).
+
+    Jobs without a recorded run time are run first, then jobs with the
+    largest nproc.
+    """
+    def _to_key(job):
+        run_time = float("inf") if job.run_time is None else job.run_time
+        return -run_time, -job.nproc
+
+    return sorted(jobs, key=_to_key)
+
+
+def get_next_jobs(pending_jobs, nproc_used, total_nproc, njobs_available):
+    """
+    Pack the pending jobs (in order) into the available nproc. A job that
+    requires more than the total nproc is only run alone.
+
+    Smaller jobs are only packed past a job that doesn't fit if they don't
+    delay it. A job that runs longer than all the jobs behind it (or without
+    a recorded run time) is never skipped. No job is started until the
+    running jobs release enough nproc, otherwise it would run last.
+
+    :param total_nproc: (int, None) Total nproc of all the running jobs. None is unbounded
+    :param njobs_available: Number of jobs that can be started
+
+    :rtype: list
+    """
+    def _to_run_time(job_):
+        return float("inf") if job_.run_time is None else job_.run_time
+
+    jobs = []
+    for i, job in enumerate(pending_jobs):
+        if len(jobs) >= njobs_available:
+            break
+        if total_nproc is None or nproc_used + job.nproc <= total_nproc or (nproc_used == 0 and not jobs):
+            jobs.append(job)
+            nproc_used += job.nproc
+        elif _to_run_time(job) >= sum(_to_run_time(j) for j in pending_jobs[i + 1:]):
+            break
+    return jobs
+
+
 def _run_testkit_cfg(testkit_cfg, debug=False, misc_opts=""):
-    os.chdir(os.path.dirname(testkit_cfg))
-    cmd = "{e} --debug {m} {c}".format(c=testkit_cfg, e=_EXE, m=misc_opts)
+    # the cwd of the process is shared by the job threads, so the job is run
+    # from the butler cfg dir by the shell
+    cmd = "cd {d} && {e} --debug {m} {c}".format(d=os.path.dirname(testkit_cfg), c=testkit_cfg, e=_EXE, m=misc_opts)
     rcode, stdout, stderr, run_time = backticks(cmd)
 
     if debug:
         log.debug(" ".join([str(i) for i in [cmd, rcode, stdout, stderr]]))
 
-    # Returning the butler cfg is a bit odd, but this is necessary for the
-    # parallelism to work consistently with the serial version
     return testkit_cfg, rcode, stdout, stderr, run_time
 
 
-def run_testkit_cfgs(testkit_cfgs, nworkers, force_distributed=False, local_only=False, force_chunk_mode=False, disable_chunk_mode=False, ignore_test_failures=True):
+class CombinedXunitWriter(object):
+
+    """Combine the (jenkins) xunit outputs of the jobs into a single xunit
+    file. The file is rewritten as each job is completed."""
+
+    def __init__(self, output_xml, name=Constants.XUNIT_SUITE_NAME):
+        self.output_xml = output_xml
+        self.name = name
+        self.tests = []
+
+    def _to_job_tests(self, job, rcode, stdout):
+        path = os.path.join(job.output_dir, Constants.JENKINS_XUNIT_XML)
+        if os.path.exists(path):
+            try:
+                return X.XunitTestSuite.from_xml(path).tests
+            except Exception as e:
+                log.warn("Unable to parse xunit {p}. {e}".format(p=path, e=e))
+        # the job failed before the tests were run
+        if rcode != 0:
+            message = "testkit job {c} failed with exit code {r}".format(c=job.testkit_cfg, r=rcode)
+            return [X.XunitTestCase(job.job_id, "_".join(["pbtestkit_runner", job.job_id]), 'error',
+                                    text=stdout, message=message, etype="exceptions.Exception")]
+        return []
+
+    def add_job(self, job, rcode, stdout):
+        self.tests.extend(self._to_job_tests(job, rcode, stdout))
+        xml = X.XunitTestSuite(self.name, self.tests).to_xml()
+        # atomic replace, so the file can be read while the jobs are running
+        tmp_path = self.output_xml + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(str(xml))
+        os.rename(tmp_path, self.output_xml)
+
+
+def _run_testkit_job(job, misc_opts, results_queue):
+    # the xunit output of the previous run must not be reported for this run
+    jenkins_xml = os.path.join(job.output_dir, Constants.JENKINS_XUNIT_XML)
+    if os.path.exists(jenkins_xml):
+        os.remove(jenkins_xml)
+    try:
+        result = _run_testkit_cfg(job.testkit_cfg, misc_opts=misc_opts)
+    except Exception as e:
+        log.exception("Failed to run {c}".format(c=job.testkit_cfg))
+        result = (job.testkit_cfg, -1, "", str(e), 0.0)
+    results_queue.put((job, result))
+
+
+def run_testkit_cfgs(testkit_cfgs, nworkers, force_distributed=False, local_only=False, force_chunk_mode=False, disable_chunk_mode=False, ignore_test_failures=True, total_nproc=None, output_xml=None):
     """Run all the butler cfgs in parallel or serial (nworkers=1)
 
+    The jobs are run longest first (using the run times of the previous
+    runs) and packed into the total nproc using the max_nproc of each job.
+
     :param testkit_cfgs: (list of str) list of absolute paths to butler.cfgs)
     :param nworkers: (int) Number of workers to spawn.
+    :param total_nproc: (int, None) Max total nproc of the concurrently running jobs
+    :param output_xml: (str, None) Combined xunit output. Updated as each job is completed
 
     :type testkit_cfgs: list
     :type nworkers: int
@@ -93,7 +268,7 @@ def run_testkit_cfgs(testkit_cfgs, nworkers, force_distributed=False, local_only
     :rtype: bool
     """
     started_at = time.time()
-    log.info("Starting with nworkers {n} and {m} butler cfg files".format(n=nworkers, m=len(testkit_cfgs)))
+    log.info("Starting with nworkers {n} total nproc {p} and {m} butler cfg files".format(n=nworkers, m=len(testkit_cfgs), p=total_nproc))
     results = []
     misc_opts = []
     if disable_chunk_mode:
@@ -107,18 +282,41 @@ def run_testkit_cfgs(testkit_cfgs, nworkers, force_distributed=False, local_only
     if ignore_test_failures:
         misc_opts.append("--ignore-test-failures")
     misc_opts = " ".join(misc_opts)
-    if nworkers == 1:
-        log.info("Running in serial mode.")
-        for testkit_cfg in testkit_cfgs:
-            bcfg, rcode, stdout, stderr, job_run_time = _run_testkit_cfg(testkit_cfg, misc_opts=misc_opts)
-            d = dict(x=testkit_cfg, r=rcode, s=int(job_run_time), m=job_run_time / 60.0)
-            log.info("Completed running {x}. exit code {r} in {s} sec ({m:.2f} min).".format(**d))
-            results.append((testkit_cfg, rcode, stdout, stderr, job_run_time))
-    else:
-        __run_testkit_cfg = functools.partial(_run_testkit_cfg,
-            misc_opts=misc_opts)
-        pool = multiprocessing.Pool(nworkers)
-        results = pool.map_async(__run_testkit_cfg, testkit_cfgs).get(9999999)
+
+    pending_jobs = to_longest_first([load_testkit_job(c) for c in testkit_cfgs])
+    for job in pending_jobs:
+        log.info("Job {j}".format(j=job))
+
+    xunit_writer = None if output_xml is None else CombinedXunitWriter(output_xml)
+    results_queue = Queue.Queue()
+    running_jobs = []
+
+    while pending_jobs or running_jobs:
+        nproc_used = sum(j.nproc for j in running_jobs)
+        for job in get_next_jobs(pending_jobs, nproc_used, total_nproc, nworkers - len(running_jobs)):
+            pending_jobs.remove(job)
+            running_jobs.append(job)
+            log.info("Starting {j} (running jobs {n})".format(j=job, n=len(running_jobs)))
+            t = threading.Thread(target=_run_testkit_job, args=(job, misc_opts, results_queue), name=job.job_id)
+            t.daemon = True
+            t.start()
+
+        # the timeout keeps the main thread responsive to KeyboardInterrupt
+        while True:
+            try:
+                job, result = results_queue.get(timeout=1)
+                break
+            except Queue.Empty:
+                pass
+
+        running_jobs.remove(job)
+        bcfg, rcode, stdout, stderr, job_run_time = result
+        d = dict(x=bcfg, r=rcode, s=int(job_run_time), m=job_run_time / 60.0)
+        log.info("Completed running {x}. exit code {r} in {s} sec ({m:.2f} min).".format(**d))
+        write_run_time(job.output_dir, job_run_time, rcode)
+        if xunit_writer is not None:
+            xunit_writer.add_job(job, rcode, stdout)
+        results.append(result)
 
     log.info("Results:")
     for bcfg, rcode, _, _, job_run_time in results:
@@ -147,7 +345,8 @@ def _args_run_multi_testkit_cfg(args):
 
     return run_testkit_cfgs(testkit_cfgs, nworkers, args.force_distributed,
         args.local_only, args.force_chunk_mode, args.disable_chunk_mode,
-        args.ignore_test_failures)
+        args.ignore_test_failures, total_nproc=args.total_nproc,
+        output_xml=args.output_xml)
 
 
 def get_parser():
@@ -164,6 +363,10 @@ def get_parser():
     p.add_argument('testkit_cfg_fofn', type=validate_testkit_cfg_fofn,
                    help="File of butler.cfg file name relative to the current dir (e.g., RS_Resquencing/testkit.cfg")
     p.add_argument('-n', '--nworkers', type=int, default=1, help="Number of jobs to concurrently run.")
+    p.add_argument('--total-nproc', type=int, default=None,
+                   help="Max total nproc of the concurrently running jobs. The nproc of each job is the max_nproc of the preset XML.")
+    p.add_argument('--output-xml', type=str, default=None,
+                   help="Combined xunit output of all the jobs. The file is updated as each job is completed.")
 
     p.set_defaults(func=_args_run_multi_testkit_cfg)
     return p
@@ -6,6 +6,7 @@ import random
 import sys
 import time
 import unittest
+import multiprocessing
 
 from pbcommand.cli import pacbio_args_runner, get_default_argparser
 
@@ -43,9 +44,9 @@ def _patch_test_cases_with_job_dir(test_cases, job_dir):
             # log.debug("Setting job dir on {c}".format(c=t))
 
 
-def _write_xunit_output(test_cases, result, output_xml, job_id):
+def _write_xunit_output(test_cases, result, output_xml, job_id, run_times=None):
     """Returns a XunitTestSuite instance"""
-    xml = X.convert_suite_and_result_to_xunit(test_cases, result)
+    xml = X.convert_suite_and_result_to_xunit(test_cases, result, run_times=run_times)
 
     log.debug("Writing Xunit XML output to {f}".format(f=output_xml))
     with open(output_xml, 'w+') as f:
@@ -73,24 +74,111 @@ def _write_xunit_output(test_cases, result, output_xml, job_id):
     return xsuite
 
 
-def run_butler_tests(test_cases, output_dir, output_xml, job_id):
+class TimedTestResult(unittest.TestResult):
+
+    """Records the run time of each test (by test id)"""
+
+    def __init__(self, *args, **kwargs):
+        super(TimedTestResult, self).__init__(*args, **kwargs)
+        self.run_times = {}
+        self._started_at = {}
+
+    def startTest(self, test):
+        self._started_at[test.id()] = time.time()
+        super(TimedTestResult, self).startTest(test)
+
+    def stopTest(self, test):
+        super(TimedTestResult, self).stopTest(test)
+        started_at = self._started_at.pop(test.id(), None)
+        if started_at is not None:
+            self.run_times[test.id()] = time.time() - started_at
+
+
+# The test cases run by the worker processes. The workers are forked after
+# this is set, so the (job dir patched) test cases don't need to be pickled.
+_WORKER_TEST_CASES = []
+
+_RESULT_NAMES = ('errors', 'failures', 'skipped')
+
+
+def _to_test_key(test):
+    # setUpClass failures are reported as an _ErrorHolder
+    if isinstance(test, unittest.suite._ErrorHolder):
+        return True, test.description
+    return False, test.id()
+
+
+def _run_worker_test_case(index):
+    """Run a TestCase class in a worker process. Returns a picklable result"""
+    test_case = _WORKER_TEST_CASES[index]
+    result = TimedTestResult()
+    test_case.run(result)
+    d = {n: [_to_test_key(t) + (msg, ) for t, msg in getattr(result, n)] for n in _RESULT_NAMES}
+    return index, result.testsRun, d, result.run_times
+
+
+def _merge_worker_result(result, test_case, worker_result):
+    """Merge the result of the worker into the TimedTestResult"""
+    _, tests_run, d, run_times = worker_result
+    tests = {t.id(): t for t in test_case}
+    result.testsRun += tests_run
+    result.run_times.update(run_times)
+    for n in _RESULT_NAMES:
+        for is_error_holder, key, msg in d[n]:
+            t = unittest.suite._ErrorHolder(key) if is_error_holder else tests[key]
+            getattr(result, n).append((t, msg))
+
+
+def _run_test_cases_parallel(test_cases, nworkers):
+    global _WORKER_TEST_CASES
+    _WORKER_TEST_CASES = test_cases
+    result = TimedTestResult()
+    pool = multiprocessing.Pool(nworkers)
+    try:
+        for worker_result in pool.imap_unordered(_run_worker_test_case, range(len(test_cases))):
+            test_case = test_cases[worker_result[0]]
+            _merge_worker_result(result, test_case, worker_result)
+            log.debug("Completed running {t}".format(t=test_case))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        _WORKER_TEST_CASES = []
+    return result
+
+
+def _log_slowest_tests(run_times, n=10):
+    slowest = sorted(run_times.items(), key=lambda x: x[1], reverse=True)[:n]
+    if slowest:
+        log.info("Slowest tests:")
+        for test_id, run_time in slowest:
+            log.info("{s:10.2f} sec {i}".format(s=run_time, i=test_id))
+
+
+def run_butler_tests(test_cases, output_dir, output_xml, job_id, nworkers=1):
     """
+    Run the test cases (serially, or each TestCase class in a pool of
+    nworkers processes) and write the Xunit output
 
-    :return:
+    :return: exit code
     """
 
     # This is really hacky
     _patch_test_cases_with_job_dir(test_cases, output_dir)
 
     # This is the API to run directly from Unittest
-    slog.info("Running test cases")
+    slog.info("Running test cases with nworkers {n}".format(n=nworkers))
     log.debug(test_cases)
-    result = unittest.TestResult()
-    test_suite = unittest.TestSuite(test_cases)
-    test_suite.run(result)
+    if nworkers > 1 and len(test_cases) > 1:
+        result = _run_test_cases_parallel(test_cases, min(nworkers, len(test_cases)))
+    else:
+        result = TimedTestResult()
+        test_suite = unittest.TestSuite(test_cases)
+        test_suite.run(result)
     #log.debug(result)
 
-    xml = _write_xunit_output(test_cases, result, output_xml, job_id)
+    _log_slowest_tests(result.run_times)
+    xml = _write_xunit_output(test_cases, result, output_xml, job_id, run_times=result.run_times)
     log.info(str(xml))
 
     return 0 if result.wasSuccessful() else 1
@@ -101,11 +189,13 @@ def run_butler(butler, test_cases, output_xml,
                log_level=logging.DEBUG,
                force_distribute=None,
                force_chunk=None,
-               ignore_test_failures=False):
+               ignore_test_failures=False,
+               test_nworkers=1):
     """
     Run a Butler instance.
 
     :param butler: Butler instance
+    :param test_nworkers: Number of processes to run the test cases
     :return: exit code
 
 
@@ -159,7 +249,7 @@ def run_butler(butler, test_cases, output_xml,
 
         if test_cases is not None:
             slog.info("Running in test-only mode")
-            trcode = run_butler_tests(test_cases, butler.output_dir, output_xml, butler.job_id)
+            trcode = run_butler_tests(test_cases, butler.output_dir, output_xml, butler.job_id, nworkers=test_nworkers)
         else:
             trcode = 0
 
@@ -205,13 +295,14 @@ def _args_run_butler(args):
         # in test only mode, only emit to stdout (to avoid overwritten the
         # log file
         setup_logger(None, level=log_level)
-        return run_butler_tests(test_cases, butler.output_dir, output_xml, butler.job_id)
+        return run_butler_tests(test_cases, butler.output_dir, output_xml, butler.job_id, nworkers=args.test_nworkers)
     else:
         rcode = run_butler(butler, test_cases, output_xml, log_file,
                            log_level=log_level,
                            force_distribute=force_distribute,
                            force_chunk=force_chunk,
-                           ignore_test_failures=args.ignore_test_failures)
+                           ignore_test_failures=args.ignore_test_failures,
+                           test_nworkers=args.test_nworkers)
         return rcode
 
 
@@ -238,6 +329,12 @@ def add_output_xml_option(p):
     return p
 
 
+def add_test_nworkers_option(p):
+    p.add_argument("--test-nworkers", type=int, default=1,
+                   help="Number of processes to run the TestCase classes in parallel")
+    return p
+
+
 def get_parser():
     desc = "Testkit Tool to run pbsmrtpipe jobs."
     p = get_default_argparser(__version__, desc)
@@ -250,7 +347,8 @@ def get_parser():
              add_log_file_option,
              add_log_debug_option,
              add_ignore_test_failures_option,
-             add_output_xml_option]
+             add_output_xml_option,
+             add_test_nworkers_option]
 
     f = compose(*funcs)
     p = f(p)
@@ -115,9 +115,12 @@ class XunitTestSuite(object):
             text = "" if test_case.text is None else test_case.text
             etype = "" if test_case.etype is None else test_case.etype
 
-            with x.testcase(classname=classname, name=test_case.name,
-                            result=test_case.result, etype=etype,
-                            text=text):
+            attrs = dict(classname=classname, name=test_case.name,
+                         result=test_case.result, etype=etype, text=text)
+            if test_case.run_time is not None:
+                attrs['time'] = "{s:.3f}".format(s=test_case.run_time)
+
+            with x.testcase(**attrs):
 
                 if test_case.result == 'failures':
                     x.error(type=test_case.etype, message=test_case.message)
@@ -212,8 +215,12 @@ def _parser(file_name):
                     etype = e.attrib['type']
 
             # t = (classname, name, result, text, message, etype)
+            run_time = el.attrib.get('time')
+            if run_time is not None:
+                run_time = float(run_time)
+
             t = XunitTestCase(classname, name, result, text=text,
-                              message=message, etype=etype)
+                              message=message, etype=etype, run_time=run_time)
             tests.append(t)
 
         xunit_test_suite = XunitTestSuite(suite_name, tests,
@@ -228,7 +235,7 @@ def _parser(file_name):
     return xunit_test_suite
 
 
-def convert_suite_and_result_to_xunit(suite, result, name="PysivXunitTestSuite"):
+def convert_suite_and_result_to_xunit(suite, result, name="PysivXunitTestSuite", run_times=None):
     """Custom a test suite and result to XML.
 
     The name is used to set the xml suitename for jenkins.
@@ -238,6 +245,7 @@ def convert_suite_and_result_to_xunit(suite, result, name="PysivXunitTestSuite")
     :param suite: unittest.TestSuite
     :param result: unittest.TestResult
     :param name:
+    :param run_times: (dict, None) test id -> run time (in sec)
 
     :return: XML instance
     """
@@ -303,7 +311,8 @@ def convert_suite_and_result_to_xunit(suite, result, name="PysivXunitTestSuite")
 
     for idx, message in all_test_cases.iteritems():
         test_method = idx.split('.')[-1]
-        with x.testcase(classname=idx, name=test_method, time="1.000"):
+        run_time = 1.0 if run_times is None else run_times.get(idx, 0.0)
+        with x.testcase(classname=idx, name=test_method, time="{s:.3f}".format(s=run_time)):
             if idx in klass_results['errors']:
                 x.error(type="exceptions.Exception", message=message)
             elif idx in klass_results['failures']:
@@ -0,0 +1,58 @@
+import unittest
+import logging
+
+from pbsmrtpipe.affinity import (CpuAllocator, parse_cpu_list, to_cpu_list,
+                                 get_numa_nodes)
+
+log = logging.getLogger(__name__)
+
+
+class TestCpuList(unittest.TestCase):
+
+    def test_parse_cpu_list(self):
+        self.assertEqual(parse_cpu_list("0-3,8,10-11\n"), [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(parse_cpu_list("5"), [5])
+
+    def test_to_cpu_list(self):
+        self.assertEqual(to_cpu_list([8, 0, 1, 2, 3, 10, 11]), "0-3,8,10-11")
+        self.assertEqual(to_cpu_list([]), "")
+
+    def test_get_numa_nodes(self):
+        nodes = get_numa_nodes()
+        self.assertTrue(len(nodes) >= 1)
+        self.assertTrue(all(len(cpus) > 0 for _, cpus in nodes))
+
+
+class TestCpuAllocator(unittest.TestCase):
+
+    def setUp(self):
+        # 2 NUMA nodes of 4 CPUs
+        self.allocator = CpuAllocator([(0, [0, 1, 2, 3]), (1, [4, 5, 6, 7])])
+
+    def test_allocate_node_local(self):
+        a = self.allocator.allocate("task-a", 2)
+        self.assertEqual(a, [0, 1])
+        # the node with the fewest free CPUs that fits the task
+        b = self.allocator.allocate("task-b", 2)
+        self.assertEqual(b, [2, 3])
+        c = self.allocator.allocate("task-c", 4)
+        self.assertEqual(c, [4, 5, 6, 7])
+        self.assertIsNone(self.allocator.allocate("task-d", 1))
+
+    def test_allocate_across_nodes(self):
+        self.allocator.allocate("task-a", 2)
+        self.allocator.allocate("task-b", 1)
+        # no node has 5 free CPUs
+        cpus = self.allocator.allocate("task-c", 5)
+        self.assertEqual(cpus, [3, 4, 5, 6, 7])
+
+    def test_release(self):
+        self.allocator.allocate("task-a", 8)
+        self.assertIsNone(self.allocator.allocate("task-b", 1))
+        self.assertEqual(self.allocator.release("task-a"), range(8))
+        self.assertEqual(self.allocator.allocate("task-b", 1), [0])
+        self.assertEqual(self.allocator.get_allocations(), {"task-b": [0]})
+
+    def test_allocate_is_idempotent(self):
+        a = self.allocator.allocate("task-a", 3)
+        self.assertEqual(self.allocator.allocate("task-a", 3), a)
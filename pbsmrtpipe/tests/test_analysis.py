@@ -0,0 +1,69 @@
+import logging
+import unittest
+
+import networkx as nx
+
+from pbsmrtpipe.models import ChunkOperator, Scatter, ScatterChunk, Gather, GatherChunk
+from pbsmrtpipe.run_time_model import DurationModel
+from pbsmrtpipe.analysis import (to_chunked_task_graph, to_level_widths,
+                                 to_max_concurrency, to_critical_path,
+                                 to_task_weights)
+
+log = logging.getLogger(__name__)
+
+
+def _to_task_graph(edges):
+    g = nx.DiGraph()
+    for a, b in edges:
+        for x in (a, b):
+            g.add_node(x, task_id=x.split("-")[0])
+        g.add_edge(a, b)
+    return g
+
+
+# a -> b -> d
+# a -> c -> d
+# c -> e
+_EDGES = [("a-1", "b-1"), ("a-1", "c-1"), ("b-1", "d-1"), ("c-1", "d-1"), ("c-1", "e-1")]
+
+
+def _to_chunk_operator(task_id):
+    scatter = Scatter(task_id, "s", [ScatterChunk("$chunk.fasta_id", task_id + ":0")])
+    gather = Gather([GatherChunk("g", "$chunk.fasta_id", task_id + ":0")])
+    return ChunkOperator("op", scatter, gather)
+
+
+class TestTemplateAnalysis(unittest.TestCase):
+
+    def test_levels(self):
+        g = _to_task_graph(_EDGES)
+        self.assertEqual(to_level_widths(g), [1, 2, 2])
+
+    def test_max_concurrency(self):
+        g = _to_task_graph(_EDGES)
+        # b, e and d are not independent (b -> d), but {b, e} and {d, e} are
+        self.assertEqual(to_max_concurrency(g), 2)
+        # b is independent of c and e
+        g.remove_edge("b-1", "d-1")
+        self.assertEqual(to_max_concurrency(g), 3)
+
+    def test_chunked(self):
+        g = _to_task_graph(_EDGES)
+        cg = to_chunked_task_graph(g, {"op": _to_chunk_operator("b")}, {}, 4)
+        self.assertEqual(cg.number_of_nodes(), 5 - 1 + 1 + 4 + 1)
+        self.assertTrue(nx.is_directed_acyclic_graph(cg))
+        # the 4 chunks of b and the chunk of c, or e
+        self.assertEqual(to_max_concurrency(cg), 5)
+
+    def test_critical_path(self):
+        g = _to_task_graph(_EDGES)
+        model = DurationModel({"a": 10.0, "b": 100.0, "c": 20.0, "d": 1.0, "e": 50.0})
+        run_time, nodes = to_critical_path(g, to_task_weights(g, model))
+        self.assertEqual(run_time, 111.0)
+        self.assertEqual(nodes, ["a-1", "b-1", "d-1"])
+
+        # chunking b splits the run time of b across the chunks
+        cg = to_chunked_task_graph(g, {"op": _to_chunk_operator("b")}, {}, 4)
+        run_time, nodes = to_critical_path(cg, to_task_weights(cg, DurationModel(model.run_times, default_run_time=0.0)))
+        self.assertEqual(run_time, 80.0)
+        self.assertEqual(nodes, ["a-1", "c-1", "e-1"])
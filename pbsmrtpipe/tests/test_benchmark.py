@@ -0,0 +1,55 @@
+import logging
+import unittest
+
+from pbsmrtpipe.tools.benchmark import (BenchmarkResult, compare_to_baseline,
+                                        run_benchmark, _to_benchmark,
+                                        get_benchmarks)
+
+log = logging.getLogger(__name__)
+
+
+class TestBenchmarkResult(unittest.TestCase):
+
+    def test_median(self):
+        self.assertEqual(BenchmarkResult("a", [3.0, 1.0, 2.0]).median, 2.0)
+        self.assertEqual(BenchmarkResult("a", [4.0, 1.0, 2.0, 3.0]).median, 2.5)
+
+    def test_run_benchmark(self):
+        calls = []
+
+        def setup():
+            calls.append("setup")
+            return 1
+
+        def run(state):
+            calls.append(state)
+
+        def teardown(state):
+            calls.append("teardown")
+
+        r = run_benchmark(_to_benchmark("x", run, setup, teardown), nrepeat=2)
+        self.assertEqual(len(r.run_times), 2)
+        self.assertEqual(calls, ["setup", 1, "teardown"] * 2)
+
+
+class TestCompareToBaseline(unittest.TestCase):
+
+    BASELINE = {"a": dict(median=1.0), "b": dict(median=1.0), "c": dict(median=0.001)}
+
+    def test_regressions(self):
+        results = {"a": dict(median=1.1), "b": dict(median=2.0),
+                   "c": dict(median=0.002), "d": dict(median=10.0)}
+        regressions = compare_to_baseline(results, self.BASELINE, threshold=0.25, min_delta=0.005)
+        # c is within min-delta and d is not in the baseline
+        self.assertEqual([r.name for r in regressions], ["b"])
+        self.assertAlmostEqual(regressions[0].ratio, 2.0)
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_chunk_benchmarks(self):
+        benchmarks = [b for b in get_benchmarks(nchunks_list=(3, )) if "nchunks" in b.name]
+        self.assertEqual(len(benchmarks), 3)
+        for b in benchmarks:
+            r = run_benchmark(b, nrepeat=1)
+            self.assertEqual(len(r.run_times), 1)
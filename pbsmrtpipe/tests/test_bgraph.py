@@ -53,3 +53,25 @@ class TestConvertBindingStrToXml(unittest.TestCase):
         xml = B.binding_strs_to_xml(self.bs)
         log.info(str(xml))
         self.assertIsNotNone(xml)
+
+
+class TestInstanceIds(unittest.TestCase):
+
+    bs = [('$entry:e_01', 'pbsmrtpipe.tasks.dev_hello_world:0'),
+          ('pbsmrtpipe.tasks.dev_hello_world:0', 'pbsmrtpipe.tasks.dev_hello_worlder:0')]
+
+    def test_next_task_instance_id(self):
+        bg = B.binding_strs_to_binding_graph(RTASKS, self.bs)
+        meta_task = RTASKS['pbsmrtpipe.tasks.dev_hello_world']
+        t1 = bg.add_meta_task(meta_task)
+        t2 = bg.add_chunked_meta_task(meta_task, "chunk-0", "group-0", "operator-0")
+        self.assertEqual(t2.instance_id, t1.instance_id + 1)
+        self.assertEqual(B.get_next_task_instance_id(bg, B.TaskBindingNode, meta_task.task_id), t2.instance_id + 1)
+
+    def test_index_is_rebuilt_after_remove(self):
+        bg = B.binding_strs_to_binding_graph(RTASKS, self.bs)
+        meta_task = RTASKS['pbsmrtpipe.tasks.dev_hello_worlder']
+        t1 = bg.add_meta_task(meta_task)
+        bg.remove_node(t1)
+        t2 = bg.add_meta_task(meta_task)
+        self.assertEqual(t1.instance_id, t2.instance_id)
@@ -0,0 +1,108 @@
+import os
+import gzip
+import json
+import tempfile
+import unittest
+import logging
+
+import pbsmrtpipe.loader
+
+RTASKS = pbsmrtpipe.loader.load_all_tool_contracts()
+
+from pbsmrtpipe.core import REGISTERED_FILE_TYPES
+import pbsmrtpipe.graph.bgraph as B
+import pbsmrtpipe.graph.bgraph_utils as BU
+from pbsmrtpipe.graph.bgraph_snapshot import (BindingsGraphSnapshotWriter,
+                                              load_bindings_graph_snapshot)
+from pbsmrtpipe.graph.models import TaskStates, ConstantsNodes, TaskBindingNode
+
+log = logging.getLogger(__name__)
+
+
+class TestBindingsGraphSnapshot(unittest.TestCase):
+
+    bs = [('$entry:e_01', 'pbsmrtpipe.tasks.dev_hello_world:0'),
+          ('pbsmrtpipe.tasks.dev_hello_world:0', 'pbsmrtpipe.tasks.dev_hello_worlder:0')]
+
+    def setUp(self):
+        self.bg = B.binding_strs_to_binding_graph(RTASKS, self.bs)
+        meta_task = RTASKS['pbsmrtpipe.tasks.dev_hello_world']
+        self.chunked_node = self.bg.add_chunked_meta_task(meta_task, "chunk-0", "group-0", "operator-0")
+        self.path = os.path.join(tempfile.mkdtemp(suffix="-snapshot"), "workflow-graph.jsonl.gz")
+
+    def _load(self):
+        return load_bindings_graph_snapshot(self.path, RTASKS, REGISTERED_FILE_TYPES)
+
+    def _to_records(self):
+        with gzip.open(self.path, 'rb') as f:
+            return [json.loads(line) for line in f]
+
+    def test_write_and_load(self):
+        BindingsGraphSnapshotWriter(self.path).write(self.bg)
+        bg = self._load()
+        self.assertEqual(set(str(n) for n in bg.nodes()), set(str(n) for n in self.bg.nodes()))
+        self.assertEqual(bg.number_of_edges(), self.bg.number_of_edges())
+        self.assertGreater(bg.number_of_edges(), 0)
+        for n in self.bg.task_nodes():
+            self.assertEqual(bg.node[n][ConstantsNodes.TASK_ATTR_STATE], self.bg.node[n][ConstantsNodes.TASK_ATTR_STATE])
+        chunked_node = [n for n in bg.nodes() if n == self.chunked_node][0]
+        self.assertEqual(chunked_node.chunk_group_id, "group-0")
+
+    def test_append_state_changes(self):
+        w = BindingsGraphSnapshotWriter(self.path)
+        w.write(self.bg)
+        nrecords = len(self._to_records())
+        # no changes
+        self.assertEqual(w.append(self.bg), 0)
+
+        tnode = self.bg.task_nodes()[0]
+        B.update_task_state_to_success(self.bg, tnode, 12.5)
+        self.assertEqual(w.append(self.bg, nodes=[tnode]), 1)
+        records = self._to_records()
+        self.assertEqual(len(records), nrecords + 1)
+        self.assertEqual(records[-1][0], "s")
+
+        bg = self._load()
+        self.assertEqual(bg.node[tnode][ConstantsNodes.TASK_ATTR_STATE], TaskStates.SUCCESSFUL)
+        self.assertEqual(bg.node[tnode][ConstantsNodes.TASK_ATTR_RUN_TIME], 12.5)
+
+    def _to_edges(self, bg):
+        return set((str(u), str(v)) for u, v in bg.edges())
+
+    def test_append_gather_rewrite(self):
+        w = BindingsGraphSnapshotWriter(self.path)
+        w.write(self.bg)
+
+        # the gather of the chunks replaces the original (unchunked) task and
+        # its output files by the gather task (see add_gather_to_completed_task_chunks)
+        meta_task = RTASKS['pbsmrtpipe.tasks.dev_hello_world']
+        tnode = [n for n in self.bg.task_nodes() if isinstance(n, TaskBindingNode) and n.meta_task is meta_task and n != self.chunked_node][0]
+        g_meta_task = RTASKS['pbcoretools.tasks.gather_txt']
+        g_node = self.bg.add_gather_meta_task(g_meta_task, "$chunk.txt_id")
+        g_in_file = self.bg.add_binding_in(g_meta_task, 0, g_meta_task.input_types[0])
+        g_out_file = self.bg.add_binding_out(g_meta_task, 0, g_meta_task.output_types[0])
+        self.bg.add_edge(g_in_file, g_node)
+        self.bg.add_edge(g_node, g_out_file)
+        for out_file in self.bg.successors(tnode):
+            for in_file in self.bg.successors(out_file):
+                self.bg.add_edge(g_out_file, in_file)
+        self.bg.remove_nodes_from(self.bg.successors(tnode))
+        self.bg.remove_node(tnode)
+
+        # only the attributes of the known nodes are compared
+        self.assertEqual(w.append(self.bg, nodes=[g_node], update_graph=False), 0)
+        self.assertGreater(w.append(self.bg, nodes=[tnode, g_node]), 0)
+        records = self._to_records()
+        self.assertEqual(len([r for r in records if r[0] == "x"]), 2)
+
+        bg = self._load()
+        self.assertEqual(set(str(n) for n in bg.nodes()), set(str(n) for n in self.bg.nodes()))
+        self.assertEqual(self._to_edges(bg), self._to_edges(self.bg))
+        # no changes
+        self.assertEqual(w.append(self.bg), 0)
+
+    def test_bindings_graph_to_dict_edges(self):
+        d = BU.bindings_graph_to_dict(self.bg)
+        self.assertEqual(d['nedges'], self.bg.number_of_edges())
+        edge_types = set(e[2] for e in d['edges'])
+        self.assertEqual(edge_types, {"entry", "input", "output", "binding"})
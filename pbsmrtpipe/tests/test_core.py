@@ -1,4 +1,62 @@
 import unittest
 import logging
 
+from pbsmrtpipe.core import PipelineRegistry
+from pbsmrtpipe.exceptions import MalformedPipelineError
+
 log = logging.getLogger(__name__)
+
+
+class TestLazyPipelineRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.registry = PipelineRegistry("pbsmrtpipe")
+
+        def _to_func(name, bs):
+            def _f():
+                self.calls.append(name)
+                return bs
+            return _f
+
+        b_base = [('$entry:e_01', 'pbsmrtpipe.tasks.dev_hello_world:0'),
+                  ('pbsmrtpipe.tasks.dev_hello_world:0', 'pbsmrtpipe.tasks.dev_txt_to_fasta:0')]
+        b_a = [('pbsmrtpipe.pipelines.dev_base:pbsmrtpipe.tasks.dev_txt_to_fasta:0', 'pbsmrtpipe.tasks.dev_filter_fasta:0')]
+        b_b = [('pbsmrtpipe.pipelines.dev_base:pbsmrtpipe.tasks.dev_txt_to_fasta:0', 'pbsmrtpipe.tasks.dev_hello_garfield:0')]
+        b_c = [('pbsmrtpipe.pipelines.dev_a:pbsmrtpipe.tasks.dev_filter_fasta:0', 'pbsmrtpipe.tasks.dev_hello_worlder:0'),
+               ('pbsmrtpipe.pipelines.dev_b:pbsmrtpipe.tasks.dev_hello_garfield:0', 'pbsmrtpipe.tasks.dev_hello_worlder:0')]
+
+        # the composite pipeline is registered before the pipelines it references
+        for name, bs in [("dev_c", b_c), ("dev_a", b_a), ("dev_b", b_b), ("dev_base", b_base)]:
+            self.registry(name, name, "0.1.0")(_to_func(name, bs))
+
+    def test_register_is_lazy(self):
+        pipelines = self.registry.pipelines
+        self.assertEqual(len(pipelines), 4)
+        self.assertIn("pbsmrtpipe.pipelines.dev_c", pipelines)
+        self.assertEqual(sorted(p.display_name for p in pipelines.definitions().values()),
+                         ["dev_a", "dev_b", "dev_base", "dev_c"])
+        self.assertEqual(self.calls, [])
+
+    def test_resolve_is_memoized(self):
+        pipelines = self.registry.pipelines
+        p = pipelines["pbsmrtpipe.pipelines.dev_c"]
+        self.assertIs(pipelines["pbsmrtpipe.pipelines.dev_c"], p)
+        _ = pipelines.values()
+        # each bindings func is only called once
+        self.assertEqual(sorted(self.calls), ["dev_a", "dev_b", "dev_base", "dev_c"])
+
+    def test_composite_bindings_are_unique(self):
+        p = self.registry.pipelines["pbsmrtpipe.pipelines.dev_c"]
+        self.assertEqual(len(p.bindings), len(set(p.bindings)))
+        self.assertEqual(len(p.bindings), 5)
+        self.assertEqual(p.entry_bindings, [('$entry:e_01', 'pbsmrtpipe.tasks.dev_hello_world:0')])
+        self.assertEqual(sorted(p.parent_pipeline_ids),
+                         ["pbsmrtpipe.pipelines.dev_a", "pbsmrtpipe.pipelines.dev_b", "pbsmrtpipe.pipelines.dev_base"])
+
+    def test_cyclic_pipeline(self):
+        def _f():
+            return [('pbsmrtpipe.pipelines.dev_cycle:pbsmrtpipe.tasks.dev_hello_world:0', 'pbsmrtpipe.tasks.dev_hello_worlder:0')]
+        self.registry("dev_cycle", "dev_cycle", "0.1.0")(_f)
+        with self.assertRaises(MalformedPipelineError):
+            _ = self.registry.pipelines["pbsmrtpipe.pipelines.dev_cycle"]
@@ -8,7 +8,8 @@ import multiprocessing
 import warnings
 
 from pbsmrtpipe.engine import (ProcessPoolManager, EngineWorker,
-                               get_results_from_queue, backticks)
+                               get_results_from_queue, backticks,
+                               tail_file, _LineBuffer)
 from pbsmrtpipe.cluster_templates import CLUSTER_TEMPLATE_DIR
 from pbsmrtpipe.cluster import ClusterTemplateRender
 
@@ -32,6 +33,35 @@ class TestUtilFuncs(unittest.TestCase):
         self.assertEqual(err, "")
 
 
+class TestBoundedOutput(unittest.TestCase):
+
+    def test_tail_file(self):
+        f = tempfile.NamedTemporaryFile(suffix="-tail.txt", delete=False)
+        f.write("".join("line {i}\n".format(i=i) for i in xrange(1000)))
+        f.close()
+        # small blocks to force several backward reads
+        lines = tail_file(f.name, 3, block_size=16)
+        self.assertEqual(lines, ["line 997", "line 998", "line 999"])
+        self.assertEqual(len(tail_file(f.name, 5000)), 1000)
+        self.assertEqual(tail_file(f.name, 0), [])
+        os.remove(f.name)
+
+    def test_line_buffer(self):
+        written = []
+        buf = _LineBuffer(written.append, max_lines=2, max_line_length=8)
+        for chunk in ("a\nb", "b\nc", "cccccccccc", "\nd"):
+            buf.add(chunk)
+        buf.flush()
+        self.assertEqual(written, ["a", "bb", "ccccccccccc", "", "d"])
+        # only the tail is kept in memory
+        self.assertEqual(buf.to_list(), ["", "d"])
+
+    def test_backticks_max_lines(self):
+        rcode, out, err, run_time = backticks("seq 1 100", max_lines=10)
+        self.assertEqual(rcode, 0)
+        self.assertEqual(out, [str(i) for i in xrange(91, 101)])
+
+
 def _task_generator(max_tasks):
     def _to_tmp(suffix):
         t = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
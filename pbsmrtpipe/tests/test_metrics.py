@@ -0,0 +1,44 @@
+import logging
+import unittest
+import urllib2
+
+from pbsmrtpipe.metrics import MasterMetrics, MetricsServer
+
+from base import get_temp_file
+
+log = logging.getLogger(__name__)
+
+
+class TestMasterMetrics(unittest.TestCase):
+
+    def test_to_text(self):
+        m = MasterMetrics(1234)
+        m.update(tasks_running=3, nproc_used=12, nproc_max=None, loop_iteration_seconds=0.25)
+        text = m.text
+        self.assertIn('# TYPE pbsmrtpipe_tasks_running gauge', text)
+        self.assertIn('pbsmrtpipe_tasks_running{job_id="1234"} 3', text)
+        self.assertIn('pbsmrtpipe_nproc_max{job_id="1234"} NaN', text)
+        self.assertIn('pbsmrtpipe_loop_iteration_seconds{job_id="1234"} 0.25', text)
+
+    def test_unsupported_metric(self):
+        m = MasterMetrics(1234)
+        with self.assertRaises(KeyError):
+            m.update(bad_metric=1)
+
+    def test_write(self):
+        m = MasterMetrics(1234)
+        m.update(tasks_completed=7)
+        path = m.write(get_temp_file(suffix="-metrics.prom"))
+        with open(path, 'r') as f:
+            self.assertEqual(f.read(), m.text)
+
+    def test_server(self):
+        m = MasterMetrics(1234)
+        m.update(tasks_runnable=5)
+        server = MetricsServer(m, 0).start()
+        try:
+            url = "http://127.0.0.1:{p}/metrics".format(p=server.port)
+            text = urllib2.urlopen(url, timeout=10).read()
+            self.assertIn('pbsmrtpipe_tasks_runnable{job_id="1234"} 5', text)
+        finally:
+            server.shutdown()
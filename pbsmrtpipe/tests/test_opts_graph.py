@@ -1,6 +1,14 @@
 import logging
+import unittest
 
-from pbsmrtpipe.schema_opt_utils import to_opt_id
+import jsonschema
+
+from pbcommand.models import SymbolTypes
+
+from pbsmrtpipe.models import MetaTask
+from pbsmrtpipe.opts_graph import compile_di_plan, get_di_plan
+from pbsmrtpipe.schema_opt_utils import (to_opt_id, to_option_schema,
+                                          OptionValidator, is_valid)
 
 
 log = logging.getLogger(__name__)
@@ -12,3 +20,71 @@ _FILTER_OPTS_NAMES = 'filter_trim filter_artifact_score use_subreads ' \
                      'filter_whitelist filter_min_snr'.split()
 
 _FILTER_OPTS = [to_opt_id(s) for s in _FILTER_OPTS_NAMES]
+
+
+def _to_nproc(max_nproc, ropts):
+    return min(ropts["pbsmrtpipe.task_options.nproc"], max_nproc)
+
+
+def _to_cmd(*args):
+    return "echo hello"
+
+
+def _to_meta_task(nproc):
+    schema = {"properties": {"pbsmrtpipe.task_options.nproc": {"default": 3}}}
+    opts = {"pbsmrtpipe.task_options.nproc": schema}
+    return MetaTask("pbsmrtpipe.tasks.dev_di", True, [], [], opts, nproc, [],
+                    _to_cmd, [], [], "DI task", "DI task")
+
+
+class TestDIPlan(unittest.TestCase):
+
+    def test_compile(self):
+        mt = _to_meta_task([SymbolTypes.MAX_NPROC, SymbolTypes.RESOLVED_OPTS, _to_nproc])
+        plan = compile_di_plan(mt)
+        method_ids = [s.method_id for s in plan.steps]
+        self.assertEqual(sorted(method_ids), ["to_nproc", "to_ropts", "to_task_type"])
+        # $nproc depends on the resolved opts
+        self.assertTrue(method_ids.index("to_ropts") < method_ids.index("to_nproc"))
+        step = plan.steps[method_ids.index("to_nproc")]
+        self.assertIs(step.func, _to_nproc)
+        self.assertEqual(step.args, [(True, SymbolTypes.MAX_NPROC), (True, SymbolTypes.RESOLVED_OPTS)])
+        self.assertEqual(plan.report_dis, [])
+
+    def test_cached(self):
+        mt = _to_meta_task(SymbolTypes.MAX_NPROC)
+        self.assertIs(get_di_plan(mt), get_di_plan(mt))
+        self.assertIsNot(get_di_plan(mt), get_di_plan(_to_meta_task(SymbolTypes.MAX_NPROC)))
+
+
+class TestOptionValidator(unittest.TestCase):
+
+    OPT_ID = to_opt_id("dev_n")
+
+    def test_fast_path(self):
+        schema = to_option_schema(self.OPT_ID, ("integer", "null"), "N", "Desc", 1)
+        v = OptionValidator(schema)
+        self.assertIsNotNone(v.type_checks)
+        v.validate({self.OPT_ID: 3})
+        v.validate({self.OPT_ID: None})
+        for x in ("3", 3.5, True):
+            self.assertFalse(is_valid(schema, {self.OPT_ID: x}))
+            with self.assertRaises(jsonschema.ValidationError):
+                v.validate({self.OPT_ID: x})
+
+    def test_full_schema(self):
+        schema = to_option_schema(self.OPT_ID, "integer", "N", "Desc", 1)
+        schema['properties'][self.OPT_ID]['minimum'] = 1
+        v = OptionValidator(schema)
+        self.assertIsNone(v.type_checks)
+        self.assertTrue(v.is_valid({self.OPT_ID: 2}))
+        self.assertFalse(v.is_valid({self.OPT_ID: 0}))
+
+    def test_meta_task_validator(self):
+        schema = to_option_schema(self.OPT_ID, "integer", "N", "Desc", 1)
+        mt = MetaTask("pbsmrtpipe.tasks.dev_di", True, [], [], {self.OPT_ID: schema}, 1, [],
+                      _to_cmd, [], [], "DI task", "DI task")
+        v = mt.get_option_validator(self.OPT_ID)
+        # compiled once per (task id, option id)
+        self.assertIs(v, mt.get_option_validator(self.OPT_ID))
+        self.assertTrue(v.is_valid({self.OPT_ID: 2}))
@@ -1,12 +1,17 @@
+import glob
 import logging
 import os
 import unittest
 
-from base import TEST_DATA_DIR, get_temp_file
+import jsonschema
+
+from base import TEST_DIR, TEST_DATA_DIR, get_temp_file
 
 import pbsmrtpipe.loader
 import pbsmrtpipe.pb_io as IO
 from pbcommand.models import PipelineChunk
+from pbsmrtpipe.models import MetaTask
+from pbsmrtpipe.schema_opt_utils import to_opt_id, to_option_schema
 
 REGISTERED_TASKS, REGISTERED_FILE_TYPES, REGISTERED_CHUNK_OPERATORS, REGISTERED_PIPELINES = pbsmrtpipe.loader.load_all()
 
@@ -77,6 +82,50 @@ class TestWriteSchemaOptsToXML(unittest.TestCase):
         self.assertTrue(len(workflow_level_opts), len(self._to_opts()))
 
 
+_INVALID_PRESET_XML = """<?xml version="1.0" ?>
+<pipeline-template-preset id="InvalidPreset">
+    <options>
+        <option id="pbsmrtpipe.options.chunk_mode">
+            <value>maybe</value>
+        </option>
+    </options>
+    <task-options />
+</pipeline-template-preset>
+"""
+
+TESTKIT_DATA_DIR = os.path.join(TEST_DIR, '..', '..', 'testkit-data')
+
+
+class TestValidateRawOptions(unittest.TestCase):
+
+    OPT_ID = to_opt_id("dev_flag")
+
+    def test_invalid_workflow_option(self):
+        preset_xml = get_temp_file(suffix="_preset.xml")
+        with open(preset_xml, 'w') as f:
+            f.write(_INVALID_PRESET_XML)
+        with self.assertRaises(jsonschema.ValidationError):
+            IO.parse_pipeline_preset_xml(preset_xml)
+
+    def test_invalid_task_option(self):
+        schema = to_option_schema(self.OPT_ID, "boolean", "Flag", "Desc", False)
+        mt = MetaTask("pbsmrtpipe.tasks.dev_flag", False, [], [], {self.OPT_ID: schema}, 1, [],
+                      None, [], [], "Flag task", "Flag task")
+        rtasks = {mt.task_id: mt}
+        self.assertEqual(IO.validate_raw_task_options(rtasks, {self.OPT_ID: "true"}), {self.OPT_ID: True})
+        with self.assertRaises(jsonschema.ValidationError):
+            IO.validate_raw_task_options(rtasks, {self.OPT_ID: "maybe"})
+
+    @unittest.skipUnless(os.path.isdir(TESTKIT_DATA_DIR), "Unable to find testkit-data")
+    def test_testkit_data_presets(self):
+        preset_xmls = glob.glob(os.path.join(TESTKIT_DATA_DIR, "*", "preset*.xml"))
+        self.assertTrue(preset_xmls)
+        for preset_xml in preset_xmls:
+            preset_record = IO.parse_pipeline_preset_xml(preset_xml)
+            self.assertIsInstance(preset_record.to_workflow_level_opt(), IO.WorkflowLevelOptions)
+            IO.validate_raw_task_options(REGISTERED_TASKS, dict(preset_record.task_options))
+
+
 class TestBindingParsing(unittest.TestCase):
     FILE_NAME = 'hello_world_workflow.xml'
     NBINDINGS = 3
@@ -0,0 +1,135 @@
+"""Test the extras/qsw.py qsub -sync wrapper with a fake qsub/qstat pair"""
+import os
+import imp
+import sys
+import stat
+import time
+import shutil
+import logging
+import tempfile
+import unittest
+import subprocess
+
+log = logging.getLogger(__name__)
+
+QSW_PY = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "extras", "qsw.py"))
+
+# The fake qsub runs the job script in the background and prints a PBS style
+# job id. The job is 'running' until the {job id}.done file is written.
+_FAKE_QSUB = """#!{python}
+import os
+import sys
+import fcntl
+import subprocess
+d = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(d, "qsub.lock"), "a") as f:
+    fcntl.flock(f, fcntl.LOCK_EX)
+    p = os.path.join(d, "next_id")
+    job_id = int(open(p).read()) + 1 if os.path.exists(p) else 1
+    with open(p, "w") as w:
+        w.write(str(job_id))
+done = os.path.join(d, "jobs", "{{i}}.done".format(i=job_id))
+open(os.path.join(d, "jobs", str(job_id)), "w").close()
+devnull = open(os.devnull, "w")
+subprocess.Popen("/bin/bash {{s}}; touch {{d}}".format(s=sys.argv[-1], d=done), shell=True,
+                 stdout=devnull, stderr=devnull, close_fds=True)
+print "{{i}}.fakehost".format(i=job_id)
+"""
+
+# The fake qstat records every call and lists all the running jobs
+_FAKE_QSTAT = """#!{python}
+import os
+d = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(d, "qstat.calls"), "a") as f:
+    f.write("call\\n")
+print "Job ID                    Name             User            Time Use S Queue"
+print "------------------------- ---------------- --------------- -------- - -----"
+jobs_dir = os.path.join(d, "jobs")
+for x in sorted(os.listdir(jobs_dir)):
+    if not x.endswith(".done") and not os.path.exists(os.path.join(jobs_dir, x + ".done")):
+        print "{{i}}.fakehost           job              user            00:00:00 R batch".format(i=x)
+"""
+
+
+def _load_qsw():
+    return imp.load_source("qsw", QSW_PY)
+
+
+def _write_exe(path, s):
+    with open(path, 'w') as f:
+        f.write(s.format(python=sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+@unittest.skipIf(not os.path.exists(QSW_PY), "Unable to find {p}".format(p=QSW_PY))
+class TestParseQstat(unittest.TestCase):
+
+    def test_parse(self):
+        qsw = _load_qsw()
+        out = "\n".join(["Job ID                    Name             User            Time Use S Queue",
+                         "------------------------- ---------------- --------------- -------- - -----",
+                         "38976.localhost           job-a            user            00:00:00 R batch",
+                         "38977.localhost           job-b            user                   0 Q batch",
+                         "38978.localhost           job-c            user            00:01:00 C batch"])
+        states = qsw.parseQstatOutput(out)
+        self.assertEqual(states, {38976: "R", 38977: "Q", 38978: "C"})
+        snapshot = qsw.QstatSnapshot(time.time(), 0, states)
+        self.assertFalse(snapshot.isJobCompleted(38976))
+        self.assertTrue(snapshot.isJobCompleted(38978))
+        self.assertTrue(snapshot.isJobCompleted(1))
+
+
+@unittest.skipIf(not os.path.exists(QSW_PY), "Unable to find {p}".format(p=QSW_PY))
+class TestQswWithFakeScheduler(unittest.TestCase):
+
+    NJOBS = 8
+    POLLING_INTERVAL = 1
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp(suffix="-qsw")
+        self.bin_dir = os.path.join(self.root_dir, "bin")
+        os.mkdir(self.bin_dir)
+        os.mkdir(os.path.join(self.bin_dir, "jobs"))
+        _write_exe(os.path.join(self.bin_dir, "qsub"), _FAKE_QSUB)
+        _write_exe(os.path.join(self.bin_dir, "qstat"), _FAKE_QSTAT)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+    def _to_env(self):
+        env = dict(os.environ)
+        env["PATH"] = os.pathsep.join([self.bin_dir, env.get("PATH", "")])
+        env["QSW_POLLING_INTERVAL"] = str(self.POLLING_INTERVAL)
+        env["QSW_QSTAT_SNAPSHOT"] = os.path.join(self.root_dir, "qstat-snapshot.json")
+        return env
+
+    def _nqstat_calls(self):
+        with open(os.path.join(self.bin_dir, "qstat.calls")) as f:
+            return len(f.readlines())
+
+    def test_shared_qstat_snapshot(self):
+        env = self._to_env()
+        processes = []
+        for i in xrange(self.NJOBS):
+            script = os.path.join(self.root_dir, "job-{i}.sh".format(i=i))
+            with open(script, 'w') as f:
+                # the last job fails to test the exit code file decoding
+                f.write("sleep 3\nexit {r}\n".format(r=3 if i == self.NJOBS - 1 else 0))
+            stdout = open(os.path.join(self.root_dir, "qsw-{i}.out".format(i=i)), 'w')
+            processes.append(subprocess.Popen([sys.executable, QSW_PY, script, "-PBS"],
+                                              env=env, stdout=stdout, stderr=subprocess.STDOUT))
+
+        started_at = time.time()
+        rcodes = [p.wait() for p in processes]
+        run_time = time.time() - started_at
+
+        self.assertEqual(rcodes, [0] * (self.NJOBS - 1) + [3])
+        # qsw must block until the jobs are completed
+        self.assertTrue(run_time >= 3)
+        # a single process refreshes the snapshot per interval. Polling
+        # qstat per job would be ~ NJOBS * run_time / interval calls
+        nmax = int(run_time / self.POLLING_INTERVAL) + 3
+        n = self._nqstat_calls()
+        log.info("qstat was called {n} times in {s:.1f} sec".format(n=n, s=run_time))
+        self.assertTrue(n <= nmax, "qstat was called {n} times. Expected <= {m}".format(n=n, m=nmax))
@@ -0,0 +1,72 @@
+import os
+import json
+import uuid
+import shutil
+import logging
+import tempfile
+import unittest
+
+from pbcommand.models import FileTypes
+
+from pbsmrtpipe.exceptions import PipelineRuntimeError
+from pbsmrtpipe.registrar import BackgroundRegistrar, get_or_create_uuid_from_file
+
+log = logging.getLogger(__name__)
+
+_DATASET_XML = """<?xml version="1.0" encoding="utf-8"?>
+<pbds:SubreadSet xmlns:pbds="http://pacificbiosciences.com/PacBioDatasets.xsd" UniqueId="{u}" Version="3.0.1">
+<pbds:ExternalResources>
+"""
+
+
+class TestGetOrCreateUuid(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp(suffix="-registrar")
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+    def _write(self, name, s):
+        path = os.path.join(self.root_dir, name)
+        with open(path, 'w') as f:
+            f.write(s)
+        return path
+
+    def test_dataset(self):
+        u = str(uuid.uuid4())
+        # only the root element is parsed. The rest of the XML is truncated
+        path = self._write("file.subreadset.xml", _DATASET_XML.format(u=u))
+        self.assertEqual(get_or_create_uuid_from_file(FileTypes.DS_SUBREADS, path), u)
+
+    def test_report(self):
+        u = str(uuid.uuid4())
+        d = dict(id="report", uuid=u, attributes=[], tables=[], plotGroups=[])
+        path = self._write("report.json", json.dumps(d))
+        self.assertEqual(get_or_create_uuid_from_file(FileTypes.REPORT, path), u)
+
+    def test_other_file_types_are_not_read(self):
+        path = os.path.join(self.root_dir, "does-not-exist.fasta")
+        self.assertIsInstance(get_or_create_uuid_from_file(FileTypes.FASTA, path), uuid.UUID)
+
+
+class TestBackgroundRegistrar(unittest.TestCase):
+
+    def test_submit(self):
+        results = []
+        r = BackgroundRegistrar().start()
+        for i in xrange(10):
+            r.submit(results.append, i)
+        r.shutdown()
+        self.assertEqual(results, range(10))
+        self.assertEqual(r.npending, 0)
+        r.raise_if_failed()
+
+    def test_errors(self):
+        def _fail(x):
+            raise ValueError(x)
+        r = BackgroundRegistrar().start()
+        r.submit(_fail, 1)
+        r.shutdown()
+        with self.assertRaises(PipelineRuntimeError):
+            r.raise_if_failed()
@@ -0,0 +1,99 @@
+import logging
+import unittest
+
+from pbsmrtpipe.models import WorkflowLevelOptions
+from pbsmrtpipe.cluster import load_cluster_templates, parse_named_cluster_templates
+from pbsmrtpipe.routing import (LocalRoutingPolicy, ClusterTemplateRouter,
+                                parse_run_time_hints, parse_cluster_routing_rules)
+from pbsmrtpipe.run_time_model import DurationModel
+
+log = logging.getLogger(__name__)
+
+
+class TestParseRunTimeHints(unittest.TestCase):
+
+    def test_parse(self):
+        hints = parse_run_time_hints("pbsmrtpipe.tasks.a=3, pbsmrtpipe.tasks.b=10.5,")
+        self.assertEqual(hints, {"pbsmrtpipe.tasks.a": 3.0, "pbsmrtpipe.tasks.b": 10.5})
+        self.assertEqual(parse_run_time_hints(None), {})
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_run_time_hints("pbsmrtpipe.tasks.a:3")
+
+
+class TestLocalRoutingPolicy(unittest.TestCase):
+
+    def _to_policy(self):
+        model = DurationModel({"a": 5.0, "b": 600.0}, {"c": 40.0})
+        return LocalRoutingPolicy(30.0, 4, duration_model=model, run_time_hints={"b": 2.0})
+
+    def test_route(self):
+        p = self._to_policy()
+        self.assertTrue(p.route("a-0", "a", 1, 0).run_local)
+        # the hint overrides the history
+        self.assertTrue(p.route("b-0", "b", 1, 0).run_local)
+        # 40 sec split over 4 chunks
+        self.assertTrue(p.route("c-1", "c", 1, 0, nchunks=4).run_local)
+        self.assertFalse(p.route("c-0", "c", 1, 0).run_local)
+        self.assertFalse(p.route("x-0", "x", 1, 0).run_local)
+
+    def test_no_free_local_slots(self):
+        d = self._to_policy().route("a-0", "a", 2, 3)
+        self.assertFalse(d.run_local)
+        self.assertEqual(d.predicted_run_time, 5.0)
+
+    def test_disabled_by_default(self):
+        p = LocalRoutingPolicy.from_workflow_options(WorkflowLevelOptions.from_defaults(), 8)
+        self.assertFalse(p.is_enabled)
+        self.assertFalse(p.route("a-0", "a", 1, 0).run_local)
+
+
+class TestClusterRoutingRules(unittest.TestCase):
+
+    RULES = "short: run_time<600; highmem: memory>=64000; long: task=pbsmrtpipe.tasks.*_long*, nproc>=8"
+
+    def test_parse(self):
+        rules = parse_cluster_routing_rules(self.RULES)
+        self.assertEqual([r.name for r in rules], ["short", "highmem", "long"])
+        self.assertEqual(rules[0].conditions, [("run_time", "<", 600.0)])
+        self.assertEqual(rules[2].conditions, [("task", "=", "pbsmrtpipe.tasks.*_long*"), ("nproc", ">=", 8.0)])
+        self.assertTrue(rules[0].uses_run_time)
+        self.assertFalse(rules[1].uses_run_time)
+
+    def test_invalid(self):
+        for s in ("short run_time<600", "short: walltime<600", "short: task<abc", "short: nproc>=x", "short: "):
+            with self.assertRaises(ValueError):
+                parse_cluster_routing_rules(s)
+
+    def test_route(self):
+        renderers = {k: None for k in ("default", "short", "highmem", "long")}
+        router = ClusterTemplateRouter(renderers, rules=parse_cluster_routing_rules(self.RULES),
+                                       memory_hints={"pbsmrtpipe.tasks.b": 128000.0})
+
+        def _to_name(task_id, meta_task_id, nproc, run_time=None):
+            return router.route(task_id, meta_task_id, nproc, run_time=run_time).name
+
+        self.assertEqual(_to_name("pbsmrtpipe.tasks.a-0", "pbsmrtpipe.tasks.a", 1, run_time=10.0), "short")
+        self.assertEqual(_to_name("pbsmrtpipe.tasks.b-0", "pbsmrtpipe.tasks.b", 1, run_time=6000.0), "highmem")
+        self.assertEqual(_to_name("pbsmrtpipe.tasks.x_long-0", "pbsmrtpipe.tasks.x_long", 16), "long")
+        # unknown run time and too few nproc
+        self.assertEqual(_to_name("pbsmrtpipe.tasks.x_long-0", "pbsmrtpipe.tasks.x_long", 4), "default")
+
+    def test_unknown_template(self):
+        with self.assertRaises(ValueError):
+            ClusterTemplateRouter({"default": None}, rules=parse_cluster_routing_rules("short: nproc<2"))
+
+    def test_from_workflow_options(self):
+        wopts = WorkflowLevelOptions.from_defaults()
+        wopts.cluster_templates = "short=pbsmrtpipe.cluster_templates.sge, long=pbsmrtpipe.cluster_templates.pbs"
+        wopts.cluster_routing_rules = "short: nproc<=1"
+        default = load_cluster_templates("pbsmrtpipe.cluster_templates.slurm")
+        router = ClusterTemplateRouter.from_workflow_options(wopts, default)
+        self.assertEqual(sorted(router.cluster_renderers.keys()), ["default", "long", "short"])
+        self.assertEqual(router.route("a-0", "a", 1).name, "short")
+        self.assertIs(router.to_cluster_renderer(router.route("a-0", "a", 4).name), default)
+
+    def test_reserved_name(self):
+        with self.assertRaises(ValueError):
+            parse_named_cluster_templates("default=pbsmrtpipe.cluster_templates.sge")
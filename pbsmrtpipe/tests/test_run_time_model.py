@@ -0,0 +1,25 @@
+import logging
+import unittest
+
+from pbsmrtpipe.run_time_model import DurationModel
+
+log = logging.getLogger(__name__)
+
+
+class TestDurationModel(unittest.TestCase):
+
+    def test_chunked_run_time(self):
+        m = DurationModel({"a": 100.0}, {"b": 400.0}, default_run_time=10.0)
+        self.assertEqual(m.to_run_time("a"), 100.0)
+        self.assertEqual(m.to_run_time("a", nchunks=4), 25.0)
+        self.assertEqual(m.to_run_time("b", nchunks=4), 100.0)
+        self.assertEqual(m.to_run_time("x"), 10.0)
+
+    def test_from_workflow_graph_dict(self):
+        nodes = [dict(klass="TaskBindingNode", node_id="a", state="successful", run_time=10.0),
+                 dict(klass="TaskChunkedBindingNode", node_id="b", state="successful", run_time=3.0),
+                 dict(klass="TaskChunkedBindingNode", node_id="b", state="successful", run_time=5.0),
+                 dict(klass="BindingInFileNode", node_id="a")]
+        m = DurationModel.from_workflow_graph_dict(dict(nodes=nodes))
+        self.assertEqual(m.run_times, {"a": 10.0})
+        self.assertEqual(m.chunked_run_times, {"b": 8.0})
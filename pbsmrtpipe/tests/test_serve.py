@@ -0,0 +1,164 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+import unittest
+import multiprocessing
+
+from pbsmrtpipe.engine import TaskManifestWorker
+from pbsmrtpipe.serve import (JobServer, JobStates, to_unix_server,
+                              send_request, submit_job, add_job_log_handlers,
+                              remove_job_log_handlers)
+
+log = logging.getLogger(__name__)
+
+
+def _run_job(job_server, job):
+    # records of the job thread are written to the job logs
+    log.info("Running job {i}".format(i=job.job_id))
+    time.sleep(0.1)
+    return 0 if job.pipeline_id.endswith("dev_a") else 1
+
+
+def _run_manifest(manifest_path):
+    log.info("Running manifest {p}".format(p=manifest_path))
+    return "successful", "", 0.0
+
+
+def _run_worker_job(job_server, job):
+    # fork the workers (while the other jobs are logging) as the driver does
+    manifest_path = os.path.join(job.output_dir, "runnable-task.json")
+    with open(manifest_path, 'w') as f:
+        f.write("{}")
+    for i in xrange(5):
+        q_out = multiprocessing.Queue()
+        w = TaskManifestWorker(q_out, multiprocessing.Event(), 0.1, _run_manifest, "task-{i}".format(i=i), manifest_path)
+        w.start()
+        try:
+            result = q_out.get(timeout=10)
+        finally:
+            w.join(10)
+            if w.is_alive():
+                w.terminate()
+        if result.state != "successful":
+            return 1
+    return 0
+
+
+class _SlowHandler(logging.Handler):
+
+    """Holds the handler lock for most of the time"""
+
+    def emit(self, record):
+        time.sleep(0.01)
+
+
+class TestJobServer(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.DEBUG)
+        self.root_dir = tempfile.mkdtemp(suffix="-serve")
+        self.socket_path = os.path.join(self.root_dir, "serve.sock")
+        self.entry_point = os.path.join(self.root_dir, "e-01.txt")
+        with open(self.entry_point, 'w') as f:
+            f.write("Mock data\n")
+
+        pipelines = {"pbsmrtpipe.pipelines.dev_a": None, "pbsmrtpipe.pipelines.dev_b": None}
+        self.job_server = JobServer(({}, {}, {}, pipelines), total_max_nproc=4, max_jobs=2, run_job_func=_run_job).start()
+        self.server = to_unix_server(self.socket_path, self.job_server)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        send_request(self.socket_path, dict(command="shutdown"))
+        self.thread.join(10)
+        self.server.server_close()
+        self.job_server.shutdown()
+
+    def _wait_for_job(self, job_id):
+        for _ in xrange(100):
+            job = send_request(self.socket_path, dict(command="status", job_id=job_id))['job']
+            if job['state'] not in JobStates.ACTIVE_STATES():
+                return job
+            time.sleep(0.1)
+        raise AssertionError("Job {i} was not completed".format(i=job_id))
+
+    def test_submit_jobs(self):
+        output_dirs = [os.path.join(self.root_dir, x) for x in ("job-a", "job-b")]
+        job_ids = []
+        for pipeline_id, output_dir in zip(["pbsmrtpipe.pipelines.dev_a", "pbsmrtpipe.pipelines.dev_b"], output_dirs):
+            r = submit_job(self.socket_path, pipeline_id, {"e_01": self.entry_point}, output_dir)
+            self.assertEqual(r['status'], "ok")
+            job_ids.append(r['job']['job_id'])
+
+        states = [self._wait_for_job(i)['state'] for i in job_ids]
+        self.assertEqual(states, [JobStates.SUCCESSFUL, JobStates.FAILED])
+
+        # each job only logs its own records
+        for job_id, output_dir in zip(job_ids, output_dirs):
+            with open(os.path.join(output_dir, "logs", "master.log")) as f:
+                s = f.read()
+            self.assertIn("Running job {i}".format(i=job_id), s)
+            self.assertEqual(s.count("Running job"), 1)
+
+        r = send_request(self.socket_path, dict(command="jobs"))
+        self.assertEqual(len(r['jobs']), 2)
+        self.assertEqual(r['nproc_max'], 4)
+
+    def test_invalid_submit(self):
+        r = submit_job(self.socket_path, "pbsmrtpipe.pipelines.dev_missing", {"e_01": self.entry_point}, self.root_dir)
+        self.assertEqual(r['status'], "error")
+        r = submit_job(self.socket_path, "pbsmrtpipe.pipelines.dev_a", {"e_01": "/path/to/missing.txt"}, self.root_dir)
+        self.assertEqual(r['status'], "error")
+
+
+class TestJobServerWorkers(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.DEBUG)
+        self.root_dir = tempfile.mkdtemp(suffix="-serve")
+        self.entry_point = os.path.join(self.root_dir, "e-01.txt")
+        with open(self.entry_point, 'w') as f:
+            f.write("Mock data\n")
+        self.handler = _SlowHandler()
+        logging.getLogger().addHandler(self.handler)
+        pipelines = {"pbsmrtpipe.pipelines.dev_a": None}
+        self.job_server = JobServer(({}, {}, {}, pipelines), total_max_nproc=4, max_jobs=3, run_job_func=_run_worker_job).start()
+
+    def tearDown(self):
+        logging.getLogger().removeHandler(self.handler)
+        self.job_server.shutdown(10)
+
+    def _run_jobs(self, func):
+        """Run jobs that fork workers while func is called in a loop in another thread"""
+        jobs = [self.job_server.submit("pbsmrtpipe.pipelines.dev_a", {"e_01": self.entry_point},
+                                       os.path.join(self.root_dir, "job-{i}".format(i=i))) for i in xrange(3)]
+        is_done = threading.Event()
+
+        def _run():
+            while not is_done.is_set():
+                func()
+
+        t = threading.Thread(target=_run)
+        t.daemon = True
+        t.start()
+        try:
+            for _ in xrange(300):
+                if not any(job.is_active for job in jobs):
+                    break
+                time.sleep(0.1)
+        finally:
+            is_done.set()
+            t.join(10)
+        self.assertFalse(t.is_alive())
+        self.assertEqual([job.state for job in jobs], [JobStates.SUCCESSFUL] * 3)
+
+    def test_concurrent_jobs_fork_workers(self):
+        # log concurrently with the forks of the workers
+        self._run_jobs(lambda: log.debug("Logging from another thread"))
+
+    def test_close_job_handlers_while_forking(self):
+        # a job completes (and closes its log handlers) while the other jobs fork workers
+        output_dir = os.path.join(self.root_dir, "job-closed")
+        self._run_jobs(lambda: remove_job_log_handlers(add_job_log_handlers(output_dir, "job-closed")))
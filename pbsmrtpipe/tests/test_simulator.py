@@ -0,0 +1,63 @@
+import logging
+import unittest
+import multiprocessing
+
+import pbsmrtpipe.loader as L
+import pbsmrtpipe.constants as GlobalConstants
+import pbsmrtpipe.graph.bgraph as B
+from pbsmrtpipe.models import WorkflowLevelOptions
+from pbsmrtpipe.driver import _get_valid_chunk_operators, _resolve_nproc_and_nchunks
+from pbsmrtpipe.run_time_model import DurationModel
+from pbsmrtpipe.simulator import (SimulatedTask, SimulationResult,
+                                  simulate_workflow, to_simulated_entry_points)
+
+log = logging.getLogger(__name__)
+
+
+class TestSimulationResult(unittest.TestCase):
+
+    def test_peaks_and_utilization(self):
+        tasks = [SimulatedTask("a", 1, 2, 0.0, 10.0),
+                 SimulatedTask("b", 1, 2, 0.0, 5.0),
+                 SimulatedTask("c", 1, 4, 5.0, 10.0)]
+        r = SimulationResult(tasks, 8, 10)
+        self.assertEqual(r.makespan, 10.0)
+        self.assertEqual(r.peak_nworkers, 2)
+        self.assertEqual(r.peak_nproc, 6)
+        self.assertAlmostEqual(r.utilization, 50.0 / 80.0)
+
+
+class TestSimulateDevPipeline(unittest.TestCase):
+
+    PIPELINE_ID = "pbsmrtpipe.pipelines.dev_local_chunk"
+
+    def _simulate(self, chunk_mode, nchunks):
+        rtasks, _, chunk_operators, pipelines = L.load_all()
+        bg = B.binding_strs_to_binding_graph(rtasks, pipelines[self.PIPELINE_ID].all_bindings)
+        wopts = WorkflowLevelOptions.from_defaults()
+        wopts.chunk_mode = chunk_mode
+        operators_d = _get_valid_chunk_operators(bg, chunk_mode, chunk_operators, rtasks)
+        return simulate_workflow(bg, to_simulated_entry_points(bg), operators_d, rtasks,
+                                 wopts, DurationModel(default_run_time=10.0), nchunks=nchunks)
+
+    def test_unchunked(self):
+        r = self._simulate(False, None)
+        self.assertTrue(r.makespan > 0)
+        self.assertTrue(all(t.run_time == 10.0 for t in r.tasks))
+
+    def test_chunked(self):
+        r = self._simulate(True, 4)
+        self.assertTrue(r.peak_nworkers >= 4)
+
+
+class TestResolveNproc(unittest.TestCase):
+
+    def test_local_mode(self):
+        wopts = WorkflowLevelOptions.from_defaults()
+        wopts.distributed_mode = False
+        wopts.total_max_nproc = None
+        wopts.max_nchunks = GlobalConstants.MAX_NCHUNKS + 1
+        wopts = _resolve_nproc_and_nchunks(wopts)
+        self.assertEqual(wopts.total_max_nproc, multiprocessing.cpu_count())
+        self.assertTrue(wopts.max_nproc <= wopts.total_max_nproc)
+        self.assertEqual(wopts.max_nchunks, GlobalConstants.MAX_NCHUNKS)
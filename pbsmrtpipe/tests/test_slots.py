@@ -0,0 +1,103 @@
+import os
+import json
+import socket
+import tempfile
+import subprocess
+import unittest
+import logging
+
+from pbsmrtpipe.slots import SlotPool, HostSlotBroker, SlotPools
+
+log = logging.getLogger(__name__)
+
+
+class TestSlotPool(unittest.TestCase):
+
+    def test_acquire_and_release(self):
+        p = SlotPool(4)
+        self.assertTrue(p.try_acquire("job-a", "t-0", 3))
+        self.assertFalse(p.try_acquire("job-b", "t-0", 2))
+        self.assertTrue(p.try_acquire("job-b", "t-1", 1))
+        self.assertEqual(p.nproc_used, 4)
+        self.assertEqual(p.release("job-a", "t-0"), 3)
+        self.assertTrue(p.try_acquire("job-b", "t-0", 2))
+        self.assertEqual(p.release_all("job-b"), 3)
+        self.assertEqual(p.nproc_used, 0)
+
+    def test_task_larger_than_pool(self):
+        p = SlotPool(2)
+        self.assertTrue(p.try_acquire("job-a", "t-0", 8))
+        self.assertFalse(p.try_acquire("job-a", "t-1", 1))
+
+    def test_unbounded(self):
+        p = SlotPool()
+        self.assertTrue(all(p.try_acquire("job-a", str(i), 100) for i in xrange(10)))
+
+
+class TestHostSlotBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(suffix="-slots"), "slots.json")
+
+    def test_shared_between_brokers(self):
+        a = HostSlotBroker(self.path, 4, max_memory=1000)
+        b = HostSlotBroker(self.path, 4, max_memory=1000)
+        self.assertTrue(a.try_acquire("job-a", "t-0", 3, memory=500))
+        self.assertFalse(b.try_acquire("job-b", "t-0", 2))
+        self.assertFalse(b.try_acquire("job-b", "t-1", 1, memory=600))
+        self.assertTrue(b.try_acquire("job-b", "t-1", 1, memory=500))
+        self.assertEqual(b.nproc_used, 4)
+        self.assertEqual(a.release_all("job-a"), 3)
+        self.assertEqual(b.release("job-b", "t-1"), 1)
+        self.assertEqual(a.get_leases(), [])
+
+    def test_reclaim_stale_leases(self):
+        p = subprocess.Popen(["true"])
+        p.wait()
+        lease = dict(host=socket.gethostname(), pid=p.pid, owner_id="job-crashed", task_id="t-0",
+                     nproc=4, memory=0, acquired_at=0.0)
+        with open(self.path, 'w') as f:
+            f.write(json.dumps(dict(leases=[lease])))
+        broker = HostSlotBroker(self.path, 4)
+        self.assertTrue(broker.try_acquire("job-a", "t-0", 4))
+        self.assertEqual([x['owner_id'] for x in broker.get_leases()], ["job-a"])
+
+    def test_reclaim_reused_pid(self):
+        # a lease of a crashed master whose pid was reused by this process
+        lease = dict(host=socket.gethostname(), pid=os.getpid(), pid_started_at=-1, owner_id="job-crashed",
+                     task_id="t-0", nproc=4, memory=0, acquired_at=0.0)
+        with open(self.path, 'w') as f:
+            f.write(json.dumps(dict(leases=[lease])))
+        broker = HostSlotBroker(self.path, 4)
+        self.assertEqual(broker.get_leases(), [])
+        self.assertTrue(broker.try_acquire("job-a", "t-0", 4))
+        self.assertEqual([x['owner_id'] for x in broker.get_leases()], ["job-a"])
+
+    def test_get_leases_is_read_only(self):
+        broker = HostSlotBroker(self.path, 4)
+        self.assertEqual(broker.get_leases(), [])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_state_file_mode(self):
+        umask = os.umask(0o022)
+        try:
+            broker = HostSlotBroker(self.path, 4)
+        finally:
+            os.umask(umask)
+        self.assertTrue(broker.try_acquire("job-a", "t-0", 1))
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o644)
+
+    def test_unreadable_state(self):
+        os.mkdir(self.path)
+        broker = HostSlotBroker(self.path, 4)
+        self.assertEqual(broker.get_leases(), [])
+
+    def test_slot_pools(self):
+        pool = SlotPool(8)
+        pools = SlotPools([pool, HostSlotBroker(self.path, 2)])
+        self.assertTrue(pools.try_acquire("job-a", "t-0", 2))
+        # the broker is full, so the slots of the pool are released
+        self.assertFalse(pools.try_acquire("job-a", "t-1", 2))
+        self.assertEqual(pool.nproc_used, 2)
+        self.assertEqual(pools.release_all("job-a"), 2)
+        self.assertEqual(pool.nproc_used, 0)
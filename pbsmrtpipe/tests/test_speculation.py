@@ -0,0 +1,56 @@
+import logging
+import unittest
+
+from pbsmrtpipe.speculation import (SpeculationPolicy, SpeculativeTasks,
+                                    to_speculative_task_id)
+
+log = logging.getLogger(__name__)
+
+
+class TestSpeculationPolicy(unittest.TestCase):
+
+    def test_is_straggler(self):
+        p = SpeculationPolicy(2.0, min_run_time=10.0)
+        siblings = [100.0, 110.0, 120.0]
+        self.assertTrue(p.is_straggler(250.0, siblings))
+        self.assertFalse(p.is_straggler(200.0, siblings))
+        # not enough completed siblings
+        self.assertFalse(p.is_straggler(1000.0, [100.0]))
+        # short chunks are never stragglers
+        self.assertFalse(p.is_straggler(9.0, [1.0, 1.0]))
+
+    def test_disabled(self):
+        p = SpeculationPolicy(None)
+        self.assertFalse(p.is_enabled)
+        self.assertFalse(p.is_straggler(1000.0, [1.0, 1.0, 1.0]))
+
+
+class TestSpeculativeTasks(unittest.TestCase):
+
+    def test_speculative_copy_wins(self):
+        s = SpeculativeTasks()
+        copy_id = s.add("a-0")
+        self.assertEqual(copy_id, to_speculative_task_id("a-0"))
+        self.assertTrue(s.has_copy("a-0"))
+        with self.assertRaises(ValueError):
+            s.add("a-0")
+
+        r = s.complete(copy_id, True)
+        self.assertTrue(r.is_final)
+        self.assertEqual(r.task_id, "a-0")
+        self.assertEqual(r.discarded, ["a-0"])
+        self.assertFalse(s.is_running_copy("a-0"))
+        # only one speculative copy per task
+        self.assertTrue(s.has_copy("a-0"))
+
+    def test_failed_copy_is_discarded(self):
+        s = SpeculativeTasks()
+        copy_id = s.add("a-0")
+        r = s.complete("a-0", False)
+        self.assertFalse(r.is_final)
+        self.assertEqual(r.discarded, ["a-0"])
+
+        # the last running copy fails the task
+        r = s.complete(copy_id, False)
+        self.assertTrue(r.is_final)
+        self.assertEqual(r.discarded, [])
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+import logging
+
+from pbsmrtpipe.models import Task, ScatterTask, SpilledTask, spill_task
+from pbsmrtpipe.constants import TASK_JSON
+
+log = logging.getLogger(__name__)
+
+
+class TestSpillTask(unittest.TestCase):
+
+    def setUp(self):
+        self.task_dir = tempfile.mkdtemp(suffix="-spill")
+        output_files = [os.path.join(self.task_dir, "file.txt")]
+        self.task = Task("pbsmrtpipe.tasks.dev_hello_world-0", False, ["/path/to/input.txt"], output_files,
+                         {"pbsmrtpipe.task_options.alpha": 1}, 3, ["$tmpfile"], ["echo hello"], self.task_dir)
+
+    def test_spill_task(self):
+        t = spill_task(self.task)
+        self.assertIsInstance(t, SpilledTask)
+        self.assertTrue(os.path.exists(os.path.join(self.task_dir, TASK_JSON)))
+        self.assertEqual(t.task_id, self.task.task_id)
+        self.assertEqual(t.nproc, 3)
+        # spilling a spilled task is a no-op
+        self.assertIs(spill_task(t), t)
+
+    def test_load_on_demand(self):
+        t = spill_task(self.task)
+        self.assertEqual(t.output_files, self.task.output_files)
+        self.assertEqual(t.resolved_options, self.task.resolved_options)
+        self.assertEqual(t.cmds, ["echo hello"])
+        self.assertEqual(t.load().uuid, self.task.uuid)
+        with self.assertRaises(AttributeError):
+            _ = t.missing_attribute
+        # repeated accesses load the task once
+        self.assertIs(t.load(), t.load())
+
+    def test_spill_scatter_task(self):
+        task = ScatterTask("pbsmrtpipe.tasks.dev_scatter-0", False, ["/path/to/input.txt"],
+                           [os.path.join(self.task_dir, "chunk.json")], {}, 1, [], ["echo scatter"], 4,
+                           self.task_dir, ["$chunk.txt_id"])
+        task.task_type_id = "pbsmrtpipe.tasks.dev_scatter"
+        t = spill_task(task)
+        loaded = t.load()
+        self.assertIsInstance(loaded, ScatterTask)
+        self.assertEqual(loaded.nchunks, 4)
+        self.assertEqual(loaded.chunk_keys, ["$chunk.txt_id"])
+        self.assertEqual(loaded.task_type_id, "pbsmrtpipe.tasks.dev_scatter")
+        self.assertEqual(loaded.uuid, task.uuid)
+        self.assertEqual(t.nchunks, 4)
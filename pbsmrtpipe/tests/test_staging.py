@@ -0,0 +1,104 @@
+import os
+import json
+import tempfile
+import subprocess
+import unittest
+import logging
+from collections import namedtuple
+
+from pbsmrtpipe.staging import StagingPolicy, TaskStager, rewrite_paths
+
+log = logging.getLogger(__name__)
+
+_FileType = namedtuple("_FileType", "file_type_id")
+_MetaTask = namedtuple("_MetaTask", "task_id input_types output_types")
+_Task = namedtuple("_Task", "input_files output_files")
+
+_TXT = _FileType("PacBio.FileTypes.txt")
+_DS = _FileType("PacBio.DataSet.SubreadSet")
+
+
+class TestStagingPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.meta_task = _MetaTask("pbalign.tasks.pbalign", [_DS, _TXT], [_TXT, _DS])
+        self.task = _Task(["/data/subreads.xml", "/data/ref.txt"], ["/job/tasks/t/out.txt", "/job/tasks/t/out.xml"])
+
+    def test_to_staging(self):
+        p = StagingPolicy("$TMPDIR", max_input_size=10, skip_file_types=["PacBio.DataSet.*"])
+        s = p.to_staging(self.meta_task, self.task)
+        self.assertEqual(s['input_files'], ["/data/ref.txt"])
+        self.assertEqual(s['output_files'], ["/job/tasks/t/out.txt"])
+        self.assertEqual(s['stage_dir'], "$TMPDIR")
+        self.assertEqual(s['max_input_size'], 10)
+
+    def test_to_staging_task_ids(self):
+        self.assertIsNone(StagingPolicy("/scratch", task_ids=["pbsmrtpipe.tasks.*"]).to_staging(self.meta_task, self.task))
+        self.assertIsNotNone(StagingPolicy("/scratch", task_ids=["pbalign.tasks.*"]).to_staging(self.meta_task, self.task))
+        self.assertIsNone(StagingPolicy(None).to_staging(self.meta_task, self.task))
+
+
+class TestRewritePaths(unittest.TestCase):
+
+    def test_rewrite_paths(self):
+        paths = {"/data/a.txt": "/scratch/0/a.txt", "/data/a.txt.fai": "/scratch/1/a.txt.fai"}
+        cmd = "tool --in=/data/a.txt --index '/data/a.txt.fai' > /data/a.txt.log"
+        self.assertEqual(rewrite_paths(cmd, paths),
+                         "tool --in=/scratch/0/a.txt --index '/scratch/1/a.txt.fai' > /data/a.txt.log")
+
+
+class TestTaskStager(unittest.TestCase):
+
+    def setUp(self):
+        root_dir = tempfile.mkdtemp(suffix="-staging")
+        self.output_dir = os.path.join(root_dir, "task")
+        os.mkdir(self.output_dir)
+        self.input_file = os.path.join(root_dir, "input.txt")
+        with open(self.input_file, 'w') as f:
+            f.write("Mock data\n")
+        self.output_file = os.path.join(self.output_dir, "output.txt")
+        self.scratch_dir = os.path.join(tempfile.mkdtemp(suffix="-scratch"), "pbsmrtpipe-task")
+
+    def _to_stager(self, max_input_size=None):
+        stager = TaskStager(self.scratch_dir, self.output_dir, [self.input_file], [self.output_file],
+                            max_input_size=max_input_size)
+        stager.stage_inputs()
+        stager.stage_outputs()
+        return stager
+
+    def test_stage_and_copy_back(self):
+        stager = self._to_stager()
+        cmd, = stager.rewrite_cmds(["cat {i} > {o} && cd $(dirname {o}) && touch output.txt.idx".format(i=self.input_file, o=self.output_file)])
+        self.assertNotIn(self.input_file, cmd)
+        self.assertIn(stager.staged_inputs[self.input_file], cmd)
+        self.assertIn(stager.staged_outputs[self.output_file], cmd)
+
+        self.assertEqual(subprocess.call(cmd, shell=True), 0)
+        self.assertFalse(os.path.exists(self.output_file))
+
+        copied = stager.copy_back_outputs()
+        self.assertEqual(sorted(copied), [self.output_file, self.output_file + ".idx"])
+        with open(self.output_file) as f:
+            self.assertEqual(f.read(), "Mock data\n")
+
+        stager.cleanup()
+        self.assertFalse(os.path.exists(self.scratch_dir))
+
+    def test_max_input_size(self):
+        stager = self._to_stager(max_input_size=0)
+        self.assertEqual(stager.staged_inputs, {})
+        self.assertIn(self.output_file, stager.staged_outputs)
+
+    def test_rewrite_resolved_tool_contract(self):
+        rtc_path = os.path.join(self.output_dir, "resolved-tool-contract.json")
+        with open(rtc_path, 'w') as f:
+            f.write(json.dumps(dict(resolved_tool_contract=dict(input_files=[self.input_file],
+                                                                output_files=[self.output_file]))))
+        stager = self._to_stager()
+        cmd, = stager.rewrite_cmds(["python -m tool --resolved-tool-contract {r}".format(r=rtc_path)])
+        staged_rtc_path = cmd.split()[-1]
+        self.assertNotEqual(staged_rtc_path, rtc_path)
+        with open(staged_rtc_path) as f:
+            d = json.load(f)['resolved_tool_contract']
+        self.assertEqual(d['input_files'], [stager.staged_inputs[self.input_file]])
+        self.assertEqual(d['output_files'], [stager.staged_outputs[self.output_file]])
@@ -0,0 +1,83 @@
+import os
+import json
+import tempfile
+import unittest
+import logging
+
+import pbsmrtpipe.testkit.multirunner as M
+from pbsmrtpipe.testkit.multirunner import TestkitJob
+
+log = logging.getLogger(__name__)
+
+
+def _to_job(job_id, nproc, run_time):
+    return TestkitJob(job_id + ".cfg", job_id, job_id, nproc, run_time)
+
+
+class TestLongestFirstPacking(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = [_to_job("short", 4, 10.0), _to_job("unknown", 1, None),
+                     _to_job("long", 8, 3600.0), _to_job("medium", 8, 600.0)]
+
+    def test_longest_first(self):
+        job_ids = [j.job_id for j in M.to_longest_first(self.jobs)]
+        self.assertEqual(job_ids, ["unknown", "long", "medium", "short"])
+
+    def test_pack_into_total_nproc(self):
+        jobs = M.to_longest_first(self.jobs)
+        next_jobs = M.get_next_jobs(jobs, 0, 12, 4)
+        # the medium job doesn't fit. The short job would delay it, so it isn't packed
+        self.assertEqual([j.job_id for j in next_jobs], ["unknown", "long"])
+        next_jobs = M.get_next_jobs(jobs[2:], 9, 12, 2)
+        self.assertEqual(next_jobs, [])
+        next_jobs = M.get_next_jobs(jobs[2:], 4, 12, 2)
+        self.assertEqual([j.job_id for j in next_jobs], ["medium"])
+
+    def test_pack_by_nworkers(self):
+        next_jobs = M.get_next_jobs(M.to_longest_first(self.jobs), 0, None, 2)
+        self.assertEqual(len(next_jobs), 2)
+
+    def test_large_job_runs_alone(self):
+        jobs = [_to_job("large", 32, None), _to_job("small", 1, None)]
+        self.assertEqual([j.job_id for j in M.get_next_jobs(jobs, 0, 16, 2)], ["large"])
+        # the large job is waiting for the running jobs to complete
+        self.assertEqual(M.get_next_jobs(jobs, 1, 16, 2), [])
+        self.assertEqual(M.get_next_jobs(jobs[1:], 1, 16, 2), [jobs[1]])
+
+    def test_oversized_long_job_is_not_run_last(self):
+        jobs = [_to_job("small-{i}".format(i=i), 4, 10.0) for i in xrange(8)]
+        jobs += [_to_job("long", 32, 100.0), _to_job("new", 4, None)]
+        started = _to_start_order(jobs, 16, 4)
+        self.assertEqual(started[:2], ["new", "long"])
+        self.assertEqual(len(started), len(jobs))
+
+
+def _to_start_order(jobs, total_nproc, nworkers, default_run_time=10.0):
+    """Run the scheduling loop of run_testkit_cfgs with the recorded run times"""
+    pending_jobs = M.to_longest_first(jobs)
+    # (completed at, job)
+    running = []
+    now = 0.0
+    started = []
+    while pending_jobs or running:
+        nproc_used = sum(job.nproc for _, job in running)
+        for job in M.get_next_jobs(pending_jobs, nproc_used, total_nproc, nworkers - len(running)):
+            pending_jobs.remove(job)
+            started.append(job.job_id)
+            run_time = default_run_time if job.run_time is None else job.run_time
+            running.append((now + run_time, job))
+        running.sort(key=lambda x: x[0])
+        now, _ = running.pop(0)
+    return started
+
+
+class TestRunTimes(unittest.TestCase):
+
+    def test_write_and_load_run_time(self):
+        output_dir = tempfile.mkdtemp()
+        self.assertIsNone(M.load_run_time(output_dir))
+        M.write_run_time(output_dir, 123.5, 0)
+        self.assertEqual(M.load_run_time(output_dir), 123.5)
+        with open(os.path.join(output_dir, M.Constants.RUN_TIME_JSON)) as f:
+            self.assertEqual(json.load(f)['exit_code'], 0)
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+import logging
+
+from pbsmrtpipe.testkit.runner import run_butler_tests
+from pbsmrtpipe.testkit.xunit import XunitTestSuite
+
+log = logging.getLogger(__name__)
+
+
+class _Validators(object):
+    """The validators aren't defined at the module level, so they aren't
+    loaded by the test runner"""
+
+    class A(unittest.TestCase):
+
+        def test_a_01(self):
+            self.assertTrue(os.path.isdir(self.job_dir))
+
+        def test_a_02(self):
+            self.assertEqual(1, 2)
+
+    class B(unittest.TestCase):
+
+        def test_b_01(self):
+            self.assertTrue(os.path.isdir(self.job_dir))
+
+        @unittest.skip("Skipped validator")
+        def test_b_02(self):
+            pass
+
+    class C(unittest.TestCase):
+
+        @classmethod
+        def setUpClass(cls):
+            raise IOError("Unable to find dataset")
+
+        def test_c_01(self):
+            pass
+
+
+class TestRunButlerTests(unittest.TestCase):
+    NWORKERS = 1
+
+    def test_run_butler_tests(self):
+        job_dir = tempfile.mkdtemp(suffix="-testkit")
+        output_xml = os.path.join(job_dir, "testkit_xunit.xml")
+        loader = unittest.TestLoader()
+        test_cases = [loader.loadTestsFromTestCase(k) for k in (_Validators.A, _Validators.B, _Validators.C)]
+
+        rcode = run_butler_tests(test_cases, job_dir, output_xml, "job_01", nworkers=self.NWORKERS)
+        self.assertEqual(rcode, 1)
+
+        suite = XunitTestSuite.from_xml(output_xml)
+        # the setUpClass error is reported as an additional test
+        self.assertEqual(suite.ntests, 6)
+        self.assertEqual(suite.nsuccess, 3)
+        self.assertEqual(suite.nfailure, 1)
+        self.assertEqual(suite.nskipped, 1)
+        self.assertEqual(suite.nerrors, 1)
+        self.assertTrue(all(t.run_time is not None for t in suite.tests))
+        self.assertTrue(os.path.exists(os.path.join(job_dir, "jenkins_testkit_xunit.xml")))
+
+
+class TestRunButlerTestsParallel(TestRunButlerTests):
+    NWORKERS = 3
@@ -3,10 +3,11 @@ import logging
 import os
 import unittest
 
-from base import TEST_DATA_DIR, TestDirBase, DEBUG, get_temp_file, get_temp_dir
+from base import TEST_DATA_DIR, TestDirBase, get_temp_file, get_temp_dir
 
-from pbcommand.models import TaskTypes
+from pbcommand.models import TaskTypes, ResourceTypes
 from pbsmrtpipe.models import RunnableTask, Task
+from pbsmrtpipe.cluster import ClusterTemplate, ClusterTemplateRender
 import pbsmrtpipe.tools.runner as R
 
 log = logging.getLogger(__name__)
@@ -52,14 +53,75 @@ class TestRunnableTask(TestDirBase):
 
         stdout = f("stdout")
         stderr = f("stderr")
-        rcode, err_msg, run_time = R.run_task(rt, self.temp_dir, stdout, stderr, DEBUG)
+        rcode, err_msg, run_time = R.run_task(rt, self.temp_dir, stdout, stderr)
         # Need to generate a manifest on-the-fly otherwise there the paths
         # in the manifest will be wrong.
         self.assertIsInstance(rcode, int)
 
+    def test_cleanup_resources_to_dict(self):
+        rt = self._to_runnable_task()
+        self.assertTrue(rt.cleanup_resources)
+        rt.cleanup_resources = False
+        d = rt.to_dict()
+        self.assertFalse(RunnableTask.from_d(d).cleanup_resources)
+        # manifests written by older versions
+        d.pop('cleanup_resources')
+        self.assertTrue(RunnableTask.from_d(d).cleanup_resources)
+
 
 class TestHelloRunnableTask(TestRunnableTask):
     TASK_ID = "my_task_02"
     INPUT_FILE_NAMES = ['file1.txt', 'file2.txt']
     OUTPUT_FILE_NAMES = ['out1.txt', 'out2.txt', 'out3.txt']
     RESOURCES = []
+
+
+class TestStopClusterJob(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = get_temp_dir("-stop-cluster-job")
+        self.stopped_file = os.path.join(self.output_dir, "stopped.txt")
+        render = ClusterTemplateRender([ClusterTemplate("start", "bash ${CMD}"),
+                                        ClusterTemplate("stop", "echo ${JOB_ID} > " + self.stopped_file)])
+        task = Task("my_task_03", True, [], [], {}, 1, [], ["echo 'Mock'"], self.output_dir)
+        RunnableTask(task, render).write_json(os.path.join(self.output_dir, "runnable-task.json"))
+
+    def test_stop_cluster_job(self):
+        # not submitted to the cluster
+        self.assertFalse(R.stop_cluster_job(self.output_dir))
+        with open(os.path.join(self.output_dir, R.Constants.CLUSTER_JOB_ID_FILE), 'w') as f:
+            f.write("job.my_task_03-1234\n")
+        self.assertTrue(R.stop_cluster_job(self.output_dir))
+        with open(self.stopped_file) as f:
+            self.assertEqual(f.read().strip(), "job.my_task_03-1234")
+
+
+class TestCleanupPendingResources(unittest.TestCase):
+
+    def test_cleanup(self):
+        tmp_dir = get_temp_dir("-tmp-resource")
+        for i in xrange(5):
+            sub_dir = os.path.join(tmp_dir, "sub-{i}".format(i=i))
+            os.mkdir(sub_dir)
+            for j in xrange(3):
+                with open(os.path.join(sub_dir, "file-{j}.txt".format(j=j)), 'w') as f:
+                    f.write("x")
+        tmp_file = get_temp_file(suffix="-tmp-resource.txt")
+        log_file = get_temp_file(suffix="-log-resource.txt")
+        resources = [dict(resource_type=ResourceTypes.TMP_DIR, path=tmp_dir),
+                     dict(resource_type=ResourceTypes.TMP_FILE, path=tmp_file),
+                     dict(resource_type=ResourceTypes.LOG_FILE, path=log_file)]
+
+        task_dir = get_temp_dir("-task")
+        cleanup_pending_path = os.path.join(task_dir, R.Constants.CLEANUP_PENDING_FILE)
+        with open(cleanup_pending_path, 'w') as f:
+            f.write(json.dumps(resources))
+        self.assertTrue(R.is_cleanup_pending(task_dir))
+
+        nfiles = R.cleanup_pending_resources(cleanup_pending_path)
+        self.assertEqual(nfiles, 16)
+        self.assertFalse(os.path.exists(tmp_dir))
+        self.assertFalse(os.path.exists(tmp_file))
+        # only tmp resources are removed
+        self.assertTrue(os.path.exists(log_file))
+        self.assertFalse(R.is_cleanup_pending(task_dir))
@@ -0,0 +1,50 @@
+import json
+import logging
+import unittest
+
+from pbsmrtpipe.trace_events import TraceRecorder, WorkerSlots
+
+from base import get_temp_file
+
+log = logging.getLogger(__name__)
+
+
+class TestTraceRecorder(unittest.TestCase):
+
+    def test_span_and_lanes(self):
+        t = TraceRecorder(pid=1)
+        with t.span("graph-op"):
+            pass
+        t.add_span("task-01", 10.0, 12.5, lane="worker-slot-0")
+
+        spans = [e for e in t.events if e['ph'] == 'X']
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans[0]['tid'], 0)
+        self.assertEqual(spans[1]['tid'], 1)
+        self.assertEqual(spans[1]['ts'], 10000000)
+        self.assertEqual(spans[1]['dur'], 2500000)
+
+    def test_min_duration(self):
+        t = TraceRecorder(min_duration=10.0)
+        with t.span("fast-op"):
+            pass
+        self.assertEqual([e for e in t.events if e['ph'] == 'X'], [])
+
+    def test_write_json(self):
+        t = TraceRecorder()
+        t.add_span("task-01", 1.0, 2.0, lane="worker-slot-0")
+        path = t.write_json(get_temp_file(suffix="-trace.json"))
+        with open(path, 'r') as f:
+            d = json.load(f)
+        names = {e['args']['name'] for e in d['traceEvents'] if e['name'] == 'thread_name'}
+        self.assertEqual(names, {"master", "worker-slot-0"})
+
+
+class TestWorkerSlots(unittest.TestCase):
+
+    def test_reuse_lowest_slot(self):
+        s = WorkerSlots()
+        self.assertEqual(s.acquire("a"), "worker-slot-0")
+        self.assertEqual(s.acquire("b"), "worker-slot-1")
+        self.assertEqual(s.release("a"), "worker-slot-0")
+        self.assertEqual(s.acquire("c"), "worker-slot-0")
@@ -0,0 +1,45 @@
+import logging
+import unittest
+
+from pbsmrtpipe.run_time_model import DurationModel
+from pbsmrtpipe.walltime import (WalltimePolicy, to_walltime_str,
+                                 to_walltime_extras)
+
+log = logging.getLogger(__name__)
+
+
+class TestWalltimePolicy(unittest.TestCase):
+
+    def test_to_walltime(self):
+        model = DurationModel({"a": 1000.0, "b": 10.0}, {"c": 4000.0})
+        p = WalltimePolicy({"b": 30.0}, 3.0, duration_model=model, min_walltime=600.0)
+        self.assertEqual(p.to_walltime("a"), 3000.0)
+        # explicit walltimes override the multiplier
+        self.assertEqual(p.to_walltime("b"), 30.0)
+        # 4000 sec split over 2 chunks
+        self.assertEqual(p.to_walltime("c", nchunks=2), 6000.0)
+        # no history
+        self.assertIsNone(p.to_walltime("x"))
+
+    def test_min_walltime(self):
+        p = WalltimePolicy(multiplier=2.0, duration_model=DurationModel({"a": 1.0}), min_walltime=600.0)
+        self.assertEqual(p.to_walltime("a"), 600.0)
+
+    def test_disabled(self):
+        p = WalltimePolicy()
+        self.assertFalse(p.is_enabled)
+        self.assertIsNone(p.to_walltime("a"))
+
+
+class TestWalltimeUtils(unittest.TestCase):
+
+    def test_to_walltime_str(self):
+        self.assertEqual(to_walltime_str(3661), "01:01:01")
+        self.assertEqual(to_walltime_str(59.5), "00:01:00")
+        self.assertEqual(to_walltime_str(360000), "100:00:00")
+
+    def test_to_walltime_extras(self):
+        self.assertEqual(to_walltime_extras("-l h_rt=${WALLTIME}", 7200), "-l h_rt=02:00:00")
+        self.assertEqual(to_walltime_extras("--time=${WALLTIME_SECONDS}", 60), "--time=60")
+        self.assertIsNone(to_walltime_extras("-l h_rt=${WALLTIME}", None))
+        self.assertIsNone(to_walltime_extras(None, 60))
@@ -0,0 +1,466 @@
+"""Benchmarks of the graph construction, chunking and task resolution
+
+Time the core operations of the workflow engine on the registered pipelines
+and on scaled-up (synthetically chunked) graphs, store the results as a
+baseline JSON file and flag regressions relative to the baseline.
+
+pbtools-benchmark --update-baseline --baseline benchmark-baseline.json # record the baseline
+pbtools-benchmark --baseline benchmark-baseline.json # compare to the baseline
+pbtools-benchmark --filter chunk # only run the chunking benchmarks
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import logging
+import datetime
+import platform
+import tempfile
+import subprocess
+from collections import defaultdict, namedtuple
+
+from pbcommand.cli import pacbio_args_runner, get_default_argparser
+from pbcommand.utils import setup_log
+
+import pbsmrtpipe
+import pbsmrtpipe.loader as L
+import pbsmrtpipe.graph.bgraph as B
+import pbsmrtpipe.opts_graph as GX
+import pbsmrtpipe.pb_io as IO
+from pbsmrtpipe.core import PipelineDefinition
+from pbsmrtpipe.driver import _get_valid_chunk_operators, run_pipeline
+from pbsmrtpipe.models import WorkflowLevelOptions, LazyPipelineRegistry
+from pbsmrtpipe.simulator import (initialize_simulated_graph,
+                                  complete_simulated_task,
+                                  to_simulated_entry_points)
+
+log = logging.getLogger(__name__)
+
+__version__ = '0.1.0'
+
+
+class Constants(object):
+    BASELINE_VERSION = "0.1.0"
+    # A benchmark is flagged if the median is > (1 + threshold) * the baseline median
+    THRESHOLD = 0.25
+    # and slower by more than MIN_DELTA sec (to ignore noise in very fast operations)
+    MIN_DELTA = 0.005
+    NREPEAT = 5
+    NCHUNKS = (10, 100, 1000)
+    CHUNK_PIPELINE_ID = "pbsmrtpipe.pipelines.dev_local_chunk"
+    DEV_PIPELINE_ID = "pbsmrtpipe.pipelines.dev_local"
+    META_TASK_IDS = ("pbsmrtpipe.tasks.dev_hello_world",
+                     "pbsmrtpipe.tasks.dev_txt_to_fofn",
+                     "pbsmrtpipe.tasks.dev_fofn_example")
+
+
+# setup_func() -> state, run_func(state) -> None, teardown_func(state) -> None
+Benchmark = namedtuple("Benchmark", "name setup_func run_func teardown_func nrepeat")
+
+Regression = namedtuple("Regression", "name baseline current ratio")
+
+
+class BenchmarkResult(object):
+
+    def __init__(self, name, run_times):
+        self.name = name
+        self.run_times = run_times
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=self.name, m=self.median, r=len(self.run_times))
+        return "<{k} {n} median:{m:.4f} sec nrepeat:{r} >".format(**_d)
+
+    @property
+    def min(self):
+        return min(self.run_times)
+
+    @property
+    def max(self):
+        return max(self.run_times)
+
+    @property
+    def median(self):
+        xs = sorted(self.run_times)
+        n = len(xs)
+        if n % 2 == 1:
+            return xs[n // 2]
+        return (xs[n // 2 - 1] + xs[n // 2]) / 2.0
+
+    def to_dict(self):
+        return dict(median=self.median, min=self.min, max=self.max,
+                    nrepeat=len(self.run_times))
+
+
+def _noop(state):
+    return None
+
+
+def _to_benchmark(name, run_func, setup_func=None, teardown_func=None, nrepeat=Constants.NREPEAT):
+    return Benchmark(name,
+                     (lambda: None) if setup_func is None else setup_func,
+                     run_func,
+                     _noop if teardown_func is None else teardown_func,
+                     nrepeat)
+
+
+def run_benchmark(benchmark, nrepeat=None):
+    """Run the benchmark. Only the run_func is timed.
+
+    :type benchmark: Benchmark
+    :rtype: BenchmarkResult
+    """
+    n = benchmark.nrepeat if nrepeat is None else nrepeat
+    run_times = []
+    for _ in xrange(n):
+        state = benchmark.setup_func()
+        try:
+            started_at = time.time()
+            benchmark.run_func(state)
+            run_times.append(time.time() - started_at)
+        finally:
+            benchmark.teardown_func(state)
+    return BenchmarkResult(benchmark.name, run_times)
+
+
+def _to_graph_benchmarks(rtasks, pipelines):
+    def to_run(bindings):
+        def run_(state):
+            return B.binding_strs_to_binding_graph(rtasks, bindings)
+        return run_
+
+    return [_to_benchmark("binding_strs_to_binding_graph:{i}".format(i=pipeline_id), to_run(pipeline.all_bindings))
+            for pipeline_id, pipeline in sorted(pipelines.iteritems())]
+
+
+class _ChunkState(object):
+
+    """Graph of the chunk dev pipeline after the scatter task has completed"""
+
+    def __init__(self, bg, chunk_operators_d, root_dir, scatter_node):
+        self.bg = bg
+        self.chunk_operators_d = chunk_operators_d
+        self.root_dir = root_dir
+        self.scatter_node = scatter_node
+
+
+def _to_scattered_state(rtasks, chunk_operators, pipeline, nchunks):
+    bg = B.binding_strs_to_binding_graph(rtasks, pipeline.all_bindings)
+    chunk_operators_d = _get_valid_chunk_operators(bg, True, chunk_operators, rtasks)
+    root_dir = tempfile.mkdtemp(suffix="-pbsmrtpipe-benchmark")
+    initialize_simulated_graph(bg, to_simulated_entry_points(bg), chunk_operators_d)
+
+    # Run the tasks until the scatter task has generated the chunk JSON
+    B.apply_scatterable(bg, chunk_operators_d, rtasks)
+    while not list(bg.scattered_task_nodes()) or not all(B.was_task_successful(bg, n) for n in bg.scattered_task_nodes()):
+        tnode = B.get_next_runnable_task(bg)
+        if tnode is None:
+            raise ValueError("Unable to find the scatter task of {i}".format(i=pipeline.idx))
+        complete_simulated_task(bg, tnode, root_dir, 0.0, 1, nchunks, chunk_operators_d)
+
+    return _ChunkState(bg, chunk_operators_d, root_dir, list(bg.scattered_task_nodes())[0])
+
+
+def _to_chunked_state(rtasks, chunk_operators, pipeline, nchunks):
+    """Graph after the chunked tasks have completed"""
+    s = _to_scattered_state(rtasks, chunk_operators, pipeline, nchunks)
+    B.apply_chunk_operator(s.bg, s.chunk_operators_d, rtasks, nchunks)
+    for tnode in s.bg.chunked_task_nodes():
+        complete_simulated_task(s.bg, tnode, s.root_dir, 0.0, 1, nchunks, s.chunk_operators_d)
+    return s
+
+
+def _teardown_chunk_state(state):
+    shutil.rmtree(state.root_dir, ignore_errors=True)
+
+
+def _to_chunk_benchmarks(rtasks, chunk_operators, pipelines, nchunks_list):
+    pipeline = pipelines[Constants.CHUNK_PIPELINE_ID]
+    benchmarks = []
+
+    for nchunks in nchunks_list:
+
+        def setup_scattered(n=nchunks):
+            return _to_scattered_state(rtasks, chunk_operators, pipeline, n)
+
+        def setup_chunked(n=nchunks):
+            return _to_chunked_state(rtasks, chunk_operators, pipeline, n)
+
+        def run_apply_chunk_operator(s, n=nchunks):
+            B.apply_chunk_operator(s.bg, s.chunk_operators_d, rtasks, n)
+
+        def run_add_chunkable_task_nodes(s):
+            pipeline_chunks = IO.load_pipeline_chunks_from_json(s.bg.node[s.scatter_node]['task'].output_files[0])
+            operators = B._get_chunk_operators_by_scatter_task_id(s.scatter_node.meta_task.task_id, s.chunk_operators_d)
+            B.add_chunkable_task_nodes_to_bgraph(s.bg, s.scatter_node, pipeline_chunks, operators, rtasks)
+
+        def run_add_gather(s):
+            B.add_gather_to_completed_task_chunks(s.bg, s.chunk_operators_d, rtasks, s.root_dir)
+
+        _d = dict(n=nchunks)
+        benchmarks.extend([
+            _to_benchmark("apply_chunk_operator:nchunks={n}".format(**_d), run_apply_chunk_operator,
+                          setup_scattered, _teardown_chunk_state),
+            _to_benchmark("add_chunkable_task_nodes_to_bgraph:nchunks={n}".format(**_d), run_add_chunkable_task_nodes,
+                          setup_scattered, _teardown_chunk_state),
+            _to_benchmark("add_gather_to_completed_task_chunks:nchunks={n}".format(**_d), run_add_gather,
+                          setup_chunked, _teardown_chunk_state)])
+
+    return benchmarks
+
+
+def _to_meta_task_benchmarks(rtasks, task_ids):
+    wopts = WorkflowLevelOptions.from_defaults()
+
+    def setup():
+        return tempfile.mkdtemp(suffix="-pbsmrtpipe-benchmark")
+
+    def teardown(root_dir):
+        shutil.rmtree(root_dir, ignore_errors=True)
+
+    def to_run(meta_task):
+        def run_(root_dir):
+            input_files = [os.path.join(root_dir, "input-{i}.{e}".format(i=i, e=ft.ext))
+                           for i, ft in enumerate(meta_task.input_types)]
+            GX.meta_task_to_task(meta_task, input_files, {}, root_dir,
+                                 wopts.max_nproc, wopts.max_nchunks,
+                                 B.to_resolve_di_resources(root_dir),
+                                 B.to_resolve_files(defaultdict(int)))
+        return run_
+
+    return [_to_benchmark("meta_task_to_task:{i}".format(i=task_id), to_run(rtasks[task_id]), setup, teardown)
+            for task_id in task_ids]
+
+
+def _run_code_in_subprocess(code):
+    with open(os.devnull, 'w') as f:
+        subprocess.check_call([sys.executable, "-c", code], stdout=f)
+
+
+def _run_load_all_in_subprocess(state):
+    # The registry is cached at the module level, so a fresh interpreter
+    # is required to time a cold load.
+    _run_code_in_subprocess("import pbsmrtpipe.loader as L; L.load_all()")
+
+
+def _to_load_all_benchmarks():
+    def run_load_all(state):
+        L.load_all()
+
+    def clear_registry():
+        L._REGISTERED_TOOL_CONTRACTS = None
+        L._REGISTERED_OPERATORS = None
+
+    # the pipelines are registered at import time, only the tool contracts
+    # and chunk operators are reloaded in process
+    return [_to_benchmark("loader.load_all:cached", run_load_all),
+            _to_benchmark("loader.load_all:reload", run_load_all, clear_registry),
+            _to_benchmark("loader.load_all:subprocess", _run_load_all_in_subprocess, nrepeat=3)]
+
+
+def _to_pipeline_registry_benchmarks(pipelines):
+    """Import of the pipeline modules, listing the templates and resolving
+    every registered pipeline"""
+    def to_subprocess_run(code):
+        def run_(state):
+            return _run_code_in_subprocess(code)
+        return run_
+
+    def setup():
+        # fresh registry of the same definitions, so nothing is memoized
+        registry = LazyPipelineRegistry()
+        for definition in pipelines.definitions().values():
+            if isinstance(definition, PipelineDefinition):
+                registry.register(definition)
+        return registry
+
+    def run_resolve_all(registry):
+        for pipeline_id in registry:
+            _ = registry[pipeline_id]
+
+    import_code = "import pbsmrtpipe.loader as L; L.load_all_installed_pipelines()"
+    show_templates_code = "from pbsmrtpipe.cli import main; main(['pbsmrtpipe', 'show-templates'])"
+
+    return [_to_benchmark("pipelines.import:subprocess", to_subprocess_run(import_code), nrepeat=3),
+            _to_benchmark("show-templates:subprocess", to_subprocess_run(show_templates_code), nrepeat=3),
+            _to_benchmark("pipelines.resolve_all", run_resolve_all, setup)]
+
+
+def _to_dev_pipeline_benchmarks(rtasks, rfiles, chunk_operators, pipelines):
+
+    def setup():
+        root_dir = tempfile.mkdtemp(suffix="-pbsmrtpipe-benchmark")
+        input_txt = os.path.join(root_dir, "e-01_input.txt")
+        with open(input_txt, 'w') as f:
+            f.write("Mock data\n")
+        return root_dir
+
+    def teardown(root_dir):
+        shutil.rmtree(root_dir, ignore_errors=True)
+
+    def run_(root_dir):
+        ep_d = {"$entry:e_01": os.path.join(root_dir, "e-01_input.txt")}
+        rcode = run_pipeline(pipelines, rfiles, rtasks, chunk_operators,
+                             pipelines[Constants.DEV_PIPELINE_ID], ep_d,
+                             os.path.join(root_dir, "job_output"), [], None, None,
+                             force_distribute=False, force_chunk_mode=False)
+        if rcode != 0:
+            raise ValueError("Pipeline {i} failed with exit code {r}".format(i=Constants.DEV_PIPELINE_ID, r=rcode))
+
+    return [_to_benchmark("run_pipeline:{i}".format(i=Constants.DEV_PIPELINE_ID), run_, setup, teardown, nrepeat=3)]
+
+
+def get_benchmarks(nchunks_list=Constants.NCHUNKS):
+    """Get all the benchmarks
+
+    :rtype: list[Benchmark]
+    """
+    rtasks, rfiles, chunk_operators, pipelines = L.load_all()
+
+    return (_to_load_all_benchmarks() +
+            _to_pipeline_registry_benchmarks(pipelines) +
+            _to_graph_benchmarks(rtasks, pipelines) +
+            _to_chunk_benchmarks(rtasks, chunk_operators, pipelines, nchunks_list) +
+            _to_meta_task_benchmarks(rtasks, Constants.META_TASK_IDS) +
+            _to_dev_pipeline_benchmarks(rtasks, rfiles, chunk_operators, pipelines))
+
+
+def run_benchmarks(benchmarks, nrepeat=None):
+    results = []
+    for benchmark in benchmarks:
+        log.info("Running benchmark {n}".format(n=benchmark.name))
+        result = run_benchmark(benchmark, nrepeat=nrepeat)
+        log.info(result)
+        results.append(result)
+    return results
+
+
+def to_results_dict(results):
+    return dict(version=Constants.BASELINE_VERSION,
+                pbsmrtpipe_version=pbsmrtpipe.get_version(),
+                created_at=datetime.datetime.now().isoformat(),
+                host=platform.node(),
+                python=platform.python_version(),
+                results={r.name: r.to_dict() for r in results})
+
+
+def write_results(results, path):
+    with open(path, 'w') as f:
+        f.write(json.dumps(to_results_dict(results), sort_keys=True, indent=4))
+    return path
+
+
+def load_baseline(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare_to_baseline(results_d, baseline_d, threshold=Constants.THRESHOLD, min_delta=Constants.MIN_DELTA):
+    """Compare the medians of the results to the baseline
+
+    Benchmarks that are not in the baseline are ignored.
+
+    :param results_d: {name: {median:}} (see BenchmarkResult.to_dict)
+    :param baseline_d: {name: {median:}}
+    :rtype: list[Regression]
+    """
+    regressions = []
+    for name, result in sorted(results_d.iteritems()):
+        if name not in baseline_d:
+            continue
+        baseline = baseline_d[name]['median']
+        current = result['median']
+        if current > baseline * (1 + threshold) and current - baseline > min_delta:
+            ratio = current / baseline if baseline > 0 else float('inf')
+            regressions.append(Regression(name, baseline, current, ratio))
+    return regressions
+
+
+def to_summary(results, baseline_d=None):
+    outs = []
+    for r in results:
+        _d = dict(n=r.name, m=r.median, x=r.min)
+        s = "{n:<80} median {m:>9.4f} sec min {x:>9.4f} sec".format(**_d)
+        if baseline_d is not None and r.name in baseline_d:
+            b = baseline_d[r.name]['median']
+            s += " baseline {b:>9.4f} sec ({p:+.1f}%)".format(b=b, p=(r.median - b) / b * 100 if b > 0 else 0.0)
+        outs.append(s)
+    return "\n".join(outs)
+
+
+def run_main(baseline_json, update_baseline, output_json, name_filter, nrepeat, threshold, min_delta):
+    benchmarks = get_benchmarks()
+    if name_filter is not None:
+        rx = re.compile(name_filter)
+        benchmarks = [b for b in benchmarks if rx.search(b.name)]
+
+    log.info("Running {n} benchmarks".format(n=len(benchmarks)))
+    results = run_benchmarks(benchmarks, nrepeat=nrepeat)
+
+    if output_json is not None:
+        write_results(results, output_json)
+
+    baseline_d = None
+    if baseline_json is not None and os.path.exists(baseline_json) and not update_baseline:
+        baseline_d = load_baseline(baseline_json)['results']
+
+    print to_summary(results, baseline_d)
+
+    if update_baseline:
+        if baseline_json is None:
+            raise ValueError("--baseline is required to update the baseline")
+        write_results(results, baseline_json)
+        print "Wrote baseline of {n} benchmarks to {p}".format(n=len(results), p=baseline_json)
+        return 0
+
+    if baseline_d is None:
+        return 0
+
+    regressions = compare_to_baseline(to_results_dict(results)['results'], baseline_d,
+                                      threshold=threshold, min_delta=min_delta)
+    for r in regressions:
+        print "REGRESSION {n} median {c:.4f} sec baseline {b:.4f} sec ({x:.2f}x)".format(n=r.name, c=r.current, b=r.baseline, x=r.ratio)
+
+    if regressions:
+        print "Found {n} regressions (threshold {t:.0f}%)".format(n=len(regressions), t=threshold * 100)
+        return 1
+
+    print "No regressions found relative to {p}".format(p=baseline_json)
+    return 0
+
+
+def _args_run_main(args):
+    return run_main(args.baseline, args.update_baseline, args.output_json, args.filter,
+                    args.nrepeat, args.threshold, args.min_delta)
+
+
+def get_parser():
+    desc = "Benchmark graph construction, chunking and task resolution"
+    p = get_default_argparser(__version__, desc)
+    p.add_argument('--baseline', type=str, default=None,
+                   help="Path to baseline JSON. Results are compared to the baseline if the file exists.")
+    p.add_argument('--update-baseline', action='store_true', default=False,
+                   help="Write the results to the baseline JSON instead of comparing")
+    p.add_argument('--output-json', type=str, default=None,
+                   help="Write the results to JSON")
+    p.add_argument('--filter', type=str, default=None,
+                   help="Only run benchmarks with names matching the regular expression")
+    p.add_argument('--nrepeat', type=int, default=None,
+                   help="Override the number of times each benchmark is run")
+    p.add_argument('--threshold', type=float, default=Constants.THRESHOLD,
+                   help="Flag benchmarks with a median slower than (1 + threshold) * baseline median")
+    p.add_argument('--min-delta', type=float, default=Constants.MIN_DELTA,
+                   help="Ignore slow downs smaller than min-delta (in sec)")
+    return p
+
+
+def main(argv=None):
+
+    argv_ = sys.argv if argv is None else argv
+    parser = get_parser()
+    return pacbio_args_runner(argv_[1:], parser, _args_run_main, log, setup_log)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,6 +9,8 @@ import time
 import datetime
 import functools
 import platform
+import json
+import subprocess
 
 from pbcommand.common_options import add_log_debug_option
 from pbcommand.cli import get_default_argparser
@@ -19,12 +21,15 @@ from pbcommand.cli.utils import main_runner_default
 
 from pbsmrtpipe.cluster import ClusterTemplateRender, ClusterTemplate
 from pbsmrtpipe.cluster import Constants as ClusterConstants
-from pbsmrtpipe.engine import run_command, backticks
+from pbsmrtpipe.engine import run_command, backticks, tail_file
 from pbsmrtpipe.models import RunnableTask, TaskStates
 from pbcommand.models import ResourceTypes, TaskTypes
 from pbsmrtpipe.utils import nfs_exists_check
+from pbsmrtpipe.affinity import set_cpu_affinity, to_cpu_list
+from pbsmrtpipe.staging import TaskStager
 import pbcommand.cli.utils as U
 import pbsmrtpipe.pb_io as IO
+import pbsmrtpipe.constants as GlobalConstants
 
 
 log = logging.getLogger(__name__)
@@ -33,6 +38,22 @@ slog = logging.getLogger('status.' + __name__)
 __version__ = '1.0.1'
 
 
+class Constants(object):
+    # Written when the task starts running (on the node for distributed tasks)
+    ENV_JSON = ".env.json"
+    # Written when the task is killed after exceeding its walltime
+    TIMED_OUT_FILE = ".timed-out"
+    # Job id (name) of a distributed task, written before the task is submitted
+    CLUSTER_JOB_ID_FILE = ".cluster-job-id"
+    # Resources of the task waiting to be removed by the background cleanup.
+    # Removed when the cleanup is completed.
+    CLEANUP_PENDING_FILE = ".cleanup-pending"
+    # The background cleanup sleeps after removing each batch of files to
+    # not starve the running tasks of IO
+    CLEANUP_BATCH_SIZE = 100
+    CLEANUP_BATCH_SLEEP = 0.05
+
+
 def _resolve_exe(exe):
     """
     Try to resolve the abspath to the exe, default to the exe if not found
@@ -190,7 +211,143 @@ def cleanup_resources(runnable_task):
     return True
 
 
-def run_task(runnable_task, output_dir, task_stdout, task_stderr, debug_mode):
+def _remove_path_throttled(path, batch_size=Constants.CLEANUP_BATCH_SIZE, batch_sleep=Constants.CLEANUP_BATCH_SLEEP):
+    """Remove a file or dir, sleeping after each batch of files. Returns the number of files removed"""
+    if os.path.isfile(path) or os.path.islink(path):
+        os.remove(path)
+        return 1
+
+    nfiles = 0
+    for root, dnames, fnames in os.walk(path, topdown=False):
+        for fname in fnames:
+            try:
+                os.remove(os.path.join(root, fname))
+            except OSError as e:
+                log.warn("Unable to remove {p}. {e}".format(p=os.path.join(root, fname), e=e))
+            nfiles += 1
+            if nfiles % batch_size == 0:
+                time.sleep(batch_sleep)
+        for dname in dnames:
+            d = os.path.join(root, dname)
+            if os.path.islink(d):
+                os.remove(d)
+            else:
+                os.rmdir(d)
+    os.rmdir(path)
+    return nfiles
+
+
+def cleanup_pending_resources(cleanup_pending_path):
+    """Remove the tmp resources listed in a cleanup pending file (written by
+    defer_cleanup_resources), then the cleanup pending file."""
+    with open(cleanup_pending_path, 'r') as f:
+        resources = json.load(f)
+
+    started_at = time.time()
+    nfiles = 0
+    for resource in resources:
+        rtype = resource['resource_type']
+        path = resource['path']
+        if rtype not in (ResourceTypes.TMP_FILE, ResourceTypes.TMP_DIR):
+            continue
+        try:
+            if os.path.exists(path):
+                nfiles += _remove_path_throttled(path)
+        except Exception as e:
+            log.error("Error cleanup resource {r} -> {p}. {e}".format(r=rtype, p=path, e=e))
+
+    os.remove(cleanup_pending_path)
+    log.info("Removed {n} files of {m} resources in {s:.2f} sec".format(n=nfiles, m=len(resources), s=time.time() - started_at))
+    return nfiles
+
+
+def _to_low_priority():
+    # runs in the child before exec. Detach from the task (and the
+    # worker's process group) and lower the CPU priority
+    os.setsid()
+    os.nice(19)
+
+
+def defer_cleanup_resources(runnable_task, output_dir):
+    """
+    Hand off the cleanup of the tmp resources of the task to a detached,
+    low priority process, so the task result can be reported immediately.
+
+    The resources are written to the cleanup pending file in the task dir,
+    which is removed once the cleanup is completed. If the process can't be
+    started, the resources are removed synchronously.
+    """
+    cleanup_pending_path = os.path.join(output_dir, Constants.CLEANUP_PENDING_FILE)
+    with open(cleanup_pending_path, 'w') as f:
+        f.write(json.dumps(runnable_task.task.resources))
+
+    cmd = [_resolve_exe("pbtools-runner"), "cleanup", cleanup_pending_path]
+    try:
+        with open(os.devnull, 'r+') as devnull:
+            p = subprocess.Popen(cmd, stdin=devnull, stdout=devnull, stderr=devnull,
+                                 close_fds=True, preexec_fn=_to_low_priority)
+            # idle IO priority (linux only)
+            ionice = which("ionice")
+            if ionice is not None:
+                subprocess.call([ionice, "-c", "3", "-p", str(p.pid)], stdout=devnull, stderr=devnull)
+        log.debug("Started background cleanup of {n} resources '{c}'".format(n=len(runnable_task.task.resources), c=" ".join(cmd)))
+    except OSError as e:
+        log.warn("Unable to start background cleanup. Cleaning up resources. {e}".format(e=e))
+        cleanup_pending_resources(cleanup_pending_path)
+    return cleanup_pending_path
+
+
+def is_cleanup_pending(output_dir):
+    return os.path.exists(os.path.join(output_dir, Constants.CLEANUP_PENDING_FILE))
+
+
+def get_task_started_at(output_dir):
+    """Returns the time the task started running in the task dir, or None
+    if the task hasn't started (e.g., waiting in the cluster queue)"""
+    env_json = os.path.join(output_dir, Constants.ENV_JSON)
+    try:
+        return os.path.getmtime(env_json)
+    except OSError:
+        return None
+
+
+def to_task_state(rcode, output_dir):
+    if rcode == 0:
+        return TaskStates.SUCCESSFUL
+    if os.path.exists(os.path.join(output_dir, Constants.TIMED_OUT_FILE)):
+        return TaskStates.TIMED_OUT
+    return TaskStates.FAILED
+
+
+def _stage_task(runnable_task, stdout_fh):
+    """
+    Stage the inputs and outputs of the task in the node-local scratch dir.
+    If the task can't be staged, the task is run in place.
+
+    :returns: (TaskStager | None, cmds)
+    """
+    cmds = runnable_task.task.cmds
+    stager = TaskStager.from_runnable_task(runnable_task)
+    if not stager.can_stage(cmds):
+        log.warn("Unable to stage task {i}. The avro resolved tool contract can't be rewritten".format(i=runnable_task.task.task_id))
+        return None, cmds
+
+    started_at = time.time()
+    try:
+        nbytes = stager.stage_inputs()
+        stager.stage_outputs()
+        cmds = stager.rewrite_cmds(cmds)
+    except (IOError, OSError) as e:
+        log.warn("Unable to stage task {i} in {d}. Running in place. {e}".format(i=runnable_task.task.task_id, d=stager.scratch_dir, e=e))
+        stager.cleanup()
+        return None, runnable_task.task.cmds
+
+    stdout_fh.write("Staged {n} inputs ({b} bytes) and {m} outputs in {d} in {s:.2f} sec\n".format(
+        n=len(stager.staged_inputs), b=nbytes, m=len(stager.staged_outputs), d=stager.scratch_dir, s=time.time() - started_at))
+    return stager, cmds
+
+
+def run_task(runnable_task, output_dir, task_stdout, task_stderr):
     """
     Run a runnable task locally.
 
@@ -216,14 +373,32 @@ def run_task(runnable_task, output_dir, task_stdout, task_stderr, debug_mode):
     # so core dumps are written to the job dir
     os.chdir(output_dir)
 
-    env_json = os.path.join(output_dir, '.env.json')
+    timed_out_file = os.path.join(output_dir, Constants.TIMED_OUT_FILE)
+    if os.path.exists(timed_out_file):
+        os.remove(timed_out_file)
+
+    env_json = os.path.join(output_dir, Constants.ENV_JSON)
 
     IO.write_env_to_json(env_json)
 
+    # pin the runner, the task commands inherit the affinity
+    if runnable_task.cpus:
+        set_cpu_affinity(runnable_task.cpus)
+
+    walltime = runnable_task.walltime
+    stager = None
+
+    def get_time_out():
+        if walltime is None:
+            return None
+        return max(walltime - get_run_time(), 0.0)
+
     with open(task_stdout, 'w') as stdout_fh:
         with open(task_stderr, 'w') as stderr_fh:
             stdout_fh.write(repr(runnable_task) + "\n")
             stdout_fh.write("Created at {x} on {h}\n".format(x=datetime.datetime.now(), h=host))
+            if runnable_task.cpus:
+                stdout_fh.write("Pinned to CPUs {c}\n".format(c=to_cpu_list(runnable_task.cpus)))
             stderr_fh.write("Running task in {o}\n".format(o=output_dir))
 
             # Validate Inputs
@@ -240,17 +415,28 @@ def run_task(runnable_task, output_dir, task_stdout, task_stderr, debug_mode):
             #if runnable_task.task.resources:
             #    create_tmp_resources_ignore_error(runnable_task.task.resources)
 
+            cmds = runnable_task.task.cmds
+            if runnable_task.staging is not None and not err_msg:
+                stager, cmds = _stage_task(runnable_task, stdout_fh)
+
             stdout_fh.write("Starting to run {n} cmds.".format(n=len(runnable_task.task.cmds)))
             stdout_fh.flush()
             stderr_fh.flush()
 
-            for i, cmd in enumerate(runnable_task.task.cmds):
+            for i, cmd in enumerate(cmds):
                 log.info("Running command \n" + cmd)
 
                 # see run_command API for future fixes
-                rcode, _, _, run_time = run_command(cmd, stdout_fh, stderr_fh, time_out=None)
+                rcode, _, _, run_time = run_command(cmd, stdout_fh, stderr_fh, time_out=get_time_out())
 
-                if rcode != 0:
+                if walltime is not None and rcode != 0 and get_run_time() >= walltime:
+                    err_msg = "Task {i} exceeded walltime of {w:.1f} sec. Killed cmd {n} of {m} after {s:.2f} sec".format(i=runnable_task.task.task_id, w=walltime, n=i + 1, m=ncmds, s=run_time)
+                    stderr_fh.write(err_msg + "\n")
+                    log.error(err_msg)
+                    with open(timed_out_file, 'w') as f:
+                        f.write(err_msg + "\n")
+                    break
+                elif rcode != 0:
                     err_msg_ = "Failed task {i} exit code {r} in {s:.2f} sec (See file '{f}'.)".format(i=runnable_task.task.task_id, r=rcode, s=run_time, f=task_stderr)
                     stderr_fh.write(err_msg + "\n")
                     stderr_fh.flush()
@@ -267,6 +453,16 @@ def run_task(runnable_task, output_dir, task_stdout, task_stderr, debug_mode):
             smsg_ = "completed running commands. Exit code {i}".format(i=rcode)
             log.debug(smsg_)
 
+            if rcode == 0 and stager is not None:
+                try:
+                    copied = stager.copy_back_outputs()
+                    stdout_fh.write("Copied {n} staged output files to {o}\n".format(n=len(copied), o=output_dir))
+                except (IOError, OSError) as e:
+                    rcode = 1
+                    err_msg = "Unable to copy the staged outputs from {d}. {e}".format(d=stager.outputs_dir, e=e)
+                    stderr_fh.write(err_msg + "\n")
+                    log.error(err_msg)
+
             if rcode == 0:
                 log.info("Core RTC runner was successful. Validating output files.")
                 # Validate output files of a successful task.
@@ -295,11 +491,16 @@ def run_task(runnable_task, output_dir, task_stdout, task_stderr, debug_mode):
             stderr_fh.flush()
             stdout_fh.flush()
 
-    # Cleanup resource files
-    if not debug_mode and runnable_task.task.resources:
+    # The driver runs tasks in debug mode. The scratch dir is always removed,
+    # or it would fill the node-local disk
+    if stager is not None:
+        stager.cleanup()
+
+    # Cleanup resource files in the background. The cleanup is disabled by
+    # the workflow debug_mode option (RunnableTask.cleanup_resources)
+    if runnable_task.cleanup_resources and runnable_task.task.resources:
         try:
-            cleanup_resources(runnable_task)
-            log.debug("successfully cleaned up {n} resources.".format(n=len(runnable_task.task.resources)))
+            defer_cleanup_resources(runnable_task, output_dir)
         except Exception as e:
             log.error(str(e))
             log.error("failed to successfully cleanup resources. {f}".format(f=runnable_task.task.resources))
@@ -324,20 +525,55 @@ def _extract_last_nlines(path, nlines=25):
     try:
         n = nlines + 1
         nfs_exists_check(path)
-        with open(path, 'r') as f:
-            s = f.readlines()
-            return "".join(s[-n:])
+        return "".join(line + "\n" for line in tail_file(path, n))
     except Exception as e:
         log.warn("Unable to extract stderr from {p}. {e}".format(p=path, e=e))
         return ""
 
 
-def run_task_on_cluster(runnable_task, task_manifest_path, output_dir, debug_mode):
+def _to_cluster_render(runnable_task):
+    # sloppy API
+    if isinstance(runnable_task.cluster, ClusterTemplateRender):
+        return runnable_task.cluster
+    ctmpls = [ClusterTemplate(name, tmpl) for name, tmpl in runnable_task.cluster.iteritems()]
+    return ClusterTemplateRender(ctmpls)
+
+
+def stop_cluster_job(output_dir):
+    """
+    Kill the cluster job of a distributed task (e.g., qdel) with the stop
+    cluster template. Terminating the worker only kills the local submit
+    process (e.g., qsub -sync y), not the job running on the cluster.
+
+    :param output_dir: Task dir
+    :returns: True if the stop command was successful
+    """
+    job_id_file = os.path.join(output_dir, Constants.CLUSTER_JOB_ID_FILE)
+    if not os.path.exists(job_id_file):
+        # local task, or not submitted yet
+        return False
+
+    with open(job_id_file, 'r') as f:
+        job_id = f.read().strip()
+
+    rt = RunnableTask.from_manifest_json(os.path.join(output_dir, GlobalConstants.RUNNABLE_TASK_JSON))
+    if rt.cluster is None:
+        return False
+
+    cmd = _to_cluster_render(rt).render(ClusterConstants.STOP, os.path.join(output_dir, 'run.sh'), job_id)
+    rcode, _, err_msg, _ = backticks(cmd)
+    if rcode == 0:
+        log.info("Stopped cluster job {i} of {d} with '{c}'".format(i=job_id, d=output_dir, c=cmd))
+    else:
+        log.warn("Unable to stop cluster job {i} with '{c}' (exit code {r}). {e}".format(i=job_id, c=cmd, r=rcode, e=err_msg))
+    return rcode == 0
+
+
+def run_task_on_cluster(runnable_task, task_manifest_path, output_dir):
     """
 
     :param runnable_task:
     :param output_dir:
-    :param debug_mode:
     :return:
 
     :type runnable_task: RunnableTask
@@ -349,25 +585,23 @@ def run_task_on_cluster(runnable_task, task_manifest_path, output_dir, debug_mod
     stderr_ = _to_p('stderr')
 
     if runnable_task.task.is_distributed is False:
-        return run_task(runnable_task, output_dir, stdout_, stderr_, debug_mode)
+        return run_task(runnable_task, output_dir, stdout_, stderr_)
 
     if runnable_task.cluster is None:
         log.warn("No cluster provided. Running task locally.")
-        return run_task(runnable_task, output_dir, stdout_, stderr_, debug_mode)
+        return run_task(runnable_task, output_dir, stdout_, stderr_)
 
     os.chdir(runnable_task.task.output_dir)
     env_json = os.path.join(output_dir, '.cluster-env.json')
     IO.write_env_to_json(env_json)
 
-    # sloppy API
-    if isinstance(runnable_task.cluster, ClusterTemplateRender):
-        render = runnable_task.cluster
-    else:
-        ctmpls = [ClusterTemplate(name, tmpl) for name, tmpl in runnable_task.cluster.iteritems()]
-        render = ClusterTemplateRender(ctmpls)
+    render = _to_cluster_render(runnable_task)
 
     job_id = to_random_job_id(runnable_task.task.task_id)
     log.debug("Using job id {i}".format(i=job_id))
+    # so the job can be killed with the stop template (see stop_cluster_job)
+    with open(_to_p(Constants.CLUSTER_JOB_ID_FILE), 'w') as f:
+        f.write(job_id + "\n")
 
     qstdout = _to_p('cluster.stdout')
     qstderr = _to_p('cluster.stderr')
@@ -404,7 +638,7 @@ def run_task_on_cluster(runnable_task, task_manifest_path, output_dir, debug_mod
     # Make +x
     os.chmod(rcmd_shell, os.stat(rcmd_shell).st_mode | stat.S_IEXEC)
 
-    cluster_cmd = render.render(ClusterConstants.START, rcmd_shell, job_id, qstdout, qstderr, runnable_task.task.nproc)
+    cluster_cmd = render.render(ClusterConstants.START, rcmd_shell, job_id, qstdout, qstderr, runnable_task.task.nproc, extras=runnable_task.extras)
     log.debug(cluster_cmd)
 
     with open(qshell, 'w') as f:
@@ -471,9 +705,9 @@ def run_task_manifest(path):
         log.error(emsg)
         raise
 
-    rcode, err_msg, run_time = run_task(rt, output_dir, stdout, stderr, True)
+    rcode, err_msg, run_time = run_task(rt, output_dir, stdout, stderr)
 
-    state = TaskStates.SUCCESSFUL if rcode == 0 else TaskStates.FAILED
+    state = to_task_state(rcode, output_dir)
     emsg = ""
     if rcode != 0:
         # try to provide a hint of the exception from the stderr
@@ -495,11 +729,13 @@ def run_task_manifest_on_cluster(path):
     rt = RunnableTask.from_manifest_json(path)
 
     # this needs to be updated to have explicit paths to stderr, stdout
-    rcode, err_msg, run_time = run_task_on_cluster(rt, path, output_dir, True)
+    rcode, err_msg, run_time = run_task_on_cluster(rt, path, output_dir)
     cstderr = os.path.join(output_dir, "cluster.stderr")
     stderr = os.path.join(output_dir, "stderr")
 
-    state = TaskStates.SUCCESSFUL if rcode == 0 else TaskStates.FAILED
+    # the walltime is enforced by the runner on the node (and the scheduler
+    # if the walltime extras are used)
+    state = to_task_state(rcode, output_dir)
     # Need to update the run_task_on_cluster
     emsg = ""
     if rcode != 0:
@@ -520,11 +756,22 @@ def _args_run_task_manifest(args):
     log.info("loaded runnable-task")
 
     # (exit code, run_time_sec) =
-    rcode, err_msg, _ = run_task(rt, output_dir, args.task_stdout, args.task_stderr, args.debug)
+    rcode, err_msg, _ = run_task(rt, output_dir, args.task_stdout, args.task_stderr)
 
     return rcode
 
 
+def _args_cleanup_pending_resources(args):
+    cleanup_pending_resources(args.cleanup_pending_json)
+    return 0
+
+
+def _add_cleanup_options(p):
+    add_log_debug_option(p)
+    p.add_argument('cleanup_pending_json', type=validate_file, help="Path to the {f} file of a task".format(f=Constants.CLEANUP_PENDING_FILE))
+    return p
+
+
 def _add_run_options(p):
     _add_base_options(p)
     U.add_output_dir_option(p)
@@ -577,6 +824,9 @@ def get_main_parser():
     builder("inspect", "Pretty-Print a summary of the task-manifestExtract the cmds from manifest.json",
             _add_base_options, _args_pprint_task_manifest)
 
+    builder("cleanup", "Remove the tmp resources of a task (used by the background cleanup)",
+            _add_cleanup_options, _args_cleanup_pending_resources)
+
     return p
 
 
@@ -0,0 +1,127 @@
+"""Record timing spans and export them as a Chrome trace-event JSON file.
+
+The output can be loaded in chrome://tracing or https://ui.perfetto.dev
+
+Each "lane" is rendered as a thread (tid) of a single process. The master
+(driver) process is always lane 0, each worker slot gets its own lane.
+"""
+import os
+import json
+import time
+import logging
+import contextlib
+
+log = logging.getLogger(__name__)
+
+__all__ = ['TraceRecorder', 'WorkerSlots']
+
+
+class Constants(object):
+    MASTER = "master"
+    CATEGORY = "pbsmrtpipe"
+    # Chrome trace event phases
+    PH_COMPLETE = "X"
+    PH_METADATA = "M"
+
+
+def _to_us(t):
+    """Convert a time.time() value in sec to microseconds"""
+    return int(round(t * 1000000))
+
+
+class TraceRecorder(object):
+
+    """Container of Chrome trace 'complete' events grouped by lane"""
+
+    def __init__(self, name="pbsmrtpipe", pid=None, min_duration=0.0):
+        """
+        :param min_duration: Spans recorded via span() that are shorter
+        than this (in sec) are dropped to keep the trace compact.
+        """
+        self.name = name
+        self.pid = os.getpid() if pid is None else pid
+        self.min_duration = min_duration
+        self.events = []
+        # {lane name: tid}
+        self._lanes = {}
+        self.lane(Constants.MASTER)
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=len(self.events), l=len(self._lanes))
+        return "<{k} events:{n} lanes:{l} >".format(**_d)
+
+    def lane(self, name):
+        """Get (or create) the tid of the lane"""
+        if name not in self._lanes:
+            tid = len(self._lanes)
+            self._lanes[name] = tid
+            self.events.append(dict(name="thread_name", ph=Constants.PH_METADATA,
+                                    pid=self.pid, tid=tid, args=dict(name=name)))
+            self.events.append(dict(name="thread_sort_index", ph=Constants.PH_METADATA,
+                                    pid=self.pid, tid=tid, args=dict(sort_index=tid)))
+        return self._lanes[name]
+
+    def add_span(self, name, started_at, ended_at, lane=Constants.MASTER, args=None):
+        """Add a completed span. Times are in sec (e.g., time.time())"""
+        e = dict(name=name, cat=Constants.CATEGORY, ph=Constants.PH_COMPLETE,
+                 ts=_to_us(started_at), dur=max(0, _to_us(ended_at) - _to_us(started_at)),
+                 pid=self.pid, tid=self.lane(lane))
+        if args:
+            e['args'] = args
+        self.events.append(e)
+        return e
+
+    @contextlib.contextmanager
+    def span(self, name, lane=Constants.MASTER, args=None):
+        """Context manager to time a block of code. The span is recorded
+        even if the block raises."""
+        started_at = time.time()
+        try:
+            yield
+        finally:
+            ended_at = time.time()
+            if ended_at - started_at >= self.min_duration:
+                self.add_span(name, started_at, ended_at, lane=lane, args=args)
+
+    def to_dict(self):
+        metadata = [dict(name="process_name", ph=Constants.PH_METADATA,
+                         pid=self.pid, tid=0, args=dict(name=self.name))]
+        return dict(traceEvents=metadata + self.events, displayTimeUnit="ms")
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            f.write(json.dumps(self.to_dict()))
+        log.debug("wrote {n} trace events to {p}".format(n=len(self.events), p=path))
+        return path
+
+
+class WorkerSlots(object):
+
+    """Assign the lowest free slot (lane) to a running worker
+
+    Slot lanes are reused, so the trace has one lane per concurrently
+    running worker, not one lane per task.
+    """
+
+    def __init__(self):
+        # {task id: slot index}
+        self._slots = {}
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=len(self._slots))
+        return "<{k} used:{n} >".format(**_d)
+
+    @staticmethod
+    def to_lane(slot):
+        return "worker-slot-{i}".format(i=slot)
+
+    def acquire(self, task_id):
+        used = set(self._slots.values())
+        slot = 0
+        while slot in used:
+            slot += 1
+        self._slots[task_id] = slot
+        return self.to_lane(slot)
+
+    def release(self, task_id):
+        return self.to_lane(self._slots.pop(task_id))
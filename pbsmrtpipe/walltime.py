@@ -0,0 +1,103 @@
+"""Per-task walltime limits
+
+The walltime (in sec) of a task is resolved from (in order)
+
+- the per-task walltimes (pbsmrtpipe.options.task_walltimes)
+- the walltime multiplier (pbsmrtpipe.options.walltime_multiplier) over the
+  run time of the task in the run time history (see DurationModel)
+
+Tasks without a walltime are never timed out. The runner kills the task
+commands when the walltime is exceeded and the driver watchdog reclaims the
+slots of tasks (local or distributed) that are still running after the
+walltime and a grace period.
+"""
+import logging
+from string import Template
+
+from pbsmrtpipe.routing import parse_run_time_hints
+from pbsmrtpipe.run_time_model import DurationModel, load_duration_model
+
+log = logging.getLogger(__name__)
+
+__all__ = ['WalltimePolicy', 'to_walltime_str', 'to_walltime_extras']
+
+
+class Constants(object):
+    # Walltimes derived from the run time history are at least this (in sec)
+    MIN_WALLTIME = 600.0
+    # Time (in sec) the runner is given to report a timed out task before
+    # the watchdog kills the worker
+    GRACE_PERIOD = 120.0
+
+
+def to_walltime_str(walltime):
+    """Convert a walltime in sec to 'HH:MM:SS' (rounded up)"""
+    total = int(walltime) + (1 if walltime > int(walltime) else 0)
+    hours, rest = divmod(total, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return "{h:02d}:{m:02d}:{s:02d}".format(h=hours, m=minutes, s=seconds)
+
+
+def to_walltime_extras(extras_template, walltime):
+    """Render the cluster EXTRAS of a task from a template (e.g., '-l h_rt=${WALLTIME}')
+
+    :returns: The extras str, or None if the task doesn't have a walltime
+    """
+    if extras_template is None or walltime is None:
+        return None
+    return Template(extras_template).substitute(WALLTIME=to_walltime_str(walltime),
+                                                WALLTIME_SECONDS=str(int(walltime)))
+
+
+class WalltimePolicy(object):
+
+    """Resolve the walltime of a task"""
+
+    def __init__(self, walltimes=None, multiplier=None, duration_model=None,
+                 min_walltime=Constants.MIN_WALLTIME):
+        """
+        :param walltimes: {task_id: walltime in sec}
+        :param multiplier: walltime = multiplier * the run time in the model
+        :type duration_model: DurationModel | None
+        """
+        self.walltimes = {} if walltimes is None else walltimes
+        self.multiplier = multiplier
+        self.duration_model = DurationModel() if duration_model is None else duration_model
+        self.min_walltime = min_walltime
+
+    def __repr__(self):
+        _d = dict(k=self.__class__.__name__, n=len(self.walltimes),
+                  m=self.multiplier, d=self.duration_model)
+        return "<{k} walltimes:{n} multiplier:{m} model:{d} >".format(**_d)
+
+    @property
+    def is_enabled(self):
+        return bool(self.walltimes) or self.multiplier is not None
+
+    @staticmethod
+    def from_workflow_options(workflow_opts):
+        """:type workflow_opts: pbsmrtpipe.models.WorkflowLevelOptions"""
+        duration_model = None
+        if workflow_opts.walltime_multiplier is not None and workflow_opts.run_time_history is not None:
+            duration_model = load_duration_model(workflow_opts.run_time_history)
+        walltimes = parse_run_time_hints(workflow_opts.task_walltimes)
+        return WalltimePolicy(walltimes, workflow_opts.walltime_multiplier, duration_model=duration_model)
+
+    def to_walltime(self, meta_task_id, nchunks=None):
+        """Returns the walltime (in sec) of the task, or None if the task
+        doesn't have a walltime
+
+        :param nchunks: Number of chunks if the task is a chunked instance
+        """
+        if meta_task_id in self.walltimes:
+            return self.walltimes[meta_task_id]
+        if self.multiplier is None:
+            return None
+
+        if nchunks is not None and meta_task_id in self.duration_model.chunked_run_times:
+            run_time = self.duration_model.to_run_time(meta_task_id, nchunks=nchunks)
+        else:
+            run_time = self.duration_model.run_times.get(meta_task_id)
+        if run_time is None:
+            return None
+        return max(self.multiplier * run_time, self.min_walltime)
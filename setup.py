@@ -50,6 +50,7 @@ setup(
                                       'pbtestkit-runner = pbsmrtpipe.testkit.runner:main',
                                       'pbtestkit-multirunner = pbsmrtpipe.testkit.multirunner:main',
                                       'pbtools-report = pbsmrtpipe.tools.report_to_html:main',
+                                      'pbtools-benchmark = pbsmrtpipe.tools.benchmark:main',
                                       'pbtestkit-service-runner = pbsmrtpipe.testkit.service_runner:main',
                                       'pbtestkit-service-multirunner = pbsmrtpipe.testkit.service_multirunner:main'
     ]},